@@ -5,35 +5,27 @@
 
 
 import os
-import threading
+import sys
 import datetime
-import csv
-import gspread
-from google.oauth2.service_account import Credentials
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import serial
-import serial.tools.list_ports
 import queue
-import time
-import re
 import webbrowser
 
-# Column headers for Google Spreadsheet
-column_headers = [
-    "MM/DD/YYYY hh:mm:ss.SSS", "Temp", "Humidity", "Library_Version", "Session_type",
-    "Device_Number", "Battery_Voltage", "Motor_Turns", "FR", "Event", "Active_Poke",
-    "Left_Poke_Count", "Right_Poke_Count", "Pellet_Count", "Block_Pellet_Count",
-    "Retrieval_Time", "InterPelletInterval", "Poke_Time","PelletsOrTrialToSwitch", "Prob_left", "Prob_right", "High_prob_poke"  
-]
-
-# Google Sheets Scope
-SCOPE = [
-    "https://spreadsheets.google.com/feeds",
-    'https://www.googleapis.com/auth/spreadsheets',
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-]
+# Shared acquisition helpers live next to the app folders in scripts/rtfed_core
+try:
+    _APP_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # running inside the notebook
+    _APP_DIR = os.getcwd()
+sys.path.insert(0, os.path.dirname(_APP_DIR))
+from rtfed_core import ipc, session_stats, sheets_mock
+from rtfed_core.gui_render import IndicatorAnimator, LogRenderer
+from rtfed_core.pi_service import PiService
+from rtfed_core.service_client import ServiceLink
+
+# Serial ports, Google Sheets uploads and data files are owned by the
+# acquisition service (rtfed_core/pi_service.py). This window is a client:
+# it can be closed and reopened while an experiment records.
 
 class SplashScreen:
     def __init__(self, root, duration=3000):
@@ -99,100 +91,65 @@ class FED3MonitorApp:
         self.json_path = tk.StringVar()
         self.spreadsheet_id = tk.StringVar()
         self.save_path = ""
-        self.data_queue = queue.Queue()
-        self.serial_ports = set(self.detect_serial_ports())
-        self.threads = []
         self.port_widgets = {}
         self.port_queues = {}
-        self.port_threads = {}
-        self.identification_threads = {}
-        self.identification_stop_events = {}
         self.log_queue = queue.Queue()
+        self.renderer = LogRenderer("RTFED(Pi)", report=self.log_queue.put)
+        self.indicators = IndicatorAnimator(self.root)
         self.recording_circle = None
         self.recording_label = None
-        self.data_to_save = {}
-        self.stop_event = threading.Event()
         self.logging_active = False
-        self.data_saved = False
-        self.gspread_client = None
-        self.last_device_check_time = time.time()
-        self.retry_attempts = 5
-        self.retry_delay = 2
-
-        # Port -> Device Number
-        self.port_to_device_number = {}
+        self.starting = False
+        self.stopping = False
+        self.no_ports_label = None
+        self.closed = False
+        self.service = ServiceLink("rtfed_core.pi_service", PiService.socket_path(), "rtfed-pi", ("--app", "pi"))
 
         self.setup_gui()
         self.root.after(0, self.update_gui)
         self.root.after(100, self.show_instruction_popup)
-        self.root.after(200, self.start_identification_threads)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-    def detect_serial_ports(self):
-        ports = list(serial.tools.list_ports.comports())
-        fed3_ports = []
-        for port in ports:
-            if port.vid == 0x239A and port.pid == 0x800B:
-                fed3_ports.append(port.device)
-        return fed3_ports
+    def on_attached(self, state):
+        for port in state["ports"]:
+            self.initialize_port_widgets(port)
+        for port, lines in state["history"].items():
+            for line in lines:
+                self.port_queues[port].put(line)
+        for port, (text, color) in state["status"].items():
+            self.set_port_status(port, text, color)
+        for line in state["log"]:
+            self.log_queue.put(line)
+        self.update_stats_labels(state["stats"])
+        self.log_queue.put(f"Attached to acquisition service (pid {state['pid']})")
+        if state["logging"]:
+            self.show_session(state["session"])
+        elif self.logging_active and not self.stopping:
+            self.show_stopped()  # the session ended while this window was detached
+
+    def on_attach_failed(self, message, fatal):
+        self.log_queue.put(message)
+        if fatal:
+            messagebox.showerror("Acquisition service", f"{message}\n\nFix the problem and restart the app; "
+                                                        "the service is not started again automatically.")
+
+    def send_command(self, cmd, **args):
+        """Run a quick service command; errors are shown to the user and None is returned."""
+        try:
+            return self.service.call(cmd, **args)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
+            return None
 
     def identify_fed3_devices(self):
-        self.stop_identification_threads()
-        if not self.serial_ports:
+        if not self.port_widgets:
             self.log_queue.put("No FED3 devices detected.")
             messagebox.showwarning("Warning", "No FED3 devices detected. Connect devices first!")
             return
-        self.log_queue.put("Identifying devices by triggering a poke on all connected FED3 devices...")
-        threading.Thread(target=self.trigger_poke_for_identification, daemon=True).start()
-
-    def trigger_poke_for_identification(self):
-        for port in list(self.serial_ports):
-            try:
-                with serial.Serial(port, baudrate=115200, timeout=1) as ser:
-                    ser.write(b'TRIGGER_POKE\n')
-                    start_time = time.time()
-                    device_number = None
-                    while time.time() - start_time < 3:
-                        line = ser.readline().decode('utf-8', errors='replace').strip()
-                        if "," in line:
-                            data_list = line.split(",")
-                            if len(data_list) >= 6:
-                                device_number = data_list[5].strip()
-                                break
-                    if device_number:
-                        self.register_device_number(port, device_number)
-                        self.log_queue.put(f"Identified device_number={device_number} on port={port}")
-                    else:
-                        self.log_queue.put(f"No valid device number received from {port}.")
-            except Exception as e:
-                self.log_queue.put(f"Error sending poke command to {port}: {e}")
+        self.send_command("identify")
 
     def sync_all_device_times(self):
-        now = datetime.datetime.now()
-        time_str = f"SET_TIME:{now.year},{now.month},{now.day},{now.hour},{now.minute},{now.second}"
-    
-        if self.logging_active:
-            for port, device_number in self.port_to_device_number.items():
-                try:
-                    ser = serial.Serial(port, 115200, timeout=2)
-                    ser.write((time_str + "\n").encode('utf-8'))
-                    start_t = time.time()
-                    while time.time() - start_t < 2:
-                        line = ser.readline().decode('utf-8', errors='replace').strip()
-                        if line == "TIME_SET_OK":
-                            self.log_queue.put(f"Time synced for device on {port}.")
-                            break
-                except Exception as e:
-                    self.log_queue.put(f"Failed to sync time for {port}: {e}")
-        else:
-            for port in self.port_to_device_number.keys():
-                try:
-                    ser = serial.Serial(port, 115200, timeout=2)
-                    ser.write((time_str + "\n").encode('utf-8'))
-                    ser.close()
-                    self.log_queue.put(f"Time sync command sent to {port}.")
-                except Exception as e:
-                    self.log_queue.put(f"Failed to sync time for {port}: {e}")
+        self.send_command("sync_clock")
 
     def set_device_mode(self):
         selected = self.mode_var.get()
@@ -206,29 +163,8 @@ class FED3MonitorApp:
             port for port, widgets in self.port_widgets.items()
             if widgets.get('selected_var') and widgets['selected_var'].get()
         ]
-
-        for port in ports_to_set:
-            try:
-                with serial.Serial(port, baudrate=115200, timeout=2) as ser:
-                    ser.write(f"SET_MODE:{mode_num}\n".encode('utf-8'))
-                    start_time = time.time()
-                    while time.time() - start_time < 3:
-                        response = ser.readline().decode().strip()
-                        if response == "MODE_SET_OK":
-                            self.log_queue.put(f"Mode {mode_num} set on {port}. Device will restart.")
-                            break
-                        elif response == "MODE_SET_FAIL":
-                            self.log_queue.put(f"Mode set failed on {port}.")
-                            break
-            except Exception as e:
-                self.log_queue.put(f"Error setting mode on {port}: {e}")
-
-    
-
-
-  
-    
-
+        # The service writes SET_MODE to each port in turn
+        self.send_command("set_mode", mode=mode_num, label=selected, ports=ports_to_set)
 
     def setup_gui(self):
         self.root.grid_columnconfigure((0, 1, 2, 3, 4), weight=1)
@@ -320,11 +256,9 @@ class FED3MonitorApp:
         ports_canvas.create_window((0,0), window=self.ports_frame, anchor="nw")
         self.ports_frame.bind("<Configure>", lambda event: ports_canvas.configure(scrollregion=ports_canvas.bbox("all")))
     
-        if not self.serial_ports:
-            tk.Label(self.ports_frame, text="Connect your FED3 devices and restart the GUI!", font=("Cascadia Code", 14), fg="red").pack()
-        else:
-            for idx, port in enumerate(self.serial_ports):
-                self.initialize_port_widgets(port, idx)
+        # Replaced by a box per port as the service detects the FED3s
+        self.no_ports_label = tk.Label(self.ports_frame, text="Connect your FED3 devices!", font=("Cascadia Code", 14), fg="red")
+        self.no_ports_label.grid(column=0, row=0, columnspan=2)
     
         log_frame = tk.Frame(self.root)
         log_frame.grid(column=0, row=5, columnspan=4, pady=10, sticky=(tk.N, tk.S, tk.E, tk.W))
@@ -333,6 +267,7 @@ class FED3MonitorApp:
         log_scrollbar = ttk.Scrollbar(log_frame, orient="vertical", command=self.log_text.yview)
         log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.log_text.configure(yscrollcommand=log_scrollbar.set)
+        self.renderer.add_view(self.log_text, "session-log", capacity=2000)
     
         bottom_frame = tk.Frame(self.root)
         bottom_frame.grid(column=0, row=6, columnspan=4, pady=10, sticky=tk.S)  # Centered at bottom
@@ -351,11 +286,16 @@ class FED3MonitorApp:
             "2) Restart and reconnect FED3 units one at a time if needed.\n"
             "3) After restarting a device, the data file saved locally would only contain the data logged after restart, however the full length data would remain available on your Google spreadsheet.\n"                  
             "4) IT IS VERY IMPORTANT to identify FED3 devices before pressing START or else RTFED will not log data.\n"
-            "5) We recommend using a powered USB hub if many FED3 units are connected.")
+            "5) We recommend using a powered USB hub if many FED3 units are connected.\n"
+            "6) The log boxes keep their latest lines; right-click a box to load older ones.\n"
+            "7) Recording runs in a background service: closing this window during an experiment can leave it recording, and reopening the app attaches to it again.")
 
     def initialize_port_widgets(self, port, idx=None):
         if port in self.port_widgets:
             return
+        if self.no_ports_label is not None:
+            self.no_ports_label.destroy()
+            self.no_ports_label = None
 
         if idx is None:
             idx = len(self.port_widgets)
@@ -366,13 +306,19 @@ class FED3MonitorApp:
         status_label.grid(column=0, row=0, sticky=tk.W)
         text_widget = tk.Text(frame, width=40, height=6, font=("Cascadia Code", 9))
         text_widget.grid(column=0, row=1, sticky=(tk.N, tk.S, tk.E, tk.W))
+        self.renderer.add_view(text_widget, port_name)
         indicator_canvas = tk.Canvas(frame, width=20, height=20)
         indicator_canvas.grid(column=1, row=0, padx=5)
         indicator_circle = indicator_canvas.create_oval(5, 5, 15, 15, fill="gray")
+        self.indicators.add(port, indicator_canvas, indicator_circle)
+
+        stats_label = ttk.Label(frame, text="", font=("Cascadia Code", 9), justify=tk.LEFT)
+        stats_label.grid(column=0, row=3, columnspan=2, sticky=tk.W)
 
         self.port_widgets[port] = {
             'status_label': status_label,
             'text_widget': text_widget,
+            'stats_label': stats_label,
             'indicator_canvas': indicator_canvas,
             'indicator_circle': indicator_circle
         }
@@ -387,14 +333,6 @@ class FED3MonitorApp:
 
         self.port_queues[port] = queue.Queue()
 
-        try:
-            ser = serial.Serial(port, 115200, timeout=1)
-            ser.close()
-            status_label.config(text="Ready", foreground="green")
-        except serial.SerialException as e:
-            status_label.config(text="Not Ready", foreground="red")
-            self.log_queue.put(f"Error with port {port}: {e}")
-
     def browse_json(self):
         filename = filedialog.askopenfilename(title="Select JSON File", filetypes=[("JSON Files", "*.json")])
         if filename:
@@ -405,94 +343,9 @@ class FED3MonitorApp:
         if self.save_path:
             self.log_queue.put(f"Data folder selected: {self.save_path}")
 
-    def start_identification_threads(self):
-        for port in self.serial_ports:
-            self.start_identification_thread(port)
-
-    def start_identification_thread(self, port):
-        if port in self.identification_threads:
-            return
-
-        stop_event = threading.Event()
-        self.identification_stop_events[port] = stop_event
-
-        def identification_with_delay():
-            time.sleep(1)
-            self.identification_thread(port, stop_event)
-
-        t = threading.Thread(target=identification_with_delay)
-        t.daemon = True
-        t.start()
-        self.identification_threads[port] = t
-        self.log_queue.put(f"Started identification thread for {port}.")
-
-    def stop_identification_threads(self):
-        for port, event in list(self.identification_stop_events.items()):
-            event.set()
-        for port, t in list(self.identification_threads.items()):
-            t.join()
-            self.log_queue.put(f"Stopped identification thread for {port}.")
-            del self.identification_threads[port]
-            del self.identification_stop_events[port]
-
-    def identification_thread(self, port, stop_event):
-        if port in self.port_threads:
-            self.log_queue.put(f"Skipping identification for {port} as it is already in use.")
-            return
-        try:
-            ser = serial.Serial(port, 115200, timeout=0.1)
-            event_index = column_headers.index("Event") - 1
-            device_number_index = column_headers.index("Device_Number") - 1
-
-            device_number_found = None
-            while not stop_event.is_set():
-                try:
-                    data = ser.readline().decode('utf-8', errors='replace').strip()
-                    if data:
-                        data_list = data.split(",")[1:]
-                        if len(data_list) == len(column_headers)-1:
-                            event_value = data_list[event_index].strip()
-                            dn = data_list[device_number_index].strip()
-
-                            # Blink indicator on "Right" event (just to show activity)
-                            if event_value in ["Right","Left","Pellet","LeftWithPellet","RightWithPellet"]:
-                                self.port_queues[port].put("RIGHT_POKE")
-
-                            if dn:
-                                device_number_found = dn
-                                break
-
-                except serial.SerialException as e:
-                    self.log_queue.put(f"Device on {port} disconnected during identification: {e}")
-                    break
-                except Exception as e:
-                    self.log_queue.put(f"Error in identification thread for {port}: {e}")
-        except serial.SerialException as e:
-            if "PermissionError" not in str(e):
-                self.log_queue.put(f"Could not open serial port {port} for identification: {e}")
-        except Exception as e:
-            self.log_queue.put(f"Unexpected error in identification thread for {port}: {e}")
-        finally:
-            try:
-                ser.close()
-            except:
-                pass
-
-        if device_number_found:
-            self.log_queue.put(f"Identified device_number={device_number_found} on port={port}")
-            self.register_device_number(port, device_number_found)
-
-    def register_device_number(self, port, device_number):
-        self.port_to_device_number[port] = device_number
-        # If logging already started, start logging for this new device immediately
-        if self.logging_active:
-            self.start_logging_for_port(port)
-
     def start_logging(self):
-        self.stop_identification_threads()
-        self.stop_event.clear()
-        self.logging_active = True
-
+        if self.starting:
+            return
         self.experimenter_name.set(self.experimenter_name.get().strip().lower())
         self.experiment_name.set(self.experiment_name.get().strip().lower())
         self.json_path.set(self.json_path.get().strip())
@@ -502,33 +355,45 @@ class FED3MonitorApp:
             messagebox.showerror("Error", "Please provide your name and experiment name.")
             return
 
-        if not self.json_path.get() or not self.spreadsheet_id.get() or not self.save_path:
+        has_sheets = self.json_path.get() or os.environ.get(sheets_mock.ENV_VAR)
+        if not has_sheets or not self.spreadsheet_id.get() or not self.save_path:
             messagebox.showerror("Error", "Please provide the JSON file, Spreadsheet ID, and data folder.")
             return
 
-        experimenter_name = re.sub(r'[<>:"/\\|?*]', '_', self.experimenter_name.get())
-        experiment_name = re.sub(r'[<>:"/\\|?*]', '_', self.experiment_name.get())
-        self.experimenter_name.set(experimenter_name)
-        self.experiment_name.set(experiment_name)
-
+        # The service opens the JSON file from its own working directory
+        json_path = os.path.abspath(self.json_path.get()) if self.json_path.get() else ""
+        # Connecting to Google Sheets can take a while; the reply comes back through update_gui
         try:
-            creds = Credentials.from_service_account_file(self.json_path.get(), scopes=SCOPE)
-            self.gspread_client = gspread.authorize(creds)
-            self.log_queue.put("Connected to Google Sheets!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to connect to Google Sheets: {e}")
+            self.service.run("started", "start", timeout=120, experimenter=self.experimenter_name.get(),
+                             experiment=self.experiment_name.get(), json_path=json_path,
+                             spreadsheet_id=self.spreadsheet_id.get(), save_path=self.save_path)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.starting = True
+        self.start_button.config(state='disabled')
+
+    def on_started(self, session, error):
+        self.starting = False
+        if error is not None:
+            self.start_button.config(state='normal')
+            messagebox.showerror("Error", error)
             return
+        self.show_session(session)
 
+    def show_session(self, session):
+        # Also used when attaching to a service that is already recording
+        self.logging_active = True
+        self.experimenter_name.set(session["experimenter"])
+        self.experiment_name.set(session["experiment"])
         self.disable_input_fields()
         self.canvas.itemconfig(self.recording_circle, fill="yellow")
         self.canvas.itemconfig(self.recording_label, text="Logging...", fill="black")
 
-        for port in list(self.serial_ports):
-            # Start logging if device_number known
-            if port in self.port_to_device_number:
-                self.start_logging_for_port(port)
-            else:
-                self.log_queue.put(f"Device number not yet known for {port}, logging will start once identified.")
+    def show_stopped(self):
+        self.logging_active = False
+        self.hide_recording_indicator()
+        self.enable_input_fields()
 
     def disable_input_fields(self):
         self.experimenter_entry.config(state='disabled')
@@ -548,274 +413,130 @@ class FED3MonitorApp:
         self.browse_button.config(state='normal')
         self.start_button.config(state='normal')
 
-    def start_logging_for_port(self, port):
-        if port in self.port_threads:
+    def stop_logging(self):
+        if not self.logging_active:
+            self.detach()
             return
-
-        # We must have device_number by now
-        if port not in self.port_to_device_number:
-            self.log_queue.put(f"Cannot start logging for {port}, no device_number known yet.")
+        if self.stopping:
             return
-
-        device_number = self.port_to_device_number[port]
-        worksheet_name = f"Device_{device_number}"
-
-        def attempt_connection(retries=self.retry_attempts, delay=self.retry_delay):
-            for attempt in range(retries):
-                try:
-                    ser = serial.Serial(port, 115200, timeout=0.1)
-                    self.data_to_save[port] = []
-                    t = threading.Thread(
-                        target=self.read_from_port,
-                        args=(ser, worksheet_name, port)
-                    )
-                    t.daemon = True
-                    t.start()
-                    self.port_threads[port] = t
-                    if self.port_widgets[port]['status_label'].cget("text") != "Ready":
-                        self.port_widgets[port]['status_label'].config(text="Ready", foreground="green")
-                    self.log_queue.put(f"Started logging from {port} with sheet {worksheet_name}.")
-                    return
-                except serial.SerialException as e:
-                    self.log_queue.put(f"Attempt {attempt+1}: Error with port {port}: {e}")
-                    time.sleep(delay)
-            self.log_queue.put(f"Failed to connect to port {port} after {retries} attempts.")
-
-        threading.Thread(target=attempt_connection).start()
-
-    def stop_logging(self):
-        self.stop_event.set()
-        self.logging_active = False
+        # Saving happens in the service and can take minutes for large sessions; never on the Tk thread
+        try:
+            self.service.run("stopped", "stop", timeout=300)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.stopping = True
+        self.stop_button.config(state='disabled')
         self.log_queue.put("Stopping logging...")
-        self.hide_recording_indicator()
-        self.enable_input_fields()
-        threading.Thread(target=self._join_threads_and_save).start()
-
-    def _join_threads_and_save(self):
-        for port, t in list(self.port_threads.items()):
-            t.join()
-            self.log_queue.put(f"Logging thread for {port} has stopped.")
-            del self.port_threads[port]
-
-        self.save_all_data()
-        self.data_saved = True
-        self.root.after(0, self._finalize_exit)
-
-    def _finalize_exit(self):
-        messagebox.showinfo("Data Saved", "All data has been saved locally.")
-        self.root.destroy()
 
-    def save_all_data(self):
-        if not self.save_path:
-            self.log_queue.put("Error: No save path specified.")
+    def on_stopped(self, result, error):
+        self.stopping = False
+        self.stop_button.config(state='normal')
+        if error is not None:
+            messagebox.showerror("Error", error)
             return
-
-        current_time = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        experimenter_name = self.experimenter_name.get().lower().strip()
-        experiment_name = self.experiment_name.get().lower().strip()
-
-        experimenter_folder = os.path.join(self.save_path, experimenter_name)
-        experiment_folder = os.path.join(experimenter_folder, f"{experiment_name}_{current_time}")
-        os.makedirs(experiment_folder, exist_ok=True)
-
-        for port, data_rows in self.data_to_save.items():
-            if data_rows:
-                port_name = os.path.basename(port)
-                safe_port_name = re.sub(r'[<>:"/\\|?*]', '_', port_name)
-                device_number = self.port_to_device_number.get(port, "unknown")
-                filename_user = os.path.join(experiment_folder, f"{safe_port_name}_device_{device_number}_{current_time}.csv")
-                try:
-                    with open(filename_user, mode='w', newline='') as file:
-                        writer = csv.writer(file)
-                        writer.writerow(column_headers)
-                        writer.writerows(data_rows)
-                    self.log_queue.put(f"Data saved for {port} in {filename_user}.")
-                except Exception as e:
-                    self.log_queue.put(f"Failed to save data for {port}: {e}")
+        self.show_stopped()
+        messagebox.showinfo("Data Saved", "All data has been saved locally.")
+        self.detach()
+
+    def handle_push(self, message):
+        kind = message["push"]
+        port = message.get("port")
+        if kind == "log":
+            if port is None:
+                self.log_queue.put(message["text"])
+            else:
+                self.port_queues[port].put(message["text"])
+        elif kind == "port":
+            self.initialize_port_widgets(port)
+        elif kind == "status":
+            self.set_port_status(port, message["text"], message["color"])
+        elif kind == "indicator":
+            self.trigger_indicator(port)
+        elif kind == "stats":
+            self.update_stats_labels(message["stats"])
+        elif kind == "session":
+            if message["logging"]:
+                self.show_session(message["session"])
+            elif self.logging_active and not self.stopping:
+                # Stopped from another client
+                self.show_stopped()
 
     def update_gui(self):
-        # Check for messages from port_queues (e.g. "RIGHT_POKE")
+        for item in self.service.poll():
+            kind = item[0]
+            if kind == "push":
+                self.handle_push(item[1])
+            elif kind == "attached":
+                self.on_attached(item[1])
+            elif kind == "attach_failed":
+                self.on_attach_failed(*item[1:])
+            elif kind == "lost":
+                self.log_queue.put("Lost connection to the acquisition service.")
+            elif kind == "started":
+                self.on_started(*item[1:])
+            elif kind == "stopped":
+                self.on_stopped(*item[1:])
+            if self.closed:
+                return
+
+        # Port lines are queued on the renderer; it writes each widget once per tick
         for port_identifier, q in list(self.port_queues.items()):
             try:
                 while True:
-                    message = q.get_nowait()
-                    if message == "RIGHT_POKE":
-                        self.trigger_indicator(port_identifier)
-                    else:
-                        if port_identifier in self.port_widgets:
-                            self.port_widgets[port_identifier]['text_widget'].insert(tk.END, message + "\n")
-                            self.port_widgets[port_identifier]['text_widget'].see(tk.END)
+                    self.renderer.write(self.port_widgets[port_identifier]['text_widget'], q.get_nowait())
             except queue.Empty:
                 pass
 
         # Check for log messages
+        stamp = datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')
         try:
             while True:
                 log_message = self.log_queue.get_nowait()
-                self.log_text.insert(tk.END, f"{datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')}: {log_message}\n")
-                self.log_text.see(tk.END)
+                self.renderer.write(self.log_text, f"{stamp}: {log_message}")
         except queue.Empty:
             pass
 
-        current_time = time.time()
-        if current_time - self.last_device_check_time >= 5:
-            self.check_device_connections()
-            self.last_device_check_time = current_time
-
-        self.root.after(100, self.update_gui)
-
-    def check_device_connections(self):
-        current_ports = set(self.detect_serial_ports())
-        # Disconnected devices
-        for port in list(self.serial_ports):
-            if port not in current_ports:
-                self.serial_ports.remove(port)
-                if port in self.port_widgets:
-                    self.port_widgets[port]['status_label'].config(text="Not Ready", foreground="red")
-                self.log_queue.put(f"Device on {port} disconnected.")
-                if port in self.port_threads:
-                    del self.port_threads[port]
-                if port in self.identification_threads:
-                    self.identification_stop_events[port].set()
-                    self.identification_threads[port].join()
-                    del self.identification_threads[port]
-                    del self.identification_stop_events[port]
-
-        # New devices
-        for port in current_ports:
-            if port not in self.serial_ports:
-                self.serial_ports.add(port)
-                idx = len(self.port_widgets)
-                self.initialize_port_widgets(port, idx)
-                self.start_identification_thread(port)
-                # If logging is active and once we identify the device number, logging will start automatically
-
-    def read_from_port(self, ser, worksheet_name, port_identifier):
-        sheet = None
-        cached_data = []
-        send_interval = 5
-        last_send_time = time.time()
-        jam_event_occurred = False
-
-        event_index = column_headers.index("Event") - 1
-        device_number_index = column_headers.index("Device_Number") - 1
-
-        device_number = self.port_to_device_number[port_identifier]
+        self.root.after(self.renderer.flush(), self.update_gui)
 
-        try:
-            spreadsheet = self.gspread_client.open_by_key(self.spreadsheet_id.get())
-            sheet = self.get_or_create_worksheet(spreadsheet, worksheet_name)
-        except Exception as e:
-            self.log_queue.put(f"Failed to access sheet {worksheet_name} at start for {port_identifier}: {e}")
-            sheet = None
-
-        while not self.stop_event.is_set():
-            try:
-                data = ser.readline().decode('utf-8', errors='replace').strip()
-            except serial.SerialException as e:
-                self.log_queue.put(f"Device on {port_identifier} disconnected: {e}")
-                if port_identifier in self.port_widgets:
-                    self.port_widgets[port_identifier]['status_label'].config(text="Not Ready", foreground="red")
-                break
-
-            if data:
-                data_list = data.split(",")[1:]
-                timestamp = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S.%f")[:-3]
-                if len(data_list) == len(column_headers) - 1:
-                    event_value = data_list[event_index].strip()
-
-                    if event_value == "JAM":
-                        jam_event_occurred = True
-                    else:
-                        row_data = [timestamp] + data_list
-                        cached_data.append(row_data)
-                        if port_identifier in self.port_queues:
-                            self.port_queues[port_identifier].put(f"Data logged: {data_list}")
-                        self.data_to_save.setdefault(port_identifier, []).append(row_data)
-
-                        if event_value in ["Right","Pellet"]:
-                            if port_identifier in self.port_queues:
-                                self.port_queues[port_identifier].put("RIGHT_POKE")
-                else:
-                    self.log_queue.put(f"Warning: Data length mismatch on {port_identifier}")
-
-            current_time = time.time()
-            should_send = (current_time - last_send_time >= send_interval)
-            if should_send and sheet:
-                if cached_data:
-                    try:
-                        sheet.append_rows(cached_data)
-                        self.log_queue.put(f"Appended {len(cached_data)} rows from {port_identifier} to Google Sheets.")
-                        cached_data.clear()
-                    except Exception as e:
-                        self.log_queue.put(f"Failed to send data to Google Sheets for {port_identifier}: {e}")
-
-                if jam_event_occurred:
-                    try:
-                        jam_row = [''] * len(column_headers)
-                        jam_row[0] = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S.%f")[:-3]
-                        jam_row[column_headers.index("Event")] = "JAM"
-                        jam_row[column_headers.index("Device_Number")] = device_number
-                        sheet.append_row(jam_row)
-                        self.log_queue.put(f"JAM event logged for {port_identifier}")
-                        jam_event_occurred = False
-                    except Exception as e:
-                        self.log_queue.put(f"Failed to send JAM event to Google Sheets for {port_identifier}: {e}")
-
-                last_send_time = current_time
-
-            time.sleep(0.1)
-
-        try:
-            ser.close()
-        except:
-            pass
-        self.log_queue.put(f"Closed serial port {port_identifier}")
+    def set_port_status(self, port, text, foreground):
+        if port in self.port_widgets:
+            label = self.port_widgets[port]['status_label']
+            if label.cget("text") != text:
+                label.config(text=text, foreground=foreground)
 
-    def get_or_create_worksheet(self, spreadsheet, title):
-        try:
-            return spreadsheet.worksheet(title)
-        except gspread.exceptions.WorksheetNotFound:
-            sheet = spreadsheet.add_worksheet(title=title, rows="1000", cols="20")
-            sheet.append_row(column_headers)
-            return sheet
+    def update_stats_labels(self, stats):
+        for port, port_stats in stats.items():
+            if port in self.port_widgets:
+                self.port_widgets[port]['stats_label'].config(text=session_stats.label(port_stats))
 
     def trigger_indicator(self, port_identifier):
-        if port_identifier not in self.port_widgets:
-            return
-        indicator_canvas = self.port_widgets[port_identifier]['indicator_canvas']
-        indicator_circle = self.port_widgets[port_identifier]['indicator_circle']
-        def blink(times):
-            if times > 0:
-                current_color = indicator_canvas.itemcget(indicator_circle, 'fill')
-                next_color = 'red' if current_color == 'gray' else 'gray'
-                indicator_canvas.itemconfig(indicator_circle, fill=next_color)
-                self.root.after(250, lambda: blink(times -1))
-            else:
-                indicator_canvas.itemconfig(indicator_circle, fill='gray')
-        blink(6)
+        self.indicators.trigger(port_identifier)
 
     def hide_recording_indicator(self):
         self.canvas.itemconfig(self.recording_circle, fill="red")
         self.canvas.itemconfig(self.recording_label, text="OFF", fill="red")
 
-    def on_closing(self):
-        if not self.data_saved:
-            self.stop_identification_threads()
-            self.stop_event.set()
-            self.logging_active = False
-
-            for t in list(self.identification_threads.values()):
-                t.join()
-
-            for t in list(self.port_threads.values()):
-                t.join()
-
-            self.save_all_data()
-            self.data_saved = True
-
+    def detach(self):
+        self.closed = True
+        self.service.close()
+        self.root.quit()
         self.root.destroy()
 
+    def on_closing(self):
+        if self.logging_active:
+            answer = messagebox.askyesnocancel(
+                "Quit",
+                "Logging is active. Do you want to stop and exit?\n\n"
+                "Yes: stop the experiment and save.\n"
+                "No: close this window and keep recording in the background.")
+            if answer:
+                self.stop_logging()
+            elif answer is False:
+                self.detach()
+        else:
+            self.detach()
+
 if __name__ == "__main__":
     splash_root = tk.Tk()
     splash_screen = SplashScreen(splash_root, duration=7000)
@@ -6,15 +6,10 @@
 
 #!/usr/bin/env python3
 import os
-import threading
+import sys
 import datetime
-import csv
-import gspread
-from google.oauth2.service_account import Credentials
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import serial
-import serial.tools.list_ports
 import queue
 import time
 import re
@@ -22,23 +17,20 @@ import cv2
 import webbrowser
 import logging
 
-# Column headers
-column_headers = [
-    "MM/DD/YYYY hh:mm:ss.SSS", "Temp", "Humidity", "Library_Version", "Session_type",
-    "Device_Number", "Battery_Voltage", "Motor_Turns", "FR", "Event", "Active_Poke",
-    "Left_Poke_Count", "Right_Poke_Count", "Pellet_Count", "Block_Pellet_Count",
-    "Retrieval_Time", "InterPelletInterval", "Poke_Time",
-    "PelletsOrTrialToSwitch", "Prob_left", "Prob_right", "High_prob_poke"  
-]
-
-
-# Google Sheets Scope
-SCOPE = [
-    "https://spreadsheets.google.com/feeds",
-    'https://www.googleapis.com/auth/spreadsheets',
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-]
+# Shared acquisition helpers live next to the app folders in scripts/rtfed_core
+try:
+    _APP_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # running inside the notebook
+    _APP_DIR = os.getcwd()
+sys.path.insert(0, os.path.dirname(_APP_DIR))
+from rtfed_core import ipc, session_stats, sheets_mock
+from rtfed_core.gui_render import IndicatorAnimator, LogRenderer
+from rtfed_core.pi_service import PiCamService
+from rtfed_core.service_client import ServiceLink
+
+# Serial ports, Google Sheets uploads, cameras and data files are owned by the
+# acquisition service (rtfed_core/pi_service.py). This window is a client: it
+# can be closed and reopened while an experiment records.
 
 class SplashScreen:
     def __init__(self, root, duration=6000):
@@ -112,60 +104,63 @@ class FED3MonitorApp:
         self.spreadsheet_id    = tk.StringVar()
         self.video_trigger     = tk.StringVar(value="Pellet")
         self.save_path         = ""
-        self.data_queue        = queue.Queue()
-        self.serial_ports      = set(self.detect_serial_ports())
-        self.threads           = []
         self.port_widgets      = {}
         self.port_queues       = {}
-        self.port_threads      = {}
-        self.identification_threads = {}
-        self.identification_stop_events = {}
         self.log_queue         = queue.Queue()
-        self.data_to_save      = {}
-        self.stop_event        = threading.Event()
+        self.renderer          = LogRenderer("RTFED(PiCAM)", report=self.log_queue.put)
+        self.indicators        = IndicatorAnimator(self.root)
         self.logging_active    = False
-        self.data_saved        = False
-        self.gspread_client    = None
-        self.last_device_check_time = time.time()
-        self.retry_attempts    = 5
-        self.retry_delay       = 2
-
-        # Thread safety
-        self.port_to_device_number_lock = threading.Lock()
-        self.data_to_save_lock = threading.Lock()
-
-        # Device mappings
-        self.port_to_device_number = {}
-        self.device_number_to_port = {}
-        self.port_to_serial = {}
-
-        # Camera handling
-        self.port_to_camera_index = {}
-        self.camera_objects = {}
-        self.recording_states = {}
-        self.last_event_times = {}
-        self.recording_locks = {}
+        self.starting          = False
+        self.stopping          = False
+        self.closed            = False
+        self.no_ports_label    = None
+        self.service           = ServiceLink("rtfed_core.pi_service", PiCamService.socket_path(), "rtfed-picam",
+                                             ("--app", "picam"))
+
+        # Camera indices found by the splash screen; the service opens the ones chosen per port at START
         self.camera_indices = camera_indices
 
-        # Time sync commands
-        self.time_sync_commands = {}
-
         # Mode selection
         self.mode_var = tk.StringVar(value="Select Mode")
 
         self.build_gui()
         self.root.after(0, self.update_gui)
         self.root.after(100, self.show_instruction_popup)
-        self.root.after(200, self.start_identification_threads)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-    def detect_serial_ports(self):
-        ports = list(serial.tools.list_ports.comports())
-        fed3_ports = []
-        for port in ports:
-            if port.vid == 0x239A and port.pid == 0x800B:
-                fed3_ports.append(port.device)
-        return fed3_ports
+    def on_attached(self, state):
+        for port in state["ports"]:
+            self.initialize_port_widgets(port)
+        for port, lines in state["history"].items():
+            for line in lines:
+                self.port_queues[port].put(line)
+        for port, (text, color) in state["status"].items():
+            self.set_port_status(port, text, color)
+        for port, label in state["modes"].items():
+            self.port_widgets[port]['mode_label'].config(text=f"Mode: {label}")
+        for line in state["log"]:
+            self.log_queue.put(line)
+        self.update_stats_labels(state["stats"])
+        self.log_queue.put(f"Attached to acquisition service (pid {state['pid']})")
+        if state["logging"]:
+            self.show_session(state["session"])
+        elif self.logging_active and not self.stopping:
+            self.show_stopped()  # the session ended while this window was detached
+
+    def on_attach_failed(self, message, fatal):
+        self.log_queue.put(message)
+        self.logger.error(message)
+        if fatal:
+            messagebox.showerror("Acquisition service", f"{message}\n\nFix the problem and restart the app; "
+                                                        "the service is not started again automatically.")
+
+    def send_command(self, cmd, **args):
+        """Run a quick service command; errors are shown to the user and None is returned."""
+        try:
+            return self.service.call(cmd, **args)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
+            return None
 
     def build_gui(self):
         # Configure root grid
@@ -201,12 +196,10 @@ class FED3MonitorApp:
             lambda event: ports_canvas.configure(scrollregion=ports_canvas.bbox("all"))
         )
 
-        if not self.serial_ports:
-            ttk.Label(self.ports_frame, text="Connect your FED3 devices and restart the GUI!",
-                      font=("Cascadia Code", 14), foreground="red").pack(pady=20)
-        else:
-            for idx, port in enumerate(self.serial_ports):
-                self.initialize_port_widgets(port, idx)
+        # Replaced by a box per port as the service detects the FED3s
+        self.no_ports_label = ttk.Label(self.ports_frame, text="Connect your FED3 devices!",
+                                        font=("Cascadia Code", 14), foreground="red")
+        self.no_ports_label.grid(column=0, row=0, columnspan=2, pady=20)
 
   
         controls_frame = ttk.Frame(main)
@@ -314,6 +307,7 @@ class FED3MonitorApp:
         self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         ttk.Scrollbar(log_frame, orient="vertical", command=self.log_text.yview).pack(side=tk.RIGHT, fill=tk.Y)
         self.log_text.configure(yscrollcommand=self.log_text.yview)
+        self.renderer.add_view(self.log_text, "session-log", capacity=2000)
 
        
         footer = ttk.Frame(self.root)
@@ -346,7 +340,9 @@ class FED3MonitorApp:
             "2. Use a powered USB hub for multiple FED3s and cameras.\n"
             "3. Do not unplug paired cameras after START.\n"
             "4. Up to 20 cameras can be detected.\n"
-            "5. Ensure sufficient disk space for video recordings."
+            "5. Ensure sufficient disk space for video recordings.\n"
+            "6. Recording runs in a background service: closing this window during an experiment can leave it "
+            "recording, and reopening the app attaches to it again."
         )
 
     def browse_json(self):
@@ -367,6 +363,9 @@ class FED3MonitorApp:
     def initialize_port_widgets(self, port, idx=None):
         if port in self.port_widgets:
             return
+        if self.no_ports_label is not None:
+            self.no_ports_label.destroy()
+            self.no_ports_label = None
         if idx is None:
             idx = len(self.port_widgets)
         port_name = os.path.basename(port)
@@ -380,6 +379,7 @@ class FED3MonitorApp:
         indicator_canvas = tk.Canvas(frame, width=20, height=20)
         indicator_canvas.grid(column=1, row=0, padx=5)
         indicator_circle = indicator_canvas.create_oval(5, 5, 15, 15, fill="gray")
+        self.indicators.add(port, indicator_canvas, indicator_circle)
 
         ttk.Label(frame, text="Camera Index:", font=("Cascadia Code", 9))\
             .grid(column=0, row=1, sticky=tk.W)
@@ -404,6 +404,9 @@ class FED3MonitorApp:
 
         text_widget = tk.Text(frame, width=50, height=8, font=("Cascadia Code", 9))
         text_widget.grid(column=0, row=3, columnspan=3, pady=5, sticky=(tk.W, tk.E))
+        self.renderer.add_view(text_widget, port_name)
+        stats_label = ttk.Label(frame, text="", font=("Cascadia Code", 9), justify=tk.LEFT)
+        stats_label.grid(column=0, row=4, columnspan=3, sticky=tk.W)
 
         self.port_widgets[port] = {
             'status_label': status_label,
@@ -414,20 +417,11 @@ class FED3MonitorApp:
             'test_cam_button': test_cam_button,
             'mode_label': mode_label,
             'selected_var': selected_var,
-            'text_widget': text_widget
+            'text_widget': text_widget,
+            'stats_label': stats_label
         }
         self.port_queues[port] = queue.Queue()
 
-        # Quick port readiness test
-        try:
-            ser = serial.Serial(port, 115200, timeout=1)
-            ser.close()
-            status_label.config(text="Ready", foreground="green")
-        except serial.SerialException as e:
-            status_label.config(text="Not Ready", foreground="red")
-            self.log_queue.put(f"Error with port {port}: {e}")
-            self.logger.error(f"Error with port {port}: {e}")
-
     def test_camera(self, port):
         camera_index_str = self.port_widgets[port]['camera_var'].get()
         if camera_index_str == 'None':
@@ -454,146 +448,15 @@ class FED3MonitorApp:
         cv2.destroyWindow(f"Camera {camera_index}")
         self.logger.info(f"Camera {camera_index} tested for port {port}")
 
-    def start_identification_threads(self):
-        for port in self.serial_ports:
-            if port not in self.port_to_device_number:
-                self.start_identification_thread(port)
-
-    def start_identification_thread(self, port):
-        if port in self.identification_threads:
-            return
-        stop_event = threading.Event()
-        self.identification_stop_events[port] = stop_event
-
-        def identification_with_delay():
-            time.sleep(1)
-            self.identification_thread(port, stop_event)
-
-        t = threading.Thread(target=identification_with_delay, daemon=True)
-        t.start()
-        self.identification_threads[port] = t
-        self.log_queue.put(f"Started identification thread for {port}.")
-        self.logger.info(f"Started identification thread for {port}.")
-
-    def stop_identification_threads(self):
-        for port, event in list(self.identification_stop_events.items()):
-            event.set()
-        for port, t in list(self.identification_threads.items()):
-            t.join()
-            self.log_queue.put(f"Stopped identification thread for {port}.")
-            self.logger.info(f"Stopped identification thread for {port}.")
-            del self.identification_threads[port]
-            del self.identification_stop_events[port]
-
-    def identification_thread(self, port, stop_event):
-        if port in self.port_to_device_number:
-            return
-        try:
-            ser = serial.Serial(port, 115200, timeout=0.1)
-            event_idx_hdr = column_headers.index("Event")
-            event_idx_data = event_idx_hdr - 1
-            devnum_idx_hdr = column_headers.index("Device_Number")
-            devnum_idx_data = devnum_idx_hdr - 1
-            device_number_found = None
-            while not stop_event.is_set():
-                line = ser.readline().decode('utf-8', errors='replace').strip()
-                if line and "," in line:
-                    data_list = line.split(",")[1:]
-                    if len(data_list) == len(column_headers) - 1:
-                        ev = data_list[event_idx_data].strip()
-                        dn = data_list[devnum_idx_data].strip()
-                        if dn:
-                            device_number_found = dn
-                            break
-            ser.close()
-        except Exception as e:
-            self.log_queue.put(f"Error in identification thread for {port}: {e}")
-            self.logger.error(f"Error in identification thread for {port}: {e}")
-            try:
-                ser.close()
-            except:
-                pass
-            return
-
-        if device_number_found:
-            self.log_queue.put(f"Identified device_number={device_number_found} on port={port}")
-            self.logger.info(f"Identified device_number={device_number_found} on port={port}")
-            self.register_device_number(port, device_number_found)
-
-    def register_device_number(self, port, device_number):
-        with self.port_to_device_number_lock:
-            if device_number in self.device_number_to_port:
-                old = self.device_number_to_port[device_number]
-                if old != port:
-                    self.log_queue.put(f"Device {device_number} reconnected on {port} (was on {old}).")
-                    self.logger.info(f"Device {device_number} reconnected on {port} (was on {old}).")
-                    del self.port_to_device_number[old]
-            self.port_to_device_number[port] = device_number
-            self.device_number_to_port[device_number] = port
-        if self.logging_active:
-            self.start_logging_for_port(port)
-
     def identify_fed3_devices(self):
-        self.stop_identification_threads()
-        if not self.serial_ports:
+        if not self.port_widgets:
             self.log_queue.put("No FED3 devices detected.")
             messagebox.showwarning("Warning", "No FED3 devices detected. Connect devices first!")
             return
-        self.log_queue.put("Identifying devices by triggering poke on all FED3s...")
-        threading.Thread(target=self.trigger_poke_for_identification, daemon=True).start()
-
-    def trigger_poke_for_identification(self):
-        for port in list(self.serial_ports):
-            try:
-                with serial.Serial(port, 115200, timeout=1) as ser:
-                    ser.write(b'TRIGGER_POKE\n')
-                    start_time = time.time()
-                    dn = None
-                    while time.time() - start_time < 3:
-                        line = ser.readline().decode('utf-8', errors='replace').strip()
-                        if "," in line:
-                            parts = line.split(",")
-                            if len(parts) >= 6:
-                                dn = parts[5].strip()
-                                break
-                    if dn:
-                        self.register_device_number(port, dn)
-                        self.log_queue.put(f"Identified device_number={dn} on port={port}")
-                    else:
-                        self.log_queue.put(f"No valid device number from {port}.")
-            except Exception as e:
-                self.log_queue.put(f"Error sending poke to {port}: {e}")
+        self.send_command("identify")
 
     def sync_all_device_times(self):
-        now = datetime.datetime.now()
-        timestr = f"SET_TIME:{now.year},{now.month},{now.day},{now.hour},{now.minute},{now.second}\n"
-        if not self.port_to_device_number:
-            self.log_queue.put("No devices to sync.")
-            return
-        self.log_queue.put(f"Syncing FED3 time: {timestr.strip()}")
-        if self.logging_active:
-            for port in self.port_to_device_number:
-                ser = self.port_to_serial.get(port)
-                if ser and ser.is_open:
-                    self.time_sync_commands[port] = ('pending', time.time())
-                    try:
-                        ser.write(timestr.encode('utf-8'))
-                    except Exception as e:
-                        self.log_queue.put(f"Failed sync on {port}: {e}")
-        else:
-            for port in self.port_to_device_number:
-                self.time_sync_commands[port] = ('pending', time.time())
-                try:
-                    with serial.Serial(port, 115200, timeout=2) as ser:
-                        ser.write(timestr.encode('utf-8'))
-                        st = time.time()
-                        while time.time() - st < 2:
-                            line = ser.readline().decode().strip()
-                            if line in ("TIME_SET_OK","TIME_SET_FAIL"):
-                                self.log_queue.put(f"{port} sync resp: {line}")
-                                break
-                except Exception as e:
-                    self.log_queue.put(f"Failed sync on {port}: {e}")
+        self.send_command("sync_clock")
 
     def set_device_mode(self):
         sel = self.mode_var.get()
@@ -605,24 +468,12 @@ class FED3MonitorApp:
         if not ports:
             messagebox.showwarning("Warning", "No devices selected.")
             return
-        for port in ports:
-            try:
-                with serial.Serial(port, 115200, timeout=2) as ser:
-                    ser.write(f"SET_MODE:{mode_num}\n".encode())
-                    st = time.time()
-                    while time.time() - st < 3:
-                        r = ser.readline().decode().strip()
-                        if r == "MODE_SET_OK":
-                            self.log_queue.put(f"Mode {mode_num} set on {port}")
-                            self.port_widgets[port]['mode_label'].config(text=f"Mode: {sel}")
-                            break
-            except Exception as e:
-                self.log_queue.put(f"Error setting mode on {port}: {e}")
+        # The service writes SET_MODE to each port in turn and pushes the new mode label
+        self.send_command("set_mode", mode=mode_num, label=sel, ports=ports)
 
     def start_logging(self):
-        self.stop_identification_threads()
-        self.stop_event.clear()
-        self.logging_active = True
+        if self.starting:
+            return
         # sanitize names
         self.experimenter_name.set(re.sub(r'[<>:"/\\|?*]', '_', self.experimenter_name.get().strip().lower()))
         self.experiment_name.set(re.sub(r'[<>:"/\\|?*]', '_', self.experiment_name.get().strip().lower()))
@@ -631,406 +482,185 @@ class FED3MonitorApp:
         if not self.experimenter_name.get() or not self.experiment_name.get():
             messagebox.showerror("Error", "Provide name & experiment name.")
             return
-        if not self.json_path.get() or not self.spreadsheet_id.get() or not self.save_path:
+        has_sheets = self.json_path.get() or os.environ.get(sheets_mock.ENV_VAR)
+        if not has_sheets or not self.spreadsheet_id.get() or not self.save_path:
             messagebox.showerror("Error", "Provide JSON file, Spreadsheet ID, and data folder.")
             return
+        cameras = {port: wd['camera_var'].get() for port, wd in self.port_widgets.items()
+                   if wd['camera_var'].get() != 'None'}
+        # The service opens the JSON file from its own working directory
+        json_path = os.path.abspath(self.json_path.get()) if self.json_path.get() else ""
+        # Connecting to Google Sheets and opening cameras can take a while; the reply comes back through update_gui
         try:
-            creds = Credentials.from_service_account_file(self.json_path.get(), scopes=SCOPE)
-            self.gspread_client = gspread.authorize(creds)
-            self.log_queue.put("Connected to Google Sheets!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to connect to Google Sheets: {e}")
+            self.service.run("started", "start", timeout=120, experimenter=self.experimenter_name.get(),
+                             experiment=self.experiment_name.get(), json_path=json_path,
+                             spreadsheet_id=self.spreadsheet_id.get(), save_path=self.save_path,
+                             video_trigger=self.video_trigger.get(), cameras=cameras)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
             return
-
-        # disable inputs
-        self.experimenter_entry.config(state='disabled')
-        self.experiment_entry.config(state='disabled')
-        self.json_entry.config(state='disabled')
-        self.spreadsheet_entry.config(state='disabled')
-        self.browse_json_button.config(state='disabled')
-        self.browse_button.config(state='disabled')
+        self.starting = True
         self.start_button.config(state='disabled')
-        self.video_trigger_menu.config(state='disabled')
-        self.mode_menu.config(state='disabled')
-        self.set_mode_button.config(state='disabled')
-        self.identify_devices_button.config(state='disabled')
-        self.sync_time_button.config(state='disabled')
 
+    def on_started(self, session, error):
+        self.starting = False
+        if error is not None:
+            self.start_button.config(state='normal')
+            messagebox.showerror("Error", error)
+            return
+        self.show_session(session)
+
+    def show_session(self, session):
+        # Also used when attaching to a service that is already recording
+        self.logging_active = True
+        self.experimenter_name.set(session["experimenter"])
+        self.experiment_name.set(session["experiment"])
+        self.set_inputs_state('disabled')
         # recording indicator
         self.canvas.itemconfig(self.recording_circle, fill="yellow")
         self.canvas.itemconfig(self.recording_label, text="Logging...", fill="black")
 
-        # prepare experiment folder
-        now = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        base = os.path.join(self.save_path, self.experimenter_name.get())
-        self.experiment_folder = os.path.join(base, f"{self.experiment_name.get()}_{now}")
-        os.makedirs(self.experiment_folder, exist_ok=True)
-        self.log_queue.put(f"Experiment folder: {self.experiment_folder}")
-
-        # setup cameras
-        for port, wd in self.port_widgets.items():
-            wd['camera_combobox'].config(state='disabled')
-            wd['test_cam_button'].config(state='disabled')
-            ci = wd['camera_var'].get()
-            ci = None if ci=='None' else int(ci)
-            self.port_to_camera_index[port] = ci
-
-        for port, ci in self.port_to_camera_index.items():
-            if ci is not None:
-                cam = cv2.VideoCapture(ci)
-                if cam.isOpened():
-                    self.camera_objects[ci] = cam
-                    self.log_queue.put(f"Camera {ci} for port {port}.")
-                    st = self.port_widgets[port]['status_label'].cget("text")
-                    if "Ready" in st:
-                        self.port_widgets[port]['status_label'].config(text="Ready (CAM Ready)", foreground="green")
-                else:
-                    self.log_queue.put(f"Camera {ci} failed for port {port}.")
-                    st = self.port_widgets[port]['status_label'].cget("text")
-                    if "Ready" in st:
-                        self.port_widgets[port]['status_label'].config(text="Ready (CAM Not Connected)", foreground="orange")
-                    cam.release()
-            self.recording_states[port] = False
-            self.last_event_times[port] = None
-            self.recording_locks[port] = threading.Lock()
-
-        # start logging threads
-        for port in list(self.serial_ports):
-            if port in self.port_to_device_number:
-                self.start_logging_for_port(port)
-            else:
-                self.log_queue.put(f"No device_number for {port}; waiting...")
+    def show_stopped(self):
+        self.logging_active = False
+        # hide indicator
+        self.canvas.itemconfig(self.recording_circle, fill="red")
+        self.canvas.itemconfig(self.recording_label, text="OFF", fill="red")
+        self.set_inputs_state('normal')
+
+    def set_inputs_state(self, state):
+        self.experimenter_entry.config(state=state)
+        self.experiment_entry.config(state=state)
+        self.json_entry.config(state=state)
+        self.spreadsheet_entry.config(state=state)
+        self.browse_json_button.config(state=state)
+        self.browse_button.config(state=state)
+        self.start_button.config(state=state)
+        self.video_trigger_menu.config(state='readonly' if state == 'normal' else state)
+        self.mode_menu.config(state='readonly' if state == 'normal' else state)
+        self.set_mode_button.config(state=state)
+        self.identify_devices_button.config(state=state)
+        self.sync_time_button.config(state=state)
+        for wd in self.port_widgets.values():
+            wd['camera_combobox'].config(state=state)
+            wd['test_cam_button'].config(state=state)
 
-    def start_logging_for_port(self, port):
-        if port in self.port_threads:
+    def stop_logging(self):
+        if not self.logging_active:
+            self.detach()
             return
-        dn = self.port_to_device_number.get(port)
-        if not dn:
-            self.log_queue.put(f"No device_number for {port}; cannot log yet.")
+        if self.stopping:
             return
-        ws_name = f"Device_{dn}"
-
-        def attempt_connection():
-            for attempt in range(self.retry_attempts):
-                try:
-                    ser = serial.Serial(port, 115200, timeout=0.1)
-                    with self.data_to_save_lock:
-                        self.data_to_save[port] = []
-                    self.port_to_serial[port] = ser
-                    t = threading.Thread(target=self.read_from_port, args=(ser, ws_name, port), daemon=True)
-                    t.start()
-                    self.port_threads[port] = t
-                    self.port_widgets[port]['status_label'].config(text="Ready", foreground="green")
-                    self.log_queue.put(f"Started logging from {port} to {ws_name}.")
-                    return
-                except Exception as e:
-                    self.log_queue.put(f"Attempt {attempt+1} error on {port}: {e}")
-                    time.sleep(self.retry_delay)
-            self.log_queue.put(f"Failed to connect to {port} after retries.")
-
-        threading.Thread(target=attempt_connection, daemon=True).start()
-
-    def read_from_port(self, ser, worksheet_name, port_identifier):
-        dn = self.port_to_device_number.get(port_identifier, 'unknown')
-        spreadsheet = self.gspread_client.open_by_key(self.spreadsheet_id.get())
-        sheet = self.get_or_create_worksheet(spreadsheet, worksheet_name)
-        cached_data = []
-        send_interval = 5
-        last_send = time.time()
-        jam_event = False
-
-        ev_idx_hdr = column_headers.index("Event")
-        ev_idx_data = ev_idx_hdr - 1
-        dn_idx_hdr = column_headers.index("Device_Number")
-        dn_idx_data = dn_idx_hdr - 1
-
+        # Saving (and finishing the videos) happens in the service; never on the Tk thread
         try:
-            while not self.stop_event.is_set():
-                line = ser.readline().decode('utf-8', errors='replace').strip()
-                cmd_info = self.time_sync_commands.get(port_identifier)
-                if cmd_info and cmd_info[0] == 'pending':
-                    if line in ("TIME_SET_OK","TIME_SET_FAIL"):
-                        self.log_queue.put(f"{port_identifier} time sync: {line}")
-                        self.time_sync_commands[port_identifier] = ('done', time.time())
-                        continue
-                    elif time.time() - cmd_info[1] > 2:
-                        self.log_queue.put(f"{port_identifier} time sync no resp.")
-                        self.time_sync_commands[port_identifier] = ('done', time.time())
-                if not line:
-                    continue
-                parts = line.split(",")[1:]
-                if len(parts) != len(column_headers)-1:
-                    self.log_queue.put(f"Length mismatch on {port_identifier}: {parts}")
-                    continue
-                if not self.validate_data(parts):
-                    self.log_queue.put(f"Invalid data from {port_identifier}: {parts}")
-                    continue
-                event = parts[ev_idx_data].strip()
-                row = [datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S.%f")[:-3]] + parts
-                cached_data.append(row)
-                self.port_queues[port_identifier].put(f"Data logged: {parts}")
-                with self.data_to_save_lock:
-                    self.data_to_save[port_identifier].append(row)
-                if event == "JAM":
-                    jam_event = True
-
-                trigger = self.video_trigger.get()
-                if ((trigger=="Pellet" and event=="Pellet") or
-                    (trigger=="Left" and event=="Left") or
-                    (trigger=="Right" and event=="Right") or
-                    (trigger=="All" and event in ["Pellet","Left","Right"])):
-                    with self.recording_locks[port_identifier]:
-                        self.last_event_times[port_identifier] = datetime.datetime.now()
-                        if not self.recording_states[port_identifier]:
-                            self.recording_states[port_identifier] = True
-                            threading.Thread(target=self.record_video, args=(port_identifier,), daemon=True).start()
-
-                now = time.time()
-                if now - last_send >= send_interval and cached_data:
-                    rows = cached_data[:]
-                    def attempt_append(rows):
-                        for _ in range(3):
-                            try:
-                                sheet.append_rows(rows)
-                                self.log_queue.put(f"Appended {len(rows)} rows from {port_identifier}")
-                                return True
-                            except gspread.exceptions.APIError as e:
-                                time.sleep(2)
-                        return False
-                    if attempt_append(rows):
-                        cached_data.clear()
-                    if jam_event:
-                        jam_row = [''] * len(column_headers)
-                        jam_row[0] = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S.%f")[:-3]
-                        jam_row[ev_idx_hdr] = "JAM"
-                        jam_row[dn_idx_hdr] = dn
-                        sheet.append_row(jam_row)
-                        self.log_queue.put(f"Logged JAM event for {port_identifier}")
-                        jam_event = False
-                    last_send = now
-                time.sleep(0.1)
-        except Exception as e:
-            self.log_queue.put(f"Error reading from {ser.port}: {e}")
-        finally:
-            try: ser.close()
-            except: pass
-            self.log_queue.put(f"Closed serial port {ser.port}")
-            if port_identifier in self.port_threads:
-                del self.port_threads[port_identifier]
-            self.log_queue.put(f"Logging ended for {port_identifier}")
-
-    def record_video(self, port_identifier):
-        ci = self.port_to_camera_index.get(port_identifier)
-        dn = self.port_to_device_number.get(port_identifier, 'unknown')
-        if ci is None or ci not in self.camera_objects:
-            self.log_queue.put(f"No camera for {port_identifier}")
+            self.service.run("stopped", "stop", timeout=300)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
             return
-        cam = self.camera_objects[ci]
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe = re.sub(r'[<>:"/\\|?*]', '_', os.path.basename(port_identifier))
-        path = os.path.join(self.experiment_folder, f"Device_{dn}")
-        os.makedirs(path, exist_ok=True)
-        fname = os.path.join(path, f"{safe}_device_{dn}_camera_{ts}.avi")
-        fw = int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
-        fh = int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        if fw==0 or fh==0:
-            self.log_queue.put(f"Camera {ci} no frames.")
-            with self.recording_locks[port_identifier]:
-                self.recording_states[port_identifier] = False
-                self.last_event_times[port_identifier] = None
-            return
-        out = cv2.VideoWriter(fname, cv2.VideoWriter_fourcc(*'XVID'), 20.0, (fw, fh))
-        try:
-            while True:
-                with self.recording_locks[port_identifier]:
-                    let = self.last_event_times[port_identifier]
-                if let is None: break
-                elapsed = (datetime.datetime.now() - let).total_seconds()
-                maxd = 30 if self.video_trigger.get()!="All" else 60
-                if elapsed > maxd: break
-                ret, frame = cam.read()
-                if not ret:
-                    self.log_queue.put(f"Failed read frame {ci}")
-                    break
-                out.write(frame)
-                time.sleep(0.05)
-        finally:
-            out.release()
-            with self.recording_locks[port_identifier]:
-                self.recording_states[port_identifier] = False
-                self.last_event_times[port_identifier] = None
-            self.log_queue.put(f"Video saved: {fname}")
-
-    def stop_logging(self):
-        self.stop_event.set()
-        self.logging_active = False
+        self.stopping = True
+        self.stop_button.config(state='disabled')
         self.log_queue.put("Stopping logging...")
-        # hide indicator
-        self.canvas.itemconfig(self.recording_circle, fill="red")
-        self.canvas.itemconfig(self.recording_label, text="OFF", fill="red")
-        # enable inputs
-        self.experimenter_entry.config(state='normal')
-        self.experiment_entry.config(state='normal')
-        self.json_entry.config(state='normal')
-        self.spreadsheet_entry.config(state='normal')
-        self.browse_json_button.config(state='normal')
-        self.browse_button.config(state='normal')
-        self.start_button.config(state='normal')
-        self.video_trigger_menu.config(state='normal')
-        self.mode_menu.config(state='normal')
-        self.set_mode_button.config(state='normal')
-        self.identify_devices_button.config(state='normal')
-        self.sync_time_button.config(state='normal')
-        for wd in self.port_widgets.values():
-            wd['camera_combobox'].config(state='normal')
-            wd['test_cam_button'].config(state='normal')
-        threading.Thread(target=self._join_threads_and_save, daemon=True).start()
-
-    def _join_threads_and_save(self):
-        for port, t in list(self.port_threads.items()):
-            t.join()
-            self.log_queue.put(f"Logging thread for {port} stopped.")
-            del self.port_threads[port]
-        self.save_all_data()
-        self.data_saved = True
-        for cam in self.camera_objects.values():
-            cam.release()
-        for ser in self.port_to_serial.values():
-            if ser.is_open:
-                ser.close()
-        self.port_to_serial.clear()
-        self.root.after(0, self._finalize_exit)
-
-    def _finalize_exit(self):
-        messagebox.showinfo("Data Saved", "All data and videos have been saved locally.")
-        self.root.destroy()
 
-    def save_all_data(self):
-        if not self.save_path:
-            self.log_queue.put("No save path.")
+    def on_stopped(self, result, error):
+        self.stopping = False
+        self.stop_button.config(state='normal')
+        if error is not None:
+            messagebox.showerror("Error", error)
             return
-        for port, rows in self.data_to_save.items():
-            if not rows: continue
-            safe = re.sub(r'[<>:"/\\|?*]', '_', os.path.basename(port))
-            dn = self.port_to_device_number.get(port, "unknown")
-            fname = os.path.join(
-                self.experiment_folder,
-                f"{safe}_device_{dn}_{datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.csv"
-            )
-            try:
-                with open(fname, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(column_headers)
-                    writer.writerows(rows)
-                self.log_queue.put(f"Saved data for {port} -> {fname}")
-            except Exception as e:
-                self.log_queue.put(f"Failed save for {port}: {e}")
+        self.show_stopped()
+        messagebox.showinfo("Data Saved", "All data and videos have been saved locally.")
+        self.detach()
+
+    def handle_push(self, message):
+        kind = message["push"]
+        port = message.get("port")
+        if kind == "log":
+            if port is None:
+                self.log_queue.put(message["text"])
+            else:
+                self.port_queues[port].put(message["text"])
+        elif kind == "port":
+            self.initialize_port_widgets(port)
+        elif kind == "status":
+            self.set_port_status(port, message["text"], message["color"])
+        elif kind == "mode":
+            self.port_widgets[port]['mode_label'].config(text=f"Mode: {message['text']}")
+        elif kind == "indicator":
+            self.trigger_indicator(port)
+        elif kind == "stats":
+            self.update_stats_labels(message["stats"])
+        elif kind == "session":
+            if message["logging"]:
+                self.show_session(message["session"])
+            elif self.logging_active and not self.stopping:
+                # Stopped from another client
+                self.show_stopped()
 
     def update_gui(self):
+        for item in self.service.poll():
+            kind = item[0]
+            if kind == "push":
+                self.handle_push(item[1])
+            elif kind == "attached":
+                self.on_attached(item[1])
+            elif kind == "attach_failed":
+                self.on_attach_failed(*item[1:])
+            elif kind == "lost":
+                self.log_queue.put("Lost connection to the acquisition service.")
+            elif kind == "started":
+                self.on_started(*item[1:])
+            elif kind == "stopped":
+                self.on_stopped(*item[1:])
+            if self.closed:
+                return
         for port, q in list(self.port_queues.items()):
             try:
                 while True:
-                    msg = q.get_nowait()
-                    if msg == "RIGHT_POKE":
-                        self.trigger_indicator(port)
-                    else:
-                        if port in self.port_widgets:
-                            tw = self.port_widgets[port]['text_widget']
-                            tw.insert(tk.END, msg + "\n")
-                            tw.see(tk.END)
+                    self.renderer.write(self.port_widgets[port]['text_widget'], q.get_nowait())
             except queue.Empty:
                 pass
+        stamp = datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')
         try:
             while True:
                 lm = self.log_queue.get_nowait()
-                self.log_text.insert(tk.END, f"{datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')}: {lm}\n")
-                self.log_text.see(tk.END)
+                self.renderer.write(self.log_text, f"{stamp}: {lm}")
         except queue.Empty:
             pass
 
-        if time.time() - self.last_device_check_time >= 5:
-            self.check_device_connections()
-            self.last_device_check_time = time.time()
-
-        self.root.after(100, self.update_gui)
-
-    def check_device_connections(self):
-        current = set(self.detect_serial_ports())
-        # removed
-        for port in list(self.serial_ports):
-            if port not in current:
-                if port in self.port_widgets:
-                    self.port_widgets[port]['status_label'].config(text="Not Ready", foreground="red")
-                self.log_queue.put(f"Device on {port} disconnected.")
-                self.serial_ports.remove(port)
-                if port in self.port_threads: del self.port_threads[port]
-                if port in self.identification_threads:
-                    self.identification_stop_events[port].set()
-                    self.identification_threads[port].join()
-                    del self.identification_threads[port]
-                    del self.identification_stop_events[port]
-        for port in current:
-            if port not in self.serial_ports:
-                self.serial_ports.add(port)
-                idx = len(self.port_widgets)
-                self.initialize_port_widgets(port, idx)
-                self.start_identification_thread(port)
-                if self.logging_active and port in self.port_to_device_number:
-                    self.start_logging_for_port(port)
-            else:
-                st = self.port_widgets[port]['status_label'].cget("text")
-                if "Not Ready" in st:
-                    self.port_widgets[port]['status_label'].config(text="Ready", foreground="green")
-                    if self.logging_active and port in self.port_to_device_number:
-                        self.start_logging_for_port(port)
+        self.root.after(self.renderer.flush(), self.update_gui)
 
-    def trigger_indicator(self, port_identifier):
-        if port_identifier not in self.port_widgets:
-            return
-        cvs = self.port_widgets[port_identifier]['indicator_canvas']
-        circ = self.port_widgets[port_identifier]['indicator_circle']
-        def blink(times):
-            if times > 0:
-                cur = cvs.itemcget(circ, 'fill')
-                nxt = 'red' if cur == 'gray' else 'gray'
-                cvs.itemconfig(circ, fill=nxt)
-                self.root.after(250, lambda: blink(times - 1))
-            else:
-                cvs.itemconfig(circ, fill='gray')
-        blink(6)
+    def set_port_status(self, port, text, foreground):
+        if port in self.port_widgets:
+            label = self.port_widgets[port]['status_label']
+            if label.cget("text") != text:
+                label.config(text=text, foreground=foreground)
 
-    def get_or_create_worksheet(self, spreadsheet, title):
-        try:
-            return spreadsheet.worksheet(title)
-        except gspread.exceptions.WorksheetNotFound:
-            ws = spreadsheet.add_worksheet(title=title, rows="1000", cols="20")
-            ws.append_row(column_headers)
-            return ws
+    def update_stats_labels(self, stats):
+        for port, port_stats in stats.items():
+            if port in self.port_widgets:
+                self.port_widgets[port]['stats_label'].config(text=session_stats.label(port_stats))
 
-    def on_closing(self):
-        if not self.data_saved:
-            self.stop_identification_threads()
-            self.stop_event.set()
-            self.logging_active = False
-            for t in list(self.identification_threads.values()): t.join()
-            for t in list(self.port_threads.values()): t.join()
-            self.save_all_data()
-            for cam in self.camera_objects.values(): cam.release()
-            for ser in self.port_to_serial.values():
-                if ser.is_open: ser.close()
+    def trigger_indicator(self, port_identifier):
+        self.indicators.trigger(port_identifier)
+
+    def detach(self):
+        self.closed = True
+        self.service.close()
+        self.root.quit()
         self.root.destroy()
 
-    def validate_data(self, data_list):
-        try:
-            for hdr, val in zip(column_headers[1:], data_list):
-                if hdr in ["Temp","Humidity","Battery_Voltage","Motor_Turns",
-                           "Left_Poke_Count","Right_Poke_Count","Pellet_Count",
-                           "Block_Pellet_Count","Retrieval_Time","InterPelletInterval","Poke_Time"]:
-                    if val.strip():
-                        float(val.strip())
-            return True
-        except:
-            return False
+    def on_closing(self):
+        if self.logging_active:
+            answer = messagebox.askyesnocancel(
+                "Quit",
+                "Logging is active. Do you want to stop and exit?\n\n"
+                "Yes: stop the experiment and save.\n"
+                "No: close this window and keep recording in the background.")
+            if answer:
+                self.stop_logging()
+            elif answer is False:
+                self.detach()
+        else:
+            self.detach()
 
 def main():
     splash_root = tk.Tk()
@@ -7,19 +7,23 @@
 #!/usr/bin/env python3
 import os
 import sys
-import RPi.GPIO as GPIO
-import serial
-import threading
 import datetime
-import time
 import logging
-import re
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import queue
-import csv
 import webbrowser
 
+# Shared acquisition helpers live next to the app folders in scripts/rtfed_core
+try:
+    _APP_DIR = os.path.dirname(os.path.abspath(__file__))
+except NameError:  # running inside the notebook
+    _APP_DIR = os.getcwd()
+sys.path.insert(0, os.path.dirname(_APP_DIR))
+from rtfed_core import ipc, session_stats, ttl_service
+from rtfed_core.gui_render import IndicatorAnimator, LogRenderer
+from rtfed_core.service_client import ServiceLink
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,187 +31,9 @@ logging.basicConfig(
     stream=sys.stdout
 )
 
-# Setup GPIO pins on the Raspberry Pi (BCM mode)
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
-
-# Define GPIO pins for each device (fixed mapping by port)
-gpio_pins_per_device = {
-    'Port 1': {"LeftPoke": 17, "RightPoke": 27, "Pellet": 22},
-    'Port 2': {"LeftPoke": 10, "RightPoke": 9,  "Pellet": 11},
-    'Port 3': {"LeftPoke": 0,  "RightPoke": 5,  "Pellet": 6},
-    'Port 4': {"LeftPoke": 13, "RightPoke": 19, "Pellet": 26},
-    'Port 5': {"LeftPoke": 14, "RightPoke": 15, "Pellet": 18},
-    'Port 6': {"LeftPoke": 23, "RightPoke": 24, "Pellet": 25},
-    'Port 7': {"LeftPoke": 8,  "RightPoke": 7,  "Pellet": 1},
-    'Port 8': {"LeftPoke": 12, "RightPoke": 16, "Pellet": 20},
-}
-
-# Set all pins as output and initially LOW
-for device_pins in gpio_pins_per_device.values():
-    for pin in device_pins.values():
-        GPIO.setup(pin, GPIO.OUT)
-        GPIO.output(pin, GPIO.LOW)
-
-# Global threading and data storage variables
-pellet_lock = threading.Lock()
-pellet_in_well = {}
-stop_event = threading.Event()
-
-column_headers = [
-    "Timestamp", "Temp", "Humidity", "Library_Version", "Session_type",
-    "Device_Number", "Battery_Voltage", "Motor_Turns", "FR", "Event", "Active_Poke",
-    "Left_Poke_Count", "Right_Poke_Count", "Pellet_Count", "Block_Pellet_Count",
-    "Retrieval_Time", "InterPelletInterval", "Poke_Time","PelletsOrTrialToSwitch", "Prob_left", "Prob_right", "High_prob_poke" 
-]
-
-# Global known devices dictionary maps serial port path to a fixed port identifier (e.g. "Port 1")
-known_devices = {}
-port_names = [f"Port {i}" for i in range(1, 9)]
-
-def send_ttl_signal(pin):
-    GPIO.output(pin, GPIO.HIGH)
-    time.sleep(0.1)
-    GPIO.output(pin, GPIO.LOW)
-
-def handle_pellet_event(event_type, port_identifier, gpio_pins, q):
-    global pellet_in_well
-    with pellet_lock:
-        if port_identifier not in pellet_in_well:
-            pellet_in_well[port_identifier] = False
-        etype = event_type.strip().lower()
-        if etype == "pellet":
-            if pellet_in_well[port_identifier]:
-                GPIO.output(gpio_pins["Pellet"], GPIO.LOW)
-                q.put("Pellet taken, signal turned OFF.")
-                pellet_in_well[port_identifier] = False
-                send_ttl_signal(gpio_pins["Pellet"])
-                q.put(f"TTL signal sent on {port_identifier} for {event_type}")
-            else:
-                q.put("No pellet was in the well, no signal for pellet taken.")
-        elif etype == "pelletinwell":
-            GPIO.output(gpio_pins["Pellet"], GPIO.HIGH)
-            pellet_in_well[port_identifier] = True
-            q.put("Pellet dispensed in well, signal ON.")
-
-def process_event(event_type, port_identifier, gpio_pins, q, app):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    q.put(f"[{timestamp}] {port_identifier} - Event: {event_type}")
-    etype = event_type.strip().lower()
-    if etype == "left":
-        send_ttl_signal(gpio_pins["LeftPoke"])
-        q.put(f"TTL signal sent on {port_identifier} for {event_type}")
-    elif etype == "right":
-        send_ttl_signal(gpio_pins["RightPoke"])
-        q.put(f"TTL signal sent on {port_identifier} for {event_type}")
-    elif etype in ["leftwithpellet", "rightwithpellet"]:
-        send_ttl_signal(gpio_pins["LeftPoke"] if etype.startswith("left") else gpio_pins["RightPoke"])
-        q.put(f"TTL signal sent on {port_identifier} for {event_type}")
-    elif etype in ["pellet", "pelletinwell"]:
-        handle_pellet_event(event_type, port_identifier, gpio_pins, q)
-    if etype in ["left", "right", "pellet", "pelletinwell", "leftwithpellet", "rightwithpellet"]:
-        app.trigger_indicator(port_identifier)
-
-def get_current_serial_devices():
-    by_path_dir = '/dev/serial/by-path/'
-    if not os.path.exists(by_path_dir):
-        return []
-    serial_devices = []
-    for symlink in os.listdir(by_path_dir):
-        symlink_path = os.path.join(by_path_dir, symlink)
-        serial_port = os.path.realpath(symlink_path)
-        if 'ttyACM' in serial_port or 'ttyUSB' in serial_port:
-            serial_devices.append(serial_port)
-    serial_devices.sort()
-    return serial_devices
-
-def get_device_mappings_by_usb_port():
-    # Return mappings for only known devices that are currently connected.
-    device_mappings = []
-    for dev in get_current_serial_devices():
-        if dev in known_devices:
-            device_mappings.append({
-                'serial_port': dev,
-                'port_identifier': known_devices[dev]
-            })
-    return device_mappings
-
-def read_from_fed(serial_port, port_identifier, gpio_pins, q, status_label, app):
-    try:
-        ser = serial.Serial(serial_port, 115200, timeout=1)
-        app.port_serial_objects[port_identifier] = ser  # store for time sync
-        q.put("Ready")
-        status_label.config(text="Connected", foreground="green")
-        while not stop_event.is_set():
-            try:
-                line = ser.readline().decode('utf-8', errors='replace').strip()
-            except serial.SerialException:
-                q.put(f"Device on {port_identifier} disconnected.")
-                status_label.config(text="Not Connected", foreground="red")
-                break
-            # Handle time sync responses
-            if port_identifier in app.time_sync_commands and app.time_sync_commands[port_identifier][0] == 'pending':
-                start_t = app.time_sync_commands[port_identifier][1]
-                if line == "TIME_SET_OK":
-                    q.put(f"Time synced for device on {port_identifier}.")
-                    app.time_sync_commands[port_identifier] = ('done', time.time())
-                    continue
-                elif line == "TIME_SET_FAIL":
-                    q.put(f"Time sync command on {port_identifier} received failure.")
-                    app.time_sync_commands[port_identifier] = ('done', time.time())
-                    continue
-                elif time.time() - start_t > 2.0:
-                    q.put(f"Time sync command on {port_identifier} timed out.")
-                    app.time_sync_commands[port_identifier] = ('done', time.time())
-            if line:
-                data_list = line.split(",")
-                q.put(f"{port_identifier} raw data: {data_list}")
-                if len(data_list) >= 10:
-                    event_type = data_list[9].strip()
-                    data_list[0] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-                    process_event(event_type, port_identifier, gpio_pins, q, app)
-                    q.put(data_list)
-                    app.data_to_save.setdefault(port_identifier, []).append(data_list)
-            time.sleep(0.1)
-    except serial.SerialException:
-        q.put(f"Error opening serial port: {serial_port}")
-        status_label.config(text="Not Connected", foreground="red")
-    finally:
-        if 'ser' in locals() and ser.is_open:
-            ser.close()
-        if port_identifier in app.port_serial_objects:
-            del app.port_serial_objects[port_identifier]
-        q.put(f"Stopped reading from {port_identifier}")
-
-def identification_thread(serial_port, port_identifier, q, status_label, app, local_stop_event):
-    try:
-        ser = serial.Serial(serial_port, 115200, timeout=0.1)
-        status_label.config(text="Connected", foreground="violet")
-        while not local_stop_event.is_set():
-            try:
-                line = ser.readline().decode('utf-8', errors='replace').strip()
-                if line:
-                    data_list = line.split(",")
-                    # Look for a CSV response with device identification (assumes FED number in index 5)
-                    if len(data_list) >= 6 and "TRIGGER_POKE" not in line:
-                        device_number = data_list[5].strip()
-                        if device_number:
-                            q.put(f"Identified device FED number {device_number} on {port_identifier}")
-                            # Do not override the fixed port mapping; update label only.
-                            status_label.config(text=f"{port_identifier} (FED {device_number})", foreground="green")
-                            break
-                    if len(data_list) >= 10:
-                        event_type = data_list[9].strip()
-                        if event_type.strip().lower() in ["right", "pellet", "left"]:
-                            app.trigger_indicator(port_identifier)
-            except serial.SerialException:
-                status_label.config(text="Not Connected", foreground="red")
-                break
-    except serial.SerialException:
-        status_label.config(text="Not Connected", foreground="red")
-    finally:
-        if 'ser' in locals() and ser.is_open:
-            ser.close()
+# Serial ports, TTL output and data files are owned by the acquisition service
+# (rtfed_core/ttl_service.py). This window is a client: it can be closed and
+# reopened while an experiment records without touching capture or TTL timing.
 
 class SplashScreen:
     def __init__(self, root, duration=3000):
@@ -230,17 +56,17 @@ class FED3MonitorApp:
         self.root.geometry("1200x800")
         self.port_widgets = {}
         self.port_queues = {}
+        self.renderer = LogRenderer("RTFED(PiTTL)")
+        self.indicators = IndicatorAnimator(self.root)
         self.experimenter_name = tk.StringVar()
         self.experiment_name = tk.StringVar()
         self.save_path = ""
         self.flat_data_path = ""
-        self.data_to_save = {}
-        self.threads = []
-        self.connected_ports = []
-        self.serial_ports = {}  # Mapping: port_identifier -> serial port path
+        self.service = ServiceLink("rtfed_core.ttl_service", ttl_service.socket_path(), "rtfed-ttl")
+        self.first_attach = True
+        self.stopping = False
+        self.closed = False
         self.logging_active = False
-        self.last_device_check_time = time.time()
-        self.time_sync_commands = {}  # Mapping: port_identifier -> (status, timestamp)
         #######mode‐selection################ ADD EXTRA MODES HERE, ALSO DEFINE IT IN THE FED3 RTS FIRMWARE, Hamid May 2025
         self.mode_var = tk.StringVar(value="Select Mode")
         self.mode_options = [
@@ -250,13 +76,8 @@ class FED3MonitorApp:
             "10 - Self-Stim (Reversed)", "11 - Timed Feeding", "12 - ClosedEconomy_PR2", "13 - Probabilistic Reversal", "14 - Bandit8020", "15 - DetBandit"
         ]
 
-        self.port_serial_objects = {}  # Mapping: port_identifier -> serial.Serial instance
         self.session_start_time = None
         self.session_timer_text = None
-        self.identification_threads = {}
-        self.identification_stop_events = {}
-        self.stop_event = stop_event
-        self.perform_initial_device_mapping()
         self.mainframe = ttk.Frame(self.root)
         self.mainframe.grid_rowconfigure(2, weight=0)
         self.mainframe.grid_columnconfigure(0, weight=1)
@@ -265,35 +86,53 @@ class FED3MonitorApp:
         self.mainframe.grid(column=0, row=0, sticky=(tk.N, tk.W, tk.E, tk.S))
         self.root.grid_rowconfigure(0, weight=1)
         self.root.grid_columnconfigure(0, weight=1)
-      
+
         self.root.grid_rowconfigure(1, weight=0)
-        
+
         footer = ttk.Frame(self.root)
         footer.grid(row=1, column=0, sticky="we")
-        
+
         footer_label = tk.Label(footer, text="© 2025 McCutcheonlab | UiT | Norway", font=("Cascadia Code", 10), fg="black")
         footer_label.pack(pady=5)
-        
+
         hyperlink_label = tk.Label(footer, text="Developed by Hamid Taghipourbibalan", font=("Cascadia Code", 10, "italic"), fg="blue", cursor="hand2")
         hyperlink_label.pack(pady=0)
         hyperlink_label.bind("<Button-1>", lambda e: webbrowser.open_new("https://www.linkedin.com/in/hamid-taghipourbibalan-b7239088/"))
 
         self.create_layout()
-        self.check_connected_devices()
-        self.start_identification_threads_for_connected()
-        self.root.after(500, self.show_port_mapping_message)
         self.update_gui()
-        self.root.after(5000, self.refresh_device_status)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-
-    def perform_initial_device_mapping(self):
-        serial_devices = get_current_serial_devices()
-        i = 0
-        for dev in serial_devices:
-            if dev not in known_devices and i < len(port_names):
-                known_devices[dev] = port_names[i]
-                i += 1
+    def on_attach_failed(self, message, fatal):
+        self.renderer.write(self.log_text, message)
+        if fatal:
+            messagebox.showerror("Acquisition service", f"{message}\n\nFix the problem and restart the app; "
+                                                        "the service is not started again automatically.")
+        self.after_first_attach()
+
+    def after_first_attach(self):
+        if self.first_attach:
+            self.first_attach = False
+            if not self.logging_active:
+                self.root.after(500, self.show_port_mapping_message)
+
+    def on_attached(self, state):
+        for port_identifier, lines in state["history"].items():
+            q = self.port_queues.get(port_identifier)
+            if q is not None:
+                for line in lines:
+                    q.put(line)
+        for port_identifier, (text, color) in state["status"].items():
+            if port_identifier in self.port_widgets:
+                self.port_widgets[port_identifier]['status_label'].config(text=text, foreground=color)
+        self.update_latency_labels(state["latency"])
+        self.update_stats_labels(state["stats"])
+        self.renderer.write(self.log_text, f"Attached to acquisition service (pid {state['pid']}, GPIO: {state['gpio']})")
+        if state["logging"]:
+            self.show_session(state["session"])
+        elif self.logging_active and not self.stopping:
+            self.show_stopped()  # the session ended while this window was detached
+        self.after_first_attach()
 
     def show_port_mapping_message(self):
         message = (
@@ -312,42 +151,18 @@ class FED3MonitorApp:
             "Port 6: Left=23, Right=24, Pellet=25\n"
             "Port 7: Left=8,  Right=7,  Pellet=1\n"
             "Port 8: Left=12, Right=16, Pellet=20\n"
+            "\n8) Recording runs in a background service: closing this window during an experiment can leave it recording, and reopening the app attaches to it again.\n"
+            "\n9) The log boxes keep their latest lines; right-click a box to load older ones.\n"
         )
         messagebox.showinfo("Port Assignment & GPIO Pins", message)
 
-    def identify_single_port(self, port_identifier):
-        """Trigger a poke and read back the device_number for just this port."""
-        # find its serial path
-        mapping = next((m for m in get_device_mappings_by_usb_port()
-                        if m['port_identifier']==port_identifier), None)
-        if not mapping:
-            self.port_queues[port_identifier].put("Port not currently mapped!")
-            return
-    
-        serial_port = mapping['serial_port']
-        q = self.port_queues[port_identifier]
-        q.put("🔎 Re-identifying port...")
+    def send_command(self, cmd, timeout=None, **args):
+        """Run a service command; errors are shown to the user and None is returned."""
         try:
-            with serial.Serial(serial_port, 115200, timeout=1) as ser:
-                ser.write(b'TRIGGER_POKE\n')
-                start = time.time()
-                device_number = None
-                while time.time() - start < 3:
-                    line = ser.readline().decode('utf-8', errors='replace').strip()
-                    if line and "," in line:
-                        parts = line.split(",")
-                        if len(parts) >= 6:
-                            device_number = parts[5].strip()
-                            break
-                if device_number:
-                    q.put(f"Port {port_identifier} is FED #{device_number}")
-                    self.port_widgets[port_identifier]['status_label']\
-                        .config(text=f"{port_identifier} (FED {device_number})", foreground="green")
-                else:
-                    q.put("⚠️ No device_number received.")
-        except Exception as e:
-            q.put(f"Error re-identifying {port_identifier}: {e}")
-
+            return self.service.call(cmd, timeout=timeout, **args)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
+            return None
 
     def set_device_mode(self):
         sel = self.mode_var.get()
@@ -355,54 +170,15 @@ class FED3MonitorApp:
             messagebox.showerror("Error", "Please select a valid mode.")
             return
         mode_num = int(sel.split(" - ")[0])
-    
+
         # get a sorted list of checked ports (Port 1, Port 2, …)
         checked = [pid for pid, pw in self.port_widgets.items()
                    if pw['selected_var'].get()]
         if not checked:
             messagebox.showerror("Error", "Check at least one 'Apply Mode' box.")
             return
-    
-        # sort by numeric suffix
-        checked.sort(key=lambda p: int(p.split()[1]))
-    
-        for pid in checked:
-            # 1) send SET_MODE
-            mapping = next((m for m in get_device_mappings_by_usb_port()
-                            if m['port_identifier']==pid), None)
-            if not mapping:
-                self.port_queues[pid].put("Port not found on USB!")
-                continue
-    
-            serial_port = mapping['serial_port']
-            q = self.port_queues[pid]
-            q.put(f"➡️ Setting mode {mode_num} on {pid}…")
-            try:
-                with serial.Serial(serial_port, 115200, timeout=2) as ser:
-                    ser.write(f"SET_MODE:{mode_num}\n".encode())
-                    start = time.time()
-                    ok = False
-                    while time.time() - start < 3:
-                        resp = ser.readline().decode().strip()
-                        if resp == "MODE_SET_OK":
-                            q.put("✅ Mode set OK; rebooting…")
-                            ok = True
-                            break
-                        if resp == "MODE_SET_FAIL":
-                            q.put("❌ Mode set FAILED")
-                            break
-                    if not ok:
-                        q.put("⚠️ No confirmation, assuming reboot anyway.")
-            except Exception as e:
-                q.put(f"Error sending SET_MODE to {pid}: {e}")
-    
-            # 2) wait for that one FED3 to reboot & re-enumerate
-            time.sleep(5)   # adjust as needed for your reboot time
-    
-            # 3) re-identify so we know which tty now maps to this pid
-            self.identify_single_port(pid)
-
-
+        # The service sets them one after the other, waiting for each reboot
+        self.send_command("set_mode", mode=mode_num, ports=checked)
 
     def create_layout(self):
         ports_frame = ttk.Frame(self.mainframe)
@@ -434,7 +210,7 @@ class FED3MonitorApp:
         identify_button.grid(column=0, row=4, columnspan=2, sticky="we", pady=5)
         sync_button = tk.Button(controls_frame, text="Sync Clock", font=("Cascadia Code", 12, "bold"), bg="blue", fg="white", command=self.sync_all_device_times)
         sync_button.grid(column=0, row=5, columnspan=2, sticky="we", pady=5)
-        
+
         tk.Label(controls_frame, text="Mode:", font=("Cascadia Code", 12, "bold")
                 ).grid(column=0, row=6, sticky=tk.W, pady=5)
         self.mode_menu = ttk.Combobox(
@@ -445,7 +221,7 @@ class FED3MonitorApp:
             state="readonly"
         )
         self.mode_menu.grid(column=1, row=6, sticky=tk.W, pady=5)
-        
+
         self.set_mode_button = tk.Button(
             controls_frame,
             text="Set Mode",
@@ -457,8 +233,8 @@ class FED3MonitorApp:
         self.set_mode_button.grid(column=0, row=7, columnspan=2, sticky="we", pady=5)
 
 
-        
-                
+
+
         self.start_button = tk.Button(controls_frame, text="START", font=("Cascadia Code", 12, "bold"), bg="green", fg="white", command=self.start_experiment)
         self.start_button.grid(column=0, row=8, columnspan=2, sticky="we", pady=10)
         self.stop_button = tk.Button(controls_frame, text="STOP & SAVE", font=("Cascadia Code", 12, "bold"), bg="red", fg="white", command=self.stop_experiment)
@@ -475,7 +251,8 @@ class FED3MonitorApp:
         log_scrollbar = ttk.Scrollbar(log_frame, orient="vertical", command=self.log_text.yview)
         log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.log_text.configure(yscrollcommand=log_scrollbar.set)
-        
+        self.renderer.add_view(self.log_text, "session-log", capacity=2000)
+
 
     def setup_port(self, parent, port_name, r, c):
         frame = ttk.LabelFrame(parent, text=port_name, padding="3")
@@ -485,11 +262,19 @@ class FED3MonitorApp:
         indicator_canvas = tk.Canvas(frame, width=20, height=20)
         indicator_canvas.grid(column=1, row=0, padx=5)
         indicator_circle = indicator_canvas.create_oval(5, 5, 15, 15, fill="gray")
+        self.indicators.add(port_name, indicator_canvas, indicator_circle)
         text_widget = tk.Text(frame, width=40, height=6, wrap=tk.WORD, font=("Cascadia Code", 9))
         text_widget.grid(column=0, row=1, columnspan=2, sticky=(tk.N, tk.S, tk.E, tk.W))
+        self.renderer.add_view(text_widget, port_name)
+        latency_label = ttk.Label(frame, text="TTL delay p50/p99/max: -", font=("Cascadia Code", 9))
+        latency_label.grid(column=0, row=3, columnspan=2, sticky=tk.W)
+        stats_label = ttk.Label(frame, text="", font=("Cascadia Code", 9), justify=tk.LEFT)
+        stats_label.grid(column=0, row=4, columnspan=2, sticky=tk.W)
         self.port_widgets[port_name] = {
             'status_label': status_label,
             'text_widget': text_widget,
+            'latency_label': latency_label,
+            'stats_label': stats_label,
             'indicator_canvas': indicator_canvas,
             'indicator_circle': indicator_circle
         }
@@ -513,33 +298,6 @@ class FED3MonitorApp:
     def browse_flat_folder(self):
         self.flat_data_path = filedialog.askdirectory(title="Select Flat Data Folder")
 
-    def check_connected_devices(self):
-        device_mappings = get_device_mappings_by_usb_port()
-        current_ports = [m['port_identifier'] for m in device_mappings]
-        for m in device_mappings:
-            port_identifier = m['port_identifier']
-            if port_identifier not in self.connected_ports:
-                self.connected_ports.append(port_identifier)
-            self.port_widgets[port_identifier]['status_label'].config(text="Connected", foreground="green")
-            if self.logging_active and port_identifier not in self.serial_ports:
-                logging.info(f"Device {port_identifier} reconnected during experiment, restarting logging thread.")
-                self.start_logging_for_port(m['serial_port'], port_identifier)
-        for port_name in list(self.connected_ports):
-            if port_name not in current_ports:
-                self.connected_ports.remove(port_name)
-                self.port_widgets[port_name]['status_label'].config(text="Not Connected", foreground="red")
-                if port_name in self.serial_ports:
-                    del self.serial_ports[port_name]
-                if port_name in self.identification_threads:
-                    self.identification_stop_events[port_name].set()
-                    self.identification_threads[port_name].join()
-                    del self.identification_threads[port_name]
-                    del self.identification_stop_events[port_name]
-
-    def refresh_device_status(self):
-        self.check_connected_devices()
-        self.root.after(5000, self.refresh_device_status)
-
     def display_recording_indicator(self):
         if self.recording_circle is None:
             self.recording_circle = self.canvas.create_oval(10, 10, 50, 50, fill="red")
@@ -560,244 +318,141 @@ class FED3MonitorApp:
         if self.logging_active:
             self.root.after(1000, self.update_session_timer)
 
-    def start_identification_threads_for_connected(self):
-        device_mappings = get_device_mappings_by_usb_port()
-        for m in device_mappings:
-            port_identifier = m['port_identifier']
-            serial_port = m['serial_port']
-            if port_identifier not in self.serial_ports and port_identifier not in self.identification_threads and not self.logging_active:
-                self.start_identification_thread(serial_port, port_identifier)
-
-    def start_identification_thread(self, serial_port, port_identifier):
-        logging.info(f"Starting identification thread for {port_identifier}")
-        stop_event_local = threading.Event()
-        self.identification_stop_events[port_identifier] = stop_event_local
-        q = self.port_queues[port_identifier]
-        status_label = self.port_widgets[port_identifier]['status_label']
-        t = threading.Thread(target=identification_thread, args=(serial_port, port_identifier, q, status_label, self, stop_event_local))
-        t.daemon = True
-        t.start()
-        self.identification_threads[port_identifier] = t
-
     def identify_devices(self):
-        self.stop_identification_threads()
-        device_mappings = get_device_mappings_by_usb_port()
-        for m in device_mappings:
-            port_identifier = m['port_identifier']
-            serial_port = m['serial_port']
-            q = self.port_queues[port_identifier]
-            q.put("Triggering device identification...")
-            try:
-                with serial.Serial(serial_port, 115200, timeout=1) as ser:
-                    ser.write(b'TRIGGER_POKE\n')
-                    start_time = time.time()
-                    device_number = None
-                    while time.time() - start_time < 3:
-                        line = ser.readline().decode('utf-8', errors='replace').strip()
-                        if line:
-                            q.put(f"Received from {port_identifier}: {line}")
-                            if "," in line:
-                                data_list = line.split(",")
-                                if len(data_list) >= 6:
-                                    device_number = data_list[5].strip()
-                                    break
-                    if device_number:
-                        q.put(f"Identified device FED number {device_number} on {port_identifier}")
-                        self.port_widgets[port_identifier]['status_label'].config(text=f"{port_identifier} (FED {device_number})", foreground="green")
-                    else:
-                        q.put(f"No valid device number received from {port_identifier}.")
-            except Exception as e:
-                q.put(f"Error sending poke command to {port_identifier}: {e}")
-        self.port_queues[port_identifier].put("Identification process complete.")
-
-    def sync_all_device_times_thread(self):
-        current_time_obj = datetime.datetime.now()
-        time_str = f"SET_TIME:{current_time_obj.year},{current_time_obj.month},{current_time_obj.day},{current_time_obj.hour},{current_time_obj.minute},{current_time_obj.second}\n"
-        device_mappings = get_device_mappings_by_usb_port()
-        for m in device_mappings:
-            port_identifier = m['port_identifier']
-            serial_port = m['serial_port']
-            self.time_sync_commands[port_identifier] = ('pending', time.time())
-            if port_identifier in self.port_serial_objects:
-                ser = self.port_serial_objects[port_identifier]
-                try:
-                    ser.write(time_str.encode('utf-8'))
-                    self.port_queues[port_identifier].put(f"Sent time sync command to {port_identifier} via open connection.")
-                except Exception as e:
-                    self.port_queues[port_identifier].put(f"Failed to send time sync via open connection for {port_identifier}: {e}")
-            else:
-                try:
-                    with serial.Serial(serial_port, 115200, timeout=2) as ser_temp:
-                        ser_temp.write(time_str.encode('utf-8'))
-                        start_t = time.time()
-                        got_response = False
-                        while time.time() - start_t < 2:
-                            line = ser_temp.readline().decode('utf-8', errors='replace').strip()
-                            if line == "TIME_SET_OK":
-                                self.port_queues[port_identifier].put(f"Time synced for device on {port_identifier}.")
-                                got_response = True
-                                break
-                            elif line == "TIME_SET_FAIL":
-                                self.port_queues[port_identifier].put(f"Time sync command sent to {port_identifier}, but received failure.")
-                                got_response = True
-                                break
-                        if not got_response:
-                            self.port_queues[port_identifier].put(f"Time sync command sent to {port_identifier}, no confirmation.")
-                    self.time_sync_commands[port_identifier] = ('done', time.time())
-                except Exception as e:
-                    self.port_queues[port_identifier].put(f"Failed to sync time for {port_identifier}: {e}")
-                    self.time_sync_commands[port_identifier] = ('done', time.time())
+        self.send_command("identify")
 
     def sync_all_device_times(self):
-        threading.Thread(target=self.sync_all_device_times_thread, daemon=True).start()
+        self.send_command("sync_clock")
 
     def start_experiment(self):
-        if not self.connected_ports:
-            messagebox.showwarning("No Devices", "No FED3 devices are connected.")
-            return
         if not self.experimenter_name.get() or not self.experiment_name.get():
             messagebox.showerror("Error", "Please provide your name and experiment name.")
             return
         if not self.save_path or not self.flat_data_path:
             messagebox.showerror("Error", "Please provide both Experiment Folder and Flat Data Folder.")
             return
+        session = self.send_command("start", experimenter=self.experimenter_name.get(),
+                                    experiment=self.experiment_name.get(),
+                                    save_path=self.save_path, flat_data_path=self.flat_data_path)
+        if session is not None:
+            self.show_session(session)
+
+    def show_session(self, session):
+        # Also used when attaching to a service that is already recording
+        was_active = self.logging_active
+        self.logging_active = True
+        self.experimenter_name.set(session["experimenter"])
+        self.experiment_name.set(session["experiment"])
         self.experimenter_entry.config(state='disabled')
         self.experiment_entry.config(state='disabled')
         self.start_button.config(state='disabled')
-        self.logging_active = True
-        self.experimenter_name.set(self.experimenter_name.get().strip().lower())
-        self.experiment_name.set(self.experiment_name.get().strip().lower())
-        for p in self.port_widgets.keys():
-            self.data_to_save[p] = []
-        current_time = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        experimenter_name = re.sub(r'[<>:"/\\|?*]', '_', self.experimenter_name.get())
-        experiment_name = re.sub(r'[<>:"/\\|?*]', '_', self.experiment_name.get())
-        experimenter_folder = os.path.join(self.save_path, experimenter_name)
-        self.experiment_folder = os.path.join(experimenter_folder, f"{experiment_name}_{current_time}")
-        os.makedirs(self.experiment_folder, exist_ok=True)
-        self.stop_identification_threads()
-        device_mappings = get_device_mappings_by_usb_port()
-        for m in device_mappings:
-            port_identifier = m['port_identifier']
-            serial_port = m['serial_port']
-            self.start_logging_for_port(serial_port, port_identifier)
         self.display_recording_indicator()
-        self.session_start_time = datetime.datetime.now()
-        self.update_session_timer()
-
-    def start_logging_for_port(self, serial_port, port_identifier):
-        if port_identifier in self.serial_ports:
-            return
-        gpio_pins = gpio_pins_per_device.get(port_identifier)
-        if not gpio_pins:
-            return
-        q = self.port_queues[port_identifier]
-        status_label = self.port_widgets[port_identifier]['status_label']
-        logging.info(f"Starting logging thread for {port_identifier} on {serial_port}")
-        t = threading.Thread(target=read_from_fed, args=(serial_port, port_identifier, gpio_pins, q, status_label, self))
-        t.daemon = True
-        t.start()
-        self.threads.append(t)
-        self.serial_ports[port_identifier] = serial_port
-
-    def stop_identification_threads(self):
-        for port, event in list(self.identification_stop_events.items()):
-            event.set()
-        for port, t in list(self.identification_threads.items()):
-            t.join()
-            del self.identification_threads[port]
-            del self.identification_stop_events[port]
+        self.session_start_time = datetime.datetime.fromtimestamp(session["start"])
+        if not was_active:
+            self.update_session_timer()
+
+    def handle_push(self, message):
+        kind = message["push"]
+        port_identifier = message.get("port")
+        if kind == "log":
+            self.port_queues[port_identifier].put(message["text"])
+        elif kind == "event":
+            event = message["event"]
+            self.port_queues[port_identifier].put(f"[{event['time']}] {port_identifier} - Event: {event['event']}")
+        elif kind == "status":
+            self.port_widgets[port_identifier]['status_label'].config(text=message["text"], foreground=message["color"])
+        elif kind == "indicator":
+            self.trigger_indicator(port_identifier)
+        elif kind == "latency":
+            self.update_latency_labels(message["labels"])
+        elif kind == "stats":
+            self.update_stats_labels(message["stats"])
+        elif kind == "session":
+            if message["logging"]:
+                self.show_session(message["session"])
+            elif self.logging_active and not self.stopping:
+                # Stopped from another client
+                self.show_stopped()
+                self.renderer.write(self.log_text, f"Experiment stopped; data saved in {message['session'].get('experiment_folder')}")
+
+    def show_stopped(self):
+        self.logging_active = False
+        self.session_start_time = None
+        self.hide_recording_indicator()
+        self.experimenter_entry.config(state='normal')
+        self.experiment_entry.config(state='normal')
+        self.start_button.config(state='normal')
 
     def update_gui(self):
+        for item in self.service.poll():
+            kind = item[0]
+            if kind == "push":
+                self.handle_push(item[1])
+            elif kind == "attached":
+                self.on_attached(item[1])
+            elif kind == "attach_failed":
+                self.on_attach_failed(*item[1:])
+            elif kind == "lost":
+                self.renderer.write(self.log_text, "Lost connection to the acquisition service.")
+            elif kind == "stopped":
+                self.on_stopped(*item[1:])
+            if self.closed:
+                return
+        # Queue lines only; the renderer writes each widget once per tick
+        stamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         for port_identifier, q in self.port_queues.items():
+            text_widget = self.port_widgets[port_identifier]['text_widget']
             try:
                 while True:
                     message = q.get_nowait()
-                    if isinstance(message, list):
-                        #self.data_to_save[port_identifier].append(message)
-                        continue
-                    elif message == "Ready":
-                        self.port_widgets[port_identifier]['status_label'].config(text="Connected", foreground="green")
-                    else:
-                        text_widget = self.port_widgets[port_identifier]['text_widget']
-                        text_widget.insert(tk.END, message + "\n")
-                        text_widget.see(tk.END)
-                        self.log_text.insert(tk.END, f"{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {message}\n")
-                        self.log_text.see(tk.END)
+                    self.renderer.write(text_widget, message)
+                    self.renderer.write(self.log_text, f"{stamp}: {message}")
             except queue.Empty:
                 pass
-        if time.time() - self.last_device_check_time >= 5:
-            self.check_connected_devices()
-            self.last_device_check_time = time.time()
-        self.root.after(100, self.update_gui)
+        self.root.after(self.renderer.flush(), self.update_gui)
+
+    def update_latency_labels(self, labels):
+        for port_identifier, text in labels.items():
+            if port_identifier in self.port_widgets:
+                self.port_widgets[port_identifier]['latency_label'].config(text=text)
+
+    def update_stats_labels(self, stats):
+        for port_identifier, port_stats in stats.items():
+            if port_identifier in self.port_widgets:
+                self.port_widgets[port_identifier]['stats_label'].config(text=session_stats.label(port_stats))
 
     def stop_experiment(self):
         if not self.logging_active:
-            self.root.quit()
-            self.root.destroy()
+            self.detach()
             return
-        stop_event.set()
-        for t in self.threads:
-            t.join()
-        GPIO.cleanup()
-        self.save_all_data()
-        self.save_summary()
-        self.hide_recording_indicator()
-        self.logging_active = False
+        if self.stopping:
+            return
+        # Saving happens in the service and can take minutes for large sessions; never on the Tk thread
+        try:
+            self.service.run("stopped", "stop", timeout=300)
+        except ipc.IPCError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.stopping = True
+        self.stop_button.config(state='disabled')
+        self.renderer.write(self.log_text, "Stopping the experiment and saving data...")
+
+    def on_stopped(self, result, error):
+        self.stopping = False
+        self.stop_button.config(state='normal')
+        if error is not None:
+            messagebox.showerror("Error", error)
+            return
+        self.show_stopped()
         messagebox.showinfo("Data Saved", "All data has been saved.")
+        self.detach()
+
+    def detach(self):
+        self.closed = True
+        self.service.close()
         self.root.quit()
         self.root.destroy()
 
-    def save_all_data(self):
-        for port_identifier, data_rows in self.data_to_save.items():
-            if data_rows:
-                filename_user = os.path.join(self.experiment_folder, f"{port_identifier}.csv")
-                try:
-                    with open(filename_user, mode='w', newline='') as file:
-                        writer = csv.writer(file)
-                        writer.writerow(column_headers)
-                        writer.writerows(data_rows)
-                    logging.info(f"Data saved for {port_identifier} in {filename_user}")
-                except Exception as e:
-                    logging.error(f"Failed to save data for {port_identifier}: {e}")
-                flat_filename = os.path.join(self.flat_data_path, f"{port_identifier}_{datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.csv")
-                try:
-                    with open(flat_filename, mode='w', newline='') as file:
-                        writer = csv.writer(file)
-                        writer.writerow(column_headers)
-                        writer.writerows(data_rows)
-                    logging.info(f"Flat copy saved for {port_identifier} in {flat_filename}")
-                except Exception as e:
-                    logging.error(f"Failed to save flat copy for {port_identifier}: {e}")
-            else:
-                logging.info(f"No data collected from {port_identifier}, no file saved.")
-
-    def save_summary(self):
-        for port_identifier, data_rows in self.data_to_save.items():
-            if not data_rows:
-                continue
-            left_count = right_count = pellet_count = 0
-            for row in data_rows:
-                if len(row) > 9:
-                    ev = row[9].strip().lower()
-                    if ev in ["left", "leftwithpellet"]:
-                        left_count += 1
-                    elif ev in ["right", "rightwithpellet"]:
-                        right_count += 1
-                    elif ev == "pellet":
-                        pellet_count += 1
-            summary_filename = os.path.join(self.experiment_folder, f"{port_identifier}_summary.csv")
-            try:
-                with open(summary_filename, mode='w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(["Event", "Count"])
-                    writer.writerow(["Left", left_count])
-                    writer.writerow(["Right", right_count])
-                    writer.writerow(["Pellet", pellet_count])
-                logging.info(f"Summary saved for {port_identifier} in {summary_filename}")
-            except Exception as e:
-                logging.error(f"Failed to save summary for {port_identifier}: {e}")
-
     def hide_recording_indicator(self):
         if self.recording_circle is not None:
             self.canvas.delete(self.recording_circle)
@@ -811,25 +466,20 @@ class FED3MonitorApp:
 
     def on_closing(self):
         if self.logging_active:
-            if messagebox.askokcancel("Quit", "Logging is active. Do you want to stop and exit?"):
+            answer = messagebox.askyesnocancel(
+                "Quit",
+                "Logging is active. Do you want to stop and exit?\n\n"
+                "Yes: stop the experiment and save.\n"
+                "No: close this window and keep recording in the background.")
+            if answer:
                 self.stop_experiment()
+            elif answer is False:
+                self.detach()
         else:
-            self.stop_identification_threads()
-            self.root.quit()
-            self.root.destroy()
+            self.detach()
 
     def trigger_indicator(self, port_identifier):
-        indicator_canvas = self.port_widgets[port_identifier]['indicator_canvas']
-        indicator_circle = self.port_widgets[port_identifier]['indicator_circle']
-        def blink(times):
-            if times > 0:
-                current_color = indicator_canvas.itemcget(indicator_circle, 'fill')
-                next_color = 'red' if current_color == 'gray' else 'gray'
-                indicator_canvas.itemconfig(indicator_circle, fill=next_color)
-                self.root.after(250, lambda: blink(times - 1))
-            else:
-                indicator_canvas.itemconfig(indicator_circle, fill='gray')
-        blink(6)
+        self.indicators.trigger(port_identifier)
 
 if __name__ == "__main__":
     splash_root = tk.Tk()
@@ -0,0 +1,202 @@
+"""Offline analysis: NumPy-vectorized vs per-row Python loops.
+
+Synthesizes --devices x --weeks sessions of a mouse on a FED3 (about
+--pellets pellets a day in circadian meals, pokes around them, Retrieval_Time
+with some "Timed_out", every fourth session progressive ratio) and runs
+each rtfed_core.analysis step over all of them, then the same step written
+as the row loops of an ad-hoc notebook. Prints the seconds for each and
+checks the two agree. Also times loading: one session from CSV and from
+.fed3z, scaled to the whole set.
+
+    python benchmarks/bench_analysis.py --devices 25 --weeks 4 --pellets 250
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import analysis, columnar
+from rtfed_core.events import FED3Event, TTL_TIME_FORMAT, column_headers
+from rtfed_core.session_store import SessionStore
+
+WEEK_S = 7 * 86400.0
+START = 1.7e9
+
+
+def synth(rng, pellets_per_day, pr):
+    """One device-week as an analysis.Session."""
+    # Meals start more often at night (hours 18-06), 1-8 pellets, 5-40 s apart
+    hours = np.arange(7 * 24)
+    rate = np.where((hours % 24 >= 18) | (hours % 24 < 6), 1.6, 0.4) * pellets_per_day / 24 / 4.5
+    meal_starts = np.sort(np.concatenate([h * 3600 + rng.uniform(0, 3600, rng.poisson(r))
+                                          for h, r in zip(hours, rate)]))
+    sizes = rng.integers(1, 9, len(meal_starts))
+    offsets = np.concatenate([np.cumsum(rng.uniform(5, 40, s)) for s in sizes]) if len(sizes) else np.empty(0)
+    pellet_t = np.repeat(meal_starts, sizes) + offsets
+    poke_t = np.concatenate([pellet_t - rng.uniform(0.5, 4, len(pellet_t)), rng.uniform(0, WEEK_S, len(pellet_t))])
+    t = np.concatenate([pellet_t, poke_t])
+    event = np.concatenate([np.full(len(pellet_t), "Pellet"),
+                            rng.choice(["Left", "Right", "LeftShort", "LeftWithPellet"], len(poke_t),
+                                       p=[0.6, 0.25, 0.1, 0.05])])
+    order = np.argsort(t, kind="stable")
+    t, event = START + t[order], event[order].astype("U14")
+    n = len(t)
+    is_pellet = event == "Pellet"
+    retrieval = np.where(is_pellet, rng.gamma(2, 2, n), np.nan)
+    retrieval[is_pellet & (rng.random(n) < 0.03)] = np.nan  # "Timed_out"
+    fr = np.full(n, 1.0)
+    if pr:
+        fr = np.floor(np.exp(0.2 * np.cumsum(is_pellet)) * 5 - 5 + 1)
+    numeric = {attr: np.full(n, np.nan) for attr in analysis._NUMERIC}
+    numeric.update(device_number=np.full(n, 1.0), fr=fr, retrieval_time=retrieval,
+                   pellet_count=np.cumsum(is_pellet).astype(np.float64))
+    text = {"library_version": np.full(n, "1.16.3"), "session_type": np.full(n, "ProgRatio" if pr else "FR1"),
+            "active_poke": np.full(n, "Left"), "high_prob_poke": np.full(n, "nan")}
+    return analysis.Session(t, event, numeric, text, source="synthetic")
+
+
+# -- the same steps as per-row loops ------------------------------------------
+
+def loop_ipi(s):
+    out, last = [], None
+    for t, e in zip(s.t.tolist(), s.event.tolist()):
+        if e == "Pellet":
+            if last is not None:
+                out.append(t - last)
+            last = t
+    return out
+
+
+def loop_meals(s, gap, min_pellets):
+    meals, current, last = [], 0, None
+    for t, e in zip(s.t.tolist(), s.event.tolist()):
+        if e != "Pellet":
+            continue
+        if last is not None and t - last >= gap:
+            if current >= min_pellets:
+                meals.append(current)
+            current = 0
+        current += 1
+        last = t
+    if current >= min_pellets:
+        meals.append(current)
+    return meals
+
+
+def loop_retrieval(s):
+    values = [rt for rt, e in zip(s["retrieval_time"].tolist(), s.event.tolist()) if e == "Pellet" and rt == rt]
+    values.sort()
+    return values[len(values) // 2] if values else None
+
+
+def loop_breakpoint(s, lapse):
+    last_t = last_fr = None
+    for t, e, fr in zip(s.t.tolist(), s.event.tolist(), s["fr"].tolist()):
+        if e != "Pellet":
+            continue
+        if last_t is not None and t - last_t >= lapse:
+            break
+        last_t, last_fr = t, fr
+    return last_fr
+
+
+def loop_chronogram(s, bin_s):
+    counts = {}
+    start = s.t[0]
+    for t, e in zip(s.t.tolist(), s.event.tolist()):
+        if e == "Pellet":
+            k = int((t - start) // bin_s)
+            counts[k] = counts.get(k, 0) + 1
+    return counts
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def load_times(session, tmp):
+    """Seconds to load one session from CSV and from .fed3z."""
+    n = len(session)
+    store = SessionStore()
+    headers = column_headers("Timestamp")
+    for i in range(n):
+        fields = ["22.5", "40.1", "1.16.3", session.session_type, "1", "4.12", "0", f"{session['fr'][i]:.0f}",
+                  session.event[i], "Left", "0", "0", "0", "0",
+                  "Timed_out" if session.event[i] == "Pellet" and np.isnan(session["retrieval_time"][i])
+                  else f"{session['retrieval_time'][i]:.2f}", "nan", "nan", "nan", "nan", "nan", "nan"]
+        store.append("Port 1", FED3Event.from_fields(fields, float(session.t[i])))
+    csv_path = os.path.join(tmp, "Port 1.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(e.to_row(TTL_TIME_FORMAT) for e in store.iter_events("Port 1"))
+    z_path = os.path.join(tmp, "Port 1" + columnar.SUFFIX)
+    columnar.write_session(z_path, store, "Port 1", headers[0], TTL_TIME_FORMAT)
+    store.close()
+    t_csv, from_csv = timed(lambda: analysis.load(csv_path))
+    t_z, from_z = timed(lambda: analysis.load(z_path))
+    assert len(from_csv) == len(from_z) == n and (from_csv.event == from_z.event).all()
+    assert np.allclose(from_csv.t, from_z.t, atol=1e-3), "CSV and .fed3z times differ"
+    return t_csv, t_z
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=25)
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--pellets", type=float, default=250, help="pellets per device per day")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    sessions = [synth(rng, args.pellets, pr=(i % 4 == 3)) for i in range(args.devices * args.weeks)]
+    events = sum(len(s) for s in sessions)
+    pellets = sum(int((s.event == "Pellet").sum()) for s in sessions)
+    print(f"{len(sessions)} device-weeks, {events:,} events, {pellets:,} pellets")
+    gap, min_pellets, lapse = analysis.MEAL_GAP_S, analysis.MEAL_MIN_PELLETS, 3600.0
+    pr_sessions = [s for s in sessions if analysis.is_progressive_ratio(s.session_type)]
+    steps = [
+        ("inter-pellet", lambda: [analysis.inter_pellet_intervals(s) for s in sessions],
+         lambda: [loop_ipi(s) for s in sessions],
+         lambda a, b: all(np.allclose(x, y) for x, y in zip(a, b))),
+        ("meals", lambda: [analysis.meals(s, gap, min_pellets)[2] for s in sessions],
+         lambda: [loop_meals(s, gap, min_pellets) for s in sessions],
+         lambda a, b: all(list(x) == y for x, y in zip(a, b))),
+        ("retrieval", lambda: [analysis.retrieval_latency(s, (50,), bins=50) for s in sessions],
+         lambda: [loop_retrieval(s) for s in sessions],
+         lambda a, b: all(abs(x["percentiles"][50] - y) < 0.5 for x, y in zip(a, b))),
+        ("PR breakpoint", lambda: [analysis.pr_breakpoint(s, lapse)[0] for s in pr_sessions],
+         lambda: [loop_breakpoint(s, lapse) for s in pr_sessions],
+         lambda a, b: a == b),
+        ("chronogram 1 h", lambda: [analysis.chronogram(s.pellet_times(), 3600, start=s.t[0])[0] for s in sessions],
+         lambda: [loop_chronogram(s, 3600) for s in sessions],
+         lambda a, b: all(all(x[k] == v for k, v in y.items()) and x.sum() == sum(y.values())
+                          for x, y in zip(a, b))),
+        ("summarize", lambda: [analysis.summarize(s) for s in sessions], None, None),
+    ]
+    print(f"{'step':>15} {'numpy s':>9} {'loops s':>9} {'speedup':>8}  agree")
+    total = 0.0
+    for name, vectorized, loops, agree in steps:
+        t_np, a = timed(vectorized)
+        total += t_np
+        if loops is None:
+            print(f"{name:>15} {t_np:>9.3f}")
+            continue
+        t_py, b = timed(loops)
+        print(f"{name:>15} {t_np:>9.3f} {t_py:>9.3f} {t_py / t_np:>7.0f}x  {agree(a, b)}")
+    print(f"{'all numpy':>15} {total:>9.3f}")
+    with tempfile.TemporaryDirectory() as tmp:
+        t_csv, t_z = load_times(sessions[0], tmp)
+    scale = len(sessions)
+    print(f"load one session ({len(sessions[0]):,} events): CSV {t_csv:.3f} s, .fed3z {t_z:.3f} s "
+          f"(x{scale}: {t_csv * scale:.1f} s, {t_z * scale:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
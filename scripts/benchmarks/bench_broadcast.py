@@ -0,0 +1,107 @@
+"""Identification and clock sync: one port at a time vs rtfed_core.broadcast.
+
+Runs a virtual FED3 fleet (rtfed_core.fed3_sim) of each of --sizes boards
+that answer commands up to --reply-ms late, plus --silent ptys that never
+answer (a board that is unplugged or still rebooting), and times:
+
+    identify    TRIGGER_POKE and wait for the logged line (3 s deadline)
+    sync        SET_TIME and wait for TIME_SET_OK (2 s deadline)
+
+first as the apps' old loops did (open, write, readline until the reply or
+the deadline, close, next port), then with broadcast(). For sync it also
+prints how far the boards' clocks end up from the host's, because the old
+loop sends the current second, which is already up to a second old.
+
+    python benchmarks/bench_broadcast.py --sizes 8 32 --reply-ms 1000 --silent 1
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import broadcast
+from rtfed_core.fed3_sim import VirtualFED3Fleet
+
+
+def serial_identify(paths):
+    found = {}
+    for path in paths:
+        with serial.Serial(path, 115200, timeout=1) as ser:
+            ser.write(b"TRIGGER_POKE\n")
+            start = time.time()
+            while time.time() - start < broadcast.IDENTIFY_TIMEOUT_S:
+                line = ser.readline().decode("utf-8", errors="replace").strip()
+                if broadcast.device_number(line):
+                    found[path] = broadcast.device_number(line)
+                    break
+    return found
+
+
+def serial_sync(paths):
+    now = datetime.datetime.now()
+    data = (broadcast.set_time_command(now) + "\n").encode()
+    ok = {}
+    for path in paths:
+        with serial.Serial(path, 115200, timeout=2) as ser:
+            ser.write(data)
+            start = time.time()
+            while time.time() - start < broadcast.SYNC_TIMEOUT_S:
+                line = ser.readline().decode("utf-8", errors="replace").strip()
+                if line in broadcast.TIME_REPLIES:
+                    ok[path] = line
+                    break
+    return ok
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def offsets_ms(fleet):
+    values = sorted(abs(b.rtc_offset) * 1000 for b in fleet.boards)
+    return f"{values[len(values) // 2]:.1f}/{values[-1]:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--reply-ms", type=float, default=1000, help="boards answer up to this late")
+    parser.add_argument("--silent", type=int, default=1, help="extra ports that never answer")
+    args = parser.parse_args()
+
+    print(f"{'devices':>7} {'step':>9} {'one by one s':>13} {'broadcast s':>12} {'answered':>9}  "
+          f"|RTC - host| ms median/max")
+    for n in args.sizes:
+        silent = [os.openpty() for _ in range(args.silent)]
+        for master, slave in silent:
+            os.set_blocking(master, False)
+        with VirtualFED3Fleet(n, rate=0, seed=1, reply_s=args.reply_ms / 1000) as fleet:
+            paths = fleet.paths + [os.ttyname(slave) for _, slave in silent]
+            ports = {path: path for path in paths}
+            t_old, old = timed(lambda: serial_identify(paths))
+            t_new, new = timed(lambda: broadcast.broadcast(ports, broadcast.TRIGGER_POKE, broadcast.device_number))
+            answered = sum(1 for r in new.values() if r.reply)
+            agree = all(new[p].reply == v for p, v in old.items()) and answered == len(old)
+            print(f"{n:>7} {'identify':>9} {t_old:>13.2f} {t_new:>12.2f} {answered:>4}/{len(paths):<4}  "
+                  f"same numbers: {agree}")
+
+            t_old, old = timed(lambda: serial_sync(paths))
+            old_offsets = offsets_ms(fleet)
+            t_new, new = timed(lambda: broadcast.broadcast(ports, None, broadcast.time_reply,
+                                                           broadcast.SYNC_TIMEOUT_S, align=True))
+            answered = sum(1 for r in new.values() if r.reply)
+            print(f"{n:>7} {'sync':>9} {t_old:>13.2f} {t_new:>12.2f} {answered:>4}/{len(paths):<4}  "
+                  f"one by one {old_offsets}, aligned {offsets_ms(fleet)}")
+        for fds in silent:
+            for fd in fds:
+                os.close(fd)
+
+
+if __name__ == "__main__":
+    main()
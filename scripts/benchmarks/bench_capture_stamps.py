@@ -0,0 +1,94 @@
+"""Capture-stamp accuracy and hot-path cost.
+
+A writer sends FED3 lines into a pseudo-terminal at known monotonic times.
+SerialMultiplexer delivers each line with its arrival stamp, and the
+callback also takes the old-style stamp (datetime.now() after the line was
+decoded, split and queued). Both are compared with the write time. The
+script also times the per-line cost of the old strftime stamping against
+the ClockAnchor conversion now done on the serial thread.
+
+    python benchmarks/bench_capture_stamps.py --lines 2000
+"""
+import argparse
+import datetime
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+import timeit
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import clock
+from rtfed_core.events import FED3Event
+from rtfed_core.serial_mux import SerialMultiplexer
+
+LINE = "4/16/2025 11:24:23,25.86,26.36,1.16.3,FR1,10,4.14,1,1,Pellet,Left,8,30,8,1,2.31,45,NaN,NaN,NaN,NaN,NaN"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run_pty(lines, gap_s):
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0)
+    sent = []
+    got = []
+    done = threading.Event()
+    q = queue.Queue()
+
+    def on_line(port, line, arrival_ns):
+        data_list = line.split(",")
+        q.put(f"{port} raw data: {data_list}")
+        event = FED3Event.from_fields(data_list[1:], clock.anchor.wall(arrival_ns), arrival_ns)
+        q.put(event)
+        old_ns = time.monotonic_ns()  # where the apps used to call datetime.now()
+        got.append((arrival_ns, old_ns))
+        if len(got) == lines:
+            done.set()
+
+    mux = SerialMultiplexer(on_line)
+    mux.add_port("Port 1", ser)
+    mux.start()
+    time.sleep(0.1)
+    payload = (LINE + "\r\n").encode()
+    for _ in range(lines):
+        sent.append(time.monotonic_ns())
+        os.write(master, payload)
+        time.sleep(gap_s)
+    done.wait(10)
+    mux.stop()
+    os.close(master)
+    new = [(a - s) / 1000 for s, (a, _) in zip(sent, got)]
+    old = [(o - s) / 1000 for s, (_, o) in zip(sent, got)]
+    return new, old
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--gap-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    clock.anchor.reset()
+    n = 20000
+    old_cost = timeit.timeit(lambda: (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+                                      datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]),
+                             number=n) / n
+    mono = time.monotonic_ns()
+    new_cost = timeit.timeit(lambda: clock.anchor.wall(mono), number=n) / n
+    print(f"hot-path stamping: 2x strftime {old_cost * 1e6:.2f} us/line, anchor.wall {new_cost * 1e6:.3f} us/line")
+
+    new, old = run_pty(args.lines, args.gap_ms / 1000)
+    for name, d in (("arrival_ns (first read)", new), ("after decode+queue (old)", old)):
+        print(f"{name:>29}: median {statistics.median(d):7.1f} us, p99 {percentile(d, 99):7.1f} us, "
+              f"SD {statistics.pstdev(d):6.1f} us after write")
+
+
+if __name__ == "__main__":
+    main()
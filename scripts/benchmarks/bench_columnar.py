@@ -0,0 +1,113 @@
+"""Reload time and size: session CSVs vs .fed3z columnar files.
+
+Writes --sessions synthetic sessions of --rows rows each (a month of daily
+files by default) as the apps do: the streamed CSV and the .fed3z written
+from the SessionStore. Then it loads every numeric and text column back
+from both, checks that the .fed3z converts back to the identical CSV and
+prints the timings.
+
+    python benchmarks/bench_columnar.py --sessions 30 --rows 5000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import columnar
+from rtfed_core.events import ATTRS, TEXT_FIELDS, TTL_TIME_FORMAT, FED3Event, column_headers
+from rtfed_core.session_store import SessionStore
+
+
+def fed3_line(rng, i):
+    event = rng.choice(("Left", "Right", "Pellet", "LeftWithPellet", "LeftShort"))
+    poke = rng.choice(("Timed_out", "NaN", f"{rng.random():.2f}"))
+    return (f"0,{22 + rng.random() * 4:.2f},{30 + rng.random() * 20:.2f},1.16.3,FR1,7,"
+            f"{4.2 - i * 1e-5:.2f},NaN,1,{event},Left,{i},{i // 2},{i // 3},0,"
+            f"{rng.choice(('NaN', f'{rng.random() * 9:.2f}'))},{rng.choice(('NaN', str(rng.randint(5, 900))))},"
+            f"{poke},NaN,NaN,NaN,NaN")
+
+
+def write_sessions(folder, sessions, rows):
+    rng = random.Random(3)
+    paths = []
+    t0 = time.time()
+    for s in range(sessions):
+        store = SessionStore(folder)
+        base = os.path.join(folder, f"Port_1_{s:02d}")
+        with open(base + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(column_headers())
+            for i in range(rows):
+                event = FED3Event.from_line(fed3_line(rng, i), t0 + s * 86400 + i * 17.3)
+                store.append("Port 1", event)
+                writer.writerow(event.to_row(TTL_TIME_FORMAT))
+        columnar.write_session(base + columnar.SUFFIX, store, "Port 1", "Timestamp", TTL_TIME_FORMAT)
+        store.close()
+        paths.append(base)
+    return paths
+
+
+def load_csv(path):
+    columns = {attr: [] for attr in ATTRS}
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            for attr, token in zip(ATTRS, row[1:]):
+                if attr in TEXT_FIELDS:
+                    columns[attr].append(token)
+                else:
+                    try:
+                        columns[attr].append(float(token))
+                    except ValueError:
+                        columns[attr].append(float("nan"))
+    return columns
+
+
+def load_columnar(path):
+    with columnar.load(path) as session:
+        columns = {attr: session.column(attr) for attr in ATTRS}
+        columns["received"] = session.received()
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_sessions(tmp, args.sessions, args.rows)
+        csv_bytes = sum(os.path.getsize(p + ".csv") for p in paths)
+        col_bytes = sum(os.path.getsize(p + columnar.SUFFIX) for p in paths)
+
+        start = time.perf_counter()
+        for p in paths:
+            load_csv(p + ".csv")
+        csv_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for p in paths:
+            load_columnar(p + columnar.SUFFIX)
+        col_s = time.perf_counter() - start
+
+        with columnar.load(paths[0] + columnar.SUFFIX) as session:
+            out = io.StringIO()
+            session.to_csv(out)
+        with open(paths[0] + ".csv", newline="") as f:
+            assert out.getvalue() == f.read(), "CSV export differs"
+
+    total = args.sessions * args.rows
+    print(f"{args.sessions} sessions x {args.rows} rows ({total} rows), numpy={'yes' if columnar.np else 'no'}")
+    print(f"   CSV: {csv_bytes / 1e6:7.2f} MB, load {csv_s * 1000:8.1f} ms")
+    print(f" fed3z: {col_bytes / 1e6:7.2f} MB, load {col_s * 1000:8.1f} ms "
+          f"({csv_s / col_s:.0f}x faster, {csv_bytes / col_bytes:.1f}x smaller); CSV export identical")
+
+
+if __name__ == "__main__":
+    main()
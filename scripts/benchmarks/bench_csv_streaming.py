@@ -0,0 +1,114 @@
+"""Write amplification of streaming CSV logs vs the old save-at-STOP.
+
+Replays a session of --events rows arriving at --rate events/s through
+StreamingCSVWriter under several flush policies (simulated clock, real
+files and fsyncs). For each policy it reports the flushes (fsyncs) and an
+estimate of the 4 KiB flash pages programmed: every fsync rewrites each
+page between the previous and the new end of file, including the partly
+filled last page. Write amplification is pages programmed divided by the
+pages the CSV finally occupies. The block-layer bytes from /proc/self/io
+are shown when the filesystem reports them (tmpfs and overlayfs report 0).
+
+    python benchmarks/bench_csv_streaming.py --events 20000 --rate 1
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.csv_log import StreamingCSVWriter
+from rtfed_core.events import FED3Event, TTL_TIME_FORMAT, column_headers
+
+PAGE = 4096
+LINES = (
+    "4/16/2025 11:24:22,25.86,26.36,1.16.3,FR1,10,4.14,NaN,1,LeftWithPellet,Left,8,30,7,0,NaN,NaN,0.82,NaN,NaN,NaN,NaN",
+    "4/16/2025 11:24:23,25.86,26.36,1.16.3,FR1,10,4.14,1,1,Pellet,Left,8,30,8,1,2.31,45,NaN,NaN,NaN,NaN,NaN",
+)
+
+
+def block_write_bytes():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def pages_between(start, end):
+    if end <= start:
+        return 0
+    return (end - 1) // PAGE - start // PAGE + 1
+
+
+def run_stop(path, events):
+    """The old behaviour: everything in RAM, one write and close at STOP."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(column_headers())
+        writer.writerows(event.to_row(TTL_TIME_FORMAT) for event in events)
+        f.flush()
+        os.fsync(f.fileno())
+    return 1, pages_between(0, os.path.getsize(path))
+
+
+def run_streaming(path, events, rate, flush_every, flush_ms, fsync=True):
+    writer = StreamingCSVWriter(path, column_headers(), TTL_TIME_FORMAT, fsync=fsync)
+    flushes = pages = 0
+    synced = 0
+    last_flush = 0.0
+    for i, event in enumerate(events):
+        now = i / rate
+        writer.write_event(event)
+        if writer.unflushed >= flush_every or (now - last_flush) * 1000 >= flush_ms:
+            writer.flush()
+            size = os.path.getsize(path)
+            pages += pages_between(synced - synced % PAGE, size)
+            synced = size
+            flushes += 1
+            last_flush = now
+    writer.close()
+    size = os.path.getsize(path)
+    if size > synced:
+        pages += pages_between(synced - synced % PAGE, size)
+        flushes += 1
+    return flushes, pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=1.0, help="events per second per device")
+    parser.add_argument("--dir", default=None, help="directory on the card to test (default: temp dir)")
+    args = parser.parse_args()
+    t0 = time.time()
+    events = [FED3Event.from_line(LINES[i % 2], t0 + i / args.rate) for i in range(args.events)]
+
+    policies = [
+        ("save at STOP", lambda p: run_stop(p, events)),
+        ("fsync every row", lambda p: run_streaming(p, events, args.rate, 1, 0)),
+        ("every 20 rows / 1000 ms", lambda p: run_streaming(p, events, args.rate, 20, 1000)),
+        ("every 200 rows / 10000 ms", lambda p: run_streaming(p, events, args.rate, 200, 10000)),
+    ]
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f"{args.events} rows at {args.rate:g} events/s "
+              f"({args.events / args.rate / 3600:.1f} h of one device)")
+        print(f"{'policy':>26} {'fsyncs':>8} {'pages':>9} {'WA':>6} {'block MB':>9} {'wall s':>7}")
+        for name, fn in policies:
+            path = os.path.join(tmp, name.replace(" ", "_").replace("/", "") + ".csv")
+            before = block_write_bytes()
+            start = time.perf_counter()
+            flushes, pages = fn(path)
+            elapsed = time.perf_counter() - start
+            block_mb = (block_write_bytes() - before) / 1e6
+            final_pages = pages_between(0, os.path.getsize(path))
+            print(f"{name:>26} {flushes:>8} {pages:>9} {pages / final_pages:>6.1f} {block_mb:>9.2f} {elapsed:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Mid-session queries on the live event database vs scanning Python lists.
+
+Loads --hours of history for --devices FED3s at --rate events/s each into
+an events.sqlite through rtfed_core.event_db.EventWriter (batches of
+--batch, as the SQLite sink writes them) and into a plain list of
+FED3Event (what the apps used to keep as data_to_save). Then times
+"pellets on device 12 in the last hour" both ways.
+
+Finally the writer keeps appending live batches for --seconds while
+--readers separate processes open the file read-only and run the same
+query every --poll-ms (a GUI refresh; 0 spins, which on a small Pi only
+measures CPU contention). Prints the writer's commit time per batch with and
+without the readers, and the readers' query times: in WAL mode neither
+side should wait for the other.
+
+    python benchmarks/bench_event_db.py --devices 16 --hours 168 --rate 0.02 --readers 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.event_db import EventReader, EventWriter
+from rtfed_core.events import FED3Event
+from rtfed_core.latency import LatencyHistogram
+
+EVENTS = ("Left", "Left", "Right", "Pellet", "LeftShort", "Pellet")
+DEVICE = 12
+
+
+def make_events(devices, rate, seconds, end_ns, seed=1):
+    rng = random.Random(seed)
+    out = []
+    for d in range(1, devices + 1):
+        t = 0.0
+        n = 0
+        while True:
+            t += rng.expovariate(rate)
+            if t >= seconds:
+                break
+            n += 1
+            fields = ["22.5", "40.1", "1.16.3", "FR1", str(d), "4.12", "0", "1", rng.choice(EVENTS), "Left",
+                      str(n), "0", str(n // 2), "0", "0.5", "12", "0.210", "nan", "nan", "nan", "nan"]
+            arrival = end_ns - int((seconds - t) * 1e9)
+            out.append((arrival, f"/dev/ttyACM{d}", FED3Event.from_fields(fields, time.time() - (seconds - t),
+                                                                          arrival)))
+    out.sort(key=lambda x: x[0])
+    return [(port, ev) for _, port, ev in out]
+
+
+def scan(events, last_s):
+    since = time.monotonic_ns() - int(last_s * 1e9)
+    return sum(1 for _, e in events if e.device_number == DEVICE and e.event == "Pellet" and e.arrival_ns >= since)
+
+
+def timed(fn, repeat):
+    hist = LatencyHistogram()
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        result = fn()
+        hist.record(time.perf_counter_ns() - t0)
+    return hist, result
+
+
+def reader(path, seconds, poll_s, out):
+    hist = LatencyHistogram()
+    with EventReader(path) as db:
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            t0 = time.perf_counter_ns()
+            db.count(DEVICE, "Pellet", 3600)
+            hist.record(time.perf_counter_ns() - t0)
+            time.sleep(poll_s)
+    out.put((hist.n, hist.percentile(50), hist.percentile(99), hist.max))
+
+
+def live_writes(writer, seconds, batch, rate):
+    """Append live batches for ``seconds``; returns the commit-time histogram."""
+    hist = LatencyHistogram()
+    fields = ["22.5", "40.1", "1.16.3", "FR1", str(DEVICE), "4.12", "0", "1", "Pellet", "Left",
+              "1", "0", "1", "0", "0.5", "12", "0.210", "nan", "nan", "nan", "nan"]
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        now = time.monotonic_ns()
+        rows = [("/dev/ttyACM12", FED3Event.from_fields(fields, time.time(), now)) for _ in range(batch)]
+        t0 = time.perf_counter_ns()
+        writer.append(rows)
+        hist.record(time.perf_counter_ns() - t0)
+        time.sleep(batch / rate)
+    return hist
+
+
+def ms(ns):
+    return ns / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--hours", type=float, default=168)
+    parser.add_argument("--rate", type=float, default=0.02, help="events/s per device")
+    parser.add_argument("--batch", type=int, default=100, help="events per transaction")
+    parser.add_argument("--readers", type=int, default=4, help="reader processes in the live run")
+    parser.add_argument("--poll-ms", type=float, default=20.0, help="pause between a reader's queries")
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of each live run")
+    args = parser.parse_args()
+
+    events = make_events(args.devices, args.rate, args.hours * 3600, time.monotonic_ns())
+    print(f"{args.devices} devices x {args.rate} events/s x {args.hours} h = {len(events)} events")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.sqlite")
+        writer = EventWriter(path)
+        t0 = time.perf_counter()
+        for i in range(0, len(events), args.batch):
+            writer.append(events[i:i + args.batch])
+        elapsed = time.perf_counter() - t0
+        print(f"load: {len(events) / elapsed:,.0f} events/s in batches of {args.batch}, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB")
+
+        print(f"\npellets on device {DEVICE} in the last hour")
+        print(f"{'method':>14} {'p50 ms':>9} {'p99 ms':>9} {'result':>7}")
+        hist, n = timed(lambda: scan(events, 3600), 5)
+        print(f"{'list scan':>14} {ms(hist.percentile(50)):>9.3f} {ms(hist.percentile(99)):>9.3f} {n:>7}")
+        with EventReader(path) as db:
+            hist, n = timed(lambda: db.count(DEVICE, "Pellet", 3600), 200)
+        print(f"{'indexed query':>14} {ms(hist.percentile(50)):>9.3f} {ms(hist.percentile(99)):>9.3f} {n:>7}")
+
+        rate = args.devices * 50.0  # a busy session: 50 events/s per device
+        print(f"\nlive writes at {rate:.0f} events/s in batches of {args.batch}")
+        print(f"{'readers':>8} {'commit p50 ms':>14} {'commit p99 ms':>14} {'queries':>8} "
+              f"{'query p50 ms':>13} {'query p99 ms':>13}")
+        hist = live_writes(writer, args.seconds, args.batch, rate)
+        print(f"{0:>8} {ms(hist.percentile(50)):>14.3f} {ms(hist.percentile(99)):>14.3f}")
+        ctx = multiprocessing.get_context("spawn")
+        out = ctx.Queue()
+        procs = [ctx.Process(target=reader, args=(path, args.seconds + 1, args.poll_ms / 1000, out))
+                 for _ in range(args.readers)]
+        for p in procs:
+            p.start()
+        time.sleep(1.0)  # let the readers start querying
+        hist = live_writes(writer, args.seconds, args.batch, rate)
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+        queries = sum(r[0] for r in results)
+        print(f"{args.readers:>8} {ms(hist.percentile(50)):>14.3f} {ms(hist.percentile(99)):>14.3f} {queries:>8} "
+              f"{ms(max(r[1] for r in results)):>13.3f} {ms(max(r[2] for r in results)):>13.3f}")
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Memory per logged event: list-of-str rows vs FED3Event.
+
+Builds a session the way the apps used to (a timestamp string plus the 21
+split fields per row) and the way they do now (one FED3Event per row) and
+reports the bytes each representation holds, measured with tracemalloc.
+It also checks that every event converts back to the original row. Build
+times are taken under tracemalloc, so only compare them with each other.
+
+    python benchmarks/bench_event_memory.py --events 100000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.events import FED3Event, TTL_TIME_FORMAT
+
+LINES = (
+    "4/16/2025 11:24:22,25.86,26.36,1.16.3,FR1,10,4.14,NaN,1,LeftWithPellet,Left,8,30,7,0,NaN,NaN,0.82,NaN,NaN,NaN,NaN",
+    "4/16/2025 11:24:23,25.86,26.36,1.16.3,FR1,10,4.14,1,1,Pellet,Left,8,30,8,1,2.31,45,NaN,NaN,NaN,NaN,NaN",
+    "4/16/2025 11:24:40,25.91,26.30,1.16.3,FR1,10,4.13,NaN,1,Right,Left,8,31,8,1,NaN,NaN,0.10,NaN,NaN,NaN,NaN",
+)
+
+
+def build_rows(lines, t0):
+    rows = []
+    for i, line in enumerate(lines):
+        received = t0 + i * 0.25
+        data_list = line.split(",")
+        data_list[0] = datetime.datetime.fromtimestamp(received).strftime(TTL_TIME_FORMAT)[:-3]
+        rows.append(data_list)
+    return rows
+
+
+def build_events(lines, t0):
+    return [FED3Event.from_line(line, t0 + i * 0.25) for i, line in enumerate(lines)]
+
+
+def measure(fn, lines, t0):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(lines, t0)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+    lines = [LINES[i % len(LINES)] for i in range(args.events)]
+    t0 = time.time()
+
+    rows, row_bytes, row_s = measure(build_rows, lines, t0)
+    evs, ev_bytes, ev_s = measure(build_events, lines, t0)
+
+    for row, ev in zip(rows, evs):
+        assert ev.to_row() == row, (ev.to_row(), row)
+
+    n = args.events
+    print(f" list-of-str: {row_bytes / n:7.1f} bytes/event, {row_s / n * 1e6:6.2f} us/event to build")
+    print(f"   FED3Event: {ev_bytes / n:7.1f} bytes/event, {ev_s / n * 1e6:6.2f} us/event to build")
+    print(f"   reduction: {row_bytes / ev_bytes:.1f}x, round trip OK for {n} events")
+
+
+if __name__ == "__main__":
+    main()
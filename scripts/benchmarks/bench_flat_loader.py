@@ -0,0 +1,113 @@
+"""Flat-folder loading: one file at a time vs rtfed_core.flat_loader.
+
+Writes --files distinct ``Port N_<timestamp>.csv`` files of --rows rows
+(TTL layout, with NaN and some Timed_out) into a temporary flat folder,
+then times:
+
+    serial csv      analysis.load() of every file in turn, no cache
+    cold scan       FlatLoader.scan() with an empty cache (--workers parsers)
+    re-scan         scan() again with nothing changed
+    incremental     scan() after adding --changed new files and rewriting
+                    --changed existing ones (half with identical bytes)
+    load cached     every session read back from the cache
+
+and checks the cached sessions match the serially parsed ones.
+
+    python benchmarks/bench_flat_loader.py --files 10000 --rows 100 --workers 4
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import analysis
+from rtfed_core.events import column_headers
+from rtfed_core.flat_loader import FlatLoader
+
+HEADER = ",".join(column_headers("Timestamp")) + "\n"
+EVENTS = ("Left", "Left", "Right", "Pellet", "LeftShort")
+
+
+def session_text(rng, rows, start):
+    lines = [HEADER]
+    t = start
+    for i in range(rows):
+        t += rng.expovariate(1 / 30)
+        event = rng.choice(EVENTS)
+        pellet = event == "Pellet"
+        retrieval = ("Timed_out" if rng.random() < 0.05 else f"{rng.uniform(0, 20):.2f}") if pellet else "NaN"
+        stamp = datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        lines.append(f"{stamp},22.5,40.1,1.16.3,FR1,{rng.randint(1, 40)},4.12,NaN,1,{event},Left,{i},0,{i // 3},0,"
+                     f"{retrieval},{rng.randint(5, 900) if pellet else 'NaN'},{rng.uniform(0, 2):.2f},"
+                     f"NaN,NaN,NaN,nan\n")
+    return "".join(lines)
+
+
+def write_files(folder, rng, count, rows, first=0):
+    names = []
+    for k in range(first, first + count):
+        start = 1.7e9 + k * 3600
+        name = f"Port {k % 8 + 1}_{datetime.datetime.fromtimestamp(start).strftime('%Y_%m_%d_%H_%M_%S')}_{k}.csv"
+        with open(os.path.join(folder, name), "w", newline="") as f:
+            f.write(session_text(rng, rows, start))
+        names.append(name)
+    return names
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: one per CPU)")
+    parser.add_argument("--changed", type=int, default=100, help="files added and files rewritten before the "
+                                                                  "incremental scan")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as folder:
+        names = write_files(folder, rng, args.files, args.rows)
+        loader = FlatLoader(folder, workers=args.workers)
+        print(f"{args.files} files x {args.rows} rows, {loader.workers} workers, {os.cpu_count()} CPUs")
+        print(f"{'step':>12} {'seconds':>9}  result")
+        t, serial = timed(lambda: {name: analysis.load(os.path.join(folder, name)) for name in names})
+        print(f"{'serial csv':>12} {t:>9.3f}  {len(serial)} sessions")
+        t, s = timed(loader.scan)
+        print(f"{'cold scan':>12} {t:>9.3f}  {s['parsed']} parsed")
+        t, s = timed(loader.scan)
+        print(f"{'re-scan':>12} {t:>9.3f}  {s['parsed']} parsed, {s['reused']} reused")
+
+        write_files(folder, rng, args.changed, args.rows, first=args.files)
+        for i, name in enumerate(names[:args.changed]):
+            path = os.path.join(folder, name)
+            with open(path) as f:
+                text = f.read()
+            with open(path, "w", newline="") as f:
+                # Half are rewritten unchanged (a fresh copy), half get a new last row
+                f.write(text if i % 2 else text + text.splitlines(True)[-1])
+        t, s = timed(FlatLoader(folder, workers=args.workers).scan)  # a fresh process would start like this
+        print(f"{'incremental':>12} {t:>9.3f}  {s['parsed']} parsed, {s['reused']} reused")
+
+        t, cached = timed(lambda: {name: loader.load(name) for name in names[args.changed:]})
+        print(f"{'load cached':>12} {t:>9.3f}  {len(cached)} sessions")
+        agree = all(len(cached[n]) == len(serial[n]) and (cached[n].event == serial[n].event).all()
+                    and np.array_equal(cached[n].t, serial[n].t)
+                    and np.array_equal(cached[n]["retrieval_time"], serial[n]["retrieval_time"], equal_nan=True)
+                    and (cached[n].tokens["retrieval_time"] == serial[n].tokens["retrieval_time"]).all()
+                    for n in cached)
+        print(f"cached sessions match the serial parse: {agree}")
+
+
+if __name__ == "__main__":
+    main()
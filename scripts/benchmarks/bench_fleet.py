@@ -0,0 +1,79 @@
+"""Load test: a virtual FED3 fleet read through SerialMultiplexer.
+
+For each fleet size, rtfed_core.fed3_sim prints lines at --rate events/s
+per device plus fleet-wide bursts, and one SerialMultiplexer reads every
+pty and parses each line into a FED3Event, as the apps do. Reported per
+size: lines printed and received, lines the simulator had to drop, lines
+that did not parse into 22 fields, and the reader thread's CPU time per
+line and as a share of one core. The simulator runs in the same process,
+so the numbers include its GIL contention.
+
+    python benchmarks/bench_fleet.py --sizes 8 16 32 64 --rate 5 --burst 20@2
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import clock
+from rtfed_core.events import FED3Event
+from rtfed_core.fed3_sim import VirtualFED3Fleet, parse_burst
+from rtfed_core.serial_mux import SerialMultiplexer
+
+
+def run(devices, rate, burst, seconds):
+    received = [0]
+    bad = [0]
+    cpu = [0.0, None]  # latest and first thread_time() of the reader thread
+    lock = threading.Lock()
+
+    def on_line(port, line, arrival_ns):
+        fields = line.split(",")
+        if len(fields) == 22:
+            FED3Event.from_fields(fields[1:], clock.anchor.wall(arrival_ns), arrival_ns)
+        else:
+            bad[0] += 1
+        received[0] += 1
+        t = time.thread_time()
+        with lock:
+            if cpu[1] is None:
+                cpu[1] = t
+            cpu[0] = t
+
+    with VirtualFED3Fleet(devices, rate, burst, seed=devices) as fleet:
+        mux = SerialMultiplexer(on_line)
+        for i, path in enumerate(fleet.paths):
+            mux.add_port(f"Port {i + 1}", serial.Serial(path, 115200, timeout=0))
+        mux.start()
+        time.sleep(seconds)
+        fleet.stop()
+        time.sleep(0.5)
+        mux.stop()
+        stats = fleet.stats()
+    used = cpu[0] - (cpu[1] or 0.0)
+    return stats, received[0], bad[0], used
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--rate", type=float, default=5.0, help="events/s per device")
+    parser.add_argument("--burst", type=parse_burst, default=(20, 2.0), help="COUNT@SECONDS")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    clock.anchor.reset()
+    print(f"{'devices':>7} {'printed':>8} {'received':>9} {'dropped':>8} {'bad':>5} {'us/line':>8} {'reader CPU':>10}")
+    for devices in args.sizes:
+        stats, received, bad, used = run(devices, args.rate, args.burst, args.seconds)
+        per_line = used / received * 1e6 if received else 0.0
+        print(f"{devices:>7} {stats['lines']:>8} {received:>9} {stats['dropped']:>8} {bad:>5} "
+              f"{per_line:>8.1f} {used / args.seconds * 100:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
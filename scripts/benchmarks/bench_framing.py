@@ -0,0 +1,85 @@
+"""Compare per-line readline() with the chunked LineFramer on a pseudo-terminal.
+
+A writer sends FED3-style bursts (LeftWithPellet followed by Pellet) and each
+reader counts read syscalls and wall time for the same stream.
+
+    python benchmarks/bench_framing.py --bursts 2000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.framing import LineFramer
+
+LINE_A = b"4/16/2025 11:24:22,25.86,26.36,1.16.3,FR1,10,4.14,NaN,1,LeftWithPellet,Left,8,30,7,0,NaN,NaN,0.82,NaN,NaN,NaN,NaN\r\n"
+LINE_B = b"4/16/2025 11:24:23,25.86,26.36,1.16.3,FR1,10,4.14,1,1,Pellet,Left,8,30,8,1,2.31,45,NaN,NaN,NaN,NaN,NaN\r\n"
+
+
+def writer(master_fd, bursts):
+    for _ in range(bursts):
+        os.write(master_fd, LINE_A + LINE_B)
+    os.write(master_fd, b"END\r\n")
+
+
+def run_readline(bursts):
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=1)
+    reads = lines = 0
+    t = threading.Thread(target=writer, args=(master, bursts))
+    t0 = time.perf_counter()
+    t.start()
+    while True:
+        line = ser.readline().decode('utf-8', errors='replace').strip()
+        reads += 1
+        if line == "END":
+            break
+        fields = line.split(",")
+        lines += bool(fields)
+    elapsed = time.perf_counter() - t0
+    t.join()
+    ser.close()
+    os.close(master)
+    return lines, reads, elapsed
+
+
+def run_framer(bursts):
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0)
+    framer = LineFramer()
+    reads = lines = 0
+    done = False
+    t = threading.Thread(target=writer, args=(master, bursts))
+    t0 = time.perf_counter()
+    t.start()
+    while not done:
+        batch = framer.read_lines(ser.fileno(), timeout=1)
+        reads += 1
+        for line in batch:
+            if line == "END":
+                done = True
+                break
+            lines += bool(line.split(","))
+    elapsed = time.perf_counter() - t0
+    t.join()
+    ser.close()
+    os.close(master)
+    return lines, reads, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bursts", type=int, default=2000)
+    args = parser.parse_args()
+    for name, fn in (("readline", run_readline), ("LineFramer", run_framer)):
+        lines, reads, elapsed = fn(args.bursts)
+        print(f"{name:>10}: {lines} lines, {reads} read calls, {elapsed * 1000:.1f} ms "
+              f"({elapsed / lines * 1e6:.2f} us/line)")
+
+
+if __name__ == "__main__":
+    main()
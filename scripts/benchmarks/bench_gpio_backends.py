@@ -0,0 +1,66 @@
+"""Per-call cost of each GPIO backend.
+
+Toggles one pin --calls times through backend.output() and reports ns per
+call, then times a full PulseScheduler.pulse() (lock, output, heap push)
+on the same backend. Backends that cannot open here (RPi.GPIO or libgpiod
+off a Pi, no /dev/gpiochip access) are listed as unavailable. On a Pi,
+pick a pin nothing is wired to with --pin.
+
+    python benchmarks/bench_gpio_backends.py --calls 100000 --pin 21
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.gpio import BACKENDS, open_backend
+from rtfed_core.ttl_scheduler import PulseScheduler
+
+
+def time_output(backend, pin, calls):
+    output = backend.output
+    high, low = backend.HIGH, backend.LOW
+    start = time.perf_counter_ns()
+    for _ in range(calls // 2):
+        output(pin, high)
+        output(pin, low)
+    return (time.perf_counter_ns() - start) / (calls // 2 * 2)
+
+
+def time_pulse(backend, pin, calls):
+    scheduler = PulseScheduler(backend)
+    # No scheduler thread: each pulse() rises and the next call just extends it
+    pulse = scheduler.pulse
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        pulse(pin, 100)
+    elapsed = (time.perf_counter_ns() - start) / calls
+    scheduler.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--pin", type=int, default=21)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    args = parser.parse_args()
+
+    print(f"{'backend':>8} {'output() ns':>12} {'pulse() ns':>11}")
+    for name in args.backends:
+        try:
+            backend = open_backend(name, [args.pin])
+        except Exception as e:
+            print(f"{name:>8}  unavailable: {type(e).__name__}: {e}")
+            continue
+        try:
+            per_output = time_output(backend, args.pin, args.calls)
+            per_pulse = time_pulse(backend, args.pin, args.calls)
+        finally:
+            backend.cleanup()
+        print(f"{name:>8} {per_output:>12.0f} {per_pulse:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
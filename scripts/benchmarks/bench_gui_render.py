@@ -0,0 +1,186 @@
+"""Per-message vs batched rendering of log lines into Tk text widgets.
+
+Builds a window with --ports port text widgets plus a session log, like the
+TTL app, and pushes --lines messages per port per tick for --ticks ticks,
+each written to its port widget and to the log. "per-message" is the old
+update_gui (insert + see per line, twice); "batched" goes through
+LogRenderer; "bounded" also registers every widget with add_view(), so
+each keeps --capacity lines and spills the rest to a temp dir. Reports
+the ms each tick spends in Tk, including the idle redraw that follows it,
+over all ticks and over the first and last tenth of the run: unbounded
+widgets get slower as they fill, bounded ones should not. Needs a display
+(run under xvfb-run on a headless Pi).
+
+First, without a display, it checks LogView paging on a stub widget: paged
+lines come back in order, the widget returns to capacity once they scroll
+out, paging works again after MAX_PAGED, and paging past the start of the
+run reaches the session marker and the previous run's lines.
+
+    python benchmarks/bench_gui_render.py --ports 8 --lines 20 --ticks 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.gui_render import MAX_PAGED, PAGE_LINES, LogRenderer, LogView, SpillFile
+from rtfed_core.latency import LatencyHistogram
+
+
+def build(root, ports):
+    widgets = []
+    for i in range(ports):
+        text = tk.Text(root, height=5, width=60)
+        text.grid(row=i // 2, column=i % 2)
+        widgets.append(text)
+    log_text = tk.Text(root, height=10, width=120)
+    log_text.grid(row=ports, column=0, columnspan=2)
+    return widgets, log_text
+
+
+def lines_for(tick, port, n):
+    return [f"[1/1/2025 12:00:{tick % 60:02d}] Port{port} - Event: Left #{tick * n + j}" for j in range(n)]
+
+
+def per_message(root, widgets, log_text, ticks, n):
+    times = []
+    for tick in range(ticks):
+        start = time.perf_counter_ns()
+        for port, widget in enumerate(widgets):
+            for line in lines_for(tick, port, n):
+                widget.insert(tk.END, line + "\n")
+                widget.see(tk.END)
+                log_text.insert(tk.END, f"2025-01-01 12:00:00: {line}\n")
+                log_text.see(tk.END)
+        root.update_idletasks()
+        times.append(time.perf_counter_ns() - start)
+    return times
+
+
+def batched(root, widgets, log_text, ticks, n, renderer):
+    times = []
+    for tick in range(ticks):
+        start = time.perf_counter_ns()
+        for port, widget in enumerate(widgets):
+            for line in lines_for(tick, port, n):
+                renderer.write(widget, line)
+                renderer.write(log_text, f"2025-01-01 12:00:00: {line}")
+        renderer.flush()
+        root.update_idletasks()
+        times.append(time.perf_counter_ns() - start)
+    return times
+
+
+class StubText:
+    """The part of tk.Text that LogView uses, as a list of lines."""
+
+    def __init__(self):
+        self.lines = []
+
+    def insert(self, index, text):
+        new = text.split("\n")[:-1]
+        if index == "1.0":
+            self.lines[:0] = new
+        else:
+            self.lines.extend(new)
+
+    def delete(self, start, end):
+        del self.lines[:int(end.split(".")[0]) - 1]
+
+    def see(self, index):
+        pass
+
+
+def add_lines(view, first, n):
+    batch = [f"line {i}" for i in range(first, first + n)]
+    view.widget.insert("end", "\n".join(batch) + "\n")
+    view.added(batch)
+    return first + n
+
+
+def check_paging(spill_dir, capacity=100):
+    """Asserts the paging contract; returns how many pages fit before MAX_PAGED."""
+    spill = SpillFile(os.path.join(spill_dir, "paging.log"))
+    # What add_view leaves behind from an earlier run
+    spill.append(["previous run", "===== marker ====="])
+    view = LogView(StubText(), spill, capacity)
+    n = add_lines(view, 0, 10 * capacity)
+    assert view.widget.lines == [f"line {i}" for i in range(n - capacity, n)]
+    assert view.load_older() == PAGE_LINES
+    assert view.widget.lines == [f"line {i}" for i in range(n - capacity - PAGE_LINES, n)]
+    # Enough new lines to push the paged-in ones back out
+    n = add_lines(view, n, PAGE_LINES)
+    assert view.paged == 0 and len(view.widget.lines) == capacity, (view.paged, len(view.widget.lines))
+    n = add_lines(view, n, 5 * MAX_PAGED)
+    pages = 0
+    while view.load_older():
+        pages += 1
+    assert view.paged == MAX_PAGED and len(view.widget.lines) == capacity + MAX_PAGED
+    n = add_lines(view, n, MAX_PAGED + 1)
+    assert view.paged == 0 and len(view.widget.lines) == capacity
+    assert view.load_older() == PAGE_LINES
+    view.close()
+
+    # Paging past this run's first line reaches the marker and the previous run
+    spill = SpillFile(os.path.join(spill_dir, "runs.log"))
+    spill.append(["previous run", "===== marker ====="])
+    view = LogView(StubText(), spill, capacity=10)
+    add_lines(view, 0, 15)
+    assert view.load_older(3) == 3 and view.widget.lines[0] == "line 2"
+    assert view.load_older(7) == 4
+    assert view.widget.lines[:4] == ["previous run", "===== marker =====", "line 0", "line 1"]
+    view.close()
+    return pages
+
+
+def percentiles_ms(times):
+    hist = LatencyHistogram()
+    for t in times:
+        hist.record(t)
+    return hist.percentile(50) / 1e6, hist.percentile(99) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ports", type=int, default=8)
+    parser.add_argument("--lines", type=int, default=20, help="messages per port per tick")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--capacity", type=int, default=1000, help="lines kept per widget in the bounded run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        pages = check_paging(spill_dir)
+    print(f"LogView paging: ok ({pages} pages of {PAGE_LINES} up to MAX_PAGED, released as new lines arrive)")
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        sys.exit(f"No display: {e}")
+    print(f"{args.ports} ports x {args.lines} lines/tick, {args.ticks} ticks")
+    print(f"{'mode':>12} {'p50 ms':>8} {'p99 ms':>8} {'first p50':>10} {'last p50':>9}")
+    tenth = max(1, args.ticks // 10)
+    with tempfile.TemporaryDirectory() as spill_dir:
+        for mode in ("per-message", "batched", "bounded"):
+            widgets, log_text = build(root, args.ports)
+            root.update()
+            if mode == "per-message":
+                times = per_message(root, widgets, log_text, args.ticks, args.lines)
+            else:
+                renderer = LogRenderer("bench", spill_dir=spill_dir)
+                if mode == "bounded":
+                    for i, w in enumerate(widgets):
+                        renderer.add_view(w, f"port{i}", capacity=args.capacity)
+                    renderer.add_view(log_text, "log", capacity=args.capacity)
+                times = batched(root, widgets, log_text, args.ticks, args.lines, renderer)
+            p50, p99 = percentiles_ms(times)
+            print(f"{mode:>12} {p50:>8.2f} {p99:>8.2f} {percentiles_ms(times[:tenth])[0]:>10.2f} {percentiles_ms(times[-tenth:])[0]:>9.2f}")
+            for w in widgets + [log_text]:
+                w.destroy()
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
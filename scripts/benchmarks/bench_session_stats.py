@@ -0,0 +1,97 @@
+"""Live session statistics: O(1) updates vs rescanning the rows.
+
+Builds sessions of --sizes events for one FED3 and computes the same
+numbers two ways: rtfed_core.session_stats.SessionStats fed one event at
+a time (time per update, then the cost of a snapshot, which is what the
+GUIs and the TTL service's "stats" push pay every second), and a rescan of
+every row, which is what a refresh would cost if the statistics were
+recomputed from the session's rows. Prints both, and checks they agree.
+
+    python benchmarks/bench_session_stats.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.events import FED3Event
+from rtfed_core.session_stats import Moments, SessionStats
+
+EVENTS = ("Left", "Left", "Right", "Pellet", "LeftShort", "LeftWithPellet", "Pellet")
+
+
+def make_events(n, seed=1):
+    rng = random.Random(seed)
+    out = []
+    t_ns = 0
+    for i in range(n):
+        t_ns += int(rng.expovariate(0.1) * 1e9)
+        name = rng.choice(EVENTS)
+        pellet = name == "Pellet"
+        retrieval = (f"{rng.uniform(0, 20):.2f}" if rng.random() > 0.05 else "Timed_out") if pellet else "nan"
+        fields = ["22.5", "40.1", "1.16.3", "FR1", "12", "4.12", "0", "1", name, "Left", str(i), "0", str(i // 3),
+                  "0", retrieval, str(rng.randint(5, 600)) if pellet else "nan",
+                  f"{rng.uniform(0.05, 2):.3f}" if not pellet else "nan", "nan", "nan", "nan", "nan"]
+        out.append(FED3Event.from_fields(fields, 1.7e9 + t_ns / 1e9, t_ns))
+    return out
+
+
+def rescan(events):
+    """The same counts and moments from every row."""
+    left = right = pellets = 0
+    retrieval = Moments()
+    ipi = Moments()
+    poke = {"left": Moments(), "right": Moments()}
+    for e in events:
+        ev = e.event.lower()
+        if ev in ("left", "leftwithpellet"):
+            left += 1
+        elif ev in ("right", "rightwithpellet"):
+            right += 1
+        elif ev == "pellet":
+            pellets += 1
+            if not isinstance(e.retrieval_time, str) and not e.is_nan("retrieval_time"):
+                retrieval.add(e.retrieval_time)
+            if not e.is_nan("inter_pellet_interval"):
+                ipi.add(e.inter_pellet_interval)
+        side = "left" if ev.startswith("left") else "right" if ev.startswith("right") else None
+        if side and not isinstance(e.poke_time, str) and not e.is_nan("poke_time"):
+            poke[side].add(e.poke_time)
+    return left, right, pellets, retrieval.n, retrieval.mean
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        result = fn()
+        times.append(time.perf_counter_ns() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'events':>9} {'update ns':>10} {'snapshot us':>12} {'rescan ms':>10}  agree")
+    for n in args.sizes:
+        events = make_events(n)
+        stats = SessionStats(clock_ns=lambda: events[-1].arrival_ns)
+        t0 = time.perf_counter_ns()
+        update = stats.update
+        for e in events:
+            update("Port 1", e)
+        per_update = (time.perf_counter_ns() - t0) / n
+        snap_ns, snap = best(stats.snapshot, 20)
+        rescan_ns, (left, right, pellets, rt_n, rt_mean) = best(lambda: rescan(events), 3 if n <= 100000 else 1)
+        s = snap["Port 1"]
+        agree = ((s["left"], s["right"], s["pellets"], s["retrieval_time"]["n"]) == (left, right, pellets, rt_n)
+                 and abs(s["retrieval_time"]["mean"] - rt_mean) < 1e-9)
+        print(f"{n:>9} {per_update:>10.0f} {snap_ns / 1e3:>12.1f} {rescan_ns / 1e6:>10.1f}  {agree}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Resident memory of a long session: list of FED3Event vs SessionStore.
+
+Appends the same events to a plain list (what data_to_save used to be) and
+to a SessionStore that spills full chunks to a temporary directory, and
+reports the memory each holds once all events are in. The store's figure
+stays flat as --events grows. It also times a full CSV export from the
+store and checks it matches the list.
+
+    python benchmarks/bench_session_store.py --events 200000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core.events import FED3Event, TTL_TIME_FORMAT
+from rtfed_core.session_store import SessionStore
+
+LINES = (
+    "4/16/2025 11:24:22,25.86,26.36,1.16.3,FR1,10,4.14,NaN,1,LeftWithPellet,Left,8,30,7,0,NaN,NaN,0.82,NaN,NaN,NaN,NaN",
+    "4/16/2025 11:24:23,25.86,26.36,1.16.3,FR1,10,4.14,1,1,Pellet,Left,8,30,8,1,2.31,45,NaN,NaN,NaN,NaN,NaN",
+    "4/16/2025 11:24:40,25.91,26.30,1.16.3,FR1,10,4.13,NaN,1,Right,Left,8,31,8,1,NaN,NaN,Timed_out,NaN,NaN,NaN,NaN",
+)
+
+
+def events(n, t0):
+    for i in range(n):
+        yield FED3Event.from_line(LINES[i % len(LINES)], t0 + i * 0.25)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--chunk-rows", type=int, default=4096)
+    args = parser.parse_args()
+    t0 = time.time()
+
+    tracemalloc.start()
+    rows = list(events(args.events, t0))
+    list_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracemalloc.start()
+        store = SessionStore(tmp, chunk_rows=args.chunk_rows)
+        for ev in events(args.events, t0):
+            store.append("Port 1", ev)
+        store_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        out = io.StringIO()
+        csv.writer(out).writerows(store.iter_rows("Port 1", TTL_TIME_FORMAT))
+        export_s = time.perf_counter() - start
+        expected = io.StringIO()
+        csv.writer(expected).writerows(ev.to_row(TTL_TIME_FORMAT) for ev in rows)
+        assert out.getvalue() == expected.getvalue()
+        spill_bytes = sum(os.path.getsize(os.path.join(root, f))
+                          for root, _, files in os.walk(tmp) for f in files)
+        store.close()
+
+    n = args.events
+    print(f"  list of events: {list_bytes / 1e6:8.2f} MB resident")
+    print(f"    SessionStore: {store_bytes / 1e6:8.2f} MB resident, {spill_bytes / 1e6:.2f} MB spilled")
+    print(f"      CSV export: {export_s:.2f} s for {n} events, identical to the list")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Google Sheets write calls: one append_rows per device vs the shared uploader.
+
+Replays --devices FED3s at --rate events/s for --minutes of session time
+against an in-memory spreadsheet that speaks the two gspread calls each
+path uses (Worksheet.append_rows, Spreadsheet.batch_update), charges
+--call-ms per request and, like the API, answers 429 to writes beyond
+60 in any minute. "per-device" is the old path: every device appends its
+own rows every --interval. "shared" is rtfed_core.sheets.SheetsUploader
+with that fixed interval and "adaptive" the same uploader left to pick
+its own; both run on the replay's clock. Prints write calls, rows per
+call, the busiest minute against the quota, the 429s received, and the
+dashboard lag (session time from an event to its row landing, p50/p99),
+and checks every path leaves the same rows in every worksheet.
+
+--outage START:MINUTES makes every write fail for that stretch of the
+session. The old path keeps retrying with the rows in RAM; the shared
+uploader spools them to disk, is stopped and restarted half-way through
+the outage (as after a reboot), and resumes from its acknowledged offsets.
+The table then also shows the most rows each path held in RAM and how long
+after the outage the backlog took to drain.
+
+    python benchmarks/bench_sheets_uploader.py --devices 16 --rate 0.5 --minutes 10
+    python benchmarks/bench_sheets_uploader.py --devices 16 --rate 2 --minutes 60 --outage 5:30
+    python benchmarks/bench_sheets_uploader.py --devices 16 --rate 0.05 --minutes 30
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import sheets
+from rtfed_core.events import FED3Event, SHEETS_TIME_FORMAT
+
+HEADERS = ["MM:DD:YYYY hh:mm:ss"] + [f"c{i}" for i in range(21)]
+
+
+class QuotaError(Exception):
+    """Stands in for gspread.exceptions.APIError on a 429."""
+
+    class response:
+        status_code = 429
+        headers = {}
+
+
+class MemorySpreadsheet:
+    def __init__(self, clock, call_ms, outage=(0, 0)):
+        self.clock = clock
+        self.call_ms = call_ms
+        self.outage = outage
+        self.rows = collections.defaultdict(list)  # title -> rows
+        self.landed = collections.defaultdict(list)  # title -> session time each data row arrived
+        self.titles = {}
+        self.writes = []  # session time of each write call
+        self.rejected = 0
+        self._minute = collections.deque()
+
+    def _write(self):
+        now = self.clock[0]
+        if self.outage[0] <= now < self.outage[1]:
+            raise ConnectionError("network unreachable")
+        while self._minute and self._minute[0] <= now - 60:
+            self._minute.popleft()
+        if len(self._minute) >= sheets.WRITE_QUOTA_PER_MIN:
+            self.rejected += 1
+            raise QuotaError("429 RESOURCE_EXHAUSTED: write requests per minute per user")
+        self._minute.append(now)
+        self.writes.append(now)
+        time.sleep(self.call_ms / 1000)
+
+    def _land(self, title, rows):
+        self.rows[title].extend(rows)
+        self.landed[title].extend(self.clock[0] for r in rows if r != HEADERS)
+
+    # Worksheet-style access for the per-device path
+    def append_rows(self, title, rows):
+        self._write()
+        self._land(title, rows)
+
+    # Spreadsheet API used by SheetsUploader
+    def fetch_sheet_metadata(self):
+        return {"sheets": [{"properties": {"title": t, "sheetId": i}} for t, i in self.titles.items()]}
+
+    def batch_update(self, body):
+        self._write()
+        replies = []
+        by_id = {i: t for t, i in self.titles.items()}
+        for request in body["requests"]:
+            if "addSheet" in request:
+                title = request["addSheet"]["properties"]["title"]
+                self.titles[title] = len(self.titles) + 1
+                replies.append({"addSheet": {"properties": {"title": title, "sheetId": self.titles[title]}}})
+            else:
+                cells = request["appendCells"]
+                self._land(by_id[cells["sheetId"]],
+                           [[c["userEnteredValue"]["stringValue"] for c in row["values"]] for row in cells["rows"]])
+                replies.append({})
+        return {"replies": replies}
+
+
+class MemoryClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+
+def events(devices, rate, seconds, seed=1):
+    rng = random.Random(seed)
+    out = []
+    for d in range(1, devices + 1):
+        t = 0.0
+        while True:
+            t += rng.expovariate(rate)
+            if t >= seconds:
+                break
+            fields = ["1.16.3", "FR1", d, "0", "5", "Left", "Left", "1", "0", "1", "0", "0", "0", "0.5"] + ["nan"] * 7
+            out.append((t, d, FED3Event.from_fields([str(f) for f in fields], 1.7e9 + t)))
+    out.sort(key=lambda x: x[0])
+    return out
+
+
+def lag_percentiles(stream, sheet):
+    """p50 and p99 of the session time between each event and its row landing."""
+    at = collections.defaultdict(list)
+    for t, d, _ in stream:
+        at[sheets.worksheet_title(d)].append(t)
+    lags = sorted(landed - t for title, times in at.items() for t, landed in zip(times, sheet.landed[title]))
+    if not lags:
+        return 0.0, 0.0
+    return lags[len(lags) // 2], lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+
+
+def busiest_minute(writes):
+    best = 0
+    j = 0
+    for i, t in enumerate(writes):
+        while writes[j] <= t - 60:
+            j += 1
+        best = max(best, i - j + 1)
+    return best
+
+
+def ticks(stream, interval):
+    """Yield (session time, [(device, event), ...]) once per send interval."""
+    batch = []
+    next_send = interval
+    for t, d, ev in stream:
+        while t >= next_send:
+            yield next_send, batch
+            batch = []
+            next_send += interval
+        batch.append((d, ev))
+    yield next_send, batch
+
+
+def per_device(stream, devices, interval, call_ms, outage, tail):
+    clock = [0.0]
+    sheet = MemorySpreadsheet(clock, call_ms, outage)
+    for d in range(1, devices + 1):
+        sheet.append_rows(sheets.worksheet_title(d), [HEADERS])
+    pending = collections.defaultdict(list)
+    peak = 0
+    drained = None
+    end = stream[-1][0] + tail if stream else tail
+    for now, batch in ticks(stream + [(end, None, None)], interval):
+        clock[0] = now
+        for d, ev in batch:
+            if ev is not None:
+                # Converted once here rather than on every retry, to keep long outages quick to replay
+                pending[sheets.worksheet_title(d)].append(ev.to_row(SHEETS_TIME_FORMAT))
+        peak = max(peak, sum(map(len, pending.values())))
+        for title, rows in pending.items():
+            if rows:
+                try:
+                    sheet.append_rows(title, rows)
+                    pending[title] = []
+                except (ConnectionError, QuotaError):
+                    pass
+        if drained is None and now >= outage[1] and not any(pending.values()):
+            drained = now
+    return sheet, peak, drained
+
+
+def shared(stream, devices, interval, call_ms, outage, tail, spool_dir):
+    clock = [0.0]
+    sheet = MemorySpreadsheet(clock, call_ms, outage)
+
+    def new_uploader():
+        # Runs on the replay's clock; the replay calls flush() after each next_delay
+        u = sheets.SheetsUploader(MemoryClient(sheet), "bench", HEADERS, interval, on_log=lambda m: None,
+                                  spool_dir=spool_dir, clock=lambda: clock[0])
+        u._resume_spools()
+        return u
+
+    uploader = new_uploader()
+    for d in range(1, devices + 1):
+        uploader.add_sheet(sheets.worksheet_title(d))
+    restart = (outage[0] + outage[1]) / 2 if outage[1] > outage[0] else None
+    peak = 0
+    drained = None
+    end = stream[-1][0] + tail if stream else tail
+    i = 0
+    while clock[0] < end:
+        clock[0] = min(end, clock[0] + uploader.next_delay)
+        while i < len(stream) and stream[i][0] < clock[0]:
+            _, d, ev = stream[i]
+            uploader.add(sheets.worksheet_title(d), ev)
+            i += 1
+        peak = max(peak, uploader.waiting)
+        uploader.flush()
+        if restart is not None and clock[0] >= restart:
+            restart = None
+            for spool in uploader._spools.values():
+                spool.close()
+            uploader = new_uploader()
+        if drained is None and clock[0] >= outage[1] and not uploader.spooled:
+            drained = clock[0]
+    for spool in uploader._spools.values():
+        spool.close()
+    return sheet, peak, drained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0.5, help="events/s per device")
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--call-ms", type=float, default=0.0, help="simulated latency per API call")
+    parser.add_argument("--outage", default=None, help="START:MINUTES of failed writes, in session minutes")
+    args = parser.parse_args()
+
+    outage = (0, 0)
+    if args.outage:
+        start, length = (float(x) * 60 for x in args.outage.split(":"))
+        outage = (start, start + length)
+    stream = events(args.devices, args.rate, args.minutes * 60)
+    tail = max(60.0, outage[1] - args.minutes * 60 + 600)
+    old, old_peak, old_drained = per_device(stream, args.devices, args.interval, args.call_ms, outage, tail)
+    runs = [("per-device", old, old_peak, old_drained)]
+    for name, interval in (("shared", args.interval), ("adaptive", None)):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            runs.append((name,) + shared(stream, args.devices, interval, args.call_ms, outage, tail, spool_dir))
+    same = all(old.rows[t] == sheet.rows[t] for _, sheet, _, _ in runs for t in set(old.rows) | set(sheet.rows))
+
+    print(f"{args.devices} devices x {args.rate} events/s, {args.minutes} min, {len(stream)} rows, "
+          f"fixed interval {args.interval} s" + (f", outage {args.outage}" if args.outage else ""))
+    print(f"{'path':>11} {'calls':>7} {'rows/call':>10} {'peak calls/min':>15} {'429s':>6} "
+          f"{'peak RAM rows':>14} {'drained after':>14} {'lag p50 s':>10} {'lag p99 s':>10}")
+    for name, sheet, peak, drained in runs:
+        after = "-" if drained is None else f"{max(0.0, drained - outage[1]):.0f} s"
+        p50, p99 = lag_percentiles(stream, sheet)
+        print(f"{name:>11} {len(sheet.writes):>7} {len(stream) / max(1, len(sheet.writes)):>10.1f} "
+              f"{busiest_minute(sheet.writes):>9}/{sheets.WRITE_QUOTA_PER_MIN} {sheet.rejected:>6} "
+              f"{peak:>14} {after:>14} {p50:>10.1f} {p99:>10.1f}")
+    print(f"same rows in every worksheet: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Serial-reader stall with inline destinations vs the sink pipeline.
+
+A reader thread replays --devices FED3s at --rate events/s for --seconds
+of real time and hands every event to the CSV log, the columnar store,
+SQLite and the Sheets uploader, which talks HTTP to a local
+rtfed_core.sheets_mock server. One more destination is slow: it sleeps
+--stall-ms per call, like an SD card in a long fsync or a network sink
+with a slow peer. "inline" is the old shape, where the reader calls every
+destination itself; "pipeline" publishes to rtfed_core.sinks.SinkPipeline.
+Prints the time the reader spends per event (p50/p99/max), how far behind
+schedule it ended, and per sink the events stored, the peak queue and the
+p99 batch write time. Then checks every event reached the mock, and
+measures upload throughput: --burst rows pushed through SheetsUploader to
+the mock with its quota off, reported as rows/s on the wire.
+
+    python benchmarks/bench_sinks.py --devices 16 --rate 5 --seconds 10 --stall-ms 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import sinks
+from rtfed_core.csv_log import CSVLogSet
+from rtfed_core.events import FED3Event, SHEETS_TIME_FORMAT, column_headers
+from rtfed_core.latency import LatencyHistogram
+from rtfed_core.session_store import SessionStore
+from rtfed_core.sheets import SheetsUploader, worksheet_title
+from rtfed_core.sheets_mock import MockSheetsClient, MockSheetsServer
+
+HEADERS = column_headers("MM/DD/YYYY hh:mm:ss.SSS")
+EVENTS = ("Left", "Right", "Pellet", "LeftShort", "Left", "Pellet")
+
+
+class SlowSink(sinks.Sink):
+    name = "slow"
+
+    def __init__(self, stall_ms, **kwargs):
+        super().__init__(**kwargs)
+        self.stall_ms = stall_ms
+
+    def write(self, batch):
+        time.sleep(self.stall_ms / 1000)
+
+
+def schedule(devices, rate, seconds, seed=1):
+    rng = random.Random(seed)
+    out = []
+    for d in range(1, devices + 1):
+        t = 0.0
+        n = 0
+        while True:
+            t += rng.expovariate(rate)
+            if t >= seconds:
+                break
+            n += 1
+            fields = ["22.5", "40.1", "1.16.3", "FR1", d, "4.12", "0", "1", rng.choice(EVENTS), "Left",
+                      n, 0, n // 2, 0, "0.5", "12", "0.210", "nan", "nan", "nan", "nan"]
+            out.append((t, f"/dev/ttyACM{d}", d, [str(f) for f in fields]))
+    out.sort(key=lambda x: x[0])
+    return out
+
+
+def replay(stream, deliver):
+    """Call deliver(port, event) for each event at its time; returns (per-call ns histogram, end lag s)."""
+    hist = LatencyHistogram()
+    start = time.monotonic()
+    for t, port, _, fields in stream:
+        delay = start + t - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        event = FED3Event.from_fields(fields, time.time(), time.monotonic_ns())
+        t0 = time.perf_counter_ns()
+        deliver(port, event)
+        hist.record(time.perf_counter_ns() - t0)
+    return hist, max(0.0, time.monotonic() - start - stream[-1][0]) if stream else 0.0
+
+
+def destinations(tmp, mode, mock_url, spreadsheet, stall_ms):
+    folder = os.path.join(tmp, mode)
+    os.makedirs(folder)
+    uploader = SheetsUploader(MockSheetsClient(mock_url), spreadsheet, HEADERS, on_log=lambda m: None,
+                              spool_dir=os.path.join(folder, "spool"))
+    uploader.start()
+    return [
+        sinks.CSVSink(CSVLogSet(lambda port: os.path.join(folder, os.path.basename(port) + ".csv"), HEADERS,
+                                SHEETS_TIME_FORMAT)),
+        sinks.ColumnarSink(SessionStore(folder),
+                           lambda port: os.path.join(folder, os.path.basename(port) + ".fed3z"),
+                           HEADERS[0], SHEETS_TIME_FORMAT, on_log=lambda m: None),
+        sinks.SQLiteSink(os.path.join(folder, "events.sqlite")),
+        sinks.SheetsSink(uploader, lambda port: port.rsplit("ACM", 1)[-1], on_log=lambda m: None),
+        SlowSink(stall_ms),
+    ]
+
+
+def run_inline(stream, sink_list):
+    lock = threading.Lock()
+
+    def deliver(port, event):
+        # The old readers called each destination in turn on their own thread
+        with lock:
+            for sink in sink_list:
+                sink.write([(port, event)])
+    hist, lag = replay(stream, deliver)
+    for sink in sink_list:
+        sink.close()
+    return hist, lag, None
+
+
+def run_pipeline(stream, sink_list):
+    pipeline = sinks.SinkPipeline(sink_list, on_log=lambda m: None)
+    hist, lag = replay(stream, pipeline.publish)
+    pipeline.close()
+    return hist, lag, pipeline.stats()
+
+
+def burst(mock_url, rows, tmp):
+    server_rows = MockSheetsClient(mock_url).stats()["rows"]
+    uploader = SheetsUploader(MockSheetsClient(mock_url), "burst", HEADERS, on_log=lambda m: None,
+                              spool_dir=os.path.join(tmp, "burst-spool"))
+    fields = schedule(1, 10, 1, seed=2)[0][3]
+    for i in range(rows):
+        uploader.add(worksheet_title(1 + i % 16), FED3Event.from_fields(fields, 1.7e9 + i))
+    start = time.perf_counter()
+    uploader.flush()
+    while uploader.spooled:
+        uploader._retry_at = 0.0
+        uploader._bucket.tokens = uploader._bucket.capacity  # the quota is off on the mock
+        uploader.flush()
+    elapsed = time.perf_counter() - start
+    return MockSheetsClient(mock_url).stats()["rows"] - server_rows, elapsed, uploader.api_calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=5.0, help="events/s per device")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--stall-ms", type=float, default=50.0, help="time the slow destination takes per call")
+    parser.add_argument("--burst", type=int, default=50000, help="rows for the upload throughput run")
+    args = parser.parse_args()
+
+    stream = schedule(args.devices, args.rate, args.seconds)
+    print(f"{args.devices} devices x {args.rate} events/s, {args.seconds} s, {len(stream)} events, "
+          f"slow destination {args.stall_ms} ms per call")
+    with tempfile.TemporaryDirectory() as tmp, MockSheetsServer(quota_per_min=0) as mock:
+        print(f"{'path':>9} {'p50 us':>9} {'p99 us':>9} {'max ms':>9} {'behind s':>9}   "
+              f"per sink: stored/peak queue/p99 write ms")
+        for mode, run in (("inline", run_inline), ("pipeline", run_pipeline)):
+            hist, lag, stats = run(stream, destinations(tmp, mode, mock.url, mode, args.stall_ms))
+            line = (f"{mode:>9} {hist.percentile(50) / 1e3:>9.1f} {hist.percentile(99) / 1e3:>9.1f} "
+                    f"{hist.max / 1e6:>9.1f} {lag:>9.1f}")
+            if stats:
+                line += "   " + ", ".join(f"{name} {s['delivered']}/{s['high_water']}/{s['write_p99_ms']:.1f}"
+                                          for name, s in stats.items())
+            print(line)
+            client = MockSheetsClient(mock.url)
+            landed = sum(len(client.rows(mode, worksheet_title(d))) - 1 for d in range(1, args.devices + 1))
+            print(f"{'':>9} rows in the Sheets mock: {landed} of {len(stream)}")
+        rows, elapsed, calls = burst(mock.url, args.burst, tmp)
+        print(f"upload throughput: {rows} rows in {calls} calls, {elapsed:.2f} s, "
+              f"{rows / elapsed:.0f} rows/s on the wire")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""End-to-end serial-to-TTL latency with the built-in histograms.
+
+Four pseudo-terminals stand in for FED3s on Ports 1-4. Lines go through
+SerialMultiplexer, FED3Event parsing and PulseScheduler (fake GPIO), the
+same path RTFEDPiTTL uses. Each line's read stamp and rising edge feed a
+LatencyRecorder. The per-port summary is printed in the shape of
+source/SPEED_TEST_RESULTS/Pi_TTL_Timing_Summary_Per_Port.csv, next to that
+baseline, followed by p50/p99/max per event.
+
+    python benchmarks/bench_ttl_latency.py --events 100
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_ttl_pulses import load_baseline, SCRIPTS_DIR  # noqa: E402
+
+sys.path.insert(0, SCRIPTS_DIR)
+from rtfed_core import clock  # noqa: E402
+from rtfed_core.events import FED3Event  # noqa: E402
+from rtfed_core.gpio import FakeGPIO  # noqa: E402
+from rtfed_core.latency import DELAY, DURATION, LatencyRecorder  # noqa: E402
+from rtfed_core.serial_mux import SerialMultiplexer  # noqa: E402
+from rtfed_core.ttl_scheduler import PulseScheduler  # noqa: E402
+
+PINS = {"Port 1": {"Left": 17, "Right": 27}, "Port 2": {"Left": 10, "Right": 9},
+        "Port 3": {"Left": 0, "Right": 5}, "Port 4": {"Left": 13, "Right": 19}}
+LINE = "4/16/2025 11:24:22,25.86,26.36,1.16.3,FR1,{dev},4.14,NaN,1,{event},Left,8,30,7,0,NaN,NaN,0.82,NaN,NaN,NaN,NaN\r\n"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=100, help="events per port")
+    parser.add_argument("--width-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    latency = LatencyRecorder()
+    owner = {}
+
+    def on_pulse_end(pin, rise_ns, fall_ns, target_ns):
+        if pin in owner:
+            latency.record(*owner.pop(pin), DURATION, fall_ns - rise_ns)
+
+    scheduler = PulseScheduler(FakeGPIO(), on_pulse_end)
+    done = threading.Event()
+    seen = [0]
+
+    def on_line(port, line, arrival_ns):
+        event = FED3Event.from_line(line, clock.anchor.wall(arrival_ns), arrival_ns)
+        pin = PINS[port][event.event]
+        rise_ns = scheduler.pulse(pin, args.width_ms)
+        if rise_ns >= arrival_ns:
+            latency.record(port, event.event, DELAY, rise_ns - arrival_ns)
+            owner[pin] = (port, event.event)
+        seen[0] += 1
+        if seen[0] == args.events * len(PINS):
+            done.set()
+
+    clock.anchor.reset()
+    mux = SerialMultiplexer(on_line)
+    masters = {}
+    for dev, port in enumerate(PINS, start=1):
+        master, slave = os.openpty()
+        masters[port] = (master, dev)
+        mux.add_port(port, serial.Serial(os.ttyname(slave), 115200, timeout=0))
+    scheduler.start()
+    mux.start()
+    time.sleep(0.1)
+    for _ in range(args.events):
+        for port, (master, dev) in masters.items():
+            os.write(master, LINE.format(dev=dev, event=random.choice(("Left", "Right"))).encode())
+        # Longer than the pulse so each one completes before its pin is used again
+        time.sleep(args.width_ms / 1000 * 2.2 + random.uniform(0, 0.01))
+    done.wait(10)
+    time.sleep(args.width_ms / 500)
+    mux.stop()
+    scheduler.stop()
+
+    baseline = {row["Port #"]: row for row in load_baseline()}
+    print(f"{'Port #':>7} {'Mean delay':>11} {'SD delay':>10} {'Mean duration':>14} {'SD duration':>12} {'N':>5}"
+          f" | baseline delay")
+    for port, mean_d, sd_d, mean_w, sd_w, n in latency.per_port_rows():
+        ref = baseline.get(port)
+        ref_text = f"{float(ref['Mean delay']) * 1e3:.3f} ± {float(ref['SD delay']) * 1e3:.3f} ms" if ref else "-"
+        print(f"{port:>7} {mean_d * 1e3:>8.3f} ms {sd_d * 1e3:>7.3f} ms {mean_w * 1e3:>11.3f} ms "
+              f"{sd_w * 1e3:>9.3f} ms {n:>5} | {ref_text}")
+    print()
+    for row in latency.per_event_rows():
+        port, event, n, _, _, p50, p99, mx = row[:8]
+        print(f"{port:>7} {event:>6}: delay p50 {p50 * 1e6:7.1f} us, p99 {p99 * 1e6:7.1f} us, "
+              f"max {mx * 1e6:7.1f} us (n={n})")
+
+
+if __name__ == "__main__":
+    main()
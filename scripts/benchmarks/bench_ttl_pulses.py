@@ -0,0 +1,80 @@
+"""Pulse-width benchmark for the TTL scheduler.
+
+Fires pulses on the 24 PiTTL pins (with some overlapping retriggers) and
+compares the achieved widths with the per-port baseline measured on the Pi
+(source/SPEED_TEST_RESULTS/Pi_TTL_Timing_Summary_Per_Port.csv). With the
+default fake backend the widths are also measured from the recorded edges;
+on a Pi, --backend rpi or gpiod drives the real pins.
+
+    python benchmarks/bench_ttl_pulses.py --pulses 200 --width-ms 100 [--backend fake]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPTS_DIR)
+from rtfed_core.gpio import BACKENDS, FakeGPIO, open_backend
+from rtfed_core.ttl_scheduler import PulseScheduler
+
+BASELINE_CSV = os.path.join(os.path.dirname(SCRIPTS_DIR), "source", "SPEED_TEST_RESULTS",
+                            "Pi_TTL_Timing_Summary_Per_Port.csv")
+PINS = [17, 27, 22, 10, 9, 11, 0, 5, 6, 13, 19, 26, 14, 15, 18, 23, 24, 25, 8, 7, 1, 12, 16, 20]
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_CSV):
+        return []
+    with open(BASELINE_CSV, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pulses", type=int, default=200)
+    parser.add_argument("--width-ms", type=float, default=100)
+    parser.add_argument("--overlap", type=float, default=0.1, help="fraction of pulses retriggered while high")
+    parser.add_argument("--backend", default="fake", choices=sorted(BACKENDS))
+    args = parser.parse_args()
+
+    backend = open_backend(args.backend, PINS)
+    scheduler = PulseScheduler(backend)
+    scheduler.start()
+    call_ns = []
+    for i in range(args.pulses):
+        pin = PINS[i % len(PINS)]
+        t0 = time.perf_counter_ns()
+        scheduler.pulse(pin, args.width_ms)
+        call_ns.append(time.perf_counter_ns() - t0)
+        if random.random() < args.overlap:
+            time.sleep(args.width_ms / 4000)
+            scheduler.pulse(pin, args.width_ms)
+        time.sleep(random.uniform(0, 0.01))
+    time.sleep(args.width_ms / 500)
+    scheduler.stop()
+    backend.cleanup()
+
+    widths = [st for st in scheduler.stats.values() if st.n]
+    n = sum(st.n for st in widths)
+    mean = sum(st.mean * st.n for st in widths) / n
+    call_ns.sort()
+    print(f"pulses completed: {n} (overlaps merged: {sum(st.overlaps for st in widths)})")
+    print(f"pulse() call: median {call_ns[len(call_ns) // 2] / 1000:.1f} us, max {call_ns[-1] / 1000:.1f} us")
+    print(f"achieved width: mean {mean * 1000:.3f} ms (retriggered pulses run longer), "
+          f"mean error vs deadline {sum(st.error_sum for st in widths) / n * 1e6:.1f} us")
+    if isinstance(backend, FakeGPIO):
+        edge_widths = [fall - rise for _, rise, fall in backend.pulses()]
+        print(f"edge-measured width: mean {sum(edge_widths) / len(edge_widths) / 1e6:.3f} ms "
+              f"over {len(edge_widths)} recorded pulses, {backend.writes} output() calls")
+    for pin, st in sorted(scheduler.stats.items())[:4]:
+        print(f"pin {pin}: {st.mean * 1000:.3f} ± {st.sd * 1000:.3f} ms (N={st.n})")
+    for row in load_baseline():
+        print(f"baseline {row['Port #']}: {float(row['Mean duration']) * 1000:.3f} ± "
+              f"{float(row['SD duration']) * 1000:.3f} ms (N={row['N']})")
+
+
+if __name__ == "__main__":
+    main()
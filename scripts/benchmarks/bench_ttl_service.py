@@ -0,0 +1,89 @@
+"""Serial-to-TTL delay of the headless service with and without GUI clients.
+
+Runs rtfed_core.ttl_service in-process on a virtual FED3 fleet with the
+fake GPIO backend and records a session three times: with no client
+attached, with a subscribed client that drains every push, and with a
+subscribed client that never reads (a stalled Tk window). Prints the delay
+p50/p99/max from the service's own histograms and the pushes each client
+received or lost.
+
+    python benchmarks/bench_ttl_service.py --devices 8 --rate 10 --seconds 10
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rtfed_core import ipc
+from rtfed_core.fed3_sim import ENV_VAR as FLEET_ENV_VAR, VirtualFED3Fleet
+from rtfed_core.latency import DELAY, LatencyHistogram
+from rtfed_core.ttl_service import TTLService, port_names
+
+
+def run(mode, seconds, tmp):
+    sock = os.path.join(tmp, f"{mode}.sock")
+    service = TTLService("fake", sock)
+    thread = threading.Thread(target=service.serve, kwargs={"persist": True}, daemon=True)
+    thread.start()
+    while not os.path.exists(sock):
+        time.sleep(0.05)
+    with service._lock:
+        service.check_connected_devices()
+    control = ipc.IPCClient(sock).connect()
+    client = None
+    received = [0]
+    if mode == "reader":
+        client = ipc.IPCClient(sock).connect()
+        client.call("subscribe")
+
+        def drain():
+            while client.pushes.get() is not None:
+                received[0] += 1
+        threading.Thread(target=drain, daemon=True).start()
+    elif mode == "stalled":
+        # Subscribe on a raw socket and never read it: the kernel buffer fills
+        # and the service's writer thread for this client blocks in sendall()
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        client.connect(sock)
+        client.sendall(b'{"id": 1, "cmd": "subscribe"}\n')
+    save = os.path.join(tmp, mode)
+    os.makedirs(save)
+    control.call("start", experimenter="bench", experiment=mode, save_path=save, flat_data_path=save)
+    time.sleep(seconds)
+    merged = LatencyHistogram()
+    for port in port_names:
+        merged.merge(service.latency.combined(port, DELAY))
+    dropped = sum(c.dropped for c in list(service.server._connections))
+    control.call("stop", timeout=120)
+    control.call("shutdown")
+    thread.join(10)
+    control.close()
+    if client is not None:
+        client.close()
+    return merged, received[0], dropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=10.0, help="events/s per device")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, VirtualFED3Fleet(args.devices, args.rate, seed=1) as fleet:
+        os.environ.update(fleet.environ())
+        print(f"{'clients':>16} {'N':>6} {'p50 us':>8} {'p99 us':>8} {'max us':>8} {'pushes':>8} {'dropped':>8}")
+        for mode in ("none", "reader", "stalled"):
+            hist, received, dropped = run(mode, args.seconds, tmp)
+            print(f"{mode:>16} {hist.n:>6} {hist.percentile(50) / 1e3:>8.1f} {hist.percentile(99) / 1e3:>8.1f} "
+                  f"{hist.max / 1e3:>8.1f} {received:>8} {dropped:>8}")
+        os.environ.pop(FLEET_ENV_VAR, None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared acquisition helpers used by the RTFED(PiTTL), RTFED(Pi) and RTFED(PiCAM) apps."""
@@ -0,0 +1,383 @@
+"""Offline analysis of recorded sessions, vectorized with NumPy.
+
+A Session holds one device's recording as columns: ``t`` (float64
+seconds, local wall-clock time as the CSVs print it), ``event`` (a
+fixed-width str array) and every numeric FED3 field as float64 with NaN
+for "NaN", "Timed_out" and other text. convert() also returns which token
+each NaN was (TOKEN_NAN, TOKEN_TIMED_OUT, TOKEN_ERROR, ...), kept per
+column in ``Session.tokens`` where a column has any. Columns are found by header name
+through the column_headers schema (events.DATA_FIELDS), so CSVs from any
+app and older firmware with fewer fields load the same way; a field the
+file lacks is all NaN. load() reads a ``Port N.csv`` from an experiment
+folder, a flat-folder CSV or a ``.fed3z`` columnar file.
+
+Every analysis below is a handful of array operations over a whole
+session, never a Python loop over rows:
+
+    inter_pellet_intervals  seconds between consecutive pellets
+    bouts / meals           runs of events separated by less than a gap
+                            (meals: pellets within 60 s, at least 2)
+    retrieval_latency       Retrieval_Time of each pellet, its percentiles
+                            and histogram, and the pellets never retrieved
+    pr_breakpoint           the last ratio completed before the first lapse
+                            of ``lapse_s`` without a pellet
+    chronogram / circadian  counts in fixed bins over the session, or folded
+                            onto the time of day and averaged per day
+
+summarize() gives one row of these per session, and the CLI prints or
+writes them for folders of sessions. The flat folder holds byte copies of
+the experiment folders' files, so the CLI summarizes each distinct content
+once and says which paths it skipped as copies. A file that does not load
+as a session is reported and left out::
+
+    python -m rtfed_core.analysis DATA/ --meal-gap 60 -o summary.csv
+"""
+import argparse
+import csv
+import datetime
+import glob
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+from . import columnar
+from .events import ATTRS, DATA_FIELDS, TEXT_FIELDS
+
+MEAL_GAP_S = 60.0
+MEAL_MIN_PELLETS = 2
+PR_LAPSE_S = 3600.0
+DAY_S = 86400.0
+
+_ATTR_FOR = dict(zip(DATA_FIELDS, ATTRS))
+_NUMERIC = tuple(attr for attr in ATTRS if attr not in TEXT_FIELDS)
+
+SUMMARY_HEADER = ["Session", "Device_Number", "Session_type", "Hours", "Events", "Pellets", "Left", "Right",
+                  "Meals", "Meal_size_mean", "Pellets_in_meals", "IPI_median", "Retrieval_median",
+                  "Retrieval_p90", "Not_retrieved", "PR_breakpoint"]
+
+
+TOKEN_NUMBER = 0
+TOKEN_NAN = 1
+TOKEN_TIMED_OUT = 2
+TOKEN_ERROR = 3
+TOKEN_EMPTY = 4
+TOKEN_TEXT = 5  # any other text
+_TOKENS = (("Timed_out", TOKEN_TIMED_OUT), ("Error", TOKEN_ERROR), ("", TOKEN_EMPTY))
+
+
+def convert(values):
+    """(float64 array, int8 token array or None) from a column of strings.
+
+    Numbers parse as floats; everything else is NaN, and the token array (None
+    when the column is all numbers) says which: NaN, Timed_out, Error, empty or
+    other text.
+    """
+    values = np.char.strip(np.asarray(values, dtype=str))
+    try:
+        out = values.astype(np.float64)
+    except ValueError:
+        pass
+    else:
+        nan = np.isnan(out)
+        return out, (nan.astype(np.int8) if nan.any() else None)
+    tokens = np.zeros(len(values), dtype=np.int8)
+    for text, token in _TOKENS:
+        tokens[values == text] = token
+    numeric = np.where(tokens == TOKEN_NUMBER, values, "nan")
+    try:
+        out = numeric.astype(np.float64)
+    except ValueError:
+        out = np.full(len(values), np.nan)
+        for i in np.flatnonzero(tokens == TOKEN_NUMBER):
+            try:
+                out[i] = float(numeric[i])
+            except ValueError:
+                tokens[i] = TOKEN_TEXT
+    tokens[(tokens == TOKEN_NUMBER) & np.isnan(out)] = TOKEN_NAN
+    return out, tokens
+
+
+def _times(stamps):
+    """Seconds from the CSVs' timestamps (TTL "YYYY-MM-DD ..." or Sheets "MM/DD/YYYY ...")."""
+    if not len(stamps):
+        return np.empty(0)
+    if "/" in stamps[0][:10]:
+        stamps = [f"{s[6:10]}-{s[0:2]}-{s[3:5]}{s[10:]}" for s in stamps]
+    return np.asarray(stamps, dtype="datetime64[ms]").astype(np.int64) / 1000.0
+
+
+class Session:
+    """One device's recording as arrays; see the module docstring for the columns."""
+
+    def __init__(self, t, event, numeric, text=None, source=None, tokens=None):
+        self.t = t
+        self.event = event
+        self.numeric = numeric  # attr -> float64 array
+        self.text = text or {}  # attr -> str array, for the other text fields
+        self.tokens = tokens or {}  # attr -> int8 TOKEN_* array, for numeric columns with any NaN
+        self.source = source
+
+    @classmethod
+    def from_columns(cls, headers, columns, source=None):
+        """Build from a header row (any column_headers layout) and one sequence per column."""
+        by_attr = {_ATTR_FOR[h.strip()]: col for h, col in zip(headers[1:], columns[1:]) if h.strip() in _ATTR_FOR}
+        n = len(columns[0]) if columns else 0
+        t = _times(columns[0]) if n else np.empty(0)
+        numeric = {}
+        tokens = {}
+        for attr in _NUMERIC:
+            if attr in by_attr:
+                numeric[attr], column_tokens = convert(by_attr[attr])
+                if column_tokens is not None:
+                    tokens[attr] = column_tokens
+            else:
+                numeric[attr] = np.full(n, np.nan)
+        text = {attr: np.asarray(by_attr.get(attr, [""] * n), dtype=str) for attr in TEXT_FIELDS if attr != "event"}
+        return cls(t, np.asarray(by_attr.get("event", [""] * n), dtype=str), numeric, text, source, tokens)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="") as f:
+            return cls.from_lines(f, path)
+
+    @classmethod
+    def from_lines(cls, lines, source=None):
+        """Parse CSV text lines (a file, or data already read) with its header row."""
+        reader = csv.reader(lines)
+        headers = next(reader, None)
+        if not headers:
+            return cls.from_columns([], [], source)
+        width = len(headers)
+        rows = [row for row in reader if len(row) >= width]
+        columns = list(zip(*rows)) if rows else [()] * width
+        return cls.from_columns(headers, [list(c) for c in columns], source)
+
+    @classmethod
+    def from_columnar(cls, path):
+        with columnar.ColumnarSession(path) as s:
+            received = np.asarray(s.received(), dtype=np.float64)
+            # Epoch seconds to local wall-clock seconds, as the CSV timestamps are
+            offset = (datetime.datetime.fromtimestamp(received[0]).astimezone().utcoffset().total_seconds()
+                      if len(received) else 0.0)
+            numeric = {attr: np.asarray(s.column(attr), dtype=np.float64) for attr in _NUMERIC}
+            text = {attr: np.asarray(s.column(attr), dtype=str) for attr in TEXT_FIELDS if attr != "event"}
+            return cls(received + offset, np.asarray(s.column("event"), dtype=str), numeric, text, path)
+
+    def __len__(self):
+        return len(self.t)
+
+    def __getitem__(self, attr):
+        return self.numeric[attr]
+
+    @property
+    def device_number(self):
+        dn = self.numeric["device_number"]
+        dn = dn[~np.isnan(dn)]
+        return int(dn[0]) if len(dn) else None
+
+    @property
+    def session_type(self):
+        st = self.text["session_type"]
+        return str(st[0]) if len(st) else ""
+
+    @property
+    def hours(self):
+        return (self.t[-1] - self.t[0]) / 3600 if len(self.t) > 1 else 0.0
+
+    def mask(self, *names):
+        """True where Event is one of ``names``."""
+        return np.isin(self.event, names)
+
+    def pokes(self, side=None):
+        """True at every poke (Left*, Right*), or one side's ("Left"/"Right")."""
+        if side is not None:
+            return np.char.startswith(self.event, side)
+        return np.char.startswith(self.event, "Left") | np.char.startswith(self.event, "Right")
+
+    def pellet_times(self):
+        return self.t[self.event == "Pellet"]
+
+
+def load(path):
+    if path.endswith(columnar.SUFFIX):
+        return Session.from_columnar(path)
+    return Session.from_csv(path)
+
+
+def find_sessions(paths):
+    """Session files under folders (recursively) or given directly; a .fed3z wins over its .csv."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "**", "*.csv"), recursive=True))
+            found.extend(glob.glob(os.path.join(path, "**", "*" + columnar.SUFFIX), recursive=True))
+        else:
+            found.append(path)
+    by_base = {}
+    for path in sorted(found):
+        base, ext = os.path.splitext(path)
+        if base.endswith(("_summary", "_stats")) or os.path.basename(base).startswith("TTL_"):
+            continue
+        if ext == columnar.SUFFIX or base not in by_base:
+            by_base[base] = path
+    return sorted(by_base.values())
+
+
+def unique_contents(paths):
+    """(paths with distinct bytes, [(copy, path it duplicates)]), keeping the first of each in order."""
+    first = {}
+    unique = []
+    copies = []
+    for path in paths:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        key = digest.digest()
+        if key in first:
+            copies.append((path, first[key]))
+        else:
+            first[key] = path
+            unique.append(path)
+    return unique, copies
+
+
+def inter_pellet_intervals(session):
+    return np.diff(session.pellet_times())
+
+
+def bouts(times, gap_s, min_size=1):
+    """Runs of ``times`` (sorted) with every gap < ``gap_s``: (start, end, size) arrays."""
+    times = np.asarray(times, dtype=np.float64)
+    if not len(times):
+        empty = np.empty(0)
+        return empty, empty, np.empty(0, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(times) >= gap_s) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks, [len(times)])) - 1
+    size = last - first + 1
+    keep = size >= min_size
+    return times[first[keep]], times[last[keep]], size[keep]
+
+
+def meals(session, gap_s=MEAL_GAP_S, min_pellets=MEAL_MIN_PELLETS):
+    """Meals as (start, end, pellets) arrays."""
+    return bouts(session.pellet_times(), gap_s, min_pellets)
+
+
+def retrieval_latency(session, percentiles=(50, 90, 99), bins=None):
+    """Retrieval_Time of each retrieved pellet, and its distribution.
+
+    Returns a dict with ``values``, ``percentiles`` ({p: seconds}), ``not_retrieved``
+    (pellets whose Retrieval_Time is not a number), ``timed_out`` (those that
+    were "Timed_out", when the session was parsed from text) and, when
+    ``bins`` is given (a count or edges, as np.histogram takes), ``histogram``
+    as (counts, edges).
+    """
+    rt = session["retrieval_time"][session.event == "Pellet"]
+    ok = ~np.isnan(rt)
+    values = rt[ok]
+    out = {"values": values,
+           "percentiles": dict(zip(percentiles, np.percentile(values, percentiles))) if len(values)
+           else {p: None for p in percentiles},
+           "not_retrieved": int(len(rt) - ok.sum())}
+    tokens = session.tokens.get("retrieval_time")
+    out["timed_out"] = int((tokens[session.event == "Pellet"] == TOKEN_TIMED_OUT).sum()) if tokens is not None else 0
+    if bins is not None:
+        out["histogram"] = np.histogram(values, bins)
+    return out
+
+
+def is_progressive_ratio(session_type):
+    """True for the FED3 PR modes ("ProgRatio", "PR", "PR2", ...), not for "Prob..." modes."""
+    st = "".join(c for c in session_type.lower() if c.isalnum())
+    return st.startswith("progr") or st == "pr" or (st.startswith("pr") and st[2:3].isdigit())
+
+
+def pr_breakpoint(session, lapse_s=PR_LAPSE_S):
+    """(breakpoint, pellets, time) for a progressive ratio session, or None without pellets.
+
+    The breakpoint is the FR (the ratio just completed) of the last pellet before
+    the first gap of ``lapse_s`` with no pellet, or of the last pellet if there is none.
+    """
+    is_pellet = session.event == "Pellet"
+    times = session.t[is_pellet]
+    if not len(times):
+        return None
+    lapses = np.flatnonzero(np.diff(times) >= lapse_s)
+    last = int(lapses[0]) if len(lapses) else len(times) - 1
+    ratio = session["fr"][is_pellet][last]
+    return (None if np.isnan(ratio) else float(ratio)), last + 1, float(times[last])
+
+
+def chronogram(times, bin_s=3600.0, start=None, end=None):
+    """Counts of ``times`` per ``bin_s`` bin from ``start`` (default: the first time): (counts, edges)."""
+    times = np.asarray(times, dtype=np.float64)
+    if start is None:
+        start = times[0] if len(times) else 0.0
+    if end is None:
+        end = times[-1] if len(times) else start
+    n = int((end - start) // bin_s) + 1
+    index = ((times - start) // bin_s).astype(np.int64)
+    index = index[(index >= 0) & (index < n)]
+    return np.bincount(index, minlength=n), start + bin_s * np.arange(n + 1)
+
+
+def circadian(times, bin_s=3600.0):
+    """Mean count per time-of-day bin over the days the times span: (mean per day, bin starts in s of day)."""
+    times = np.asarray(times, dtype=np.float64)
+    n = int(round(DAY_S / bin_s))
+    if not len(times):
+        return np.zeros(n), bin_s * np.arange(n)
+    counts = np.bincount(((times % DAY_S) // bin_s).astype(np.int64), minlength=n)[:n]
+    days = max(1.0, (times[-1] - times[0]) / DAY_S)
+    return counts / days, bin_s * np.arange(n)
+
+
+def summarize(session, meal_gap_s=MEAL_GAP_S, meal_min=MEAL_MIN_PELLETS, lapse_s=PR_LAPSE_S):
+    """One SUMMARY_HEADER row for a session."""
+    pellets = session.pellet_times()
+    _, _, sizes = bouts(pellets, meal_gap_s, meal_min)
+    ipi = np.diff(pellets)
+    rt = retrieval_latency(session, (50, 90))
+    pr = pr_breakpoint(session, lapse_s) if is_progressive_ratio(session.session_type) else None
+    return [session.source, session.device_number, session.session_type, round(session.hours, 3), len(session),
+            len(pellets), int(session.pokes("Left").sum()), int(session.pokes("Right").sum()),
+            len(sizes), float(sizes.mean()) if len(sizes) else None, int(sizes.sum()),
+            float(np.median(ipi)) if len(ipi) else None, rt["percentiles"][50], rt["percentiles"][90],
+            rt["not_retrieved"], pr[0] if pr else None]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize recorded FED3 sessions.")
+    parser.add_argument("paths", nargs="+", help="session files or folders (searched recursively)")
+    parser.add_argument("--meal-gap", type=float, default=MEAL_GAP_S, help="seconds between pellets in one meal")
+    parser.add_argument("--meal-min", type=int, default=MEAL_MIN_PELLETS, help="pellets in the smallest meal")
+    parser.add_argument("--lapse", type=float, default=PR_LAPSE_S, help="PR lapse in seconds")
+    parser.add_argument("-o", "--output", help="write the summary CSV here instead of printing it")
+    args = parser.parse_args(argv)
+    paths, copies = unique_contents(find_sessions(args.paths))
+    for path, original in copies:
+        print(f"Skipped {path}: same content as {original}", file=sys.stderr)
+    rows = []
+    for path in paths:
+        try:
+            rows.append(summarize(load(path), args.meal_gap, args.meal_min, args.lapse))
+        except Exception as e:
+            print(f"Skipped {path}: {type(e).__name__}: {e}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(SUMMARY_HEADER)
+            writer.writerows(rows)
+        print(f"{len(rows)} sessions -> {args.output}")
+        return
+    for row in rows:
+        print(", ".join(f"{h}={v:.4g}" if isinstance(v, float) else f"{h}={v}"
+                        for h, v in zip(SUMMARY_HEADER, row)))
+
+
+if __name__ == "__main__":
+    main()
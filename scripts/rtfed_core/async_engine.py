@@ -0,0 +1,197 @@
+"""Asyncio acquisition and upload engine for the RTFED(Pi) apps.
+
+One event loop thread watches every FED3 tty with ``loop.add_reader`` and
+hands complete lines to ``on_line``. Each device has its own upload task
+that batches rows every ``send_interval`` seconds. The blocking Google
+Sheets call runs in a small shared thread pool, so a stalled HTTP request
+only delays that device's next batch and never the serial reads. With
+``upload=None`` the engine only reads, for apps that hand rows to a shared
+uploader (rtfed_core.sheets) instead.
+"""
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .framing import LineFramer
+
+
+class _Channel:
+    __slots__ = ("port", "ser", "fd", "framer", "pending", "context", "setup", "upload_task", "lock")
+
+    def __init__(self, port, ser, setup, read_size):
+        self.port = port
+        self.ser = ser
+        self.fd = ser.fileno()
+        self.framer = LineFramer(read_size)
+        self.pending = []
+        self.context = None  # whatever setup() returned, e.g. the worksheet
+        self.setup = setup
+        self.upload_task = None
+        self.lock = asyncio.Lock()  # one batch in flight per device, in order
+
+
+class AsyncAcquisitionEngine:
+    def __init__(self, on_line, upload, on_disconnect=None, on_log=None,
+                 send_interval=5, upload_workers=4, read_size=4096):
+        # on_line(port, line, arrival_ns) runs on the loop thread and must not block;
+        # arrival_ns is time.monotonic_ns() after the read that returned the line's first chunk
+        self.on_line = on_line
+        # upload(port, context, rows) is a blocking call run in the upload pool, or None
+        self.upload = upload
+        self.on_disconnect = on_disconnect
+        self.on_log = on_log or logging.info
+        self.send_interval = send_interval
+        self.upload_workers = upload_workers
+        self.read_size = read_size
+        self.channels = {}
+        self.loop = None
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="fed3-upload")
+        self._thread = threading.Thread(target=self._run_loop, name="fed3-engine", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def has_port(self, port):
+        return port in self.channels
+
+    def port_serial(self, port):
+        """The open serial.Serial of a port being read, or None; for writing commands from any thread."""
+        ch = self.channels.get(port)
+        return ch.ser if ch is not None else None
+
+    def open_port(self, port, open_serial, setup=None, retries=5, delay=2):
+        """Open a port with open_serial() and start reading it; safe to call from any thread.
+
+        setup() runs in the upload pool once the port is open and its result is
+        passed to upload() as the context (e.g. the device's worksheet).
+        """
+        return asyncio.run_coroutine_threadsafe(self._open_port(port, open_serial, setup, retries, delay), self.loop)
+
+    def remove_port(self, port):
+        self.loop.call_soon_threadsafe(self._close_channel, port, False)
+
+    def queue_upload(self, port, row):
+        """Queue a row for the device's next batch; call from on_line (loop thread)."""
+        ch = self.channels.get(port)
+        if ch is not None:
+            ch.pending.append(row)
+
+    def stop(self, timeout=15):
+        """Stop reading, flush pending uploads once and shut the loop down."""
+        if self._thread is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception:
+            future.cancel()
+            self.on_log(f"Upload flush did not finish within {timeout} s on stop.")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        self._executor.shutdown(wait=False)
+
+    async def _open_port(self, port, open_serial, setup, retries, delay):
+        if port in self.channels:
+            return True
+        for attempt in range(retries):
+            try:
+                ser = open_serial()
+                break
+            except Exception as e:
+                self.on_log(f"Attempt {attempt+1}: Error with port {port}: {e}")
+                await asyncio.sleep(delay)
+        else:
+            self.on_log(f"Failed to connect to port {port} after {retries} attempts.")
+            return False
+        ch = _Channel(port, ser, setup, self.read_size)
+        self.channels[port] = ch
+        self.loop.add_reader(ch.fd, self._on_readable, ch)
+        if self.upload is not None:
+            ch.upload_task = self.loop.create_task(self._upload_loop(ch))
+        if setup is not None:
+            self.loop.create_task(self._flush(ch))  # run setup straight away
+        return True
+
+    def _on_readable(self, ch):
+        try:
+            lines = ch.framer.read_stamped_lines(ch.fd)
+        except EOFError:
+            self._close_channel(ch.port, True)
+            return
+        for line, arrival_ns in lines:
+            try:
+                self.on_line(ch.port, line, arrival_ns)
+            except Exception:
+                logging.exception(f"Error handling line from {ch.port}")
+
+    def _close_channel(self, port, notify):
+        ch = self.channels.pop(port, None)
+        if ch is None:
+            return
+        self.loop.remove_reader(ch.fd)
+        try:
+            ch.ser.close()
+        except Exception:
+            pass
+        if ch.upload_task is not None:
+            # Keep uploading what was already read, then let the task end
+            ch.upload_task.cancel()
+            if ch.pending:
+                self.loop.create_task(self._flush(ch))
+        if notify and self.on_disconnect is not None:
+            self.on_disconnect(port)
+
+    async def _upload_loop(self, ch):
+        try:
+            while True:
+                await asyncio.sleep(self.send_interval)
+                # Shielded so cancelling the loop never drops an in-flight batch
+                await asyncio.shield(self._flush(ch))
+        except asyncio.CancelledError:
+            pass
+
+    async def _flush(self, ch):
+        async with ch.lock:
+            await self._flush_locked(ch)
+
+    async def _flush_locked(self, ch):
+        if ch.context is None and ch.setup is not None:
+            try:
+                ch.context = await self.loop.run_in_executor(self._executor, ch.setup)
+            except Exception as e:
+                self.on_log(f"Upload setup failed for {ch.port}: {e}")
+                return
+        if not ch.pending:
+            return
+        rows, ch.pending = ch.pending, []
+        try:
+            await self.loop.run_in_executor(self._executor, self.upload, ch.port, ch.context, rows)
+        except Exception as e:
+            # Keep the rows, in order, for the next attempt
+            ch.pending[:0] = rows
+            self.on_log(f"Failed to send data to Google Sheets for {ch.port}: {e}")
+
+    async def _shutdown(self):
+        channels = list(self.channels.values())
+        for ch in channels:
+            self.loop.remove_reader(ch.fd)
+            if ch.upload_task is not None:
+                ch.upload_task.cancel()
+        await asyncio.gather(*(self._flush(ch) for ch in channels), return_exceptions=True)
+        for ch in channels:
+            self.channels.pop(ch.port, None)
+            try:
+                ch.ser.close()
+            except Exception:
+                pass
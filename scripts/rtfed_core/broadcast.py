@@ -0,0 +1,178 @@
+"""Send one command to every FED3 at once and collect the replies.
+
+Identification (TRIGGER_POKE) and clock sync (SET_TIME) used to visit the
+ports one at a time: open the port, write, wait up to 2-3 s for the reply,
+close. Eight devices took ~24 s when some were slow to answer, and a
+32-device rig took minutes. broadcast() opens every port, writes the
+command to all of them back to back, then waits for the replies on one
+selector. Each port has its own deadline, counted from its own write, so
+the whole fleet takes as long as its slowest device.
+
+SET_TIME carries whole seconds, and the FED3 sets its RTC when the line
+arrives. With ``align=True`` the command is built for the next wall-clock
+second and written as that second starts. Every board then starts that
+second at the same instant as the host, give or take the USB latency.
+Without alignment a board could be up to a second behind.
+
+Ports that a running session already holds open go in ``open_ports``. The
+command is written through that handle, and the reply arrives on the
+session's own reader.
+"""
+import datetime
+import selectors
+import time
+
+import serial
+
+from .framing import LineFramer
+
+TRIGGER_POKE = "TRIGGER_POKE"
+IDENTIFY_TIMEOUT_S = 3.0
+SYNC_TIMEOUT_S = 2.0
+TIME_REPLIES = ("TIME_SET_OK", "TIME_SET_FAIL")
+
+
+def set_time_command(when):
+    return f"SET_TIME:{when.year},{when.month},{when.day},{when.hour},{when.minute},{when.second}"
+
+
+def device_number(line):
+    """Device_Number of a logged line (the FED3's reply to TRIGGER_POKE), else None."""
+    if TRIGGER_POKE in line:
+        return None
+    parts = line.split(",")
+    if len(parts) >= 6:
+        return parts[5].strip() or None
+    return None
+
+
+def time_reply(line):
+    return line if line in TIME_REPLIES else None
+
+
+def open_serial(path):
+    return serial.Serial(path, 115200, timeout=0)
+
+
+class Result:
+    __slots__ = ("port", "reply", "lines", "error", "shared", "sent", "seconds")
+
+    def __init__(self, port, shared=False):
+        self.port = port
+        self.reply = None  # what match() returned for the first matching line
+        self.lines = []  # every line read before it
+        self.error = None
+        self.shared = shared  # written through an open handle; the reply goes to its reader
+        self.sent = None  # wall-clock time of the write
+        self.seconds = None  # write to reply, or to the deadline
+
+    def __repr__(self):
+        return f"Result({self.port!r}, reply={self.reply!r}, error={self.error!r})"
+
+
+def _wait_until(wall):
+    while True:
+        left = wall - time.time()
+        if left <= 0:
+            return
+        time.sleep(left - 0.002 if left > 0.003 else 0)
+
+
+def broadcast(ports, command, match, timeout=IDENTIFY_TIMEOUT_S, open_ports=None, align=False,
+              on_line=None, on_result=None, opener=open_serial):
+    """Write ``command`` to every port and wait for each port's reply.
+
+    ports: {key: device path} to open for this command; open_ports: {key: an open serial.Serial}.
+    command is a str, or with align=True a function of the datetime it should carry.
+    match(line) returns the reply value for the line that ends the wait, or None.
+    timeout is seconds per port, or {key: seconds}. on_line(key, line) and on_result(key, result)
+    run on the calling thread as lines and results come in. Returns {key: Result}.
+    """
+    open_ports = open_ports or {}
+    results = {}
+    handles = {}
+
+    def finish(key, now):
+        result = results[key]
+        if result.sent is not None and result.seconds is None:
+            result.seconds = now - result.sent
+        if on_result is not None:
+            on_result(key, result)
+
+    for key, path in ports.items():
+        results[key] = Result(key)
+        try:
+            handles[key] = opener(path)
+        except Exception as e:
+            results[key].error = f"could not open {path}: {e}"
+    for key in open_ports:
+        results[key] = Result(key, shared=True)
+    try:
+        if align:
+            target = int(time.time()) + 1
+            data = (set_time_command(datetime.datetime.fromtimestamp(target)) + "\n").encode()
+            _wait_until(target)
+        else:
+            data = (command + "\n").encode()
+        pending = {}
+        for key, ser in list(handles.items()) + list(open_ports.items()):
+            result = results[key]
+            try:
+                ser.write(data)
+            except Exception as e:
+                result.error = f"write failed: {e}"
+                continue
+            result.sent = time.time()
+            if not result.shared:
+                limit = timeout.get(key, IDENTIFY_TIMEOUT_S) if isinstance(timeout, dict) else timeout
+                pending[key] = time.monotonic() + limit
+        for key, result in results.items():
+            if key not in pending:
+                finish(key, time.time())
+        _collect(handles, pending, results, match, on_line, finish)
+    finally:
+        for ser in handles.values():
+            try:
+                ser.close()
+            except Exception:
+                pass
+    return results
+
+
+def _collect(handles, pending, results, match, on_line, finish):
+    sel = selectors.DefaultSelector()
+    framers = {}
+    try:
+        for key in pending:
+            framers[key] = LineFramer()
+            sel.register(handles[key].fileno(), selectors.EVENT_READ, key)
+        while pending:
+            now = time.monotonic()
+            for key in [k for k, deadline in pending.items() if deadline <= now]:
+                del pending[key]
+                sel.unregister(handles[key].fileno())
+                finish(key, time.time())
+            if not pending:
+                break
+            for sel_key, _ in sel.select(min(pending.values()) - now):
+                key = sel_key.data
+                result = results[key]
+                try:
+                    lines = framers[key].read_lines(sel_key.fd)
+                except EOFError as e:
+                    result.error = str(e)
+                    lines = None
+                for line in lines or ():
+                    if on_line is not None:
+                        on_line(key, line)
+                    value = match(line)
+                    if value is not None:
+                        result.reply = value
+                        break
+                    result.lines.append(line)
+                if lines is None or result.reply is not None:
+                    del pending[key]
+                    sel.unregister(sel_key.fd)
+                    finish(key, time.time())
+    finally:
+        sel.close()
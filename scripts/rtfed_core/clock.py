@@ -0,0 +1,65 @@
+"""Monotonic capture clock with a wall-clock anchor.
+
+Lines are stamped with ``time.monotonic_ns()`` when the read that returned
+their first chunk completes (see rtfed_core.framing). A ClockAnchor pairs one monotonic reading with one wall-clock
+reading, so any stamp converts to epoch time with a subtraction instead of
+another clock call. Monotonic stamps are what latency and alignment work
+should use; NTP steps only move the anchor, never the stamps.
+
+A Pi has no RTC, so a session started before NTP syncs is anchored to the
+wrong time. The apps call check() about once a second: when the wall clock
+has moved more than STEP_NS away from what the anchor predicts, the anchor
+is taken again and the step is returned so it can be logged. Stamps
+converted after that carry the corrected time.
+"""
+import time
+
+STEP_NS = 50_000_000  # wall-clock step that re-anchors
+
+
+class ClockAnchor:
+    __slots__ = ("ref",)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Bracket the wall-clock read and take the midpoint of the two monotonic reads
+        before = time.monotonic_ns()
+        wall = time.time_ns()
+        after = time.monotonic_ns()
+        # One tuple, so a reader on another thread never pairs an old and a new reading
+        self.ref = ((before + after) // 2, wall)
+
+    @property
+    def mono_ns(self):
+        return self.ref[0]
+
+    @property
+    def wall_ns(self):
+        return self.ref[1]
+
+    def wall(self, mono_ns):
+        """Epoch seconds for a monotonic_ns() stamp."""
+        mono, wall = self.ref
+        return (wall + (mono_ns - mono)) / 1e9
+
+    def now(self):
+        mono = time.monotonic_ns()
+        return mono, self.wall(mono)
+
+    def check(self, max_step_ns=STEP_NS):
+        """Re-anchor if the wall clock stepped; returns the step in seconds, or None."""
+        mono, wall = self.ref
+        before = time.monotonic_ns()
+        now = time.time_ns()
+        after = time.monotonic_ns()
+        step = now - (wall + (before + after) // 2 - mono)
+        if abs(step) <= max_step_ns:
+            return None
+        self.reset()
+        return step / 1e9
+
+
+# Shared by every reader in the process; apps call reset() when a session starts
+anchor = ClockAnchor()
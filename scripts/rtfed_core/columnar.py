@@ -0,0 +1,295 @@
+"""Typed, compressed columnar session files (``.fed3z``).
+
+A session file is a zip archive with ``meta.json`` and one member per column
+per chunk, deflate-compressed. The chunks are the SessionStore's chunks, so
+writing never needs more than one chunk in memory. Inside a chunk:
+
+* text columns (Library_Version, Session_type, Event, ...) are dictionary
+  encoded: a uint8/16/32 code per row plus the chunk's string list;
+* numeric columns with at most 256 distinct values (Device_Number, FR,
+  Motor_Turns, ...) are dictionary encoded the same way, with
+  ``[value, tag]`` entries;
+* other numeric columns are a float64 value and an int8 tag per row. The
+  tag holds the printed decimals, or marks an int or a text token such as
+  "Timed_out" (whose value indexes the column's ``strings``).
+
+``ColumnarSession`` loads columns as NumPy arrays when NumPy is installed
+(plain lists otherwise) and rebuilds the exact CSV the apps write::
+
+    python -m rtfed_core.columnar Port_1.fed3z [-o Port_1.csv]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import zipfile
+from array import array
+
+from .events import ATTRS, DATA_FIELDS, TEXT_FIELDS, FED3Event
+from .session_store import TAG_INT, TAG_STR, field_columns
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SUFFIX = ".fed3z"
+FORMAT = "rtfed-columnar"
+VERSION = 2  # 2 adds arrival_ns
+
+_CODE_TYPES = (("B", "u1", 1 << 8), ("H", "u2", 1 << 16), ("I", "u4", 1 << 32))
+_TYPECODE = {"u1": "B", "u2": "H", "u4": "I", "f8": "d", "i1": "b", "i8": "q"}
+_NAN = float("nan")
+_HEADERS = dict(zip(ATTRS, DATA_FIELDS))
+
+
+def _code_type(n):
+    for typecode, dtype, limit in _CODE_TYPES:
+        if n <= limit:
+            return typecode, dtype
+    raise ValueError("dictionary too large")
+
+
+def _key(value, tag):
+    # NaN never equals itself, so key it by tag only
+    return ("nan", tag) if value != value else (value, tag)
+
+
+def _encode_text(codes, rows, strings):
+    local = {}
+    dictionary = []
+    out = []
+    for code in codes[:rows]:
+        k = local.get(code)
+        if k is None:
+            k = local[code] = len(dictionary)
+            dictionary.append(strings[code])
+        out.append(k)
+    typecode, dtype = _code_type(len(dictionary))
+    return {"encoding": "dict", "codes": dtype, "dictionary": dictionary}, {"codes": array(typecode, out)}
+
+
+def _encode_numeric(values, tags, rows, strings):
+    local = {}
+    dictionary = []
+    out = []
+    for i in range(rows):
+        value, tag = values[i], tags[i]
+        key = _key(value, tag)
+        k = local.get(key)
+        if k is None:
+            if len(dictionary) == 256:
+                break
+            k = local[key] = len(dictionary)
+            dictionary.append([strings[int(value)] if tag == TAG_STR else value, tag])
+        out.append(k)
+    else:
+        return {"encoding": "dict", "codes": "u1", "dictionary": dictionary}, {"codes": array("B", out)}
+    # Too many distinct values: plain float64 + tag, text tokens moved to a list
+    text = {}
+    plain = array("d", values[:rows])
+    for i in range(rows):
+        if tags[i] == TAG_STR:
+            s = strings[int(values[i])]
+            plain[i] = text.setdefault(s, len(text))
+    return ({"encoding": "plain", "strings": list(text)},
+            {"values": plain, "tags": array("b", tags[:rows])})
+
+
+def write_session(path, store, port, time_header="Timestamp", time_format="%Y-%m-%d %H:%M:%S.%f"):
+    """Write one device's session from a SessionStore; returns the row count."""
+    tmp = path + ".tmp"
+    chunks = []
+    total = 0
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for cols, rows in store.iter_chunks(port):
+            if not rows:
+                continue
+            prefix = f"{len(chunks):05d}/"
+            zf.writestr(prefix + "received", cols[0][:rows].tobytes())
+            zf.writestr(prefix + "arrival_ns", cols[1][:rows].tobytes())
+            columns = {}
+            for attr, is_text, values, tags in field_columns(cols):
+                if is_text:
+                    meta, parts = _encode_text(values, rows, store.strings)
+                else:
+                    meta, parts = _encode_numeric(values, tags, rows, store.strings)
+                for part, data in parts.items():
+                    zf.writestr(f"{prefix}{attr}.{part}", data.tobytes())
+                columns[attr] = meta
+            chunks.append({"rows": rows, "columns": columns})
+            total += rows
+        meta = {
+            "format": FORMAT, "version": VERSION, "byteorder": sys.byteorder,
+            "rows": total, "time_header": time_header, "time_format": time_format,
+            "attrs": list(ATTRS), "chunks": chunks,
+        }
+        zf.writestr("meta.json", json.dumps(meta))
+    os.replace(tmp, path)
+    return total
+
+
+class ColumnarSession:
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self.meta = json.loads(self._zip.read("meta.json"))
+        if self.meta.get("format") != FORMAT:
+            raise ValueError(f"{path} is not an {FORMAT} file")
+        self.rows = self.meta["rows"]
+        self._swap = self.meta["byteorder"] != sys.byteorder
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _array(self, name, dtype):
+        data = array(_TYPECODE[dtype])
+        data.frombytes(self._zip.read(name))
+        if self._swap:
+            data.byteswap()
+        return data
+
+    def _ndarray(self, name, dtype):
+        order = "<" if self.meta["byteorder"] == "little" else ">"
+        return np.frombuffer(self._zip.read(name), dtype=order + dtype)
+
+    def received(self):
+        """Receive times in seconds since the epoch (float64)."""
+        if np is not None:
+            parts = [self._ndarray(f"{k:05d}/received", "f8") for k in range(len(self.meta["chunks"]))]
+            return np.concatenate(parts) if parts else np.empty(0)
+        out = array("d")
+        for k in range(len(self.meta["chunks"])):
+            out.extend(self._array(f"{k:05d}/received", "f8"))
+        return out
+
+    def arrival_ns(self):
+        """Monotonic capture stamps (int64 ns); zeros for version 1 files."""
+        chunks = self.meta["chunks"]
+        if np is not None:
+            parts = [self._ndarray(f"{k:05d}/arrival_ns", "i8") if self.meta["version"] >= 2
+                     else np.zeros(c["rows"], dtype=np.int64) for k, c in enumerate(chunks)]
+            return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        out = array("q")
+        for k, c in enumerate(chunks):
+            out.extend(self._array(f"{k:05d}/arrival_ns", "i8") if self.meta["version"] >= 2
+                       else array("q", bytes(8 * c["rows"])))
+        return out
+
+    def column(self, attr):
+        """One column for analysis: float64 (text tokens become NaN) or str for text fields."""
+        if np is None:
+            values = []
+            for _, decoded, _ in self._iter_decoded(attr):
+                values.extend(_NAN if attr not in TEXT_FIELDS and v.__class__ is str else v
+                              for v in decoded)
+            return values
+        parts = []
+        for k, chunk in enumerate(self.meta["chunks"]):
+            meta = chunk["columns"][attr]
+            prefix = f"{k:05d}/{attr}."
+            if meta["encoding"] == "dict":
+                codes = self._ndarray(prefix + "codes", meta["codes"])
+                if attr in TEXT_FIELDS:
+                    lookup = np.array(meta["dictionary"], dtype=object)
+                else:
+                    lookup = np.array([_NAN if tag == TAG_STR else value
+                                       for value, tag in meta["dictionary"]], dtype=np.float64)
+                parts.append(lookup[codes])
+            else:
+                values = self._ndarray(prefix + "values", "f8").copy()
+                values[self._ndarray(prefix + "tags", "i1") == TAG_STR] = np.nan
+                parts.append(values)
+        if not parts:
+            return np.empty(0, dtype=object if attr in TEXT_FIELDS else np.float64)
+        return np.concatenate(parts)
+
+    def _iter_decoded(self, attr):
+        """Yield (chunk, values, decimals) with the original typed values per row."""
+        for k, chunk in enumerate(self.meta["chunks"]):
+            meta = chunk["columns"][attr]
+            prefix = f"{k:05d}/{attr}."
+            rows = chunk["rows"]
+            if meta["encoding"] == "dict":
+                codes = self._array(prefix + "codes", meta["codes"])
+                if attr in TEXT_FIELDS:
+                    dictionary = meta["dictionary"]
+                    yield k, [dictionary[c] for c in codes], [0] * rows
+                    continue
+                entries = [_decode(value, tag, None) for value, tag in meta["dictionary"]]
+                yield k, [entries[c][0] for c in codes], [entries[c][1] for c in codes]
+            else:
+                values = self._array(prefix + "values", "f8")
+                tags = self._array(prefix + "tags", "i1")
+                strings = meta["strings"]
+                decoded = [_decode(v, t, strings) for v, t in zip(values, tags)]
+                yield k, [d[0] for d in decoded], [d[1] for d in decoded]
+
+    def iter_events(self):
+        """Yield FED3Event objects in the original order."""
+        columns = [self._iter_decoded(attr) for attr in ATTRS]
+        for k, chunk in enumerate(self.meta["chunks"]):
+            received = self._array(f"{k:05d}/received", "f8")
+            if self.meta["version"] >= 2:
+                arrival = self._array(f"{k:05d}/arrival_ns", "i8")
+            else:
+                arrival = array("q", bytes(8 * chunk["rows"]))
+            decoded = [next(col) for col in columns]
+            for i in range(chunk["rows"]):
+                decimals = 0
+                values = []
+                for f, (_, vals, decs) in enumerate(decoded):
+                    values.append(vals[i])
+                    decimals |= decs[i] << (4 * f)
+                yield FED3Event.from_values(values, received[i], decimals, arrival[i])
+
+    def iter_rows(self):
+        time_format = self.meta["time_format"]
+        for event in self.iter_events():
+            yield event.to_row(time_format)
+
+    def header(self):
+        return [self.meta["time_header"]] + [_HEADERS[attr] for attr in self.meta["attrs"]]
+
+    def to_csv(self, out):
+        """Write the session in the apps' CSV layout to a path or text file."""
+        if isinstance(out, (str, os.PathLike)):
+            with open(out, "w", newline="") as f:
+                return self.to_csv(f)
+        writer = csv.writer(out)
+        writer.writerow(self.header())
+        writer.writerows(self.iter_rows())
+
+
+def _decode(value, tag, strings):
+    if tag == TAG_STR:
+        return (value if strings is None else strings[int(value)]), 0
+    if tag == TAG_INT:
+        return int(value), 0
+    return value, tag
+
+
+def load(path):
+    return ColumnarSession(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a .fed3z session file back to CSV.")
+    parser.add_argument("path")
+    parser.add_argument("-o", "--output", help="CSV path (default: next to the input)")
+    args = parser.parse_args(argv)
+    output = args.output or os.path.splitext(args.path)[0] + ".csv"
+    with ColumnarSession(args.path) as session:
+        session.to_csv(output)
+        print(f"{session.rows} rows -> {output}")
+
+
+if __name__ == "__main__":
+    main()
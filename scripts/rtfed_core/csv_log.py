@@ -0,0 +1,133 @@
+"""Streaming per-device CSV logs.
+
+Each event is handed to the device's log as soon as it is parsed. One
+flusher thread formats the pending events into CSV rows, writes them and
+fsyncs the file every ``flush_every`` events or every ``flush_ms``
+milliseconds, whichever comes first. The acquisition threads only append
+to a list, so they never format timestamps or wait on the SD card. After a
+crash or power cut the CSV holds everything up to the last flush, and STOP
+only has to close the files.
+"""
+import csv
+import os
+import threading
+import logging
+
+from .events import TTL_TIME_FORMAT
+
+FLUSH_EVERY = 20
+FLUSH_MS = 1000
+
+
+class StreamingCSVWriter:
+    def __init__(self, path, header, time_format=TTL_TIME_FORMAT, fsync=True, buffer_size=65536):
+        self.path = path
+        self.time_format = time_format
+        self.fsync = fsync
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", buffering=buffer_size)
+        self._writer = csv.writer(self._file)
+        self._pending = []
+        self._pending_lock = threading.Lock()  # held only to append/swap
+        self._io_lock = threading.Lock()
+        self.rows = 0
+        self.flushes = 0
+        self._dirty = new
+        if new:
+            self._writer.writerow(header)
+
+    @property
+    def unflushed(self):
+        return len(self._pending)
+
+    def write_event(self, event):
+        """Queue an event; returns the number waiting for the next flush."""
+        with self._pending_lock:
+            self._pending.append(event)
+            return len(self._pending)
+
+    def flush(self):
+        with self._io_lock:
+            with self._pending_lock:
+                events, self._pending = self._pending, []
+            if self._file.closed or not (events or self._dirty):
+                return
+            time_format = self.time_format
+            self._writer.writerows(event.to_row(time_format) for event in events)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.rows += len(events)
+            self.flushes += 1
+            self._dirty = False
+
+    def close(self):
+        self.flush()
+        with self._io_lock:
+            self._file.close()
+
+
+class CSVLogSet:
+    def __init__(self, path_for, header, time_format=TTL_TIME_FORMAT,
+                 flush_every=FLUSH_EVERY, flush_ms=FLUSH_MS, fsync=True):
+        # path_for(port) gives the CSV path; a device's file is created on its first event
+        self.path_for = path_for
+        self.header = header
+        self.time_format = time_format
+        self.flush_every = flush_every
+        self.flush_ms = flush_ms
+        self.fsync = fsync
+        self.writers = {}
+        self._lock = threading.Lock()
+        self._due = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write_event(self, port, event):
+        writer = self.writers.get(port)
+        if writer is None:
+            writer = self._open(port)
+        if writer.write_event(event) >= self.flush_every:
+            self._due.set()
+
+    def paths(self):
+        return {port: w.path for port, w in self.writers.items()}
+
+    def flush(self):
+        for writer in list(self.writers.values()):
+            try:
+                writer.flush()
+            except Exception as e:
+                logging.error(f"Failed to flush {writer.path}: {e}")
+
+    def close(self):
+        """Flush and close every file; returns {port: path} of the files written."""
+        self._stop.set()
+        self._due.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            for writer in self.writers.values():
+                try:
+                    writer.close()
+                except Exception as e:
+                    logging.error(f"Failed to close {writer.path}: {e}")
+            return self.paths()
+
+    def _open(self, port):
+        with self._lock:
+            writer = self.writers.get(port)
+            if writer is None:
+                writer = StreamingCSVWriter(self.path_for(port), self.header, self.time_format, self.fsync)
+                self.writers[port] = writer
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="csv-flusher", daemon=True)
+                self._thread.start()
+            return writer
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._due.wait(self.flush_ms / 1000)
+            self._due.clear()
+            self.flush()
@@ -0,0 +1,182 @@
+"""Live SQLite event database for a session (``events.sqlite``).
+
+The database is in WAL mode. One writer (the SQLite sink's worker thread)
+appends events in one transaction per batch, and any number of read-only
+connections in other processes (the GUI, a notebook, an alert script) can
+query it mid-session. Each query reads a consistent snapshot: readers never
+block the writer and the writer never blocks them. The serial readers never
+touch the database; they only publish to the sink pipeline.
+
+One ``events`` row per event: the port, ``received`` (epoch s),
+``arrival_ns`` (monotonic capture stamp), the printed-decimals mask and
+the 21 FED3 fields under their FED3Event attribute names. Text fields are
+TEXT, numeric fields NUMERIC (so "Timed_out" stays text), and NaN is NULL.
+Two indexes serve the per-device questions:
+
+    events_device_time   (device_number, arrival_ns)
+    events_device_event  (device_number, event, arrival_ns)
+
+The second is the (device, event) index with the time appended, so
+"pellets on device 12 in the last hour" is one index range scan.
+time.monotonic_ns() is the same clock in every process on one boot, so
+"the last hour" is ``arrival_ns >= monotonic_ns() - 3600e9``. The meta table
+records the boot id, and EventReader falls back to the wall-clock
+``received`` column for a database from an earlier boot::
+
+    python -m rtfed_core.event_db events.sqlite --device 12 --event Pellet --last 3600
+"""
+import argparse
+import os
+import sqlite3
+import time
+import urllib.parse
+
+from .events import ATTRS, TEXT_FIELDS, FED3Event
+
+FILENAME = "events.sqlite"
+
+_COLUMNS = ", ".join(f"{attr} {'TEXT' if attr in TEXT_FIELDS else 'NUMERIC'}" for attr in ATTRS)
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS events (
+    port TEXT, received REAL, arrival_ns INTEGER, decimals TEXT, {_COLUMNS});
+CREATE INDEX IF NOT EXISTS events_device_time ON events (device_number, arrival_ns);
+CREATE INDEX IF NOT EXISTS events_device_event ON events (device_number, event, arrival_ns);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+_INSERT = (f"INSERT INTO events (port, received, arrival_ns, decimals, {', '.join(ATTRS)}) "
+           f"VALUES ({', '.join('?' * (len(ATTRS) + 4))})")
+_SELECT = f"SELECT received, arrival_ns, decimals, {', '.join(ATTRS)} FROM events"
+_NAN = float("nan")
+
+
+def boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class EventWriter:
+    """The one writing connection; use it from one thread at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self.transactions = 0
+        # Opened by the app thread, then used only by the sink's worker
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL syncs at checkpoints, not on every commit; a power
+        # cut can lose the last transactions but never corrupts the file
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.executescript(SCHEMA)
+            self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                 [("boot_id", boot_id()), ("created", str(time.time()))])
+
+    def append(self, batch):
+        """Insert a list of (port, FED3Event) in one transaction."""
+        with self._db:
+            self._db.executemany(_INSERT, [(port, e.received, e.arrival_ns, f"{e._decimals:x}", *e.values())
+                                           for port, e in batch])
+        self.rows += len(batch)
+        self.transactions += 1
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class EventReader:
+    """Read-only queries; safe to open from any process while the session writes."""
+
+    def __init__(self, path):
+        uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+        self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._db.execute("PRAGMA query_only=1")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'boot_id'").fetchone()
+        self.same_boot = row is not None and row[0] is not None and row[0] == boot_id()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _window(self, last_s):
+        if last_s is None:
+            return "", ()
+        if self.same_boot:
+            return " AND arrival_ns >= ?", (time.monotonic_ns() - int(last_s * 1e9),)
+        return " AND received >= ?", (time.time() - last_s,)
+
+    def count(self, device, event=None, last_s=None):
+        """Events on ``device`` (of one Event name if given) in the last ``last_s`` seconds."""
+        where, params = self._window(last_s)
+        if event is not None:
+            where = " AND event = ?" + where
+            params = (event,) + params
+        sql = f"SELECT count(*) FROM events WHERE device_number = ?{where}"
+        return self._db.execute(sql, (device,) + params).fetchone()[0]
+
+    def counts(self, device, last_s=None):
+        """{Event name: count} for ``device``."""
+        where, params = self._window(last_s)
+        sql = f"SELECT event, count(*) FROM events WHERE device_number = ?{where} GROUP BY event"
+        return dict(self._db.execute(sql, (device,) + params).fetchall())
+
+    def devices(self):
+        """{device number: (events, seconds since the last one or None)}."""
+        rows = self._db.execute("SELECT device_number, count(*), max(arrival_ns), max(received) "
+                                "FROM events GROUP BY device_number").fetchall()
+        now_ns, now = time.monotonic_ns(), time.time()
+        return {dn: (n, (now_ns - last_ns) / 1e9 if self.same_boot else now - last)
+                for dn, n, last_ns, last in rows}
+
+    def events(self, device, last_s=None, event=None, limit=None):
+        """The device's events as FED3Event, oldest first (the newest ``limit`` if given)."""
+        where, params = self._window(last_s)
+        if event is not None:
+            where = " AND event = ?" + where
+            params = (event,) + params
+        sql = f"{_SELECT} WHERE device_number = ?{where} ORDER BY arrival_ns DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        rows = self._db.execute(sql, (device,) + params).fetchall()
+        return [_event(row) for row in reversed(rows)]
+
+    def execute(self, sql, params=()):
+        return self._db.execute(sql, params).fetchall()
+
+
+def _event(row):
+    received, arrival_ns, decimals = row[0], row[1], int(row[2] or "0", 16)
+    values = [("" if attr in TEXT_FIELDS else _NAN) if v is None else v for attr, v in zip(ATTRS, row[3:])]
+    return FED3Event.from_values(values, received, decimals, arrival_ns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query a session's live event database.")
+    parser.add_argument("path")
+    parser.add_argument("--device", help="device number (default: a summary of every device)")
+    parser.add_argument("--event", help="Event name to count, e.g. Pellet")
+    parser.add_argument("--last", type=float, help="only the last LAST seconds")
+    args = parser.parse_args(argv)
+    with EventReader(args.path) as db:
+        if args.device is None:
+            for dn, (n, age) in sorted(db.devices().items(), key=lambda kv: str(kv[0])):
+                print(f"Device {dn}: {n} events, last {age:.0f} s ago")
+        elif args.event is not None:
+            print(db.count(args.device, args.event, args.last))
+        else:
+            for name, n in sorted(db.counts(args.device, args.last).items()):
+                print(f"{name}: {n}")
+
+
+if __name__ == "__main__":
+    main()
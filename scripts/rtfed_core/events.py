@@ -0,0 +1,157 @@
+"""Parsed FED3 log line.
+
+The RTS firmware prints one comma-separated line per event (FED3 clock
+first, then the 21 fields below). FED3Event parses that line once, at
+ingestion. Numeric fields are stored as int/float ("NaN" becomes nan) and
+repeated text such as Library_Version, Session_type and Event is interned,
+so a session holds one copy of each string instead of one per row.
+Tokens that are not numbers ("Timed_out", "Error", "") are kept as
+interned strings.
+
+Each event carries two times taken when the read that returned its first
+chunk completed:
+``arrival_ns`` (time.monotonic_ns(), for latency and alignment) and
+``received`` (epoch seconds from the clock anchor). Timestamps are only
+formatted as text when a row is exported.
+
+to_row() rebuilds the exact text row the apps have always written. Each
+float field remembers how many decimals the FED3 printed.
+"""
+import datetime
+import math
+import sys
+
+# Column order after the timestamp, shared by every app and by the firmware
+DATA_FIELDS = (
+    "Temp", "Humidity", "Library_Version", "Session_type",
+    "Device_Number", "Battery_Voltage", "Motor_Turns", "FR", "Event", "Active_Poke",
+    "Left_Poke_Count", "Right_Poke_Count", "Pellet_Count", "Block_Pellet_Count",
+    "Retrieval_Time", "InterPelletInterval", "Poke_Time", "PelletsOrTrialToSwitch",
+    "Prob_left", "Prob_right", "High_prob_poke",
+)
+
+ATTRS = (
+    "temp", "humidity", "library_version", "session_type",
+    "device_number", "battery_voltage", "motor_turns", "fr", "event", "active_poke",
+    "left_poke_count", "right_poke_count", "pellet_count", "block_pellet_count",
+    "retrieval_time", "inter_pellet_interval", "poke_time", "pellets_or_trial_to_switch",
+    "prob_left", "prob_right", "high_prob_poke",
+)
+
+TEXT_FIELDS = frozenset(("library_version", "session_type", "event", "active_poke", "high_prob_poke"))
+
+TTL_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+SHEETS_TIME_FORMAT = "%m/%d/%Y %H:%M:%S.%f"
+
+_intern = sys.intern
+_NAN = float("nan")
+
+
+def column_headers(timestamp_header="Timestamp"):
+    return [timestamp_header] + list(DATA_FIELDS)
+
+
+def _parse_number(token):
+    """Return (value, decimals); decimals is 0 for ints and non-numbers."""
+    token = token.strip()
+    if not token:
+        return "", 0
+    try:
+        return int(token), 0
+    except ValueError:
+        pass
+    try:
+        value = float(token)
+    except ValueError:
+        return _intern(token), 0
+    if value != value:
+        return _NAN, 0
+    dot = token.find(".")
+    return value, (min(len(token) - dot - 1, 15) if dot >= 0 else 0)
+
+
+def _format_number(value, decimals):
+    if value.__class__ is float:
+        if value != value:
+            return "NaN"
+        return f"{value:.{decimals}f}"
+    return str(value)
+
+
+class FED3Event:
+    __slots__ = ("received", "arrival_ns") + ATTRS + ("_decimals",)
+
+    def __init__(self, received, arrival_ns=0):
+        # received is the host wall-clock time in seconds since the epoch,
+        # arrival_ns the monotonic capture stamp it was derived from
+        self.received = received
+        self.arrival_ns = arrival_ns
+
+    @classmethod
+    def from_fields(cls, fields, received, arrival_ns=0):
+        """Build an event from the 21 data fields (the FED3 clock already removed).
+
+        Short lines (older firmware) leave the missing fields empty; extra fields are ignored.
+        """
+        ev = cls(received, arrival_ns)
+        decimals = 0
+        n = len(fields)
+        for i, attr in enumerate(ATTRS):
+            token = fields[i] if i < n else ""
+            if attr in TEXT_FIELDS:
+                setattr(ev, attr, _intern(token.strip()))
+            else:
+                value, d = _parse_number(token)
+                setattr(ev, attr, value)
+                decimals |= d << (4 * i)
+        ev._decimals = decimals
+        return ev
+
+    @classmethod
+    def from_values(cls, values, received, decimals=0, arrival_ns=0):
+        """Build an event from already typed values in ATTRS order (no parsing)."""
+        ev = cls(received, arrival_ns)
+        for attr, value in zip(ATTRS, values):
+            setattr(ev, attr, value)
+        ev._decimals = decimals
+        return ev
+
+    @classmethod
+    def from_line(cls, line, received, arrival_ns=0):
+        return cls.from_fields(line.split(",")[1:], received, arrival_ns)
+
+    @classmethod
+    def marker(cls, received, event, device_number="", arrival_ns=0):
+        """An event row with only Event and Device_Number set (e.g. the JAM row for Sheets)."""
+        ev = cls.from_fields((), received, arrival_ns)
+        ev.event = _intern(event)
+        ev.device_number, _ = _parse_number(str(device_number))
+        return ev
+
+    def values(self):
+        return [getattr(self, attr) for attr in ATTRS]
+
+    def fields(self):
+        """The 21 data fields as the text the FED3 sent."""
+        decimals = self._decimals
+        out = []
+        for i, attr in enumerate(ATTRS):
+            value = getattr(self, attr)
+            if value.__class__ is str:
+                out.append(value)
+            else:
+                out.append(_format_number(value, (decimals >> (4 * i)) & 0xF))
+        return out
+
+    def format_time(self, time_format=TTL_TIME_FORMAT):
+        return datetime.datetime.fromtimestamp(self.received).strftime(time_format)[:-3]
+
+    def to_row(self, time_format=TTL_TIME_FORMAT):
+        return [self.format_time(time_format)] + self.fields()
+
+    def is_nan(self, attr):
+        value = getattr(self, attr)
+        return value.__class__ is float and math.isnan(value)
+
+    def __repr__(self):
+        return f"FED3Event({self.format_time()}, {self.event!r}, device={self.device_number!r})"
@@ -0,0 +1,441 @@
+"""Virtual FED3 fleet on pseudo-terminals.
+
+Each VirtualFED3 owns a pty pair and speaks the RTS firmware's serial
+protocol on the master side: it prints the 22-field log line built in
+FED3::logdata() and answers the host commands with the same replies as
+checkSerialCommands():
+
+    SET_TIME:YYYY,MM,DD,HH,MM,SS   -> TIME_SET_OK / TIME_SET_FAIL
+    SET_MODE:<0-12>                -> MODE_SET_OK (then a reboot pause) / MODE_SET_FAIL
+    TRIGGER_POKE                   -> SIMULATED_POKE, then a Left or Right line
+
+Events follow a small FR-schedule state machine (pokes, PelletInWell,
+pokes with the pellet present, Pellet on retrieval) so the counters and
+intervals look like a real session. Lines arrive as a Poisson process at
+``rate`` events/s per device, plus optional fleet-wide bursts where every
+device prints ``count`` lines at once every ``period`` seconds. With
+``reply_s`` the answers to host commands arrive up to that late, as on a
+board whose loop() is busy dispensing or writing the SD card.
+
+A running fleet keeps a directory of symlinks to its ptys, in the style of
+/dev/serial/by-path. Point RTFED_VIRTUAL_FED3 at it and the apps' device
+detection returns the virtual boards instead of USB ones:
+
+    python -m rtfed_core.fed3_sim --devices 16 --rate 2 --burst 10@5 --dir /tmp/rtfed_fleet
+    RTFED_VIRTUAL_FED3=/tmp/rtfed_fleet python RTFED_Pi/RTFEDPiOS.py
+
+The simulator holds the slave side open, so the ports survive the apps
+opening and closing them. Lines printed while no app has a port open wait
+in the kernel buffer; once the backlog passes MAX_BACKLOG bytes, whole
+lines are dropped and counted.
+"""
+import argparse
+import datetime
+import heapq
+import os
+import random
+import selectors
+import shutil
+import tempfile
+import threading
+import time
+import tty
+
+ENV_VAR = "RTFED_VIRTUAL_FED3"
+VERSION = "1.16.3"
+MAX_BACKLOG = 64 * 1024
+LINK_PREFIX = "virtual-fed3-"
+
+# FEDmode -> (sessiontype, FR), as set up in ClassicFED3.ino
+MODES = {
+    0: ("Free_feed", 1), 1: ("FR1", 1), 2: ("FR3", 3), 3: ("FR5", 5), 4: ("ProgRatio", 1),
+    5: ("Extinct", 1), 6: ("Light Trk", 1), 7: ("FR1_R", 1), 8: ("PR_R", 1), 9: ("OptoStim", 1),
+    10: ("OptoStim_R", 1), 11: ("Timed", 1), 12: ("ClEco_PR1", 1),
+}
+
+
+def virtual_ports():
+    """pty paths of the fleet named by $RTFED_VIRTUAL_FED3, or None when it is not set."""
+    link_dir = os.environ.get(ENV_VAR)
+    if not link_dir:
+        return None
+    if not os.path.isdir(link_dir):
+        return []
+    return [os.path.realpath(os.path.join(link_dir, name))
+            for name in sorted(os.listdir(link_dir)) if name.startswith(LINK_PREFIX)]
+
+
+def parse_burst(text):
+    """"10@5" -> (10, 5.0): ten lines per device every five seconds."""
+    count, _, period = text.partition("@")
+    count, period = int(count), float(period or 1)
+    if count < 1 or period <= 0:
+        raise ValueError(f"bad burst spec: {text!r}")
+    return count, period
+
+
+def _leading_int(text):
+    # Arduino String.toInt(): optional sign and leading digits, 0 when there are none
+    text = text.strip()
+    end = 1 if text[:1] in "+-" else 0
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    try:
+        return int(text[:end])
+    except ValueError:
+        return 0
+
+
+class VirtualFED3:
+    """One simulated board: a pty pair plus the firmware's counters."""
+
+    def __init__(self, device_number, mode=1, seed=None, reboot_s=2.0, p_active=0.7):
+        self.master, self.slave = os.openpty()
+        # Raw before anyone opens it, so our own output is never echoed back as a command
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self.slave)
+        self.device_number = device_number
+        self.rng = random.Random(seed)
+        self.reboot_s = reboot_s
+        self.p_active = p_active
+        self.rtc_offset = 0.0  # FED3 clock minus host clock, seconds
+        self.temp = 24 + self.rng.random() * 3
+        self.humidity = 25 + self.rng.random() * 10
+        self.battery = 4.2
+        self.lines = 0
+        self.dropped = 0
+        self.commands = 0
+        self.paused_until = 0.0
+        self._in = b""
+        self._out = bytearray()
+        self.reset(mode)
+
+    def reset(self, mode):
+        """State after a reboot into ``mode``; the counters live in RAM on the board."""
+        self.mode = mode
+        self.session_type, self.fr = MODES[mode]
+        self.active = "Left"
+        self.left = self.right = self.pellets = self.block_pellets = 0
+        self.progress = 0
+        self.dispense_pending = False
+        self.pellet_time = None
+        self.last_pellet = None
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    # -- firmware behaviour ---------------------------------------------------
+
+    def rtc(self, now):
+        return datetime.datetime.fromtimestamp(now + self.rtc_offset)
+
+    def next_event(self, now):
+        """Advance the FR state machine by one logged event; returns the log line."""
+        rng = self.rng
+        if self.pellet_time is not None:
+            if rng.random() < 0.5:
+                return self._pellet_taken(now)
+            side = self.active if rng.random() < self.p_active else _other(self.active)
+            return self._poke(now, side, side + "WithPellet")
+        if self.dispense_pending:
+            self.dispense_pending = False
+            self.pellet_time = now
+            return self.log_line(now, "PelletInWell")
+        side = self.active if rng.random() < self.p_active else _other(self.active)
+        line = self._poke(now, side, side)
+        if side == self.active:
+            self.progress += 1
+            if self.progress >= self.fr:
+                self.progress = 0
+                self.dispense_pending = True
+        return line
+
+    def _poke(self, now, side, event, duration=None):
+        if side == "Left":
+            self.left += 1
+        else:
+            self.right += 1
+        if duration is None:
+            duration = self.rng.uniform(0.05, 1.5)
+        return self.log_line(now, event, poke_time=duration)
+
+    def _pellet_taken(self, now):
+        self.pellets += 1
+        retrieval = now - self.pellet_time
+        rtc_now = now + self.rtc_offset
+        ipi = "NaN"
+        if self.pellets >= 2 and self.last_pellet is not None:
+            ipi = str(int(rtc_now - self.last_pellet))
+        self.last_pellet = rtc_now
+        self.pellet_time = None
+        self.battery = max(3.3, self.battery - 0.0005)
+        return self.log_line(now, "Pellet", motor_turns=self.rng.randint(1, 3),
+                             retrieval=retrieval, ipi=ipi)
+
+    def log_line(self, now, event, motor_turns=None, retrieval=None, ipi="NaN", poke_time=None):
+        t = self.rtc(now)
+        if retrieval is None:
+            retrieval_text = "NaN"
+        elif retrieval < 60:
+            retrieval_text = f"{retrieval:.2f}"
+        else:
+            retrieval_text = "Timed_out"
+        fields = [
+            f"{t.month}/{t.day}/{t.year} {t.hour:02d}:{t.minute:02d}:{t.second:02d}",
+            f"{self.temp:.2f}", f"{self.humidity:.2f}", VERSION, self.session_type,
+            str(self.device_number), f"{self.battery:.2f}",
+            "NaN" if motor_turns is None else str(motor_turns), str(self.fr), event, self.active,
+            str(self.left), str(self.right), str(self.pellets), str(self.block_pellets),
+            retrieval_text, ipi, "NaN" if poke_time is None else f"{poke_time:.2f}",
+            "NaN", "NaN", "NaN", "NaN",
+        ]
+        return ",".join(fields)
+
+    def handle_command(self, line, now):
+        """Replies to one host command, as checkSerialCommands() does."""
+        self.commands += 1
+        replies = []
+        if line.startswith("SET_TIME:"):
+            try:
+                parts = [int(p) for p in line[9:].split(",")]
+                if len(parts) != 6:
+                    raise ValueError
+                target = datetime.datetime(*parts).timestamp()
+            except (ValueError, OverflowError):
+                replies.append("TIME_SET_FAIL")
+            else:
+                self.rtc_offset = target - now
+                replies.append("TIME_SET_OK")
+        elif line.startswith("SET_MODE:"):
+            mode = _leading_int(line[9:])
+            if mode in MODES:
+                replies.append("MODE_SET_OK")
+                # writeFEDmode() then NVIC_SystemReset(): quiet while it reboots
+                self.reset(mode)
+                self.paused_until = now + self.reboot_s
+            else:
+                replies.append("MODE_SET_FAIL")
+        elif line == "TRIGGER_POKE":
+            # simulatePoke(): logged with a zero poke time and no feeding
+            replies.append("SIMULATED_POKE")
+            side = "Left" if self.rng.random() < 0.5 else "Right"
+            replies.append(self._poke(now, side, side, duration=0.0))
+        return replies
+
+    # -- pty I/O --------------------------------------------------------------
+
+    def send(self, lines):
+        for line in lines:
+            if len(self._out) >= MAX_BACKLOG:
+                self.dropped += 1
+                continue
+            self._out += line.encode() + b"\r\n"
+            self.lines += 1
+        self.flush()
+
+    def flush(self):
+        while self._out:
+            try:
+                n = os.write(self.master, self._out)
+            except (BlockingIOError, InterruptedError):
+                return
+            del self._out[:n]
+
+    @property
+    def backlog(self):
+        return len(self._out)
+
+    def read_commands(self):
+        try:
+            data = os.read(self.master, 4096)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError:
+            data = b""
+        self._in += data
+        *lines, self._in = self._in.split(b"\n")
+        return [l.decode("utf-8", "replace").strip() for l in lines]
+
+
+def _other(side):
+    return "Right" if side == "Left" else "Left"
+
+
+class VirtualFED3Fleet:
+    """N virtual boards served by one thread, plus the by-path style link directory."""
+
+    def __init__(self, devices=8, rate=1.0, burst=None, mode=1, first_device=1,
+                 link_dir=None, seed=None, reboot_s=2.0, reply_s=0.0):
+        self.rate = rate
+        self.burst = burst  # (count, period_s) or None
+        # Replies come up to reply_s late: the firmware only reads commands once per loop() pass
+        self.reply_s = reply_s
+        rng = random.Random(seed)
+        self.boards = [VirtualFED3(first_device + i, mode, rng.random(), reboot_s)
+                       for i in range(devices)]
+        self._own_dir = link_dir is None
+        self.link_dir = link_dir or tempfile.mkdtemp(prefix="rtfed_fleet_")
+        os.makedirs(self.link_dir, exist_ok=True)
+        for name in os.listdir(self.link_dir):
+            if name.startswith(LINK_PREFIX):
+                os.unlink(os.path.join(self.link_dir, name))
+        for i, board in enumerate(self.boards):
+            os.symlink(board.path, os.path.join(self.link_dir, f"{LINK_PREFIX}{i + 1:03d}"))
+        self._rng = rng
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def paths(self):
+        return [board.path for board in self.boards]
+
+    def environ(self):
+        """Environment entries that make the apps detect this fleet."""
+        return {ENV_VAR: self.link_dir}
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fed3-sim", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        for board in self.boards:
+            board.close()
+        if self._own_dir:
+            shutil.rmtree(self.link_dir, ignore_errors=True)
+        else:
+            for i in range(len(self.boards)):
+                try:
+                    os.unlink(os.path.join(self.link_dir, f"{LINK_PREFIX}{i + 1:03d}"))
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        return {
+            "lines": sum(b.lines for b in self.boards),
+            "dropped": sum(b.dropped for b in self.boards),
+            "commands": sum(b.commands for b in self.boards),
+            "backlog": sum(b.backlog for b in self.boards),
+        }
+
+    def _next_gap(self):
+        return self._rng.expovariate(self.rate) if self.rate > 0 else None
+
+    def _run(self):
+        sel = selectors.DefaultSelector()
+        for board in self.boards:
+            sel.register(board.master, selectors.EVENT_READ, board)
+        writing = set()
+        now = time.time()
+        heap = []  # (due, seq, board, or None for a fleet burst, or (board, lines) for a delayed reply)
+        seq = 0
+        for board in self.boards:
+            gap = self._next_gap()
+            if gap is not None:
+                heap.append((now + gap, seq, board))
+                seq += 1
+        if self.burst:
+            heap.append((now + self.burst[1], seq, None))
+            seq += 1
+        heapq.heapify(heap)
+        try:
+            while not self._stop.is_set():
+                timeout = 0.1
+                if heap:
+                    timeout = min(timeout, max(0.0, heap[0][0] - time.time()))
+                for key, mask in sel.select(timeout):
+                    board = key.data
+                    if mask & selectors.EVENT_READ:
+                        now = time.time()
+                        for line in board.read_commands():
+                            if line and now >= board.paused_until:
+                                replies = board.handle_command(line, now)
+                                if self.reply_s > 0:
+                                    heapq.heappush(heap, (now + self._rng.uniform(0, self.reply_s), seq,
+                                                          (board, replies)))
+                                    seq += 1
+                                else:
+                                    board.send(replies)
+                    if mask & selectors.EVENT_WRITE:
+                        board.flush()
+                now = time.time()
+                while heap and heap[0][0] <= now:
+                    due, _, board = heapq.heappop(heap)
+                    if isinstance(board, tuple):
+                        board[0].send(board[1])
+                        continue
+                    if board is None:
+                        count = self.burst[0]
+                        for b in self.boards:
+                            if now >= b.paused_until:
+                                b.send([b.next_event(now) for _ in range(count)])
+                        heapq.heappush(heap, (due + self.burst[1], seq, None))
+                    else:
+                        if now >= board.paused_until:
+                            board.send([board.next_event(now)])
+                        heapq.heappush(heap, (now + self._next_gap(), seq, board))
+                    seq += 1
+                # Watch for writability only while a board has output the pty would not take
+                for board in self.boards:
+                    if board.backlog and board not in writing:
+                        sel.modify(board.master, selectors.EVENT_READ | selectors.EVENT_WRITE, board)
+                        writing.add(board)
+                    elif not board.backlog and board in writing:
+                        sel.modify(board.master, selectors.EVENT_READ, board)
+                        writing.discard(board)
+        finally:
+            sel.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fleet of virtual FED3 boards on ptys.")
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1.0, help="mean events/s per device (0 for bursts only)")
+    parser.add_argument("--burst", type=parse_burst, default=None,
+                        help="COUNT@SECONDS: every device prints COUNT lines at once every SECONDS")
+    parser.add_argument("--mode", type=int, default=1, choices=sorted(MODES))
+    parser.add_argument("--first-device", type=int, default=1, help="Device_Number of the first board")
+    parser.add_argument("--dir", default=None, help="link directory to export (default: a temp dir)")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: until Ctrl-C)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--reply-ms", type=float, default=0.0, help="answer commands up to this late")
+    args = parser.parse_args(argv)
+
+    fleet = VirtualFED3Fleet(args.devices, args.rate, args.burst, args.mode,
+                             args.first_device, args.dir, args.seed, reply_s=args.reply_ms / 1000)
+    with fleet:
+        for i, path in enumerate(fleet.paths):
+            print(f"FED3 #{args.first_device + i}: {path}")
+        print(f"export {ENV_VAR}={fleet.link_dir}", flush=True)
+        start = time.time()
+        try:
+            while args.duration is None or time.time() - start < args.duration:
+                time.sleep(min(5.0, args.duration or 5.0))
+                s = fleet.stats()
+                print(f"{time.time() - start:8.1f} s: {s['lines']} lines, {s['dropped']} dropped, "
+                      f"{s['commands']} commands, {s['backlog']} B waiting", flush=True)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
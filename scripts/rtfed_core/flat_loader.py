@@ -0,0 +1,269 @@
+"""Bulk loader for the flat data folder, with a content-hashed cache.
+
+save_all_data copies every session's CSV (and its .fed3z) into the flat
+folder, so over a year it holds thousands of ``Port N_<timestamp>.csv``
+files. FlatLoader.scan() lists the folder with one os.scandir and
+compares each file's size and mtime with the cache index; only files that
+are new or changed are read and hashed (BLAKE2b of the bytes), and only
+hashes not already in the cache are parsed. Parsing runs in a process pool:
+each worker parses a file with analysis.Session (typed columns, with the
+NaN/Timed_out/Error tokens from analysis.convert) and writes it to the
+cache as ``<hash>.col``, so a renamed or re-copied file is never parsed
+twice. Unchanged files cost one stat, which keeps a re-scan of 10k files
+well under a second. A file that does not parse (truncated, or not a FED3
+log) is recorded in the index with its error instead of a cache file, so
+it neither stops the scan nor is parsed again until it changes; scan()
+counts these as "failed" and failures() lists them.
+
+The cache lives in ``<folder>/.rtfed_cache`` unless told otherwise:
+
+    index.json    {"files": {name: [size, mtime_ns, hash]},
+                   "entries": {hash: {rows, device_number, session_type, start, end} or {error}}}
+    <hash>.col    one file per distinct content: a JSON header naming the
+                  columns (t, event, the numeric columns that are not all
+                  NaN, their tokens, the other text columns) and their raw
+                  buffers, zlib-compressed; text is dictionary encoded
+
+entries() returns the per-file metadata without loading anything, and
+load() / sessions() read sessions back from the cache::
+
+    python -m rtfed_core.flat_loader /path/to/flat_data [--workers 4] [-o summary.csv]
+"""
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import io
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from . import analysis
+
+CACHE_DIR = ".rtfed_cache"
+INDEX = "index.json"
+VERSION = 1
+SUFFIXES = (".csv",)
+CACHE_SUFFIX = ".col"
+MAGIC = b"RTFEDCOL"
+POOL_MIN = 8  # fewer files than this are parsed in-process
+
+
+def file_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _save(path, session):
+    columns = [("t", session.t), ("event", session.event)]
+    columns += [(f"numeric.{attr}", v) for attr, v in session.numeric.items() if not np.isnan(v).all()]
+    columns += [(f"tokens.{attr}", v) for attr, v in session.tokens.items()]
+    columns += [(f"text.{attr}", v) for attr, v in session.text.items()]
+    header = []
+    buffers = []
+    for name, values in columns:
+        column = {"name": name}
+        if values.dtype.kind == "U":
+            vocab, values = np.unique(values, return_inverse=True)
+            values = values.astype(np.uint8 if len(vocab) <= 256 else np.uint32)
+            column["vocab"] = vocab.tolist()
+        column["dtype"] = values.dtype.str
+        header.append(column)
+        buffers.append(np.ascontiguousarray(values).tobytes())
+    head = json.dumps({"rows": len(session.t), "columns": header}, separators=(",", ":")).encode()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(head)) + head + zlib.compress(b"".join(buffers), 1))
+    os.replace(tmp, path)  # two workers writing the same hash both write whole files
+
+
+def _restore(path, source=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a cache file")
+    start = len(MAGIC) + 4
+    size, = struct.unpack("<I", data[len(MAGIC):start])
+    head = json.loads(data[start:start + size])
+    payload = bytearray(zlib.decompress(data[start + size:]))  # writable arrays
+    rows = head["rows"]
+    columns = {}
+    offset = 0
+    for column in head["columns"]:
+        dtype = np.dtype(column["dtype"])
+        values = np.frombuffer(payload, dtype, rows, offset)
+        offset += rows * dtype.itemsize
+        if "vocab" in column:
+            values = np.array(column["vocab"], dtype=str)[values] if column["vocab"] else np.empty(rows, dtype=str)
+        columns[column["name"]] = values
+    numeric = {attr: columns.get(f"numeric.{attr}", np.full(rows, np.nan)) for attr in analysis._NUMERIC}
+    tokens = {name[7:]: v for name, v in columns.items() if name.startswith("tokens.")}
+    text = {name[5:]: v for name, v in columns.items() if name.startswith("text.")}
+    return analysis.Session(columns["t"], columns["event"], numeric, text, source, tokens)
+
+
+def _meta(session):
+    return {"rows": len(session), "device_number": session.device_number, "session_type": session.session_type,
+            "start": float(session.t[0]) if len(session) else None,
+            "end": float(session.t[-1]) if len(session) else None}
+
+
+def _parse(task):
+    """Worker: read, hash and (unless cached) parse one file. Returns (name, size, mtime_ns, hash, meta).
+
+    A file that cannot be read has hash None; one that does not parse has meta {"error": ...}.
+    """
+    folder, cache_dir, name = task
+    path = os.path.join(folder, name)
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return name, None, None, None, {"error": str(e)}
+    digest = file_hash(data)
+    cached = os.path.join(cache_dir, digest + CACHE_SUFFIX)
+    if os.path.exists(cached):
+        return name, st.st_size, st.st_mtime_ns, digest, None
+    try:
+        session = analysis.Session.from_lines(io.StringIO(data.decode("utf-8", errors="replace"), newline=""), path)
+    except Exception as e:
+        return name, st.st_size, st.st_mtime_ns, digest, {"error": f"{type(e).__name__}: {e}"}
+    _save(cached, session)
+    return name, st.st_size, st.st_mtime_ns, digest, _meta(session)
+
+
+class FlatLoader:
+    def __init__(self, folder, cache_dir=None, workers=None):
+        self.folder = folder
+        self.cache_dir = cache_dir or os.path.join(folder, CACHE_DIR)
+        self.workers = workers or os.cpu_count() or 1
+        self.files = {}  # name -> [size, mtime_ns, hash]
+        self.meta = {}  # hash -> metadata
+        self.last_scan = {}
+        self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == VERSION:
+            self.files = index["files"]
+            self.meta = index["entries"]
+
+    def _write_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, INDEX)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"version": VERSION, "files": self.files, "entries": self.meta}, f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    def scan(self):
+        """Bring the cache up to date with the folder; returns counts of what was done."""
+        start = time.perf_counter()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        seen = {}
+        todo = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIXES) or not entry.is_file():
+                    continue
+                st = entry.stat()
+                known = self.files.get(entry.name)
+                if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns \
+                        and known[2] in self.meta:
+                    seen[entry.name] = known
+                else:
+                    todo.append(entry.name)
+        removed = len(set(self.files) - set(seen) - set(todo))
+        parsed = reused = unreadable = 0
+        tasks = [(self.folder, self.cache_dir, name) for name in todo]
+        if len(tasks) >= POOL_MIN and self.workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(self.workers) as pool:
+                results = list(pool.map(_parse, tasks, chunksize=max(1, len(tasks) // (4 * self.workers))))
+        else:
+            results = [_parse(task) for task in tasks]
+        for name, size, mtime_ns, digest, meta in results:
+            if digest is None:
+                unreadable += 1  # e.g. removed mid-scan; tried again next time
+                continue
+            if meta is not None:
+                parsed += "error" not in meta
+                self.meta[digest] = meta
+            elif digest not in self.meta:
+                # Cached by content but missing from the index (e.g. the index was deleted)
+                self.meta[digest] = _meta(_restore(os.path.join(self.cache_dir, digest + CACHE_SUFFIX)))
+            else:
+                reused += 1
+            seen[name] = [size, mtime_ns, digest]
+        changed = todo or removed or len(seen) != len(self.files)
+        self.files = seen
+        if changed:
+            live = {h for _, _, h in seen.values()}
+            self.meta = {h: m for h, m in self.meta.items() if h in live}
+            self._prune(live)
+            self._write_index()
+        failed = sum(1 for _, _, h in seen.values() if "error" in self.meta[h]) + unreadable
+        self.last_scan = {"files": len(seen), "parsed": parsed, "reused": reused, "failed": failed,
+                          "removed": removed, "seconds": time.perf_counter() - start}
+        return self.last_scan
+
+    def _prune(self, live):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_SUFFIX) and name[:-len(CACHE_SUFFIX)] not in live:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def entries(self, device=None):
+        """[(file name, metadata)] sorted by start time, optionally for one device number; failed files are left out."""
+        out = [(name, self.meta[h]) for name, (_, _, h) in self.files.items()
+               if "error" not in self.meta[h] and (device is None or self.meta[h]["device_number"] == device)]
+        return sorted(out, key=lambda e: (e[1]["start"] is None, e[1]["start"] or 0.0, e[0]))
+
+    def failures(self):
+        """[(file name, error)] for files in the folder that did not parse."""
+        return sorted((name, self.meta[h]["error"]) for name, (_, _, h) in self.files.items()
+                      if "error" in self.meta[h])
+
+    def load(self, name):
+        """One file's analysis.Session, from the cache."""
+        digest = self.files[name][2]
+        return _restore(os.path.join(self.cache_dir, digest + CACHE_SUFFIX), os.path.join(self.folder, name))
+
+    def sessions(self, device=None):
+        for name, _ in self.entries(device):
+            yield self.load(name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the flat data folder through the parsed-session cache.")
+    parser.add_argument("folder")
+    parser.add_argument("--cache", default=None, help=f"cache directory (default: <folder>/{CACHE_DIR})")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: one per CPU)")
+    parser.add_argument("--device", type=int, default=None, help="only this device number")
+    parser.add_argument("-o", "--output", help="write an analysis summary of every session here")
+    args = parser.parse_args(argv)
+    loader = FlatLoader(args.folder, args.cache, args.workers)
+    s = loader.scan()
+    print(f"{s['files']} files: {s['parsed']} parsed, {s['reused']} already cached by content, "
+          f"{s['failed']} failed, {s['removed']} removed, {s['seconds']:.3f} s")
+    for name, error in loader.failures():
+        print(f"  skipped {name}: {error}")
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(analysis.SUMMARY_HEADER)
+            for session in loader.sessions(args.device):
+                writer.writerow(analysis.summarize(session))
+        print(f"Summary -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Chunked line framing for FED3 serial streams.
+
+A LineFramer reads whatever bytes a port has ready in a single ``readv``
+call into one reusable bytearray. All complete lines in that chunk are
+decoded in one go, and a trailing partial line stays in the buffer for the
+next read. When a FED3 sends a burst (e.g. LeftWithPellet followed by
+Pellet), this costs one syscall and one decode for the whole burst instead
+of a readline() per line.
+
+Each line is stamped with ``time.monotonic_ns()`` taken when the read that
+returned its first chunk came back. That is the moment the host read the
+bytes, not when they reached the port: a line that arrives over several
+reads keeps the stamp of the first of them, and anything that delays the
+reader (scheduling, a select wake-up) is included in the stamp.
+"""
+import os
+import select
+import time
+
+
+class LineFramer:
+    def __init__(self, capacity=4096, max_capacity=65536):
+        self.max_capacity = max_capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._len = 0
+        self._head_ns = 0  # arrival of the first byte now in the buffer
+        self._last_ns = 0  # arrival of the latest read
+
+    def read_from(self, fd):
+        """Read what is available on fd in one syscall; returns the byte count (0 at EOF)."""
+        if self._len == len(self._buf):
+            self._grow()
+        n = os.readv(fd, [self._view[self._len:]])
+        self._stamp(n)
+        return n
+
+    def _stamp(self, n):
+        now = time.monotonic_ns()  # after the read returned, not when the bytes arrived
+        if not self._len:
+            self._head_ns = now
+        self._last_ns = now
+        self._len += n
+
+    def feed(self, data):
+        """Append bytes that were read elsewhere."""
+        if len(data) >= self.max_capacity:
+            data = data[-(self.max_capacity // 2):]
+            self._len = 0
+        while self._len + len(data) > len(self._buf):
+            self._grow()
+        self._view[self._len:self._len + len(data)] = data
+        self._stamp(len(data))
+
+    def pop_lines(self):
+        """Return every complete, non-empty line and keep the partial tail."""
+        return [line for line, _ in self.pop_stamped_lines()]
+
+    def pop_stamped_lines(self):
+        """Like pop_lines() but returns (line, arrival_ns) pairs."""
+        end = self._buf.rfind(b"\n", 0, self._len)
+        if end < 0:
+            return []
+        text = str(self._view[:end], "utf-8", "replace")
+        rest = self._len - end - 1
+        if rest:
+            self._buf[:rest] = bytes(self._view[end + 1:self._len])
+        self._len = rest
+        # Only the first line can have started in an earlier read
+        stamp = self._head_ns
+        out = []
+        for line in text.split("\n"):
+            line = line.strip()
+            if line:
+                out.append((line, stamp))
+            stamp = self._last_ns
+        self._head_ns = self._last_ns
+        return out
+
+    def read_lines(self, fd, timeout=None):
+        """Wait up to timeout for data on fd, read it and return the complete lines.
+
+        Raises EOFError when the port reports data but returns none (unplugged).
+        """
+        return [line for line, _ in self.read_stamped_lines(fd, timeout)]
+
+    def read_stamped_lines(self, fd, timeout=None):
+        """read_lines() returning (line, arrival_ns) pairs."""
+        if timeout is not None:
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                return []
+        try:
+            n = self.read_from(fd)
+        except BlockingIOError:
+            return []
+        except OSError as e:
+            raise EOFError(f"serial device read failed: {e}") from e
+        if n == 0:
+            raise EOFError("serial device returned no data (disconnected?)")
+        return self.pop_stamped_lines()
+
+    def pending_bytes(self):
+        return self._len
+
+    def _grow(self):
+        if len(self._buf) >= self.max_capacity:
+            # A line this long is noise (e.g. baud mismatch); drop it
+            self._len = 0
+            return
+        self._view.release()
+        new = bytearray(min(len(self._buf) * 2, self.max_capacity))
+        new[:self._len] = self._buf[:self._len]
+        self._buf = new
+        self._view = memoryview(self._buf)
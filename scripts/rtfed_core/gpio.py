@@ -0,0 +1,198 @@
+"""GPIO output backends for the TTL lines.
+
+Every backend offers the small surface PulseScheduler and the TTL app use:
+``HIGH``/``LOW``, ``setup(pins)`` (configure as outputs driven low),
+``output(pin, state)`` and ``cleanup()``. Pins are BCM/line offsets.
+
+    RPiGPIOBackend  RPi.GPIO (the original dependency)
+    GpiodBackend    Linux GPIO character device through libgpiod (v1 or v2
+                    Python bindings); also works on a Pi 5 and on other boards
+    FakeGPIO        in memory; records every edge with time.monotonic_ns()
+                    so pulse timing can be checked without hardware
+
+open_backend() picks one by name, or from $RTFED_GPIO_BACKEND ("rpi",
+"gpiod", "fake"), and sets the pins up. The default, "auto", tries
+RPi.GPIO, then libgpiod, and raises GPIOUnavailable when neither opens: a
+session recorded with no TTL output is worse than one that does not start.
+The fake is only used when asked for by name (benchmarks, CI, working off
+a Pi). Nothing touches hardware until open_backend() is called.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+ENV_VAR = "RTFED_GPIO_BACKEND"
+CHIP_ENV_VAR = "RTFED_GPIO_CHIP"
+DEFAULT_CHIP = "/dev/gpiochip0"
+
+
+class RPiGPIOBackend:
+    name = "rpi"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        # Bound straight to the C function: no wrapper on the pulse path
+        self.output = GPIO.output
+
+    def setup(self, pins):
+        for pin in pins:
+            self._gpio.setup(pin, self._gpio.OUT)
+            self._gpio.output(pin, self._gpio.LOW)
+
+    def cleanup(self):
+        self._gpio.cleanup()
+
+
+class GpiodBackend:
+    name = "gpiod"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, chip=None, consumer="rtfed-ttl"):
+        import gpiod
+        self._gpiod = gpiod
+        self.chip_path = chip or os.environ.get(CHIP_ENV_VAR, DEFAULT_CHIP)
+        self.consumer = consumer
+        self._v2 = hasattr(gpiod, "request_lines")
+        self._pins = []
+        self._request = None  # v2 line request
+        self._chip = None  # v1 chip
+        self._lines = {}  # v1 pin -> line
+
+    def setup(self, pins):
+        pins = sorted(set(self._pins) | set(pins))
+        self.cleanup()
+        self._pins = pins
+        gpiod = self._gpiod
+        if self._v2:
+            from gpiod.line import Direction, Value
+            settings = gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.INACTIVE)
+            self._request = gpiod.request_lines(self.chip_path, consumer=self.consumer,
+                                                config={tuple(pins): settings})
+            set_value = self._request.set_value
+            values = (Value.INACTIVE, Value.ACTIVE)
+            self.output = lambda pin, state: set_value(pin, values[1 if state else 0])
+        else:
+            self._chip = gpiod.Chip(self.chip_path)
+            for pin in pins:
+                line = self._chip.get_line(pin)
+                line.request(consumer=self.consumer, type=gpiod.LINE_REQ_DIR_OUT, default_vals=[0])
+                self._lines[pin] = line
+            lines = self._lines
+            self.output = lambda pin, state: lines[pin].set_value(1 if state else 0)
+
+    def output(self, pin, state):
+        raise RuntimeError("GpiodBackend.setup() must be called before output()")
+
+    def cleanup(self):
+        # Released lines keep their last value on most drivers; drive them low first
+        if self._request is not None:
+            for pin in self._pins:
+                self.output(pin, self.LOW)
+            self._request.release()
+            self._request = None
+        for line in self._lines.values():
+            line.set_value(0)
+            line.release()
+        self._lines.clear()
+        if self._chip is not None:
+            self._chip.close()
+            self._chip = None
+        self.__dict__.pop("output", None)
+
+
+class FakeGPIO:
+    """In-memory pins; ``edges`` holds (monotonic_ns, pin, level) for every level change.
+
+    Only the last ``max_edges`` edges are kept, so the fake can stand in for
+    hardware through a whole session.
+    """
+    name = "fake"
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, max_edges=100_000):
+        self.levels = {}
+        self.edges = collections.deque(maxlen=max_edges)
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def setup(self, pins):
+        for pin in pins:
+            self.output(pin, self.LOW)
+
+    def output(self, pin, state):
+        level = 1 if state else 0
+        now = time.monotonic_ns()
+        with self._lock:
+            self.writes += 1
+            if self.levels.get(pin) != level:
+                self.levels[pin] = level
+                self.edges.append((now, pin, level))
+
+    def cleanup(self):
+        with self._lock:
+            for pin, level in self.levels.items():
+                if level:
+                    self.levels[pin] = 0
+                    self.edges.append((time.monotonic_ns(), pin, 0))
+
+    def pulses(self, pin=None):
+        """(pin, rise_ns, fall_ns) for every completed high period, in order."""
+        rises = {}
+        out = []
+        with self._lock:
+            edges = list(self.edges)
+        for t, p, level in edges:
+            if pin is not None and p != pin:
+                continue
+            if level:
+                rises[p] = t
+            elif p in rises:
+                out.append((p, rises.pop(p), t))
+        return out
+
+    def clear(self):
+        with self._lock:
+            self.edges.clear()
+            self.writes = 0
+
+
+BACKENDS = {"rpi": RPiGPIOBackend, "gpiod": GpiodBackend, "fake": FakeGPIO}
+
+
+class GPIOUnavailable(RuntimeError):
+    pass
+
+
+def open_backend(name=None, pins=()):
+    """Open a backend by name ("rpi", "gpiod", "fake" or "auto") with ``pins`` set up as outputs.
+
+    Set-up is part of the "auto" probe: RPi.GPIO imports on a Pi 5 but
+    fails there on the first setup(), so that is when libgpiod is tried.
+    """
+    name = (name or os.environ.get(ENV_VAR) or "auto").lower()
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"unknown GPIO backend {name!r}; choose from {', '.join(BACKENDS)} or auto")
+        backend = BACKENDS[name]()
+        backend.setup(pins)
+        return backend
+    failures = []
+    for cls in (RPiGPIOBackend, GpiodBackend):
+        try:
+            backend = cls()
+            backend.setup(pins)
+            return backend
+        except (ImportError, RuntimeError, OSError) as e:
+            logging.info("GPIO backend %s unavailable: %s", cls.name, e)
+            failures.append(f"{cls.name}: {e}")
+    raise GPIOUnavailable(f"no GPIO hardware backend could be opened ({'; '.join(failures)}); "
+                          f"use the fake backend by name (--gpio fake or ${ENV_VAR}=fake) to run without TTL output")
@@ -0,0 +1,336 @@
+"""Batched rendering of log lines into Tk text widgets.
+
+update_gui used to insert every queued message and scroll to it one at a
+time, so a burst of N lines cost N re-layouts per widget. LogRenderer
+collects lines per widget between ticks and writes each widget once per
+frame: one insert of the joined text and one see(END), and the see(END)
+only when the widget was already scrolled to the bottom.
+
+The tick adapts to load. While lines are arriving and frames are cheap it
+runs at MIN_TICK_MS so the display keeps up; when frames get expensive it
+stretches so rendering stays under FRAME_BUDGET of the main loop (a longer
+tick means a bigger batch for the same one re-layout); with nothing to
+render it sits at IDLE_TICK_MS. Frame render times go into a
+LatencyHistogram and are summarised every REPORT_S seconds through
+``report`` (logging.info unless the app passes its own log sink).
+
+Widgets registered with add_view() are bounded: a LogView keeps the last
+``capacity`` lines in the widget and appends the lines that fall off the
+top to a rotating SpillFile, so a multi-week session costs the same memory
+and redraw time as the first hour. Right-click on the widget pages older
+lines back in from the spill, PAGE_LINES at a time, up to MAX_PAGED lines
+beyond capacity. Once new lines have pushed the paged-in ones back out,
+the widget returns to ``capacity`` and can page again. Spill files outlive
+the run, so each view starts with a marker line naming the app, the view
+and the time, and paging past it shows the previous run.
+
+IndicatorAnimator drives the per-port activity ovals from one after() clock
+instead of a chain of six timers per event. trigger() only records an
+"active until" deadline (so any thread may call it, and a retrigger extends
+the blink rather than stacking timers); each tick computes every active
+oval's colour from its deadline and repaints only those that changed.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import tkinter as tk
+
+from .latency import LatencyHistogram
+
+MIN_TICK_MS = 50
+IDLE_TICK_MS = 100
+MAX_TICK_MS = 1000
+FRAME_BUDGET = 0.2  # fraction of the tick spent rendering
+REPORT_S = 60.0
+
+VIEW_LINES = 1000
+PAGE_LINES = 500
+MAX_PAGED = 5000
+SPILL_BYTES = 2 * 1024 * 1024
+SPILL_BACKUPS = 4
+
+BLINK_S = 1.5
+BLINK_PERIOD_S = 0.25  # red and gray phases of the blink
+ANIM_TICK_MS = 50
+
+
+def default_spill_dir(app):
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "rtfed", re.sub(r"[^\w.-]+", "_", app).strip("_"))
+
+
+class SpillFile:
+    """Append-only text log rotated like logging.handlers.RotatingFileHandler (path, path.1, ...)."""
+
+    def __init__(self, path, max_bytes=SPILL_BYTES, backups=SPILL_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+
+    def append(self, lines):
+        if not lines:
+            return
+        self._f.write("\n".join(lines) + "\n")
+        self._f.flush()
+        if self._f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def read_back(self, skip, count):
+        """Up to ``count`` lines, oldest first, ending ``skip`` lines before the newest one."""
+        self._f.flush()
+        wanted = []
+        for path in [self.path] + [f"{self.path}.{i}" for i in range(1, self.backups + 1)]:
+            try:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                break
+            if skip >= len(lines):
+                skip -= len(lines)
+                continue
+            end = len(lines) - skip
+            skip = 0
+            wanted[:0] = lines[max(0, end - (count - len(wanted))):end]
+            if len(wanted) >= count:
+                break
+        return wanted
+
+    def close(self):
+        self._f.close()
+
+    def _rotate(self):
+        self._f.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        self._f = open(self.path, "w", encoding="utf-8")
+
+
+class LogView:
+    """Keeps a text widget to its last ``capacity`` lines, spilling the rest to disk.
+
+    Lines are numbered from the start of the run: the widget shows
+    [top, total) and lines below ``spilled`` are on disk, with
+    top <= spilled. Paged-in lines at the top are already on disk, so only
+    lines in [spilled, total) are held here for spilling. Paging can take
+    ``top`` below 0 into the previous run's lines.
+    """
+
+    def __init__(self, widget, spill, capacity=VIEW_LINES):
+        self.widget = widget
+        self.spill = spill
+        self.capacity = capacity
+        self.top = 0
+        self.total = 0
+        self.spilled = 0
+        self.paged = 0  # lines allowed beyond capacity after "load older"
+        self._unspilled = []
+
+    def added(self, lines):
+        self.total += len(lines)
+        self._unspilled.extend(lines)
+        limit = self.capacity + self.paged
+        if self.paged and self.total - limit >= self.spilled:
+            # Every paged-in line has scrolled back out
+            self.paged = 0
+            limit = self.capacity
+        excess = self.total - self.top - limit
+        if excess <= 0:
+            return
+        new_top = self.total - limit
+        if new_top > self.spilled:
+            n = new_top - self.spilled
+            self.spill.append(self._unspilled[:n])
+            del self._unspilled[:n]
+            self.spilled = new_top
+        self.widget.delete("1.0", f"{excess + 1}.0")
+        self.top = new_top
+
+    def load_older(self, count=PAGE_LINES):
+        count = min(count, MAX_PAGED - self.paged)
+        if count <= 0:
+            return 0
+        lines = self.spill.read_back(self.spilled - self.top, count)
+        if lines:
+            self.widget.insert("1.0", "\n".join(lines) + "\n")
+            self.widget.see("1.0")
+            self.top -= len(lines)
+            self.paged += len(lines)
+        return len(lines)
+
+    def close(self):
+        # Leave the whole run in the spill file
+        self.spill.append(self._unspilled)
+        self._unspilled = []
+        self.spill.close()
+
+
+class LogRenderer:
+    def __init__(self, name="gui", report=None, spill_dir=None):
+        self.name = name
+        self.report = report or logging.info
+        self.spill_dir = spill_dir or default_spill_dir(name)
+        self.views = {}  # widget -> LogView
+        self.frames = LatencyHistogram()  # render ns per non-empty frame since the last report
+        self.tick_ms = IDLE_TICK_MS
+        self.last_frame_ns = 0
+        self.last_lines = 0
+        self._pending = {}  # widget -> [line, ...]
+        self._avg_ns = 0.0
+        self._last_report = time.monotonic()
+
+    def add_view(self, widget, name, capacity=VIEW_LINES):
+        """Bound ``widget`` to ``capacity`` lines, spilling to <spill_dir>/<name>.log, with a right-click pager."""
+        path = os.path.join(self.spill_dir, re.sub(r"[^\w.-]+", "_", name).strip("_") + ".log")
+        try:
+            spill = SpillFile(path)
+            spill.append([f"===== {self.name} {name}: log opened {time.strftime('%Y-%m-%d %H:%M:%S')} ====="])
+        except OSError as e:
+            self.report(f"Cannot open {path} for old log lines; keeping them in the widget: {e}")
+            return None
+        view = self.views[widget] = LogView(widget, spill, capacity)
+        menu = tk.Menu(widget, tearoff=0)
+        menu.add_command(label=f"Load {PAGE_LINES} older lines", command=lambda: self.load_older(widget))
+        menu.add_command(label=f"Older lines: {path}", state=tk.DISABLED)
+        widget.bind("<Button-3>", lambda e: menu.tk_popup(e.x_root, e.y_root))
+        widget.bind("<Destroy>", lambda e: self._drop_view(e.widget), add="+")
+        return view
+
+    def load_older(self, widget):
+        view = self.views.get(widget)
+        if view is None or not view.load_older():
+            widget.bell()
+
+    def write(self, widget, line):
+        pending = self._pending.get(widget)
+        if pending is None:
+            pending = self._pending[widget] = []
+        if "\n" in line:
+            pending.extend(line.split("\n"))
+        else:
+            pending.append(line)
+
+    @property
+    def pending(self):
+        return sum(len(lines) for lines in self._pending.values())
+
+    def flush(self):
+        """Render everything pending and return the delay in ms before the next tick."""
+        if not self._pending:
+            self.tick_ms = IDLE_TICK_MS
+            self.last_lines = 0
+            self._maybe_report()
+            return self.tick_ms
+        pending, self._pending = self._pending, {}
+        start = time.perf_counter_ns()
+        lines = 0
+        for widget, batch in pending.items():
+            lines += len(batch)
+            # Follow new lines only if the user has not scrolled up to read
+            follow = widget.yview()[1] >= 0.999
+            widget.insert("end", "\n".join(batch) + "\n")
+            view = self.views.get(widget)
+            if view is not None:
+                view.added(batch)
+            if follow:
+                widget.see("end")
+        elapsed = time.perf_counter_ns() - start
+        self.frames.record(elapsed)
+        self.last_frame_ns = elapsed
+        self.last_lines = lines
+        self._avg_ns = elapsed if not self._avg_ns else 0.8 * self._avg_ns + 0.2 * elapsed
+        tick = self._avg_ns / 1e6 / FRAME_BUDGET
+        self.tick_ms = int(min(MAX_TICK_MS, max(MIN_TICK_MS, tick)))
+        self._maybe_report()
+        return self.tick_ms
+
+    def close(self):
+        for widget in list(self.views):
+            self._drop_view(widget)
+
+    def summary(self):
+        f = self.frames
+        if not f.n:
+            return f"{self.name} render: idle, tick {self.tick_ms} ms"
+        return (f"{self.name} render: {f.n} frames, p50 {f.percentile(50) / 1e6:.2f} ms, "
+                f"p99 {f.percentile(99) / 1e6:.2f} ms, max {f.max / 1e6:.2f} ms, tick {self.tick_ms} ms")
+
+    def _drop_view(self, widget):
+        view = self.views.pop(widget, None)
+        if view is not None:
+            self._pending.pop(widget, None)
+            view.close()
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if now - self._last_report < REPORT_S:
+            return
+        if self.frames.n:
+            self.report(self.summary())
+        self.frames = LatencyHistogram()
+        self._last_report = now
+
+
+class IndicatorAnimator:
+    def __init__(self, root, on="red", off="gray", blink_s=BLINK_S, period_s=BLINK_PERIOD_S):
+        self.root = root
+        self.on = on
+        self.off = off
+        self.blink_s = blink_s
+        self.period_s = period_s
+        self.repaints = 0
+        self._items = {}  # key -> (canvas, item)
+        self._painted = {}  # key -> colour last set on the canvas
+        self._active = {}  # key -> [blink start, active until]
+        self._lock = threading.Lock()
+        self._job = root.after(ANIM_TICK_MS, self._tick)
+
+    def add(self, key, canvas, item):
+        self._items[key] = (canvas, item)
+        self._painted[key] = canvas.itemcget(item, "fill")
+
+    def trigger(self, key):
+        now = time.monotonic()
+        with self._lock:
+            active = self._active.get(key)
+            if active is None:
+                self._active[key] = [now, now + self.blink_s]
+            else:
+                active[1] = now + self.blink_s
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        now = time.monotonic()
+        changes = []
+        with self._lock:
+            for key, (start, until) in list(self._active.items()):
+                if now >= until:
+                    del self._active[key]
+                    changes.append((key, self.off))
+                elif int((now - start) / self.period_s) % 2 == 0:
+                    changes.append((key, self.on))
+                else:
+                    changes.append((key, self.off))
+        for key, colour in changes:
+            item = self._items.get(key)
+            if item is None or self._painted.get(key) == colour:
+                continue
+            try:
+                item[0].itemconfig(item[1], fill=colour)
+            except tk.TclError:
+                # Canvas destroyed with its port frame
+                self._items.pop(key, None)
+                continue
+            self._painted[key] = colour
+            self.repaints += 1
+        self._job = self.root.after(ANIM_TICK_MS if self._active else IDLE_TICK_MS, self._tick)
@@ -0,0 +1,308 @@
+"""Local JSON-lines IPC over a Unix socket.
+
+Used between a headless acquisition service and the GUI clients that
+attach to it. Every message is one JSON object per line:
+
+    request   {"id": 7, "cmd": "start", "args": {...}}
+    reply     {"id": 7, "ok": true, "result": ...}   or   {"id": 7, "ok": false, "error": "..."}
+    push      {"push": "log", ...}                    (after "subscribe")
+
+IPCServer runs each connection on its own reader thread, so a slow command
+only holds up the client that sent it. Pushes go into a bounded per-client
+queue drained by a writer thread: publish() never blocks and never does
+I/O, and a client that stops reading loses its oldest pushes instead of
+slowing the caller (the serial thread, for instance). Replies are never
+dropped: closing a connection only stops its reader, and the writer still
+sends every queued reply and push (including the reply to a request that
+was being handled at the time) before it closes the socket. Objects that
+are not JSON types are passed to the server's ``encode`` function on the
+writer thread.
+"""
+import collections
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+
+class CommandError(Exception):
+    """Raised by a command handler; the message is sent back to the client."""
+
+
+class IPCError(Exception):
+    """Raised by IPCClient.call when the service reports an error or goes away."""
+
+
+def default_socket_path(name):
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, f"{name}.sock")
+
+
+class _Connection:
+    def __init__(self, server, sock):
+        self.server = server
+        self.sock = sock
+        self.subscribed = False
+        self.dropped = 0
+        self._pushes = collections.deque(maxlen=server.backlog)
+        self._replies = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._reading = True
+        self.writer = None
+
+    def push(self, message):
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pushes) == self._pushes.maxlen:
+                self.dropped += 1
+            self._pushes.append(message)
+            self._cond.notify()
+
+    def reply(self, message):
+        with self._cond:
+            self._replies.append(message)
+            self._cond.notify()
+
+    def close(self):
+        """Stop reading; the writer sends what is queued, then closes the socket."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def read_loop(self):
+        try:
+            with self.sock.makefile("rb") as f:
+                for raw in f:
+                    try:
+                        request = json.loads(raw)
+                    except ValueError:
+                        self.reply({"id": None, "ok": False, "error": "bad JSON"})
+                        continue
+                    self.reply(self.server.dispatch(self, request))
+        except OSError:
+            pass
+        finally:
+            self.server.drop(self)
+            with self._cond:
+                self._reading = False  # no more replies can be queued
+            self.close()
+
+    def write_loop(self):
+        encode = self.server.encode
+        try:
+            while True:
+                with self._cond:
+                    while not (self._replies or self._pushes or (self._closed and not self._reading)):
+                        self._cond.wait()
+                    if not (self._replies or self._pushes):
+                        return  # closed, reader finished and everything sent
+                    batch = list(self._replies)
+                    self._replies.clear()
+                    batch.extend(self._pushes)
+                    self._pushes.clear()
+                data = "".join(json.dumps(m, default=encode, separators=(",", ":")) + "\n" for m in batch)
+                self.sock.sendall(data.encode())
+        except OSError:
+            pass
+        finally:
+            try:
+                self.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+
+class IPCServer:
+    def __init__(self, path, handler, encode=None, backlog=2000):
+        # handler(cmd, args) returns a JSON-able result or raises CommandError
+        self.path = path
+        self.handler = handler
+        self.encode = encode
+        self.backlog = backlog
+        self.on_subscribe = None  # returns the snapshot sent back to "subscribe"
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # stale socket from a previous run
+            else:
+                probe.close()
+                raise RuntimeError(f"a service is already listening on {self.path}")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(8)
+        self._thread = threading.Thread(target=self._accept_loop, name="ipc-accept", daemon=True)
+        self._thread.start()
+
+    @property
+    def clients(self):
+        with self._lock:
+            return len(self._connections)
+
+    def publish(self, message):
+        with self._lock:
+            for conn in self._connections:
+                if conn.subscribed:
+                    conn.push(message)
+
+    def dispatch(self, conn, request):
+        rid = request.get("id")
+        cmd = request.get("cmd")
+        try:
+            if cmd == "subscribe":
+                # Subscribe before taking the snapshot so no push falls between the two
+                conn.subscribed = True
+                result = self.on_subscribe() if self.on_subscribe else None
+            else:
+                result = self.handler(cmd, request.get("args") or {})
+            return {"id": rid, "ok": True, "result": result}
+        except CommandError as e:
+            return {"id": rid, "ok": False, "error": str(e)}
+        except Exception as e:
+            logging.exception(f"IPC command {cmd!r} failed")
+            return {"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def drop(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+
+    def close(self, flush_timeout=2.0):
+        """Stop listening and close every connection, waiting up to flush_timeout for queued replies to go out."""
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            conn.close()
+        deadline = time.monotonic() + flush_timeout
+        for conn in connections:
+            if conn.writer is not None:
+                conn.writer.join(max(0.0, deadline - time.monotonic()))
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self._sock.accept()
+            except (OSError, AttributeError):
+                return
+            conn = _Connection(self, sock)
+            with self._lock:
+                self._connections.add(conn)
+            conn.writer = threading.Thread(target=conn.write_loop, name="ipc-write", daemon=True)
+            threading.Thread(target=conn.read_loop, name="ipc-read", daemon=True).start()
+            conn.writer.start()
+
+
+class IPCClient:
+    """Blocking calls plus a queue of pushes; ``pushes`` gets None when the connection ends."""
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self.pushes = queue.Queue()
+        self._ids = itertools.count(1)
+        self._waiting = {}  # id -> [threading.Event, reply]
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self.connected = False
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self._sock = sock
+        self.connected = True
+        self._thread = threading.Thread(target=self._read_loop, name="ipc-client", daemon=True)
+        self._thread.start()
+        return self
+
+    def call(self, cmd, timeout=None, **args):
+        if not self.connected:
+            raise IPCError("not connected to the service")
+        rid = next(self._ids)
+        slot = [threading.Event(), None]
+        with self._lock:
+            self._waiting[rid] = slot
+        data = json.dumps({"id": rid, "cmd": cmd, "args": args}) + "\n"
+        try:
+            with self._send_lock:
+                self._sock.sendall(data.encode())
+            if not slot[0].wait(self.timeout if timeout is None else timeout):
+                raise IPCError(f"{cmd}: no reply from the service")
+        finally:
+            with self._lock:
+                self._waiting.pop(rid, None)
+        reply = slot[1]
+        if reply is None:
+            raise IPCError("connection to the service was lost")
+        if not reply.get("ok"):
+            raise IPCError(reply.get("error") or "command failed")
+        return reply.get("result")
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+
+    def _read_loop(self):
+        try:
+            with self._sock.makefile("rb") as f:
+                for raw in f:
+                    message = json.loads(raw)
+                    if "push" in message:
+                        self.pushes.put(message)
+                        continue
+                    with self._lock:
+                        slot = self._waiting.get(message.get("id"))
+                    if slot is not None:
+                        slot[1] = message
+                        slot[0].set()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.connected = False
+            with self._lock:
+                for slot in self._waiting.values():
+                    slot[0].set()
+            self.pushes.put(None)
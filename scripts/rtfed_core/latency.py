@@ -0,0 +1,152 @@
+"""HDR-style latency histograms for the TTL path.
+
+LatencyHistogram keeps log-linear buckets of nanosecond values: exact below
+256 ns, then 128 buckets per power of two, so any percentile is within
+0.8 % of the true value whatever the range (µs delays and 100 ms pulse
+widths share the same structure). Counts live in a dict, so a histogram
+costs memory only for the buckets it has seen. Mean and SD are tracked
+exactly alongside (Welford), to match the SPEED_TEST summaries.
+
+LatencyRecorder holds one histogram per (port, event, metric), where the
+metric is "delay" (line read -> TTL rising edge) or "duration" (rising ->
+falling edge). The delay starts at the line's read stamp, taken after the
+read that returned its first chunk (rtfed_core.framing), so it leaves out
+the USB transfer and any wait before the reader woke up.
+"""
+import math
+import threading
+
+SUB_BITS = 7
+_SUB = 1 << SUB_BITS
+
+DELAY = "delay"
+DURATION = "duration"
+
+
+def bucket_index(value):
+    if value < 2 * _SUB:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return shift * _SUB + (value >> shift)
+
+
+def bucket_value(index):
+    """Midpoint of a bucket, in the recorded unit."""
+    if index < 2 * _SUB:
+        return index
+    shift = index // _SUB - 1
+    m = index - shift * _SUB
+    return (m << shift) + ((1 << shift) - 1) / 2
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "n", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.counts = {}
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value_ns):
+        value_ns = max(0, int(value_ns))
+        i = bucket_index(value_ns)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.n += 1
+        delta = value_ns - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value_ns - self.mean)
+        self.min = value_ns if self.min is None else min(self.min, value_ns)
+        self.max = value_ns if self.max is None else max(self.max, value_ns)
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def percentile(self, p):
+        if not self.n:
+            return None
+        target = max(1, math.ceil(p / 100 * self.n))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= target:
+                return min(max(bucket_value(i), self.min), self.max)
+        return self.max
+
+    def merge(self, other):
+        """Add another histogram's samples (Chan et al. for mean/SD)."""
+        if not other.n:
+            return self
+        for i, c in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + c
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.n = n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.histograms = {}  # (port, event, metric) -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def record(self, port, event, metric, value_ns):
+        with self._lock:
+            hist = self.histograms.get((port, event, metric))
+            if hist is None:
+                hist = self.histograms[(port, event, metric)] = LatencyHistogram()
+            hist.record(value_ns)
+
+    def combined(self, port, metric, event=None):
+        """Merged histogram for a port (all events unless event is given)."""
+        out = LatencyHistogram()
+        with self._lock:
+            for (p, e, m), hist in self.histograms.items():
+                if p == port and m == metric and (event is None or e == event):
+                    out.merge(hist)
+        return out
+
+    def keys(self):
+        with self._lock:
+            return sorted({(p, e) for p, e, _ in self.histograms})
+
+    def ports(self):
+        return sorted({p for p, _ in self.keys()})
+
+    def per_port_rows(self):
+        """Rows shaped like SPEED_TEST_RESULTS/Pi_TTL_Timing_Summary_Per_Port.csv (seconds)."""
+        rows = []
+        for port in self.ports():
+            delay = self.combined(port, DELAY)
+            duration = self.combined(port, DURATION)
+            rows.append([port, delay.mean / 1e9, delay.sd / 1e9,
+                         duration.mean / 1e9, duration.sd / 1e9, delay.n])
+        return rows
+
+    def per_event_rows(self):
+        """Per (port, event) rows with N, mean, SD, p50, p99 and max for both metrics (seconds)."""
+        rows = []
+        for port, event in self.keys():
+            row = [port, event]
+            for metric in (DELAY, DURATION):
+                h = self.combined(port, metric, event)
+                if h.n:
+                    row += [h.n, h.mean / 1e9, h.sd / 1e9, h.percentile(50) / 1e9,
+                            h.percentile(99) / 1e9, h.max / 1e9]
+                else:
+                    row += [0, "", "", "", "", ""]
+            rows.append(row)
+        return rows
+
+
+PER_PORT_HEADER = ["Port #", "Mean delay", "SD delay", "Mean duration", "SD duration", "N"]
+PER_EVENT_HEADER = ["Port #", "Event",
+                    "N delay", "Mean delay", "SD delay", "p50 delay", "p99 delay", "Max delay",
+                    "N duration", "Mean duration", "SD duration", "p50 duration", "p99 duration", "Max duration"]
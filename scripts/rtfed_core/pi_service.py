@@ -0,0 +1,778 @@
+"""Headless acquisition service for RTFED(Pi) and RTFED(PiCAM).
+
+Same split as rtfed_core.ttl_service. This process owns the FED3 serial
+ports (read on one AsyncAcquisitionEngine loop), the sink pipeline (CSV,
+.fed3z, SQLite and Google Sheets), the live statistics and, for PiCAM, the
+cameras and the event-triggered videos. The Tk windows
+(RTFED_Pi/RTFEDPiOS.py, RTFED_PiCAM/RTFEDPiCAM.py) are clients over a Unix
+socket, so closing one never stops a recording.
+
+Ports are the FED3 tty paths, found by USB VID/PID (or the simulated fleet
+named by $RTFED_VIRTUAL_FED3). A port is read once its device number is
+known, either from the passive identification thread, which listens for
+the next event line, or from Identify Devices. PiCamService adds the camera
+per port (chosen in the window, sent with start) and records a video when
+the port's trigger event arrives.
+
+Commands (see PiService.handle_command): state, stats, identify,
+sync_clock, set_mode, start, stop, shutdown. Subscribed clients get "log"
+(port None for the session log), "status", "indicator", "mode", "port",
+"stats" and "session" pushes.
+
+identify and set_mode open the ports themselves, and sync_clock writes to
+them, so they run one at a time on a job thread. start is refused while
+one is queued or running.
+
+    python -m rtfed_core.pi_service --app pi|picam [--socket PATH] [--persist]
+
+Without --persist the service exits once no session is running and no
+client has been attached for --linger seconds.
+"""
+import argparse
+import collections
+import datetime
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+import serial
+import serial.tools.list_ports
+
+from . import broadcast, clock, columnar, event_db, events, fed3_sim, ipc, session_stats, sheets_mock
+from .async_engine import AsyncAcquisitionEngine
+from .csv_log import CSVLogSet
+from .events import FED3Event, SHEETS_TIME_FORMAT
+from .framing import LineFramer
+from .session_store import SessionStore
+from .sheets import SheetsUploader, worksheet_title
+from .sinks import ColumnarSink, CSVSink, SheetsSink, SinkPipeline, SQLiteSink
+
+# Column headers for Google Spreadsheet
+column_headers = events.column_headers("MM/DD/YYYY hh:mm:ss.SSS")
+
+# Google Sheets Scope
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    'https://www.googleapis.com/auth/spreadsheets',
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+]
+
+HISTORY_LINES = 100  # messages per port (and session log) replayed to a client when it attaches
+DEVICE_CHECK_S = 5
+RETRY_ATTEMPTS = 5
+RETRY_DELAY_S = 2
+
+
+def detect_serial_ports():
+    virtual = fed3_sim.virtual_ports()  # RTFED_VIRTUAL_FED3 set: use the simulated fleet
+    if virtual is not None:
+        return virtual
+    return [port.device for port in serial.tools.list_ports.comports()
+            if port.vid == 0x239A and port.pid == 0x800B]
+
+
+def sheets_client(json_path):
+    # $RTFED_SHEETS_MOCK points uploads at a local stand-in instead of Google
+    client = sheets_mock.client_from_env()
+    if client is not None:
+        return client
+    import gspread
+    from google.oauth2.service_account import Credentials
+    return gspread.authorize(Credentials.from_service_account_file(json_path, scopes=SCOPE))
+
+
+def safe_name(text):
+    return re.sub(r'[<>:"/\\|?*]', '_', text)
+
+
+class PiService:
+    name = "RTFED(Pi)"
+    socket_env = "RTFED_PI_SOCKET"
+    socket_name = "rtfed-pi"
+    skip_events = ("JAM",)  # JAM rows stay out of the CSV and .fed3z
+    sheets_jam = "replace"
+    unknown_device = ""
+
+    def __init__(self, socket=None):
+        self.ports = []  # every FED3 tty seen, in the order found; the windows show one box each
+        self.connected = set()
+        self.port_to_device_number = {}
+        self.device_number_to_port = {}
+        self.device_lock = threading.Lock()
+        self.identification_threads = {}
+        self.identification_stop_events = {}
+        self.opening = set()  # ports the engine is still trying to open
+        self.status = {}
+        self.modes = {}
+        self.history = {}
+        self.log_history = collections.deque(maxlen=HISTORY_LINES)
+        # Serial reads for every FED3 run on one asyncio loop; parsed events go to the sink pipeline
+        self.engine = AsyncAcquisitionEngine(on_line=self.handle_line, upload=None,
+                                             on_disconnect=self.handle_disconnect, on_log=self.log)
+        self.sinks = None  # CSV, columnar, Sheets and SQLite workers, built when logging starts
+        self.uploader = None
+        self.stats = session_stats.SessionStats()
+        self.logging_active = False
+        self.session = {}
+        self.session_time = None
+        self.experiment_folder = None
+        # Commands arrive on one thread per client; session changes run one at a time
+        self._lock = threading.RLock()
+        self._jobs = queue.Queue()
+        self.pending_jobs = collections.Counter()  # device commands queued or running, by name
+        self._stop = threading.Event()
+        self.server = ipc.IPCServer(socket or self.socket_path(), self.handle_command)
+        self.server.on_subscribe = self.snapshot
+
+    @classmethod
+    def socket_path(cls):
+        return os.environ.get(cls.socket_env) or ipc.default_socket_path(cls.socket_name)
+
+    # -- pushes to attached clients ---------------------------------------------
+
+    def log(self, message, port=None):
+        """A session-log line, or a line for one port's box."""
+        if port is None:
+            logging.info(message)
+            self.log_history.append(message)
+        else:
+            self.history[port].append(message)
+        self.server.publish({"push": "log", "port": port, "text": message})
+
+    def set_status(self, port, text, color):
+        self.status[port] = (text, color)
+        self.server.publish({"push": "status", "port": port, "text": text, "color": color})
+
+    def trigger_indicator(self, port):
+        self.server.publish({"push": "indicator", "port": port})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "app": self.name,
+                "logging": self.logging_active,
+                "session": self.session,
+                "ports": list(self.ports),
+                "status": dict(self.status),
+                "modes": dict(self.modes),
+                "stats": self.stats.snapshot(),
+                "log": list(self.log_history),
+                "history": {port: list(lines) for port, lines in self.history.items()},
+            }
+
+    # -- device discovery -------------------------------------------------------
+
+    def add_port(self, port):
+        if port not in self.ports:
+            self.ports.append(port)
+            self.history[port] = collections.deque(maxlen=HISTORY_LINES)
+            self.server.publish({"push": "port", "port": port})
+        self.connected.add(port)
+        try:
+            ser = serial.Serial(port, 115200, timeout=1)
+            ser.close()
+            self.set_status(port, "Ready", "green")
+        except serial.SerialException as e:
+            self.set_status(port, "Not Ready", "red")
+            self.log(f"Error with port {port}: {e}")
+
+    def check_device_connections(self):
+        current = detect_serial_ports()
+        for port in list(self.connected):
+            if port not in current:
+                self.connected.discard(port)
+                self.set_status(port, "Not Ready", "red")
+                self.log(f"Device on {port} disconnected.")
+                if self.engine.has_port(port):
+                    self.engine.remove_port(port)
+                self.stop_identification_thread(port)
+        for port in current:
+            if port not in self.connected:
+                self.add_port(port)
+                if self.logging_active and port in self.port_to_device_number:
+                    self.start_logging_for_port(port)
+                else:
+                    self.start_identification_thread(port)
+            elif self.logging_active and not self.engine.has_port(port) and port in self.port_to_device_number:
+                # Still listed but its reader ended (e.g. the FED3 rebooted); read it again
+                self.start_logging_for_port(port)
+
+    # -- identification ---------------------------------------------------------
+
+    def start_identification_threads(self):
+        for port in sorted(self.connected):
+            self.start_identification_thread(port)
+
+    def start_identification_thread(self, port):
+        if port in self.identification_threads:
+            return
+        stop_event = threading.Event()
+        self.identification_stop_events[port] = stop_event
+
+        def identification_with_delay():
+            time.sleep(1)
+            self.identification_thread(port, stop_event)
+
+        t = threading.Thread(target=identification_with_delay, daemon=True)
+        t.start()
+        self.identification_threads[port] = t
+        self.log(f"Started identification thread for {port}.")
+
+    def stop_identification_thread(self, port):
+        if port in self.identification_threads:
+            self.identification_stop_events.pop(port).set()
+            self.identification_threads.pop(port).join()
+
+    def stop_identification_threads(self):
+        for event in list(self.identification_stop_events.values()):
+            event.set()
+        for port, t in list(self.identification_threads.items()):
+            t.join()
+            self.log(f"Stopped identification thread for {port}.")
+            del self.identification_threads[port]
+            del self.identification_stop_events[port]
+
+    def identification_thread(self, port, stop_event):
+        if self.engine.has_port(port):
+            self.log(f"Skipping identification for {port} as it is already in use.")
+            return
+        ser = None
+        device_number_found = None
+        try:
+            ser = serial.Serial(port, 115200, timeout=0)
+            framer = LineFramer()
+            event_index = column_headers.index("Event") - 1
+            device_number_index = column_headers.index("Device_Number") - 1
+            while not stop_event.is_set() and not device_number_found:
+                try:
+                    for data in framer.read_lines(ser.fileno(), timeout=0.1):
+                        data_list = data.split(",")[1:]
+                        if len(data_list) == len(column_headers) - 1:
+                            # Blink the indicator on activity
+                            if data_list[event_index].strip() in ("Right", "Left", "Pellet",
+                                                                  "LeftWithPellet", "RightWithPellet"):
+                                self.trigger_indicator(port)
+                            dn = data_list[device_number_index].strip()
+                            if dn:
+                                device_number_found = dn
+                                break
+                except (serial.SerialException, EOFError) as e:
+                    self.log(f"Device on {port} disconnected during identification: {e}")
+                    break
+        except serial.SerialException as e:
+            if "PermissionError" not in str(e):
+                self.log(f"Could not open serial port {port} for identification: {e}")
+        except Exception as e:
+            self.log(f"Unexpected error in identification thread for {port}: {e}")
+        finally:
+            if ser is not None:
+                ser.close()
+        if device_number_found:
+            self.log(f"Identified device_number={device_number_found} on port={port}")
+            self.register_device_number(port, device_number_found)
+
+    def register_device_number(self, port, device_number):
+        with self.device_lock:
+            old = self.device_number_to_port.get(device_number)
+            if old is not None and old != port:
+                # The same FED3 came back on another tty; its rows keep going to its own files and sheet
+                self.log(f"Device {device_number} reconnected on {port} (was on {old}).")
+                self.port_to_device_number.pop(old, None)
+            self.port_to_device_number[port] = device_number
+            self.device_number_to_port[device_number] = port
+        # If logging already started, start logging for this new device immediately
+        if self.logging_active:
+            self.start_logging_for_port(port)
+
+    def identify_devices(self):
+        self.stop_identification_threads()
+        ports = sorted(self.connected)
+        if not ports:
+            self.log("No FED3 devices detected. Connect devices first!")
+            return
+        self.log("Identifying devices by triggering a poke on all connected FED3 devices...")
+
+        def on_result(port, result):
+            if result.reply:
+                self.register_device_number(port, result.reply)
+                self.log(f"Identified device_number={result.reply} on port={port}")
+            elif result.error:
+                self.log(f"Error sending poke command to {port}: {result.error}")
+            else:
+                self.log(f"No valid device number received from {port}.")
+
+        # All devices at once, each with its own deadline
+        broadcast.broadcast({port: port for port in ports}, broadcast.TRIGGER_POKE,
+                            broadcast.device_number, on_result=on_result)
+
+    # -- device commands --------------------------------------------------------
+
+    def sync_all_device_times(self):
+        if not self.port_to_device_number:
+            self.log("No devices to sync.")
+            return
+        ports = {}
+        open_ports = {}
+        for port in list(self.port_to_device_number):
+            ser = self.engine.port_serial(port)
+            if ser is not None:
+                open_ports[port] = ser  # its TIME_SET_OK comes back through handle_line
+            elif port in self.connected:
+                ports[port] = port
+
+        def on_result(port, result):
+            if result.error:
+                self.log(f"Failed to sync time for {port}: {result.error}")
+            elif result.reply == "TIME_SET_OK":
+                self.log(f"Time synced for device on {port}.")
+            elif result.reply == "TIME_SET_FAIL":
+                self.log(f"Time sync failed on {port}.")
+            else:
+                self.log(f"Time sync command sent to {port}.")
+
+        # Written to every FED3 as the next wall-clock second starts
+        self.log("Syncing FED3 time at the next second boundary")
+        broadcast.broadcast(ports, None, broadcast.time_reply, broadcast.SYNC_TIMEOUT_S, open_ports,
+                            align=True, on_result=on_result)
+
+    def set_device_mode(self, mode_num, label, ports):
+        for port in ports:
+            try:
+                with serial.Serial(port, baudrate=115200, timeout=2) as ser:
+                    ser.write(f"SET_MODE:{mode_num}\n".encode('utf-8'))
+                    start_time = time.time()
+                    while time.time() - start_time < 3:
+                        response = ser.readline().decode().strip()
+                        if response == "MODE_SET_OK":
+                            self.log(f"Mode {mode_num} set on {port}. Device will restart.")
+                            self.modes[port] = label
+                            self.server.publish({"push": "mode", "port": port, "text": label})
+                            break
+                        elif response == "MODE_SET_FAIL":
+                            self.log(f"Mode set failed on {port}.")
+                            break
+            except Exception as e:
+                self.log(f"Error setting mode on {port}: {e}")
+
+    # -- acquisition ------------------------------------------------------------
+
+    def start_logging_for_port(self, port):
+        if self.engine.has_port(port) or port in self.opening:
+            return
+        # We must have device_number by now
+        if port not in self.port_to_device_number:
+            self.log(f"Cannot start logging for {port}, no device_number known yet.")
+            return
+        worksheet_name = worksheet_title(self.port_to_device_number[port])
+        self.uploader.add_sheet(worksheet_name)
+
+        def open_serial():
+            return serial.Serial(port, 115200, timeout=0)
+
+        def on_opened(future):
+            # Runs on the engine loop thread
+            self.opening.discard(port)
+            if future.result():
+                if not self.status.get(port, ("",))[0].startswith("Ready"):
+                    self.set_status(port, "Ready", "green")
+                self.log(f"Started logging from {port} with sheet {worksheet_name}.")
+
+        self.opening.add(port)
+        future = self.engine.open_port(port, open_serial, None, RETRY_ATTEMPTS, RETRY_DELAY_S)
+        future.add_done_callback(on_opened)
+
+    def accept(self, port, data_list):
+        """Whether a full-length line is stored; PiCamService also checks its numbers."""
+        return True
+
+    def on_event(self, port, event):
+        """Called on the engine loop thread after an event is stored."""
+
+    def handle_line(self, port, data, arrival_ns):
+        # Runs on the engine loop thread for every complete line
+        if data in broadcast.TIME_REPLIES:
+            self.log(f"{port} time sync: {data}")
+            return
+        data_list = data.split(",")[1:]
+        if len(data_list) != len(column_headers) - 1:
+            self.log(f"Warning: Data length mismatch on {port}")
+            return
+        if not self.accept(port, data_list):
+            return
+        event = FED3Event.from_fields(data_list, clock.anchor.wall(arrival_ns), arrival_ns)
+        self.stats.update(port, event)
+        self.sinks.publish(port, event)
+        if event.event != "JAM":
+            self.log(f"Data logged: {data_list}", port)
+            if event.event in ("Right", "Pellet"):
+                self.trigger_indicator(port)
+        self.on_event(port, event)
+
+    def handle_disconnect(self, port):
+        # Runs on the engine loop thread
+        self.log(f"Device on {port} disconnected.")
+        self.set_status(port, "Not Ready", "red")
+        self.log(f"Closed serial port {port}")
+
+    # -- session ----------------------------------------------------------------
+
+    def start_experiment(self, args):
+        with self._lock:
+            if self.logging_active:
+                raise ipc.CommandError("An experiment is already running.")
+            if self.pending_jobs:
+                # They open the ports themselves and would take lines from the session's readers
+                raise ipc.CommandError(f"Wait for {', '.join(sorted(self.pending_jobs))} to finish first.")
+            experimenter = safe_name((args.get("experimenter") or "").strip().lower())
+            experiment = safe_name((args.get("experiment") or "").strip().lower())
+            json_path = (args.get("json_path") or "").strip()
+            spreadsheet_id = (args.get("spreadsheet_id") or "").strip()
+            save_path = args.get("save_path")
+            if not experimenter or not experiment:
+                raise ipc.CommandError("Please provide your name and experiment name.")
+            has_sheets = json_path or os.environ.get(sheets_mock.ENV_VAR)
+            if not has_sheets or not spreadsheet_id or not save_path:
+                raise ipc.CommandError("Please provide the JSON file, Spreadsheet ID, and data folder.")
+            try:
+                self.uploader = SheetsUploader(sheets_client(json_path), spreadsheet_id, column_headers,
+                                               on_log=self.log)
+            except Exception as e:
+                raise ipc.CommandError(f"Failed to connect to Google Sheets: {e}")
+            self.log("Connected to Google Sheets!")
+            self.start_cameras(args)
+            self.stop_identification_threads()
+            try:
+                self.session_time = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+                experimenter_folder = os.path.join(save_path, experimenter)
+                self.experiment_folder = os.path.join(experimenter_folder, f"{experiment}_{self.session_time}")
+                os.makedirs(self.experiment_folder, exist_ok=True)
+                self.log(f"Experiment folder: {self.experiment_folder}")
+                # Each destination drains its own queue on its own thread, so a slow one
+                # never holds up the engine loop or the others
+                self.sinks = SinkPipeline([
+                    CSVSink(CSVLogSet(self.csv_path_for, column_headers, SHEETS_TIME_FORMAT),
+                            skip_events=self.skip_events),
+                    # Full chunks spill next to the session's CSVs instead of growing in RAM
+                    ColumnarSink(SessionStore(self.experiment_folder),
+                                 lambda port: os.path.splitext(self.csv_path_for(port))[0] + columnar.SUFFIX,
+                                 column_headers[0], SHEETS_TIME_FORMAT, on_log=self.log, skip_events=self.skip_events),
+                    SheetsSink(self.uploader, lambda port: self.port_to_device_number.get(port, self.unknown_device),
+                               jam=self.sheets_jam, on_log=self.log),
+                    # Queryable mid-session from other processes: python -m rtfed_core.event_db <path>
+                    SQLiteSink(os.path.join(self.experiment_folder, event_db.FILENAME)),
+                ], on_log=self.log)
+            except Exception:
+                # Back to where the failed START found it
+                self.stop_cameras()
+                self.start_identification_threads()
+                raise
+            self.stats = session_stats.SessionStats()
+            clock.anchor.reset()
+            self.engine.start()
+            self.uploader.start()
+            self.logging_active = True
+            self.session = {"experimenter": experimenter, "experiment": experiment,
+                            "experiment_folder": self.experiment_folder, "start": time.time()}
+            self.server.publish({"push": "session", "logging": True, "session": self.session})
+            for port in sorted(self.connected):
+                # Start logging if device_number known
+                if port in self.port_to_device_number:
+                    self.start_logging_for_port(port)
+                else:
+                    self.log(f"Device number not yet known for {port}, logging will start once identified.")
+            return self.session
+
+    def start_cameras(self, args):
+        """PiCamService opens the cameras chosen in the window."""
+
+    def stop_cameras(self):
+        """PiCamService ends the recordings and releases the cameras."""
+
+    def stop_experiment(self):
+        with self._lock:
+            if not self.logging_active:
+                raise ipc.CommandError("No experiment is running.")
+            self.logging_active = False
+            self.log("Stopping logging...")
+            self.engine.stop()
+            self.log("Serial reads have stopped.")
+            self.stop_cameras()
+            files = self.save_all_data()
+            result = dict(self.session, files=files)
+            self.session = {}
+            self.server.publish({"push": "session", "logging": False, "session": result})
+            # Ready for the next run, as when the service started
+            self.start_identification_threads()
+            return result
+
+    def csv_path_for(self, port):
+        device_number = self.port_to_device_number.get(port, "unknown")
+        return os.path.join(self.experiment_folder,
+                            f"{safe_name(os.path.basename(port))}_device_{device_number}_{self.session_time}.csv")
+
+    def save_all_data(self):
+        # The CSVs were written while logging; the sinks drain what is queued and close
+        saved = self.sinks.close()
+        csv_files = saved.get("csv") or {}
+        for port, filename_user in csv_files.items():
+            self.log(f"Data saved for {port} in {filename_user}.")
+        self.log(self.sinks.summary())
+        self.sinks = None
+        self.save_summary()
+        return csv_files
+
+    def save_summary(self):
+        # Written from the live statistics; the rows are not read again
+        for port, port_stats in self.stats.snapshot().items():
+            base = os.path.splitext(self.csv_path_for(port))[0]
+            try:
+                session_stats.write_summary(f"{base}_summary.csv", f"{base}_stats.csv", port_stats)
+                self.log(f"Summary saved for {port} in {base}_summary.csv.")
+            except Exception as e:
+                self.log(f"Failed to save summary for {port}: {e}")
+
+    # -- IPC --------------------------------------------------------------------
+
+    def handle_command(self, cmd, args):
+        if cmd == "state":
+            return self.snapshot()
+        if cmd == "stats":
+            return self.stats.snapshot()
+        if cmd == "start":
+            return self.start_experiment(args)
+        if cmd == "stop":
+            return self.stop_experiment()
+        # Device commands hold ports for seconds; they run in order on the job thread
+        if cmd in ("identify", "sync_clock", "set_mode"):
+            if cmd == "identify":
+                job = (self.identify_devices, ())
+            elif cmd == "sync_clock":
+                job = (self.sync_all_device_times, ())
+            else:
+                ports = [p for p in args.get("ports", []) if p in self.ports]
+                if not ports:
+                    raise ipc.CommandError("No devices selected.")
+                job = (self.set_device_mode, (int(args["mode"]), args.get("label") or str(args["mode"]), ports))
+            # Checked and counted under the session lock, so "start" cannot slip in between
+            with self._lock:
+                if cmd != "sync_clock" and self.logging_active:
+                    raise ipc.CommandError("Not available while logging.")
+                self.pending_jobs[cmd] += 1
+                self._jobs.put((cmd,) + job)
+            return {"queued": cmd}
+        if cmd == "shutdown":
+            if self.logging_active and not args.get("force"):
+                raise ipc.CommandError("Logging is active; stop the experiment first.")
+            if self.logging_active:
+                self.stop_experiment()
+            self._stop.set()
+            return {"pid": os.getpid()}
+        raise ipc.CommandError(f"unknown command {cmd!r}")
+
+    def _job_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            cmd, fn, args = job
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception(f"{fn.__name__} failed")
+            finally:
+                with self._lock:
+                    self.pending_jobs[cmd] -= 1
+                    if not self.pending_jobs[cmd]:
+                        del self.pending_jobs[cmd]
+
+    def serve(self, linger=10.0, persist=False):
+        """Run until shutdown, or until idle for ``linger`` s with no client (unless persist)."""
+        for port in detect_serial_ports():
+            self.add_port(port)
+        self.server.start()
+        logging.info(f"{self.name} service listening on {self.server.path}")
+        jobs = threading.Thread(target=self._job_loop, name="pi-jobs", daemon=True)
+        jobs.start()
+        self.start_identification_threads()
+        idle_since = time.monotonic()
+        last_check = time.monotonic()
+        try:
+            while not self._stop.wait(1.0):
+                now = time.monotonic()
+                if now - last_check >= DEVICE_CHECK_S:
+                    with self._lock:
+                        self.check_device_connections()
+                    last_check = now
+                if self.logging_active:
+                    step = clock.anchor.check()
+                    if step is not None:
+                        # e.g. NTP syncing after a start without network; later rows carry the corrected time
+                        self.log(f"Wall clock stepped {step:+.3f} s; timestamps re-anchored.")
+                    self.server.publish({"push": "stats", "stats": self.stats.snapshot()})
+                if self.logging_active or self.server.clients:
+                    idle_since = now
+                elif not persist and now - idle_since >= linger:
+                    logging.info("No session and no clients; exiting.")
+                    break
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self.logging_active:
+                self.stop_experiment()
+        self._jobs.put(None)
+        self.stop_identification_threads()
+        self.engine.stop()
+        self.server.close()
+
+
+class PiCamService(PiService):
+    name = "RTFED(PiCAM)"
+    socket_env = "RTFED_PICAM_SOCKET"
+    socket_name = "rtfed-picam"
+    skip_events = ()
+    sheets_jam = "add"
+    unknown_device = "unknown"
+    numeric_headers = ("Temp", "Humidity", "Battery_Voltage", "Motor_Turns", "Left_Poke_Count",
+                       "Right_Poke_Count", "Pellet_Count", "Block_Pellet_Count", "Retrieval_Time",
+                       "InterPelletInterval", "Poke_Time")
+    triggers = {"Pellet": ("Pellet",), "Left": ("Left",), "Right": ("Right",), "All": ("Pellet", "Left", "Right")}
+
+    def __init__(self, socket=None):
+        super().__init__(socket)
+        self.video_trigger = "Pellet"
+        self.port_to_camera_index = {}
+        self.camera_objects = {}
+        self.recording_states = {}
+        self.last_event_times = {}
+        self.recording_locks = {}
+        self.recorders = []
+
+    def accept(self, port, data_list):
+        try:
+            for hdr, val in zip(column_headers[1:], data_list):
+                if hdr in self.numeric_headers and val.strip():
+                    float(val.strip())
+        except ValueError:
+            self.log(f"Invalid data from {port}: {data_list}")
+            return False
+        return True
+
+    def start_cameras(self, args):
+        self.video_trigger = args.get("video_trigger") or "Pellet"
+        if self.video_trigger not in self.triggers:
+            raise ipc.CommandError(f"Unknown video trigger {self.video_trigger!r}.")
+        self.port_to_camera_index = {port: int(ci) for port, ci in (args.get("cameras") or {}).items()
+                                     if ci not in (None, "None")}
+        if self.port_to_camera_index:
+            import cv2  # only the camera app needs OpenCV
+        for port, ci in self.port_to_camera_index.items():
+            cam = cv2.VideoCapture(ci)
+            if cam.isOpened():
+                self.camera_objects[ci] = cam
+                self.log(f"Camera {ci} for port {port}.")
+                if "Ready" in self.status.get(port, ("",))[0]:
+                    self.set_status(port, "Ready (CAM Ready)", "green")
+            else:
+                self.log(f"Camera {ci} failed for port {port}.")
+                if "Ready" in self.status.get(port, ("",))[0]:
+                    self.set_status(port, "Ready (CAM Not Connected)", "orange")
+                cam.release()
+        for port in self.ports:
+            self.recording_states[port] = False
+            self.last_event_times[port] = None
+            self.recording_locks[port] = threading.Lock()
+
+    def on_event(self, port, event):
+        if event.event in self.triggers[self.video_trigger] and port in self.recording_locks:
+            with self.recording_locks[port]:
+                self.last_event_times[port] = datetime.datetime.now()
+                if not self.recording_states[port]:
+                    self.recording_states[port] = True
+                    t = threading.Thread(target=self.record_video, args=(port,), daemon=True)
+                    t.start()
+                    self.recorders.append(t)
+
+    def record_video(self, port):
+        import cv2
+        ci = self.port_to_camera_index.get(port)
+        dn = self.port_to_device_number.get(port, 'unknown')
+        if ci is None or ci not in self.camera_objects:
+            self.log(f"No camera for {port}")
+            with self.recording_locks[port]:
+                self.recording_states[port] = False
+            return
+        cam = self.camera_objects[ci]
+        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.experiment_folder, f"Device_{dn}")
+        os.makedirs(path, exist_ok=True)
+        fname = os.path.join(path, f"{safe_name(os.path.basename(port))}_device_{dn}_camera_{ts}.avi")
+        fw = int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
+        fh = int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if fw == 0 or fh == 0:
+            self.log(f"Camera {ci} no frames.")
+            with self.recording_locks[port]:
+                self.recording_states[port] = False
+                self.last_event_times[port] = None
+            return
+        out = cv2.VideoWriter(fname, cv2.VideoWriter_fourcc(*'XVID'), 20.0, (fw, fh))
+        maxd = 60 if self.video_trigger == "All" else 30
+        try:
+            while True:
+                with self.recording_locks[port]:
+                    let = self.last_event_times[port]
+                if let is None or (datetime.datetime.now() - let).total_seconds() > maxd:
+                    break
+                ret, frame = cam.read()
+                if not ret:
+                    self.log(f"Failed read frame {ci}")
+                    break
+                out.write(frame)
+                time.sleep(0.05)
+        finally:
+            out.release()
+            with self.recording_locks[port]:
+                self.recording_states[port] = False
+                self.last_event_times[port] = None
+            self.log(f"Video saved: {fname}")
+
+    def stop_cameras(self):
+        # A recording ends at its next frame once its event time is cleared
+        for port, lock in self.recording_locks.items():
+            with lock:
+                self.last_event_times[port] = None
+        for t in self.recorders:
+            t.join()
+        self.recorders = []
+        for cam in self.camera_objects.values():
+            cam.release()
+        self.camera_objects = {}
+        self.recording_locks = {}
+
+
+APPS = {"pi": PiService, "picam": PiCamService}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless RTFED(Pi) / RTFED(PiCAM) acquisition service.")
+    parser.add_argument("--app", default="pi", choices=sorted(APPS), help="which app's outputs (default: pi)")
+    parser.add_argument("--socket", default=None,
+                        help="Unix socket path (default: $RTFED_PI_SOCKET / $RTFED_PICAM_SOCKET or the runtime dir)")
+    parser.add_argument("--persist", action="store_true", help="keep running with no session and no clients")
+    parser.add_argument("--linger", type=float, default=10.0, help="idle seconds before exiting")
+    parser.add_argument("--log", default=None, help="log file (default: stdout)")
+    args = parser.parse_args(argv)
+    target = {"filename": args.log} if args.log else {"stream": sys.stdout}
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', **target)
+    APPS[args.app](args.socket).serve(args.linger, args.persist)
+
+
+if __name__ == "__main__":
+    main()
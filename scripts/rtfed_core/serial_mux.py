@@ -0,0 +1,128 @@
+"""Single-threaded reader for all FED3 serial ports.
+
+Every open port is registered in one selector (epoll on Linux). The loop wakes
+as soon as bytes arrive on any port, splits complete lines and hands them to
+the ``on_line`` callback straight away, so there is no per-port thread and no
+polling sleep between lines.
+"""
+import os
+import queue
+import selectors
+import threading
+import logging
+
+from .framing import LineFramer
+
+
+class SerialMultiplexer:
+    def __init__(self, on_line, on_disconnect=None, read_size=4096, name="fed3-mux"):
+        # on_line(port_identifier, line, arrival_ns) is called from the loop thread;
+        # arrival_ns is time.monotonic_ns() after the read that returned the line's first chunk
+        self.on_line = on_line
+        self.on_disconnect = on_disconnect
+        self.read_size = read_size
+        self.name = name
+        self.selector = selectors.DefaultSelector()
+        self.ports = {}  # port_identifier -> open serial.Serial
+        self.framers = {}  # port_identifier -> LineFramer holding any partial line
+        self._pending = queue.Queue()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()  # restartable after stop(), e.g. one service running several sessions
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_port(self, port_identifier, ser):
+        """Register an already opened serial.Serial; safe to call from any thread."""
+        self._pending.put(("add", port_identifier, ser))
+        self._wake()
+
+    def remove_port(self, port_identifier):
+        self._pending.put(("remove", port_identifier, None))
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # a wake-up is already pending
+
+    def _apply_pending(self):
+        while True:
+            try:
+                action, port_identifier, ser = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if action == "add":
+                self._drop(port_identifier, notify=False)
+                ser.timeout = 0
+                self.ports[port_identifier] = ser
+                self.framers[port_identifier] = LineFramer(self.read_size)
+                self.selector.register(ser.fileno(), selectors.EVENT_READ, port_identifier)
+            elif action == "remove":
+                self._drop(port_identifier, notify=False)
+
+    def _drop(self, port_identifier, notify=True):
+        ser = self.ports.pop(port_identifier, None)
+        self.framers.pop(port_identifier, None)
+        if ser is None:
+            return
+        try:
+            self.selector.unregister(ser.fileno())
+        except (KeyError, ValueError, OSError):
+            pass
+        try:
+            ser.close()
+        except Exception:
+            pass
+        if notify and self.on_disconnect is not None:
+            self.on_disconnect(port_identifier)
+
+    def _read_port(self, port_identifier, fd):
+        try:
+            lines = self.framers[port_identifier].read_stamped_lines(fd)
+        except EOFError:
+            # A readable tty that returns no data has been unplugged
+            self._drop(port_identifier)
+            return
+        for line, arrival_ns in lines:
+            try:
+                self.on_line(port_identifier, line, arrival_ns)
+            except Exception:
+                logging.exception(f"Error handling line from {port_identifier}")
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._apply_pending()
+                for key, _ in self.selector.select(timeout=1.0):
+                    if key.data is None:
+                        try:
+                            while os.read(self._wake_r, 512):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    if key.data in self.ports:
+                        self._read_port(key.data, key.fd)
+        finally:
+            self._apply_pending()
+            for port_identifier in list(self.ports):
+                self._drop(port_identifier, notify=False)
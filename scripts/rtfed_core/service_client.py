@@ -0,0 +1,190 @@
+"""The Tk windows' side of a headless acquisition service.
+
+Each app's serial ports, outputs and data files belong to a service process
+(rtfed_core.ttl_service, rtfed_core.pi_service) and the window is a client
+over its Unix socket. ServiceLink keeps everything that can block off the
+Tk thread. Connecting, starting the service when nothing listens, and slow
+commands such as stop (which saves the session) all run on worker threads,
+and their results come back through poll(), which update_gui calls every
+tick.
+
+A window starts its service at most once. If that process exits, its last
+stderr line is reported as fatal and the window does not try again, since
+a service that cannot open its hardware would only fail the same way. A
+service that is merely unreachable is retried, first after ATTACH_RETRY_S
+and then at doubling intervals up to ATTACH_RETRY_MAX_S. Only a message
+that differs from the previous one is reported.
+"""
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from . import ipc
+
+ATTACH_RETRY_S = 2  # first retry after a failed attach; doubles up to ATTACH_RETRY_MAX_S
+ATTACH_RETRY_MAX_S = 60
+START_TIMEOUT_S = 15.0
+_SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ServiceFailed(Exception):
+    """The service this window started has exited; it is not started again."""
+
+
+def service_files(path, name):
+    base = os.path.dirname(path)
+    return os.path.join(base, f"{name}-service.log"), os.path.join(base, f"{name}-service.err")
+
+
+def start_service(module, path, name, args=()):
+    """Start ``python -m module`` in the background; its stderr goes to a file so a failed start can be shown."""
+    log_path, err_path = service_files(path, name)
+    logging.info(f"Starting acquisition service on {path} (log: {log_path})")
+    with open(err_path, "w") as err:
+        # Own session: the service outlives the window and ignores its Ctrl-C
+        return subprocess.Popen([sys.executable, "-m", module, "--socket", path, "--log", log_path, *args],
+                                cwd=_SCRIPTS_DIR, start_new_session=True,
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err)
+
+
+def service_exit_reason(path, name, proc):
+    log_path, err_path = service_files(path, name)
+    try:
+        with open(err_path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+    except OSError:
+        lines = []
+    reason = lines[-1] if lines else f"see {log_path}"
+    return f"The acquisition service exited (code {proc.returncode}): {reason}"
+
+
+def connect_service(path, proc=None, name=None, timeout=START_TIMEOUT_S):
+    """Connect to the service socket, waiting up to timeout while ``proc`` (a service being started) comes up."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return ipc.IPCClient(path).connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if proc is not None and proc.poll() is not None:
+                raise ServiceFailed(service_exit_reason(path, name, proc))
+            if proc is None or time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+class ServiceLink:
+    """One window's connection to its service; call poll() from the Tk thread only."""
+
+    def __init__(self, module, path, name, args=()):
+        self.module = module
+        self.path = path
+        self.name = name  # names the service's .log and .err files
+        self.args = tuple(args)
+        self.client = None
+        self.proc = None  # the service this window started, at most once
+        self.error = None
+        self.attaching = False
+        self.next_attach = 0.0
+        self.delay = ATTACH_RETRY_S
+        self._results = queue.Queue()  # (kind, ...) from the worker threads
+
+    @property
+    def connected(self):
+        return self.client is not None and self.client.connected
+
+    def poll(self):
+        """Start an attach when one is due and return what happened since the last call, in order:
+
+        ("attached", state)              connected and subscribed; state is the service's snapshot
+        ("attach_failed", message, fatal) only when the message differs from the last one
+        ("push", message)                a push from the service
+        ("lost",)                        the connection ended; the next attach is already due
+        (kind, result, error)            a command started with run() finished
+        """
+        out = []
+        try:
+            while True:
+                item = self._results.get_nowait()
+                if item[0] == "attached":
+                    self.attaching = False
+                    self.client, state = item[1], item[2]
+                    self.error = None
+                    self.delay = ATTACH_RETRY_S
+                    out.append(("attached", state))
+                elif item[0] == "attach_failed":
+                    self.attaching = False
+                    self.next_attach = time.time() + self.delay
+                    self.delay = min(self.delay * 2, ATTACH_RETRY_MAX_S)
+                    if item[1] != self.error:
+                        self.error = item[1]
+                        out.append(item)
+                else:
+                    out.append(item)
+        except queue.Empty:
+            pass
+        if self.client is not None:
+            try:
+                while True:
+                    message = self.client.pushes.get_nowait()
+                    if message is None:
+                        self.client = None
+                        out.append(("lost",))
+                        break
+                    out.append(("push", message))
+            except queue.Empty:
+                pass
+        elif not self.attaching and time.time() >= self.next_attach:
+            self.attaching = True
+            threading.Thread(target=self._attach, name=f"{self.name}-attach", daemon=True).start()
+        return out
+
+    def call(self, cmd, timeout=None, **args):
+        """A quick command, on the calling thread; raises ipc.IPCError."""
+        if not self.connected:
+            raise ipc.IPCError("Not connected to the acquisition service.")
+        return self.client.call(cmd, timeout=timeout, **args)
+
+    def run(self, kind, cmd, timeout=None, **args):
+        """A slow command on a worker thread; poll() returns (kind, result, error) once it ends."""
+        client = self.client
+        if client is None or not client.connected:
+            raise ipc.IPCError("Not connected to the acquisition service.")
+
+        def worker():
+            try:
+                self._results.put((kind, client.call(cmd, timeout=timeout, **args), None))
+            except ipc.IPCError as e:
+                self._results.put((kind, None, str(e)))
+
+        threading.Thread(target=worker, name=f"{self.name}-{cmd}", daemon=True).start()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def _attach(self):
+        client = None
+        try:
+            try:
+                client = connect_service(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.proc is not None:
+                    if self.proc.poll() is not None:
+                        raise ServiceFailed(service_exit_reason(self.path, self.name, self.proc))
+                    raise
+                self.proc = start_service(self.module, self.path, self.name, self.args)
+                client = connect_service(self.path, self.proc, self.name)
+            state = client.call("subscribe")
+        except ServiceFailed as e:
+            self._results.put(("attach_failed", str(e), True))
+        except (OSError, ipc.IPCError) as e:
+            if client is not None:
+                client.close()
+            self._results.put(("attach_failed", f"Acquisition service unavailable: {e}", False))
+        else:
+            self._results.put(("attached", client, state))
@@ -0,0 +1,236 @@
+"""Live per-device session statistics, updated in O(1) per event.
+
+The apps used to learn what a session looked like only at STOP, by
+rescanning every row (and PiOS/PiCAM not at all). SessionStats is fed
+each event as it is parsed and keeps, per device:
+
+    counts          events by Event name, plus Left/Right (pokes with and
+                    without a pellet, as the TTL summary always counted
+                    them), Pellet and JAM totals
+    pellet rate     pellets per hour of session, and pellets in the last
+                    hour from a ring of 60 one-minute buckets
+    Retrieval_Time, InterPelletInterval and Poke_Time (per side)
+                    running n/mean/SD/min/max (Welford), in seconds;
+                    "Timed_out" retrievals are counted, not averaged
+    last event      its name and arrival_ns, for the time since it
+
+update() is called on the thread that parses events and takes one lock;
+snapshot() returns plain JSON-able dicts for the GUIs and the TTL
+service's "stats" command and push, and the summary CSVs are written from
+the same numbers (summary_rows, stats_rows), so nothing rereads raw rows.
+"""
+import csv
+import math
+import threading
+import time
+
+MINUTE_NS = 60 * 10**9
+HOUR_NS = 60 * MINUTE_NS
+TIMED_OUT = "Timed_out"
+
+SUMMARY_HEADER = ["Event", "Count"]
+STATS_HEADER = ["Statistic", "N", "Mean", "SD", "Min", "Max"]
+
+
+class Moments:
+    """Running count, mean, SD, min and max (Welford)."""
+
+    __slots__ = ("n", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def as_dict(self):
+        if not self.n:
+            return {"n": 0, "mean": None, "sd": None, "min": None, "max": None}
+        return {"n": self.n, "mean": self.mean, "sd": self.sd, "min": self.min, "max": self.max}
+
+
+_KINDS = {}
+
+
+def _classify(name):
+    """(count kind, poke side) for an Event name; cached, so each name is lowered once."""
+    kind = _KINDS.get(name)
+    if kind is None:
+        ev = name.strip().lower()
+        if ev in ("left", "leftwithpellet"):
+            count = "left"
+        elif ev in ("right", "rightwithpellet"):
+            count = "right"
+        elif ev == "pellet":
+            count = "pellet"
+        elif ev == "jam":
+            count = "jam"
+        else:
+            count = None
+        side = "left" if ev.startswith("left") else "right" if ev.startswith("right") else None
+        kind = _KINDS[name] = (count, side)
+    return kind
+
+
+def _number(value):
+    return (value.__class__ is int or value.__class__ is float) and value == value
+
+
+class DeviceStats:
+    __slots__ = ("device_number", "events", "counts", "left", "right", "pellets", "jams", "last_event", "last_ns",
+                 "retrieval", "timed_out", "ipi", "poke", "_minute", "_per_minute")
+
+    def __init__(self):
+        self.device_number = None
+        self.events = 0
+        self.counts = {}
+        self.left = self.right = self.pellets = self.jams = 0
+        self.last_event = None
+        self.last_ns = None
+        self.retrieval = Moments()
+        self.timed_out = 0
+        self.ipi = Moments()
+        self.poke = {"left": Moments(), "right": Moments()}
+        self._minute = [-1] * 60  # minute number each bucket currently holds
+        self._per_minute = [0] * 60
+
+    def update(self, event):
+        name = event.event
+        count, side = _classify(name)
+        self.events += 1
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.device_number = event.device_number
+        self.last_event = name
+        self.last_ns = event.arrival_ns
+        if count == "pellet":
+            self.pellets += 1
+            minute = event.arrival_ns // MINUTE_NS
+            slot = minute % 60
+            if self._minute[slot] != minute:
+                self._minute[slot] = minute
+                self._per_minute[slot] = 0
+            self._per_minute[slot] += 1
+            value = event.retrieval_time
+            if _number(value):
+                self.retrieval.add(value)
+            elif value == TIMED_OUT:
+                self.timed_out += 1
+            value = event.inter_pellet_interval
+            if _number(value):
+                self.ipi.add(value)
+        elif count == "left":
+            self.left += 1
+        elif count == "right":
+            self.right += 1
+        elif count == "jam":
+            self.jams += 1
+        if side is not None and _number(event.poke_time):
+            self.poke[side].add(event.poke_time)
+
+    def pellets_last_hour(self, now_ns):
+        now = now_ns // MINUTE_NS
+        return sum(n for minute, n in zip(self._minute, self._per_minute) if now - minute < 60)
+
+    def as_dict(self, start_ns, now_ns):
+        hours = (now_ns - start_ns) / HOUR_NS
+        return {
+            "device_number": self.device_number,
+            "events": self.events,
+            "counts": dict(self.counts),
+            "left": self.left,
+            "right": self.right,
+            "pellets": self.pellets,
+            "jams": self.jams,
+            "pellets_per_hour": self.pellets / hours if hours > 0 else None,
+            "pellets_last_hour": self.pellets_last_hour(now_ns),
+            "last_event": self.last_event,
+            "since_last_s": (now_ns - self.last_ns) / 1e9 if self.last_ns is not None else None,
+            "retrieval_time": self.retrieval.as_dict(),
+            "timed_out": self.timed_out,
+            "inter_pellet_interval": self.ipi.as_dict(),
+            "poke_time": {side: m.as_dict() for side, m in self.poke.items()},
+        }
+
+
+class SessionStats:
+    """DeviceStats per key (port identifier) for one session; safe to update and read from any thread."""
+
+    def __init__(self, clock_ns=time.monotonic_ns):
+        self.clock_ns = clock_ns
+        self.start_ns = clock_ns()
+        self.devices = {}
+        self._lock = threading.Lock()
+
+    def update(self, key, event):
+        with self._lock:
+            stats = self.devices.get(key)
+            if stats is None:
+                stats = self.devices[key] = DeviceStats()
+            stats.update(event)
+
+    def keys(self):
+        with self._lock:
+            return list(self.devices)
+
+    def snapshot(self, now_ns=None):
+        """{key: dict of the device's statistics}, all JSON types."""
+        now_ns = self.clock_ns() if now_ns is None else now_ns
+        with self._lock:
+            return {key: stats.as_dict(self.start_ns, now_ns) for key, stats in self.devices.items()}
+
+
+def _fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def label(s):
+    """Two GUI lines for one device's snapshot."""
+    rt = s["retrieval_time"]
+    ipi = s["inter_pellet_interval"]
+    since = s["since_last_s"]
+    return (f"Pellets {s['pellets']} ({_fmt(s['pellets_per_hour'])}/h, {s['pellets_last_hour']} last h) "
+            f"L {s['left']} R {s['right']} JAM {s['jams']}\n"
+            f"Retrieval {_fmt(rt['mean'])}±{_fmt(rt['sd'])} s  IPI {_fmt(ipi['mean'], '.0f')} s  "
+            f"last {s['last_event'] or '-'} {_fmt(since, '.0f')} s ago")
+
+
+def summary_rows(s):
+    """Event,Count rows: Left, Right and Pellet as the TTL summary always had, then JAM."""
+    return [["Left", s["left"]], ["Right", s["right"]], ["Pellet", s["pellets"]], ["JAM", s["jams"]]]
+
+
+def stats_rows(s):
+    """Statistic,N,Mean,SD,Min,Max rows (seconds; pellets per hour of session)."""
+    rows = [["Pellets_per_hour", s["pellets"], s["pellets_per_hour"], "", "", ""]]
+    for name, m in (("Retrieval_Time", s["retrieval_time"]),
+                    ("InterPelletInterval", s["inter_pellet_interval"]),
+                    ("Poke_Time_Left", s["poke_time"]["left"]),
+                    ("Poke_Time_Right", s["poke_time"]["right"])):
+        rows.append([name, m["n"]] + ["" if m[k] is None else m[k] for k in ("mean", "sd", "min", "max")])
+    rows.append(["Retrieval_Time_Timed_out", s["timed_out"], "", "", "", ""])
+    return rows
+
+
+def write_summary(summary_path, stats_path, s):
+    """Write one device's summary (Event,Count) and statistics CSVs."""
+    for path, header, rows in ((summary_path, SUMMARY_HEADER, summary_rows(s)),
+                               (stats_path, STATS_HEADER, stats_rows(s))):
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
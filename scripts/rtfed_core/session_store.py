@@ -0,0 +1,204 @@
+"""Columnar per-device session store with bounded memory.
+
+Each device keeps one preallocated chunk of ``chunk_rows`` rows as
+``array`` columns: the receive time, the int64 monotonic arrival stamp,
+one float64 value + one int8 tag
+column per numeric field and one uint32 dictionary code per text field.
+When the chunk is full its column bytes are appended to the device's spill
+file and the same arrays are reused, so resident memory stays at one chunk
+per device however long the session runs. Reads stream the spilled chunks
+back one at a time.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import Counter
+
+from .events import ATTRS, TEXT_FIELDS, FED3Event
+
+# Tags for numeric fields; 0..15 is a float with that many printed decimals
+TAG_INT = -1
+TAG_STR = -2  # the value is a code into SessionStore.strings
+
+_IS_TEXT = tuple(attr in TEXT_FIELDS for attr in ATTRS)
+_EVENT = ATTRS.index("event")
+
+
+def _typecodes():
+    codes = ["d", "q"]  # received, arrival_ns
+    for is_text in _IS_TEXT:
+        codes.extend(("I",) if is_text else ("d", "b"))
+    return codes
+
+
+_TYPECODES = _typecodes()
+_ROW_BYTES = sum(array(code).itemsize for code in _TYPECODES)
+
+
+def field_columns(cols):
+    """Yield (attr, is_text, values, tags) for one chunk's columns; tags is None for text."""
+    c = 2
+    for attr, is_text in zip(ATTRS, _IS_TEXT):
+        if is_text:
+            yield attr, True, cols[c], None
+            c += 1
+        else:
+            yield attr, False, cols[c], cols[c + 1]
+            c += 2
+
+
+class _DeviceColumns:
+    __slots__ = ("columns", "n", "spilled", "spill_path")
+
+    def __init__(self, chunk_rows):
+        self.columns = [array(code, bytes(array(code).itemsize * chunk_rows)) for code in _TYPECODES]
+        self.n = 0
+        self.spilled = []  # (offset, rows) of each chunk in the spill file
+        self.spill_path = None
+
+
+class SessionStore:
+    def __init__(self, spill_root=None, chunk_rows=4096):
+        # spill_root is where the spill directory is created (system temp if None)
+        self.spill_root = spill_root
+        self.chunk_rows = chunk_rows
+        self.devices = {}
+        self.strings = []  # dictionary shared by every text column
+        self._codes = {}
+        self._spill_dir = None
+        self._lock = threading.Lock()
+
+    def append(self, port, event):
+        with self._lock:
+            dev = self.devices.get(port)
+            if dev is None:
+                dev = self.devices[port] = _DeviceColumns(self.chunk_rows)
+            i = dev.n
+            cols = dev.columns
+            cols[0][i] = event.received
+            cols[1][i] = event.arrival_ns
+            decimals = event._decimals
+            c = 2
+            for f, attr in enumerate(ATTRS):
+                value = getattr(event, attr)
+                if _IS_TEXT[f]:
+                    cols[c][i] = self._code(value)
+                    c += 1
+                    continue
+                if value.__class__ is str:
+                    cols[c][i] = self._code(value)
+                    cols[c + 1][i] = TAG_STR
+                elif value.__class__ is int:
+                    cols[c][i] = value
+                    cols[c + 1][i] = TAG_INT
+                else:
+                    cols[c][i] = value
+                    cols[c + 1][i] = (decimals >> (4 * f)) & 0xF
+                c += 2
+            dev.n = i + 1
+            if dev.n == self.chunk_rows:
+                self._spill(port, dev)
+
+    def ports(self):
+        return list(self.devices)
+
+    def count(self, port):
+        dev = self.devices.get(port)
+        if dev is None:
+            return 0
+        return sum(rows for _, rows in dev.spilled) + dev.n
+
+    def iter_events(self, port):
+        """Yield the device's events in arrival order, one chunk in memory at a time."""
+        for cols, rows in self.iter_chunks(port):
+            for i in range(rows):
+                yield self._event(cols, i)
+
+    def iter_rows(self, port, time_format):
+        for event in self.iter_events(port):
+            yield event.to_row(time_format)
+
+    def event_counts(self, port):
+        """Counter of Event names, read from the code column only."""
+        column = 2 + sum(1 if is_text else 2 for is_text in _IS_TEXT[:_EVENT])
+        counts = Counter()
+        for cols, rows in self.iter_chunks(port):
+            counts.update(cols[column][:rows])
+        return Counter({self.strings[code]: n for code, n in counts.items()})
+
+    def resident_bytes(self):
+        return len(self.devices) * self.chunk_rows * _ROW_BYTES
+
+    def close(self):
+        """Drop all data and delete the spill files."""
+        with self._lock:
+            self.devices.clear()
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    def _code(self, text):
+        code = self._codes.get(text)
+        if code is None:
+            code = self._codes[text] = len(self.strings)
+            self.strings.append(text)
+        return code
+
+    def _spill(self, port, dev):
+        if dev.spill_path is None:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix=".rtfed_spill_", dir=self.spill_root)
+            dev.spill_path = os.path.join(self._spill_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", str(port)) + ".bin")
+        with open(dev.spill_path, "ab") as f:
+            offset = f.tell()
+            for col in dev.columns:
+                col[:dev.n].tofile(f)
+        dev.spilled.append((offset, dev.n))
+        dev.n = 0
+
+    def iter_chunks(self, port):
+        """Yield (columns, rows) per chunk, oldest first; see field_columns() for the layout."""
+        dev = self.devices.get(port)
+        if dev is None:
+            return
+        with self._lock:
+            # Snapshot both parts together so a concurrent spill is not read twice
+            spilled = list(dev.spilled)
+            path = dev.spill_path
+            live = [col[:dev.n] for col in dev.columns]
+            live_rows = dev.n
+        if spilled:
+            with open(path, "rb") as f:
+                for offset, rows in spilled:
+                    f.seek(offset)
+                    cols = []
+                    for code in _TYPECODES:
+                        col = array(code)
+                        col.fromfile(f, rows)
+                        cols.append(col)
+                    yield cols, rows
+        yield live, live_rows
+
+    def _event(self, cols, i):
+        values = []
+        decimals = 0
+        c = 2
+        for f, is_text in enumerate(_IS_TEXT):
+            if is_text:
+                values.append(self.strings[cols[c][i]])
+                c += 1
+                continue
+            value = cols[c][i]
+            tag = cols[c + 1][i]
+            if tag == TAG_STR:
+                values.append(self.strings[int(value)])
+            elif tag == TAG_INT:
+                values.append(int(value))
+            else:
+                values.append(value)
+                decimals |= tag << (4 * f)
+            c += 2
+        return FED3Event.from_values(values, cols[0][i], decimals, cols[1][i])
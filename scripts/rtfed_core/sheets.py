@@ -0,0 +1,520 @@
+"""One Google Sheets uploader for every FED3 in a session.
+
+Each device used to open the spreadsheet itself and call append_rows on
+its Device_N worksheet every few seconds, plus an append_row per JAM, so
+16 devices made 16+ write calls per interval against a per-user quota of
+WRITE_QUOTA_PER_MIN. SheetsUploader gathers the rows of every device and
+sends them every ``interval`` seconds as a single spreadsheets.batchUpdate
+holding one appendCells request per worksheet. appendCells appends after
+the last row with data and grows the grid, like append_rows, and cells
+are sent as strings, like append_rows' RAW input.
+
+Rows are not held in memory until they are sent. Every interval the
+upload thread moves the rows added since the last one into a per-worksheet
+SheetSpool on disk (an append-only JSON-lines file plus the byte offset of
+the first row not yet acknowledged by the API) and sends from there, at
+most MAX_BATCH_ROWS per call. During an outage the backlog grows on disk
+only; when the API answers again the uploader catches up with up to
+CATCHUP_CALLS full batches per interval while the write quota has room.
+The spool lives under the spreadsheet's id, so after a crash or reboot
+the next session resumes from the last acknowledged row. Delivery is at
+least once: a batch that was applied but not acknowledged before a crash
+is sent again.
+
+Missing worksheets are created together in one batchUpdate (addSheet) and
+their header row goes out with the next data batch.
+
+Calls are paced by a TokenBucket refilled at WRITE_QUOTA_PER_MIN -
+QUOTA_RESERVE calls a minute with bursts of up to 1 + CATCHUP_CALLS, so a
+catch-up cannot trip the quota. A failed call backs off exponentially with
+jitter (BACKOFF_BASE_S doubling up to BACKOFF_MAX_S, or the server's
+Retry-After on a 429); until the retry time rows keep spooling but no
+request is built. Errors that retrying will not fix (a 4xx other than 429,
+such as a spreadsheet that is not shared with the service account) wait
+BACKOFF_MAX_S. Without a fixed ``interval`` the send interval follows the
+event rate: MIN_INTERVAL_S while events trickle in, so the dashboard trails
+the rig by seconds, stretching towards MAX_INTERVAL_S as the rate nears
+HIGH_RATE rows/s so each call carries a large batch. metrics() gives the
+rows queued and the age of the oldest unsent row per worksheet, and a
+summary goes through ``on_log`` every REPORT_S.
+"""
+import collections
+import glob
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from .events import SHEETS_TIME_FORMAT
+
+WRITE_QUOTA_PER_MIN = 60  # Sheets API write requests per minute per user
+MIN_INTERVAL_S = 2.0
+MAX_INTERVAL_S = 15.0
+HIGH_RATE = 40.0  # rows/s at which the interval reaches MAX_INTERVAL_S
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+REPORT_S = 60.0
+MAX_BATCH_ROWS = 5000  # keeps a catch-up batch well under the request size limit
+CATCHUP_CALLS = 4  # extra full batches per interval while a backlog drains
+QUOTA_RESERVE = 10  # write calls per minute left for everything else
+NEW_SHEET_ROWS = 1000
+NEW_SHEET_COLS = 20
+
+
+def worksheet_title(device_number):
+    return f"Device_{device_number}"
+
+
+def default_spool_dir(spreadsheet_id):
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "rtfed", "sheets-spool", re.sub(r"[^\w.-]+", "_", spreadsheet_id))
+
+
+def _row_data(values):
+    return {"values": [{"userEnteredValue": {"stringValue": str(v)}} for v in values]}
+
+
+def _http_status(exc):
+    # gspread.exceptions.APIError keeps the requests.Response it failed on
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``capacity``."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self._t = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def take(self):
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def charge(self, n=1):
+        """Spend ``n`` tokens even if that leaves the bucket in debt."""
+        self._refill()
+        self.tokens -= n
+
+    def empty(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def wait(self):
+        """Seconds until the next token."""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class SheetSpool:
+    """Rows for one worksheet: <title>.spool holds them, <title>.ack the offset of the first unsent one."""
+
+    def __init__(self, directory, title, now=0.0):
+        self.title = title
+        self.path = os.path.join(directory, title + ".spool")
+        self.ack_path = os.path.join(directory, title + ".ack")
+        self._w = open(self.path, "ab")
+        self.size = self._w.seek(0, os.SEEK_END)
+        self._drop_partial_tail()
+        try:
+            with open(self.ack_path) as f:
+                self.acked = min(int(f.read().strip() or 0), self.size)
+        except (FileNotFoundError, ValueError):
+            self.acked = 0
+        self.backlog = self._count_lines(self.acked)
+        # [end offset, time its oldest row was added] per append; a backlog
+        # left by a previous run counts from when it was found
+        self._chunks = collections.deque([[self.size, now]] if self.backlog else [])
+
+    def append(self, rows, added_at=0.0):
+        if not rows:
+            return
+        data = b"".join(json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in rows)
+        self._w.write(data)
+        self._w.flush()
+        self.size += len(data)
+        self.backlog += len(rows)
+        self._chunks.append([self.size, added_at])
+
+    @property
+    def oldest(self):
+        """When the oldest unsent row was added, or None."""
+        try:
+            return self._chunks[0][1]
+        except IndexError:
+            return None
+
+    def read(self, max_rows):
+        """Up to ``max_rows`` unsent rows and the offset just past them."""
+        rows = []
+        offset = self.acked
+        if max_rows <= 0 or offset >= self.size:
+            return rows, offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                rows.append(json.loads(line))
+                offset += len(line)
+                if len(rows) >= max_rows:
+                    break
+        return rows, offset
+
+    def ack(self, offset, rows):
+        self.backlog -= rows
+        if offset >= self.size:
+            # Everything sent: start the file again rather than let it grow
+            self._w.truncate(0)
+            self._w.seek(0)
+            self.size = self.acked = 0
+            self.backlog = 0
+            self._chunks.clear()
+        else:
+            self.acked = offset
+            while self._chunks and self._chunks[0][0] <= offset:
+                self._chunks.popleft()
+        tmp = self.ack_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.acked))
+        os.replace(tmp, self.ack_path)
+
+    def close(self):
+        self._w.close()
+
+    def _drop_partial_tail(self):
+        # A crash mid-write can leave half a row at the end
+        if not self.size:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(max(0, self.size - 65536))
+            tail = f.read()
+        if tail.endswith(b"\n"):
+            return
+        cut = tail.rfind(b"\n")
+        self.size = self.size - len(tail) + cut + 1 if cut >= 0 else max(0, self.size - len(tail))
+        self._w.truncate(self.size)
+        self._w.seek(self.size)
+
+    def _count_lines(self, offset):
+        if offset >= self.size:
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return sum(1 for _ in f)
+
+
+class SheetsUploader:
+    def __init__(self, client, spreadsheet_id, headers, interval=None,
+                 on_log=None, time_format=SHEETS_TIME_FORMAT, spool_dir=None, clock=time.monotonic):
+        self.client = client  # an authorized gspread client
+        self.spreadsheet_id = spreadsheet_id
+        self.headers = list(headers)
+        self.interval = interval  # fixed send interval in s; None adapts it to the event rate
+        self.on_log = on_log or logging.info
+        self.time_format = time_format
+        self.spool_dir = spool_dir or default_spool_dir(spreadsheet_id)
+        self.clock = clock
+        self.api_calls = 0
+        self.rows_sent = 0
+        self.rate = 0.0  # rows/s added, smoothed over recent flushes
+        self.next_delay = interval or MIN_INTERVAL_S
+        self.failures = 0  # consecutive failed calls
+        self._bucket = TokenBucket((WRITE_QUOTA_PER_MIN - QUOTA_RESERVE) / 60, 1 + CATCHUP_CALLS, clock)
+        self._retry_at = 0.0
+        self._rng = random.Random()
+        self._calls = collections.deque()  # clock time of each write call in the last minute
+        self._pending = {}  # worksheet title -> [FED3Event, ...] added since the last flush
+        self._first_added = {}  # worksheet title -> when its oldest pending row was added
+        self._spools = {}
+        self._sheet_ids = {}
+        self._needs_header = set()
+        self._spreadsheet = None
+        self._last_flush = clock()
+        self._last_report = self._last_flush
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._resume_spools()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sheets-upload", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=30):
+        """Send what is queued once more and stop the upload thread; unsent rows stay spooled."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.on_log(f"Google Sheets upload did not finish within {timeout} s on stop.")
+            return
+        self._thread = None
+        if self.spooled:
+            self.on_log(f"{self.spooled} rows not yet in Google Sheets are kept in {self.spool_dir}; "
+                        f"the next session on this spreadsheet sends them.")
+        for spool in self._spools.values():
+            spool.close()
+        self._spools.clear()
+
+    def add_sheet(self, title):
+        """Make sure ``title`` exists (with headers) by the next flush, even before it has rows."""
+        with self._lock:
+            self._pending.setdefault(title, [])
+
+    def add(self, title, event):
+        with self._lock:
+            rows = self._pending.get(title)
+            if rows is None:
+                rows = self._pending[title] = []
+            if not rows:
+                self._first_added[title] = self.clock()
+            rows.append(event)
+
+    @property
+    def waiting(self):
+        """Rows added since the last flush, still in memory."""
+        with self._lock:
+            return sum(len(rows) for rows in self._pending.values())
+
+    @property
+    def spooled(self):
+        """Rows on disk not yet acknowledged by the API."""
+        return sum(spool.backlog for spool in list(self._spools.values()))
+
+    def metrics(self):
+        """Per worksheet: rows not yet sent and the age in s of the oldest of them."""
+        now = self.clock()
+        with self._lock:
+            waiting = {title: len(rows) for title, rows in self._pending.items()}
+            first = dict(self._first_added)
+        spools = dict(self._spools)
+        out = {}
+        for title in sorted(set(waiting) | set(spools)):
+            spool = spools.get(title)
+            oldest = first.get(title)
+            if spool is not None and spool.oldest is not None:
+                oldest = spool.oldest if oldest is None else min(oldest, spool.oldest)
+            out[title] = {"queued": waiting.get(title, 0) + (spool.backlog if spool is not None else 0),
+                          "lag_s": now - oldest if oldest is not None else 0.0}
+        return out
+
+    def stats(self):
+        used = self._calls_last_minute()
+        devices = self.metrics()
+        return {
+            "api_calls": self.api_calls,
+            "rows_sent": self.rows_sent,
+            "rows_per_call": self.rows_sent / self.api_calls if self.api_calls else 0.0,
+            "calls_last_minute": used,
+            "quota_headroom": 1 - used / WRITE_QUOTA_PER_MIN,
+            "waiting": self.waiting,
+            "spooled": self.spooled,
+            "rate": self.rate,
+            "interval_s": self.next_delay,
+            "backoff_s": max(0.0, self._retry_at - self.clock()),
+            "max_lag_s": max((m["lag_s"] for m in devices.values()), default=0.0),
+            "devices": devices,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.next_delay):
+            self.flush()
+        self.flush()
+
+    def _resume_spools(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.spool"))):
+            title = os.path.basename(path)[:-len(".spool")]
+            spool = self._spool(title)
+            if spool.backlog:
+                self.on_log(f"Resuming {spool.backlog} unsent Google Sheets rows for {title} from a previous run.")
+
+    def _spool(self, title):
+        spool = self._spools.get(title)
+        if spool is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            spool = self._spools[title] = SheetSpool(self.spool_dir, title, self.clock())
+        return spool
+
+    def flush(self):
+        """Spool the rows added since the last flush, send what the quota allows and set next_delay.
+
+        Upload thread only.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            first, self._first_added = self._first_added, {}
+        now = self.clock()
+        added = sum(len(events) for events in pending.values())
+        elapsed = max(now - self._last_flush, 1e-3)
+        self._last_flush = now
+        self.rate = 0.7 * self.rate + 0.3 * added / elapsed
+        try:
+            for title, events in pending.items():
+                self._spool(title).append([event.to_row(self.time_format) for event in events],
+                                          first.get(title, now))
+        except OSError as e:
+            # Disk full or gone: keep the rows in memory rather than lose them
+            with self._lock:
+                for title, events in pending.items():
+                    self._pending[title] = events + self._pending.get(title, [])
+                    if title in first:
+                        self._first_added[title] = min(first[title], self._first_added.get(title, now))
+            self.on_log(f"Cannot spool Google Sheets rows to {self.spool_dir}: {e}")
+            self.next_delay = self._interval()
+            return
+        if now >= self._retry_at:
+            new_sheets = set(pending)
+            for n in range(1 + CATCHUP_CALLS):
+                if n and not any(s.backlog for s in self._spools.values()):
+                    break
+                if not self._bucket.take() or not self._send_batch(new_sheets):
+                    break
+                new_sheets = set()
+        self.next_delay = self._interval()
+        self._maybe_report()
+
+    def _interval(self):
+        now = self.clock()
+        if self.interval is not None:
+            interval = self.interval
+        else:
+            load = min(1.0, self.rate / HIGH_RATE)
+            interval = MIN_INTERVAL_S + (MAX_INTERVAL_S - MIN_INTERVAL_S) * load
+        if now < self._retry_at:
+            # Keep spooling while backing off, and wake for the retry
+            return min(interval, self._retry_at - now)
+        if any(s.backlog for s in self._spools.values()):
+            # Catching up: go again as soon as the quota has a call to spare
+            interval = min(interval, max(MIN_INTERVAL_S / 2, self._bucket.wait()))
+        return max(interval, self._bucket.wait())
+
+    def _send_batch(self, new_sheets):
+        budget = MAX_BATCH_ROWS
+        batch = {}  # title -> (rows, end offset)
+        for title, spool in self._spools.items():
+            if not budget:
+                break
+            rows, end = spool.read(budget)
+            if rows or title in new_sheets:
+                batch[title] = (rows, end)
+                budget -= len(rows)
+        if not batch:
+            return False
+        try:
+            self._ensure_sheets(batch)
+            requests = []
+            sent = 0
+            for title, (rows, _) in batch.items():
+                data = [_row_data(self.headers)] if title in self._needs_header else []
+                data.extend(_row_data(row) for row in rows)
+                if data:
+                    requests.append({"appendCells": {"sheetId": self._sheet_ids[title], "rows": data,
+                                                     "fields": "userEnteredValue"}})
+                    sent += len(rows)
+            if requests:
+                self._spreadsheet.batch_update({"requests": requests})
+                self._count_call()
+        except Exception as e:
+            self._back_off(e)
+            return False
+        if self.failures:
+            self.on_log(f"Google Sheets reachable again after {self.failures} failed attempts; "
+                        f"sending {self.spooled} spooled rows.")
+            self.failures = 0
+        self._needs_header.difference_update(batch)
+        for title, (rows, end) in batch.items():
+            if rows:
+                self._spools[title].ack(end, len(rows))
+        self.rows_sent += sent
+        return True
+
+    def _back_off(self, exc):
+        self.failures += 1
+        status = _http_status(exc)
+        if status is not None and status != 429 and 400 <= status < 500:
+            delay = BACKOFF_MAX_S
+            hint = (" (retrying will not fix this; check the spreadsheet id and that it is shared "
+                    "with the service account)")
+        else:
+            # Full jitter: devices that lost the network together do not retry in step
+            delay = self._rng.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (self.failures - 1)))
+            delay = max(delay, BACKOFF_BASE_S / 2, _retry_after(exc) or 0.0)
+            hint = ""
+        if status == 429:
+            self._bucket.empty()
+        self._retry_at = self.clock() + delay
+        self.on_log(f"Failed to send data to Google Sheets (attempt {self.failures}), "
+                    f"{self.spooled} rows kept in the spool, retrying in {delay:.0f} s: {exc}{hint}")
+
+    def _ensure_sheets(self, titles):
+        if self._spreadsheet is None:
+            self._spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+        missing = [t for t in titles if t not in self._sheet_ids]
+        if not missing:
+            return
+        for sheet in self._spreadsheet.fetch_sheet_metadata()["sheets"]:
+            props = sheet["properties"]
+            self._sheet_ids[props["title"]] = props["sheetId"]
+        missing = [t for t in missing if t not in self._sheet_ids]
+        if not missing:
+            return
+        grid = {"rowCount": NEW_SHEET_ROWS, "columnCount": NEW_SHEET_COLS}
+        reply = self._spreadsheet.batch_update({"requests": [
+            {"addSheet": {"properties": {"title": t, "gridProperties": grid}}} for t in missing]})
+        self._bucket.charge()
+        self._count_call()
+        for r in reply["replies"]:
+            props = r["addSheet"]["properties"]
+            self._sheet_ids[props["title"]] = props["sheetId"]
+            self._needs_header.add(props["title"])
+
+    def _maybe_report(self):
+        now = self.clock()
+        if now - self._last_report < REPORT_S:
+            return
+        self._last_report = now
+        s = self.stats()
+        if not s["calls_last_minute"] and not s["spooled"]:
+            return
+        worst = max(s["devices"].items(), key=lambda kv: kv[1]["lag_s"], default=(None, None))[0]
+        self.on_log(f"Google Sheets: {s['rows_per_call']:.1f} rows/call, "
+                    f"{s['calls_last_minute']}/{WRITE_QUOTA_PER_MIN} write calls in the last minute, "
+                    f"sending every {s['interval_s']:.1f} s at {s['rate']:.1f} rows/s, "
+                    f"{s['waiting'] + s['spooled']} rows queued"
+                    + (f", oldest unsent {s['max_lag_s']:.0f} s old ({worst})" if s["max_lag_s"] >= 1 else "") + ".")
+
+    def _count_call(self):
+        self.api_calls += 1
+        self._calls.append(self.clock())
+
+    def _calls_last_minute(self):
+        cutoff = self.clock() - 60
+        calls = self._calls
+        while calls and calls[0] < cutoff:
+            calls.popleft()
+        return len(calls)
@@ -0,0 +1,260 @@
+"""Local stand-in for the parts of the Google Sheets API the apps use.
+
+MockSheetsServer answers the two calls SheetsUploader makes over HTTP on
+localhost, in the v4 REST shapes:
+
+    GET  /v4/spreadsheets/<id>               sheet properties (fetch_sheet_metadata)
+    POST /v4/spreadsheets/<id>:batchUpdate   addSheet and appendCells requests
+
+and keeps every worksheet's rows in memory. Like the real API it answers
+429 with a Retry-After header to writes beyond ``quota_per_min`` in any
+minute, and ``latency_ms`` is added to every request. Two extra endpoints
+let a benchmark or a test look inside:
+
+    GET  /mock/stats                         calls, rows and 429s so far
+    GET  /mock/rows/<id>/<title>             one worksheet's rows
+
+MockSheetsClient is the matching client: open_by_key() returns an object
+with the gspread Spreadsheet methods SheetsUploader calls, and HTTP errors
+are raised as MockAPIError carrying a ``response`` with ``status_code`` and
+``headers``, as gspread's APIError does. Set $RTFED_SHEETS_MOCK to the
+server's URL and the PiOS/PiCAM apps upload there instead of to Google,
+without credentials::
+
+    python -m rtfed_core.sheets_mock --port 8765
+    export RTFED_SHEETS_MOCK=http://127.0.0.1:8765
+"""
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENV_VAR = "RTFED_SHEETS_MOCK"
+QUOTA_PER_MIN = 60
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        mock = self.server.mock
+        mock.delay()
+        parts = [urllib.parse.unquote(p) for p in urllib.parse.urlsplit(self.path).path.strip("/").split("/")]
+        if parts == ["mock", "stats"]:
+            self._reply(200, mock.stats())
+        elif len(parts) == 4 and parts[:2] == ["mock", "rows"]:
+            self._reply(200, {"values": mock.rows(parts[2], parts[3])})
+        elif len(parts) == 3 and parts[:2] == ["v4", "spreadsheets"]:
+            self._reply(200, mock.metadata(parts[2]))
+        else:
+            self._reply(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self):
+        mock = self.server.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        mock.delay()
+        parts = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) != 3 or parts[:2] != ["v4", "spreadsheets"] or not parts[2].endswith(":batchUpdate"):
+            self._reply(404, {"error": {"code": 404, "message": "not found"}})
+            return
+        retry_after = mock.take_write()
+        if retry_after is not None:
+            self._reply(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                        "message": "Quota exceeded for write requests per minute per user"}},
+                        [("Retry-After", str(retry_after))])
+            return
+        try:
+            self._reply(200, mock.batch_update(urllib.parse.unquote(parts[2][:-len(":batchUpdate")]), body))
+        except (KeyError, ValueError) as e:
+            self._reply(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT", "message": str(e)}})
+
+
+class MockSheetsServer:
+    def __init__(self, host="127.0.0.1", port=0, quota_per_min=QUOTA_PER_MIN, latency_ms=0.0):
+        self.quota_per_min = quota_per_min
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.rejected = 0
+        self.rows_appended = 0
+        self._spreadsheets = collections.defaultdict(dict)  # id -> title -> {"sheetId", "rows"}
+        self._writes = collections.deque()  # time of each accepted write in the last minute
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="sheets-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def delay(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def take_write(self):
+        """None if a write is allowed now, else the seconds until one is."""
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            writes = self._writes
+            while writes and writes[0] <= now - 60:
+                writes.popleft()
+            if self.quota_per_min and len(writes) >= self.quota_per_min:
+                self.rejected += 1
+                return max(1, int(writes[0] + 60 - now + 1))
+            writes.append(now)
+            return None
+
+    def metadata(self, spreadsheet_id):
+        with self._lock:
+            sheets = self._spreadsheets[spreadsheet_id]
+            return {"spreadsheetId": spreadsheet_id,
+                    "sheets": [{"properties": {"title": t, "sheetId": s["sheetId"]}} for t, s in sheets.items()]}
+
+    def batch_update(self, spreadsheet_id, body):
+        with self._lock:
+            sheets = self._spreadsheets[spreadsheet_id]
+            by_id = {s["sheetId"]: s for s in sheets.values()}
+            replies = []
+            for request in body["requests"]:
+                if "addSheet" in request:
+                    title = request["addSheet"]["properties"]["title"]
+                    if title in sheets:
+                        raise ValueError(f"A sheet with the name \"{title}\" already exists.")
+                    sheet = sheets[title] = {"sheetId": len(sheets) + 1, "rows": []}
+                    by_id[sheet["sheetId"]] = sheet
+                    replies.append({"addSheet": {"properties": {"title": title, "sheetId": sheet["sheetId"]}}})
+                elif "appendCells" in request:
+                    cells = request["appendCells"]
+                    rows = [[c["userEnteredValue"]["stringValue"] for c in row["values"]] for row in cells["rows"]]
+                    by_id[cells["sheetId"]]["rows"].extend(rows)
+                    self.rows_appended += len(rows)
+                    replies.append({})
+                else:
+                    raise ValueError(f"unsupported request {sorted(request)}")
+            return {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+    def rows(self, spreadsheet_id, title):
+        with self._lock:
+            sheet = self._spreadsheets[spreadsheet_id].get(title)
+            return list(sheet["rows"]) if sheet else []
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "rejected": self.rejected, "rows": self.rows_appended}
+
+
+class MockAPIError(Exception):
+    class _Response:
+        def __init__(self, status_code, headers, text):
+            self.status_code = status_code
+            self.headers = headers
+            self.text = text
+
+    def __init__(self, status_code, headers, text):
+        super().__init__(f"{status_code}: {text}")
+        self.response = self._Response(status_code, headers, text)
+
+
+class MockSpreadsheet:
+    def __init__(self, client, key):
+        self.client = client
+        self.id = key
+
+    def fetch_sheet_metadata(self):
+        return self.client.request("GET", f"/v4/spreadsheets/{urllib.parse.quote(self.id)}")
+
+    def batch_update(self, body):
+        return self.client.request("POST", f"/v4/spreadsheets/{urllib.parse.quote(self.id)}:batchUpdate", body)
+
+
+class MockSheetsClient:
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def open_by_key(self, key):
+        return MockSpreadsheet(self, key)
+
+    def request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        req = urllib.request.Request(self.url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                return json.loads(r.read())
+        except urllib.error.HTTPError as e:
+            raise MockAPIError(e.code, dict(e.headers), e.read().decode(errors="replace")) from None
+
+    def rows(self, key, title):
+        path = f"/mock/rows/{urllib.parse.quote(key, safe='')}/{urllib.parse.quote(title, safe='')}"
+        return self.request("GET", path)["values"]
+
+    def stats(self):
+        return self.request("GET", "/mock/stats")
+
+
+def client_from_env():
+    """A MockSheetsClient for $RTFED_SHEETS_MOCK, or None when it is not set."""
+    url = os.environ.get(ENV_VAR)
+    return MockSheetsClient(url) if url else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Google Sheets API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--quota", type=int, default=QUOTA_PER_MIN, help="write calls per minute, 0 for no limit")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    server = MockSheetsServer(args.host, args.port, args.quota, args.latency_ms)
+    print(f"export {ENV_VAR}={server.url}", flush=True)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Fan-out of parsed FED3 events to independent storage sinks.
+
+The serial readers used to call every destination themselves, one after
+the other: the session store, the CSV log and the Sheets uploader, so a
+slow one held up the read and every destination after it. SinkPipeline
+takes each event once and hands it to every sink's worker. publish()
+appends to a bounded per-sink queue under that queue's lock and never
+waits on a sink or does I/O. Each sink has its own worker thread that
+drains its queue in batches of up to MAX_BATCH into write(), so a sink
+that stalls only backs up its own queue. What happens when a queue is
+full is the sink's policy:
+
+    KEEP         keep queuing past ``capacity`` (nothing is lost); the
+                 pipeline logs the backlog each time it doubles
+    DROP_OLDEST  discard the oldest queued event (live feeds)
+    DROP_NEWEST  discard the incoming event
+
+A batch whose write() raises goes back to the front of the queue and is
+retried with exponential backoff (RETRY_MIN_S doubling to RETRY_MAX_S),
+so a transient disk or database error delays events but loses none. A sink
+that stored part of a batch before failing removes those items from the
+list before raising, so they are not written twice. Each distinct error is
+logged once, and again when the sink recovers. Only at close(), after
+CLOSE_RETRIES more failures, are the remaining events given up, and the
+count is logged and reported as "lost".
+
+close() lets every worker drain its queue, then calls each sink's close()
+on its worker thread and returns their results by sink name.
+
+Sinks: CSVSink (CSVLogSet), ColumnarSink (SessionStore, written out as
+.fed3z on close), SQLiteSink (the event_db database other processes can
+query mid-session) and SheetsSink (SheetsUploader, which can point at
+Google or at the local rtfed_core.sheets_mock server).
+"""
+import abc
+import collections
+import logging
+import threading
+import time
+
+from . import columnar
+from .event_db import EventWriter
+from .events import FED3Event
+from .latency import LatencyHistogram
+from .sheets import worksheet_title
+
+KEEP = "keep"
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+CAPACITY = 10000
+MAX_BATCH = 1000
+RETRY_MIN_S = 0.05
+RETRY_MAX_S = 5.0
+CLOSE_RETRIES = 5
+
+
+class Sink(abc.ABC):
+    """A destination for events; write() and close() run on the sink's own worker thread."""
+
+    name = "sink"
+
+    def __init__(self, policy=KEEP, capacity=CAPACITY, skip_events=()):
+        self.policy = policy
+        self.capacity = capacity
+        self.skip_events = frozenset(skip_events)  # Event names this sink never sees
+
+    @abc.abstractmethod
+    def write(self, batch):
+        """Store a list of (port, FED3Event) in arrival order; on failure, delete what was stored, then raise."""
+
+    def close(self):
+        return None
+
+
+class _Worker:
+    def __init__(self, sink, on_log):
+        self.sink = sink
+        self.on_log = on_log
+        self.result = None
+        self.queued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0  # failed write() attempts
+        self.lost = 0  # events given up at close after repeated failures
+        self.high_water = 0
+        self.write_ns = LatencyHistogram()  # time per write() batch
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._warn_at = sink.capacity
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"sink-{sink.name}", daemon=True)
+        self._thread.start()
+
+    def offer(self, item):
+        sink = self.sink
+        warn = 0
+        with self._cond:
+            q = self._queue
+            if len(q) >= sink.capacity:
+                if sink.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                if sink.policy == DROP_OLDEST:
+                    q.popleft()
+                    self.dropped += 1
+                elif len(q) >= self._warn_at:
+                    self._warn_at *= 2
+                    warn = len(q)
+            q.append(item)
+            self.queued += 1
+            if len(q) > self.high_water:
+                self.high_water = len(q)
+            self._cond.notify()
+        if warn:
+            self.on_log(f"{sink.name} sink is {warn} events behind.")
+
+    @property
+    def backlog(self):
+        return len(self._queue)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        sink = self.sink
+        skip = sink.skip_events
+        q = self._queue
+        failed = 0  # failed attempts since the last successful write
+        delay = 0.0
+        last_error = None
+        while True:
+            with self._cond:
+                while not q and not self._closed:
+                    self._cond.wait()
+                if not q:
+                    break
+                closing = self._closed
+                batch = [q.popleft() for _ in range(min(len(q), MAX_BATCH))]
+            if skip:
+                batch = [item for item in batch if item[1].event not in skip]
+            if not batch:
+                continue
+            size = len(batch)
+            start = time.perf_counter_ns()
+            try:
+                sink.write(batch)
+            except Exception as e:
+                self.write_ns.record(time.perf_counter_ns() - start)
+                self.delivered += size - len(batch)  # stored before the failure
+                self.errors += 1
+                failed += 1
+                error = f"{type(e).__name__}: {e}"
+                if error != last_error:
+                    last_error = error
+                    self.on_log(f"{sink.name} sink failed to store {len(batch)} events, will retry: {e}")
+                if closing and failed > CLOSE_RETRIES:
+                    # Later failing batches are given up straight away, so close() still ends
+                    self.lost += len(batch)
+                    self.on_log(f"{sink.name} sink gave up on {len(batch)} events at close after "
+                                f"{failed} failed attempts: {e}")
+                    continue
+                with self._cond:
+                    q.extendleft(reversed(batch))
+                delay = min(RETRY_MAX_S, delay * 2 if delay else RETRY_MIN_S)
+                time.sleep(delay)
+                continue
+            self.write_ns.record(time.perf_counter_ns() - start)
+            self.delivered += len(batch)
+            if failed:
+                self.on_log(f"{sink.name} sink is storing events again after {failed} failed attempts.")
+                failed = 0
+                delay = 0.0
+                last_error = None
+        try:
+            self.result = sink.close()
+        except Exception as e:
+            self.on_log(f"Failed to close the {sink.name} sink: {e}")
+
+
+class SinkPipeline:
+    def __init__(self, sinks, on_log=None):
+        self.on_log = on_log or logging.info
+        self.workers = [_Worker(sink, self.on_log) for sink in sinks]
+        self.published = 0
+
+    def publish(self, port, event):
+        """Queue ``event`` for every sink; returns immediately (any thread)."""
+        self.published += 1
+        item = (port, event)
+        for worker in self.workers:
+            worker.offer(item)
+
+    def close(self, timeout=None):
+        """Drain and close every sink; returns {sink name: what its close() returned}."""
+        for worker in self.workers:
+            worker.close()
+        for worker in self.workers:
+            if not worker.join(timeout):
+                self.on_log(f"{worker.sink.name} sink still has {worker.backlog} events after {timeout} s.")
+        return {worker.sink.name: worker.result for worker in self.workers}
+
+    def stats(self):
+        return {w.sink.name: {"delivered": w.delivered, "backlog": w.backlog, "high_water": w.high_water,
+                              "dropped": w.dropped, "errors": w.errors, "lost": w.lost,
+                              "write_p99_ms": w.write_ns.percentile(99) / 1e6 if w.write_ns.n else 0.0}
+                for w in self.workers}
+
+    def summary(self):
+        parts = []
+        for name, s in self.stats().items():
+            part = f"{name} {s['delivered']}"
+            if s["dropped"] or s["errors"] or s["lost"]:
+                part += f" ({s['dropped']} dropped, {s['errors']} failed writes retried, {s['lost']} lost)"
+            parts.append(part)
+        return f"Events stored: {', '.join(parts)} of {self.published}."
+
+
+class CSVSink(Sink):
+    name = "csv"
+
+    def __init__(self, logs, **kwargs):
+        super().__init__(**kwargs)
+        self.logs = logs  # a CSVLogSet
+
+    def write(self, batch):
+        write_event = self.logs.write_event
+        for i, (port, event) in enumerate(batch):
+            try:
+                write_event(port, event)
+            except Exception:
+                del batch[:i]  # only the rest is retried
+                raise
+
+    def close(self):
+        """{port: CSV path}"""
+        return self.logs.close()
+
+
+class ColumnarSink(Sink):
+    name = "columnar"
+
+    def __init__(self, store, path_for, time_header, time_format, on_log=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store  # a SessionStore
+        self.path_for = path_for  # port -> .fed3z path
+        self.time_header = time_header
+        self.time_format = time_format
+        self.on_log = on_log or logging.info
+
+    def write(self, batch):
+        append = self.store.append
+        for i, (port, event) in enumerate(batch):
+            try:
+                append(port, event)
+            except Exception:
+                del batch[:i]
+                raise
+
+    def close(self):
+        """{port: .fed3z path} of the files written; the store's spill files are removed."""
+        paths = {}
+        try:
+            for port in self.store.ports():
+                path = self.path_for(port)
+                try:
+                    columnar.write_session(path, self.store, port, self.time_header, self.time_format)
+                    paths[port] = path
+                except Exception as e:
+                    self.on_log(f"Failed to save columnar data for {port}: {e}")
+        finally:
+            self.store.close()
+        return paths
+
+
+class SQLiteSink(Sink):
+    """The session's live event database (see event_db); one transaction per batch."""
+
+    name = "sqlite"
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        # Created now so readers can open it before the first event
+        self.db = EventWriter(path)
+
+    def write(self, batch):
+        self.db.append(batch)
+
+    def close(self):
+        self.db.close()
+        return self.path
+
+
+class SheetsSink(Sink):
+    """Rows for the shared SheetsUploader; a JAM also gets a marker row with only Event and Device_Number.
+
+    ``jam`` is "replace" to send the marker instead of the JAM event, "add" to send both.
+    """
+
+    name = "sheets"
+
+    def __init__(self, uploader, device_for, jam="add", on_log=None, **kwargs):
+        super().__init__(**kwargs)
+        self.uploader = uploader
+        self.device_for = device_for  # port -> device number
+        self.jam = jam
+        self.on_log = on_log or logging.info
+
+    def write(self, batch):
+        add = self.uploader.add
+        for i, (port, event) in enumerate(batch):
+            try:
+                device_number = self.device_for(port)
+                title = worksheet_title(device_number)
+                if event.event == "JAM":
+                    if self.jam == "add":
+                        add(title, event)
+                    add(title, FED3Event.marker(event.received, "JAM", device_number, event.arrival_ns))
+                    self.on_log(f"JAM event on {port} queued for Google Sheets")
+                else:
+                    add(title, event)
+            except Exception:
+                del batch[:i]
+                raise
+
+    def close(self):
+        self.uploader.stop()
+
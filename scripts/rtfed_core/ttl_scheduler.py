@@ -0,0 +1,155 @@
+"""Non-blocking TTL pulse scheduler.
+
+``pulse(pin, width_ms)`` drives the pin HIGH on the caller's thread and
+returns at once. The falling edge is queued on a monotonic-clock deadline
+heap that one scheduler thread services. A new pulse on a pin that is
+still high extends that pin's deadline instead of starting a second pulse.
+Achieved widths are tracked per pin so sessions can be compared with the
+~100.2 ms +/- 0.1 ms baseline in source/SPEED_TEST_RESULTS.
+"""
+import heapq
+import math
+import threading
+import time
+import logging
+
+
+class PulseStats:
+    """Running mean/SD (Welford) of achieved pulse widths for one pin."""
+    __slots__ = ("n", "mean", "m2", "min", "max", "error_sum", "overlaps")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.error_sum = 0.0
+        self.overlaps = 0
+
+    def add(self, width_s, target_s):
+        self.n += 1
+        delta = width_s - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (width_s - self.mean)
+        self.min = min(self.min, width_s)
+        self.max = max(self.max, width_s)
+        self.error_sum += width_s - target_s
+
+    @property
+    def sd(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    @property
+    def mean_error(self):
+        return self.error_sum / self.n if self.n else 0.0
+
+
+class PulseScheduler:
+    def __init__(self, gpio, on_pulse_end=None, name="ttl-scheduler"):
+        # gpio needs output(pin, state), HIGH and LOW (RPi.GPIO or compatible)
+        self.gpio = gpio
+        # on_pulse_end(pin, rise_ns, fall_ns, target_ns) runs on the scheduler thread
+        self.on_pulse_end = on_pulse_end
+        self.name = name
+        self._cond = threading.Condition()
+        self._heap = []  # (deadline_ns, seq, pin, generation)
+        self._seq = 0
+        self._active = {}  # pin -> [generation, rise_ns, deadline_ns, target_ns]
+        self._generation = {}
+        self.stats = {}
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread and end every pulse that is still high."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            for pin in list(self._active):
+                self._fall(pin, time.monotonic_ns())
+            self._heap.clear()
+
+    def pulse(self, pin, width_ms=100):
+        """Start (or extend) a pulse on pin and return the rising-edge time in ns."""
+        width_ns = int(width_ms * 1_000_000)
+        with self._cond:
+            now = time.monotonic_ns()
+            active = self._active.get(pin)
+            if active is not None:
+                # Overlapping pulse: keep the pin high until the later deadline
+                self.stats.setdefault(pin, PulseStats()).overlaps += 1
+                deadline = max(active[2], now + width_ns)
+                active[2] = deadline
+                active[3] = deadline - active[1]
+                self._push(deadline, pin, active[0])
+                return active[1]
+            self.gpio.output(pin, self.gpio.HIGH)
+            rise_ns = time.monotonic_ns()
+            generation = self._generation.get(pin, 0) + 1
+            self._generation[pin] = generation
+            self._active[pin] = [generation, rise_ns, rise_ns + width_ns, width_ns]
+            self._push(rise_ns + width_ns, pin, generation)
+            return rise_ns
+
+    def set_level(self, pin, high):
+        """Hold pin at a fixed level (e.g. pellet in well), cancelling any pending falling edge."""
+        with self._cond:
+            if pin in self._active:
+                del self._active[pin]
+                self._generation[pin] = self._generation.get(pin, 0) + 1
+            self.gpio.output(pin, self.gpio.HIGH if high else self.gpio.LOW)
+
+    def summary(self, pin_labels=None):
+        """Rows of (label, pin, N, mean, SD, min, max, mean error, overlaps) with times in seconds."""
+        rows = []
+        for pin, st in sorted(self.stats.items()):
+            if not st.n:
+                continue
+            label = pin_labels.get(pin, str(pin)) if pin_labels else str(pin)
+            rows.append((label, pin, st.n, st.mean, st.sd, st.min, st.max, st.mean_error, st.overlaps))
+        return rows
+
+    def _push(self, deadline_ns, pin, generation):
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline_ns, self._seq, pin, generation))
+        self._cond.notify()
+
+    def _fall(self, pin, now_ns):
+        _, rise_ns, _, target_ns = self._active.pop(pin)
+        self.gpio.output(pin, self.gpio.LOW)
+        fall_ns = time.monotonic_ns()
+        self.stats.setdefault(pin, PulseStats()).add((fall_ns - rise_ns) / 1e9, target_ns / 1e9)
+        if self.on_pulse_end is not None:
+            try:
+                self.on_pulse_end(pin, rise_ns, fall_ns, target_ns)
+            except Exception:
+                logging.exception("Error in pulse end callback")
+
+    def _run(self):
+        with self._cond:
+            while not self._stop:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, _, pin, generation = self._heap[0]
+                now = time.monotonic_ns()
+                if deadline > now:
+                    self._cond.wait((deadline - now) / 1e9)
+                    continue
+                heapq.heappop(self._heap)
+                active = self._active.get(pin)
+                # Skip stale entries from extended or cancelled pulses
+                if active is None or active[0] != generation or active[2] != deadline:
+                    continue
+                self._fall(pin, now)
@@ -0,0 +1,771 @@
+"""Headless acquisition service for RTFED(PiTTL).
+
+Owns everything that must keep running while an experiment records: the
+FED3 serial ports, the GPIO backend and TTL scheduler, the session store,
+the streaming CSVs and the latency histograms. The Tk window
+(RTFED_TTL/RTFEDPiTTL.py) is only a client over a Unix socket
+(rtfed_core.ipc). It can attach and detach at any time; closing it never
+stops a recording, and a stalled window cannot delay a TTL pulse.
+
+Commands (see TTLService.handle_command): state, latency, stats, identify,
+sync_clock, set_mode, start, stop, shutdown. Subscribed clients get
+"log", "event", "status", "indicator", "latency", "stats" and "session"
+pushes.
+
+identify, sync_clock and set_mode open the ports themselves, so they run
+one at a time on a job thread, and start is refused while one is queued or
+running.
+
+    python -m rtfed_core.ttl_service [--socket PATH] [--gpio fake] [--persist]
+
+Without --persist the service exits once no session is running and no
+client has been attached for --linger seconds, which releases the pins.
+"""
+import argparse
+import collections
+import csv
+import datetime
+import logging
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+
+import serial
+
+from . import broadcast, clock, columnar, events, fed3_sim, gpio, ipc
+from .csv_log import CSVLogSet
+from .events import FED3Event, TTL_TIME_FORMAT
+from .framing import LineFramer
+from .latency import DELAY, DURATION, PER_EVENT_HEADER, PER_PORT_HEADER, LatencyRecorder
+from .serial_mux import SerialMultiplexer
+from .session_stats import SessionStats, write_summary
+from .session_store import SessionStore
+from .ttl_scheduler import PulseScheduler
+
+SOCKET_ENV_VAR = "RTFED_TTL_SOCKET"
+
+# Define GPIO pins for each device (fixed mapping by port, BCM numbering)
+gpio_pins_per_device = {
+    'Port 1': {"LeftPoke": 17, "RightPoke": 27, "Pellet": 22},
+    'Port 2': {"LeftPoke": 10, "RightPoke": 9,  "Pellet": 11},
+    'Port 3': {"LeftPoke": 0,  "RightPoke": 5,  "Pellet": 6},
+    'Port 4': {"LeftPoke": 13, "RightPoke": 19, "Pellet": 26},
+    'Port 5': {"LeftPoke": 14, "RightPoke": 15, "Pellet": 18},
+    'Port 6': {"LeftPoke": 23, "RightPoke": 24, "Pellet": 25},
+    'Port 7': {"LeftPoke": 8,  "RightPoke": 7,  "Pellet": 1},
+    'Port 8': {"LeftPoke": 12, "RightPoke": 16, "Pellet": 20},
+}
+port_names = [f"Port {i}" for i in range(1, 9)]
+
+# TTL pulse width sent to the RZ10 for every event
+TTL_PULSE_WIDTH_MS = 100
+
+column_headers = events.column_headers("Timestamp")
+
+HISTORY_LINES = 100  # per-port messages replayed to a client when it attaches
+DEVICE_CHECK_S = 5
+
+
+def socket_path():
+    return os.environ.get(SOCKET_ENV_VAR) or ipc.default_socket_path("rtfed-ttl")
+
+
+def get_current_serial_devices():
+    virtual = fed3_sim.virtual_ports()  # RTFED_VIRTUAL_FED3 set: use the simulated fleet
+    if virtual is not None:
+        return virtual
+    by_path_dir = '/dev/serial/by-path/'
+    if not os.path.exists(by_path_dir):
+        return []
+    serial_devices = []
+    for symlink in os.listdir(by_path_dir):
+        symlink_path = os.path.join(by_path_dir, symlink)
+        serial_port = os.path.realpath(symlink_path)
+        if 'ttyACM' in serial_port or 'ttyUSB' in serial_port:
+            serial_devices.append(serial_port)
+    serial_devices.sort()
+    return serial_devices
+
+
+def encode_push(obj):
+    # Runs on the IPC writer threads, so events are formatted off the serial thread
+    if isinstance(obj, FED3Event):
+        return {"time": obj.format_time(), "event": obj.event}
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+class TTLService:
+    def __init__(self, gpio_backend=None, socket=None):
+        self.known_devices = {}
+        pins = [pin for device_pins in gpio_pins_per_device.values() for pin in device_pins.values()]
+        self.gpio = gpio.open_backend(gpio_backend, pins)  # all pins as outputs, LOW
+        logging.info("GPIO backend: %s", self.gpio.name)
+        # Falling edges are timed by the scheduler thread so callers never block
+        self.ttl_scheduler = PulseScheduler(self.gpio, self.record_ttl_duration)
+        self.pellet_lock = threading.Lock()
+        self.pellet_in_well = {}
+        self.store = SessionStore()
+        self.csv_logs = None
+        # Serial-to-TTL latency and pulse width histograms per port and event
+        self.latency = LatencyRecorder()
+        self.pulse_owner = {}  # pin -> (port_identifier, event) of the pulse in flight
+        # Counts, pellet rate and retrieval/IPI/poke moments per port, kept up to date per event
+        self.stats = SessionStats()
+        # One selector thread reads every FED3 port while logging
+        self.mux = SerialMultiplexer(on_line=self.handle_fed_line, on_disconnect=self.handle_fed_disconnect)
+        self.connected_ports = []
+        self.serial_ports = {}  # Mapping: port_identifier -> serial port path
+        self.port_serial_objects = {}  # Mapping: port_identifier -> serial.Serial instance
+        self.time_sync_commands = {}  # Mapping: port_identifier -> (status, timestamp)
+        self.identification_threads = {}
+        self.identification_stop_events = {}
+        self.status = {port: ("Not Connected", "red") for port in port_names}
+        self.history = {port: collections.deque(maxlen=HISTORY_LINES) for port in port_names}
+        self.logging_active = False
+        self.session = {}
+        self.experiment_folder = None
+        # Commands arrive on one thread per client; session changes run one at a time
+        self._lock = threading.RLock()
+        self._jobs = queue.Queue()
+        self.pending_jobs = collections.Counter()  # device commands queued or running, by name
+        self._stop = threading.Event()
+        self.server = ipc.IPCServer(socket or socket_path(), self.handle_command, encode_push)
+        self.server.on_subscribe = self.snapshot
+        self.perform_initial_device_mapping()
+
+    # -- pushes to attached clients ---------------------------------------------
+
+    def log(self, port_identifier, message):
+        self.history[port_identifier].append(message)
+        self.server.publish({"push": "log", "port": port_identifier, "text": message})
+
+    def set_status(self, port_identifier, text, color):
+        self.status[port_identifier] = (text, color)
+        self.server.publish({"push": "status", "port": port_identifier, "text": text, "color": color})
+
+    def trigger_indicator(self, port_identifier):
+        self.server.publish({"push": "indicator", "port": port_identifier})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "gpio": self.gpio.name,
+                "logging": self.logging_active,
+                "session": self.session,
+                "status": self.status,
+                "latency": self.latency_labels(),
+                "stats": self.stats.snapshot(),
+                "history": {port: [m if isinstance(m, str) else
+                                   f"[{m.format_time()}] {port} - Event: {m.event}" for m in list(lines)]
+                            for port, lines in self.history.items()},
+            }
+
+    # -- device discovery -------------------------------------------------------
+
+    def perform_initial_device_mapping(self):
+        i = 0
+        for dev in get_current_serial_devices():
+            if dev not in self.known_devices and i < len(port_names):
+                self.known_devices[dev] = port_names[i]
+                i += 1
+
+    def get_device_mappings_by_usb_port(self):
+        # Return mappings for only known devices that are currently connected.
+        return [{'serial_port': dev, 'port_identifier': self.known_devices[dev]}
+                for dev in get_current_serial_devices() if dev in self.known_devices]
+
+    def check_connected_devices(self):
+        device_mappings = self.get_device_mappings_by_usb_port()
+        current_ports = [m['port_identifier'] for m in device_mappings]
+        for m in device_mappings:
+            port_identifier = m['port_identifier']
+            if port_identifier not in self.connected_ports:
+                self.connected_ports.append(port_identifier)
+            self.set_status(port_identifier, "Connected", "green")
+            if self.logging_active and port_identifier not in self.serial_ports:
+                logging.info(f"Device {port_identifier} reconnected during experiment, restarting logging thread.")
+                self.start_logging_for_port(m['serial_port'], port_identifier)
+        for port_name in list(self.connected_ports):
+            if port_name not in current_ports:
+                self.connected_ports.remove(port_name)
+                self.set_status(port_name, "Not Connected", "red")
+                self.serial_ports.pop(port_name, None)
+                if port_name in self.identification_threads:
+                    self.identification_stop_events[port_name].set()
+                    self.identification_threads[port_name].join()
+                    del self.identification_threads[port_name]
+                    del self.identification_stop_events[port_name]
+
+    # -- identification ---------------------------------------------------------
+
+    def start_identification_threads_for_connected(self):
+        for m in self.get_device_mappings_by_usb_port():
+            port_identifier = m['port_identifier']
+            if (port_identifier not in self.serial_ports and port_identifier not in self.identification_threads
+                    and not self.logging_active):
+                self.start_identification_thread(m['serial_port'], port_identifier)
+
+    def start_identification_thread(self, serial_port, port_identifier):
+        logging.info(f"Starting identification thread for {port_identifier}")
+        stop_event_local = threading.Event()
+        self.identification_stop_events[port_identifier] = stop_event_local
+        t = threading.Thread(target=self.identification_thread, args=(serial_port, port_identifier, stop_event_local))
+        t.daemon = True
+        t.start()
+        self.identification_threads[port_identifier] = t
+
+    def identification_thread(self, serial_port, port_identifier, local_stop_event):
+        try:
+            ser = serial.Serial(serial_port, 115200, timeout=0)
+            framer = LineFramer()
+            self.set_status(port_identifier, "Connected", "violet")
+            device_number = None
+            while not local_stop_event.is_set() and not device_number:
+                try:
+                    lines = framer.read_lines(ser.fileno(), timeout=0.1)
+                except EOFError:
+                    self.set_status(port_identifier, "Not Connected", "red")
+                    break
+                for line in lines:
+                    data_list = line.split(",")
+                    # Look for a CSV response with device identification (assumes FED number in index 5)
+                    if len(data_list) >= 6 and "TRIGGER_POKE" not in line:
+                        device_number = data_list[5].strip()
+                        if device_number:
+                            self.log(port_identifier, f"Identified device FED number {device_number} on {port_identifier}")
+                            # Do not override the fixed port mapping; update label only.
+                            self.set_status(port_identifier, f"{port_identifier} (FED {device_number})", "green")
+                            break
+                    if len(data_list) >= 10:
+                        event_type = data_list[9].strip()
+                        if event_type.strip().lower() in ["right", "pellet", "left"]:
+                            self.trigger_indicator(port_identifier)
+        except serial.SerialException:
+            self.set_status(port_identifier, "Not Connected", "red")
+        finally:
+            if 'ser' in locals() and ser.is_open:
+                ser.close()
+
+    def stop_identification_threads(self):
+        for port, event in list(self.identification_stop_events.items()):
+            event.set()
+        for port, t in list(self.identification_threads.items()):
+            t.join()
+            del self.identification_threads[port]
+            del self.identification_stop_events[port]
+
+    def identify_devices(self):
+        self.stop_identification_threads()
+        ports = {m['port_identifier']: m['serial_port'] for m in self.get_device_mappings_by_usb_port()}
+        for port_identifier in ports:
+            self.log(port_identifier, "Triggering device identification...")
+
+        def on_result(port_identifier, result):
+            if result.reply:
+                self.log(port_identifier, f"Identified device FED number {result.reply} on {port_identifier}")
+                self.set_status(port_identifier, f"{port_identifier} (FED {result.reply})", "green")
+            elif result.error:
+                self.log(port_identifier, f"Error sending poke command to {port_identifier}: {result.error}")
+            else:
+                self.log(port_identifier, f"No valid device number received from {port_identifier}.")
+
+        # Every port at once; each waits at most IDENTIFY_TIMEOUT_S from its own write
+        broadcast.broadcast(ports, broadcast.TRIGGER_POKE, broadcast.device_number,
+                            on_line=lambda p, line: self.log(p, f"Received from {p}: {line}"), on_result=on_result)
+        if ports:
+            self.log(list(ports)[-1], "Identification process complete.")
+
+    def identify_single_port(self, port_identifier):
+        """Trigger a poke and read back the device_number for just this port."""
+        mapping = next((m for m in self.get_device_mappings_by_usb_port()
+                        if m['port_identifier'] == port_identifier), None)
+        if not mapping:
+            self.log(port_identifier, "Port not currently mapped!")
+            return
+        self.log(port_identifier, "🔎 Re-identifying port...")
+        result = broadcast.broadcast({port_identifier: mapping['serial_port']}, broadcast.TRIGGER_POKE,
+                                     broadcast.device_number)[port_identifier]
+        if result.reply:
+            self.log(port_identifier, f"Port {port_identifier} is FED #{result.reply}")
+            self.set_status(port_identifier, f"{port_identifier} (FED {result.reply})", "green")
+        elif result.error:
+            self.log(port_identifier, f"Error re-identifying {port_identifier}: {result.error}")
+        else:
+            self.log(port_identifier, "⚠️ No device_number received.")
+
+    # -- device commands --------------------------------------------------------
+
+    def set_device_mode(self, mode_num, ports):
+        for pid in sorted(ports, key=lambda p: int(p.split()[1])):
+            mapping = next((m for m in self.get_device_mappings_by_usb_port()
+                            if m['port_identifier'] == pid), None)
+            if not mapping:
+                self.log(pid, "Port not found on USB!")
+                continue
+            self.log(pid, f"➡️ Setting mode {mode_num} on {pid}…")
+            try:
+                with serial.Serial(mapping['serial_port'], 115200, timeout=2) as ser:
+                    ser.write(f"SET_MODE:{mode_num}\n".encode())
+                    start = time.time()
+                    ok = False
+                    while time.time() - start < 3:
+                        resp = ser.readline().decode().strip()
+                        if resp == "MODE_SET_OK":
+                            self.log(pid, "✅ Mode set OK; rebooting…")
+                            ok = True
+                            break
+                        if resp == "MODE_SET_FAIL":
+                            self.log(pid, "❌ Mode set FAILED")
+                            break
+                    if not ok:
+                        self.log(pid, "⚠️ No confirmation, assuming reboot anyway.")
+            except Exception as e:
+                self.log(pid, f"Error sending SET_MODE to {pid}: {e}")
+            # Wait for that one FED3 to reboot & re-enumerate, then re-identify it
+            time.sleep(5)
+            self.identify_single_port(pid)
+
+    def sync_all_device_times(self):
+        ports = {}
+        open_ports = {}
+        for m in self.get_device_mappings_by_usb_port():
+            port_identifier = m['port_identifier']
+            self.time_sync_commands[port_identifier] = ('pending', time.time())
+            if port_identifier in self.port_serial_objects:
+                open_ports[port_identifier] = self.port_serial_objects[port_identifier]
+            else:
+                ports[port_identifier] = m['serial_port']
+
+        def on_result(port_identifier, result):
+            if result.shared:
+                if result.error:
+                    self.log(port_identifier, f"Failed to send time sync via open connection for {port_identifier}: "
+                                              f"{result.error}")
+                else:
+                    self.log(port_identifier, f"Sent time sync command to {port_identifier} via open connection.")
+                    if self.time_sync_commands.get(port_identifier, ('done',))[0] == 'pending':
+                        self.time_sync_commands[port_identifier] = ('pending', result.sent)
+                return
+            if result.reply == "TIME_SET_OK":
+                self.log(port_identifier, f"Time synced for device on {port_identifier}.")
+            elif result.reply == "TIME_SET_FAIL":
+                self.log(port_identifier, f"Time sync command sent to {port_identifier}, but received failure.")
+            elif result.error:
+                self.log(port_identifier, f"Failed to sync time for {port_identifier}: {result.error}")
+            else:
+                self.log(port_identifier, f"Time sync command sent to {port_identifier}, no confirmation.")
+            self.time_sync_commands[port_identifier] = ('done', time.time())
+
+        # Written to every board as the next wall-clock second starts
+        broadcast.broadcast(ports, None, broadcast.time_reply, broadcast.SYNC_TIMEOUT_S, open_ports,
+                            align=True, on_result=on_result)
+
+    # -- acquisition ------------------------------------------------------------
+
+    def open_fed_port(self, serial_port, port_identifier):
+        try:
+            ser = serial.Serial(serial_port, 115200, timeout=0)
+        except serial.SerialException:
+            self.log(port_identifier, f"Error opening serial port: {serial_port}")
+            self.set_status(port_identifier, "Not Connected", "red")
+            return False
+        self.port_serial_objects[port_identifier] = ser  # store for time sync
+        self.mux.add_port(port_identifier, ser)
+        self.set_status(port_identifier, "Connected", "green")
+        return True
+
+    def start_logging_for_port(self, serial_port, port_identifier):
+        if port_identifier in self.serial_ports or port_identifier not in gpio_pins_per_device:
+            return
+        logging.info(f"Starting logging for {port_identifier} on {serial_port}")
+        if self.open_fed_port(serial_port, port_identifier):
+            self.serial_ports[port_identifier] = serial_port
+
+    def handle_fed_line(self, port_identifier, line, arrival_ns):
+        # Called from the multiplexer thread for every complete line
+        gpio_pins = gpio_pins_per_device[port_identifier]
+        # Handle time sync responses
+        if port_identifier in self.time_sync_commands and self.time_sync_commands[port_identifier][0] == 'pending':
+            start_t = self.time_sync_commands[port_identifier][1]
+            if line == "TIME_SET_OK":
+                self.log(port_identifier, f"Time synced for device on {port_identifier}.")
+                self.time_sync_commands[port_identifier] = ('done', time.time())
+                return
+            elif line == "TIME_SET_FAIL":
+                self.log(port_identifier, f"Time sync command on {port_identifier} received failure.")
+                self.time_sync_commands[port_identifier] = ('done', time.time())
+                return
+            elif time.time() - start_t > 2.0:
+                self.log(port_identifier, f"Time sync command on {port_identifier} timed out.")
+                self.time_sync_commands[port_identifier] = ('done', time.time())
+        data_list = line.split(",")
+        self.log(port_identifier, f"{port_identifier} raw data: {data_list}")
+        if len(data_list) >= 10:
+            # Parsed once here; TTL logic, clients and CSV writer all use the same record
+            event = FED3Event.from_fields(data_list[1:], clock.anchor.wall(arrival_ns), arrival_ns)
+            pulse = self.process_event(event.event, port_identifier, gpio_pins)
+            if pulse is not None:
+                self.record_ttl_delay(port_identifier, event.event, pulse, arrival_ns)
+            self.history[port_identifier].append(event)
+            self.stats.update(port_identifier, event)
+            self.server.publish({"push": "event", "port": port_identifier, "event": event})
+            self.store.append(port_identifier, event)
+            self.csv_logs.write_event(port_identifier, event)
+
+    def handle_fed_disconnect(self, port_identifier):
+        self.log(port_identifier, f"Device on {port_identifier} disconnected.")
+        self.set_status(port_identifier, "Not Connected", "red")
+        self.port_serial_objects.pop(port_identifier, None)
+        self.serial_ports.pop(port_identifier, None)
+        self.log(port_identifier, f"Stopped reading from {port_identifier}")
+
+    def send_ttl_signal(self, pin):
+        return self.ttl_scheduler.pulse(pin, TTL_PULSE_WIDTH_MS)
+
+    def handle_pellet_event(self, event_type, port_identifier, gpio_pins):
+        # Returns (pin, rise_ns) when a pulse was started
+        pulse = None
+        with self.pellet_lock:
+            if port_identifier not in self.pellet_in_well:
+                self.pellet_in_well[port_identifier] = False
+            etype = event_type.strip().lower()
+            if etype == "pellet":
+                if self.pellet_in_well[port_identifier]:
+                    self.ttl_scheduler.set_level(gpio_pins["Pellet"], False)
+                    self.log(port_identifier, "Pellet taken, signal turned OFF.")
+                    self.pellet_in_well[port_identifier] = False
+                    pulse = (gpio_pins["Pellet"], self.send_ttl_signal(gpio_pins["Pellet"]))
+                    self.log(port_identifier, f"TTL signal sent on {port_identifier} for {event_type}")
+                else:
+                    self.log(port_identifier, "No pellet was in the well, no signal for pellet taken.")
+            elif etype == "pelletinwell":
+                self.ttl_scheduler.set_level(gpio_pins["Pellet"], True)
+                self.pellet_in_well[port_identifier] = True
+                self.log(port_identifier, "Pellet dispensed in well, signal ON.")
+        return pulse
+
+    def process_event(self, event_type, port_identifier, gpio_pins):
+        # Returns (pin, rise_ns) when a pulse was started, for the latency histograms
+        pulse = None
+        etype = event_type.strip().lower()
+        if etype == "left":
+            pulse = (gpio_pins["LeftPoke"], self.send_ttl_signal(gpio_pins["LeftPoke"]))
+            self.log(port_identifier, f"TTL signal sent on {port_identifier} for {event_type}")
+        elif etype == "right":
+            pulse = (gpio_pins["RightPoke"], self.send_ttl_signal(gpio_pins["RightPoke"]))
+            self.log(port_identifier, f"TTL signal sent on {port_identifier} for {event_type}")
+        elif etype in ["leftwithpellet", "rightwithpellet"]:
+            pin = gpio_pins["LeftPoke"] if etype.startswith("left") else gpio_pins["RightPoke"]
+            pulse = (pin, self.send_ttl_signal(pin))
+            self.log(port_identifier, f"TTL signal sent on {port_identifier} for {event_type}")
+        elif etype in ["pellet", "pelletinwell"]:
+            pulse = self.handle_pellet_event(event_type, port_identifier, gpio_pins)
+        if etype in ["left", "right", "pellet", "pelletinwell", "leftwithpellet", "rightwithpellet"]:
+            self.trigger_indicator(port_identifier)
+        return pulse
+
+    def record_ttl_delay(self, port_identifier, event, pulse, arrival_ns):
+        pin, rise_ns = pulse
+        # A pulse that was already high (overlap) keeps its first rise; don't count it as a delay
+        if rise_ns >= arrival_ns:
+            self.latency.record(port_identifier, event, DELAY, rise_ns - arrival_ns)
+            self.pulse_owner[pin] = (port_identifier, event)
+
+    def record_ttl_duration(self, pin, rise_ns, fall_ns, target_ns):
+        # Runs on the TTL scheduler thread at every falling edge
+        owner = self.pulse_owner.pop(pin, None)
+        if owner is not None:
+            self.latency.record(owner[0], owner[1], DURATION, fall_ns - rise_ns)
+
+    def latency_labels(self):
+        labels = {}
+        for port_identifier in self.latency.ports():
+            delay = self.latency.combined(port_identifier, DELAY)
+            if delay.n:
+                labels[port_identifier] = (f"TTL delay p50/p99/max: {delay.percentile(50) / 1e6:.2f}/"
+                                           f"{delay.percentile(99) / 1e6:.2f}/{delay.max / 1e6:.2f} ms (n={delay.n})")
+        return labels
+
+    # -- session ----------------------------------------------------------------
+
+    def start_experiment(self, experimenter, experiment, save_path, flat_data_path):
+        with self._lock:
+            if self.logging_active:
+                raise ipc.CommandError("An experiment is already running.")
+            if self.pending_jobs:
+                # They open the ports themselves and would take lines from the session's readers
+                raise ipc.CommandError(f"Wait for {', '.join(sorted(self.pending_jobs))} to finish first.")
+            if not self.connected_ports:
+                raise ipc.CommandError("No FED3 devices are connected.")
+            experimenter = (experimenter or "").strip().lower()
+            experiment = (experiment or "").strip().lower()
+            if not experimenter or not experiment:
+                raise ipc.CommandError("Please provide your name and experiment name.")
+            if not save_path or not flat_data_path:
+                raise ipc.CommandError("Please provide both Experiment Folder and Flat Data Folder.")
+            current_time = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+            experimenter_folder = os.path.join(save_path, re.sub(r'[<>:"/\\|?*]', '_', experimenter))
+            experiment_name = re.sub(r'[<>:"/\\|?*]', '_', experiment)
+            self.experiment_folder = os.path.join(experimenter_folder, f"{experiment_name}_{current_time}")
+            os.makedirs(self.experiment_folder, exist_ok=True)
+            self.flat_data_path = flat_data_path
+            # Full chunks spill next to the session's CSVs instead of growing in RAM
+            self.store = SessionStore(self.experiment_folder)
+            # Rows are appended to each device's CSV as they arrive
+            self.csv_logs = CSVLogSet(self.csv_path_for, column_headers, TTL_TIME_FORMAT)
+            self.stop_identification_threads()
+            clock.anchor.reset()
+            self.latency = LatencyRecorder()
+            self.stats = SessionStats()
+            self.pulse_owner = {}
+            self.pellet_in_well = {}
+            self.ttl_scheduler.start()
+            self.mux.start()
+            self.logging_active = True
+            for m in self.get_device_mappings_by_usb_port():
+                self.start_logging_for_port(m['serial_port'], m['port_identifier'])
+            self.session = {"experimenter": experimenter, "experiment": experiment,
+                            "experiment_folder": self.experiment_folder, "start": time.time()}
+            self.server.publish({"push": "session", "logging": True, "session": self.session})
+            return self.session
+
+    def stop_experiment(self):
+        with self._lock:
+            if not self.logging_active:
+                raise ipc.CommandError("No experiment is running.")
+            self.mux.stop()
+            for port_identifier in list(self.port_serial_objects):
+                self.log(port_identifier, f"Stopped reading from {port_identifier}")
+            self.port_serial_objects.clear()
+            self.serial_ports.clear()
+            self.ttl_scheduler.stop()
+            # Drop every pin the session may have left high (pellet in well)
+            for pins in gpio_pins_per_device.values():
+                for pin in pins.values():
+                    self.ttl_scheduler.set_level(pin, False)
+            files = self.save_all_data()
+            self.save_summary()
+            self.save_ttl_timing()
+            self.store.close()
+            self.logging_active = False
+            result = dict(self.session, files=files)
+            self.session = {}
+            self.server.publish({"push": "session", "logging": False, "session": result})
+            return result
+
+    def csv_path_for(self, port_identifier):
+        return os.path.join(self.experiment_folder, f"{port_identifier}.csv")
+
+    def save_all_data(self):
+        # The CSVs were written while logging; only close them and copy
+        paths = self.csv_logs.close()
+        saved = {}
+        for port_identifier in gpio_pins_per_device:
+            filename_user = paths.get(port_identifier)
+            if filename_user:
+                logging.info(f"Data saved for {port_identifier} in {filename_user}")
+                saved[port_identifier] = filename_user
+                # Typed columnar copy for fast reloading; converts back to this CSV
+                columnar_filename = os.path.splitext(filename_user)[0] + columnar.SUFFIX
+                try:
+                    columnar.write_session(columnar_filename, self.store, port_identifier, column_headers[0], TTL_TIME_FORMAT)
+                except Exception as e:
+                    logging.error(f"Failed to save columnar data for {port_identifier}: {e}")
+                    columnar_filename = None
+                flat_filename = os.path.join(self.flat_data_path, f"{port_identifier}_{datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')}.csv")
+                try:
+                    shutil.copyfile(filename_user, flat_filename)
+                    if columnar_filename:
+                        shutil.copyfile(columnar_filename, os.path.splitext(flat_filename)[0] + columnar.SUFFIX)
+                    logging.info(f"Flat copy saved for {port_identifier} in {flat_filename}")
+                except Exception as e:
+                    logging.error(f"Failed to save flat copy for {port_identifier}: {e}")
+            else:
+                logging.info(f"No data collected from {port_identifier}, no file saved.")
+        return saved
+
+    def save_summary(self):
+        # Written from the live statistics; the rows are not read again
+        for port_identifier, port_stats in self.stats.snapshot().items():
+            summary_filename = os.path.join(self.experiment_folder, f"{port_identifier}_summary.csv")
+            stats_filename = os.path.join(self.experiment_folder, f"{port_identifier}_stats.csv")
+            try:
+                write_summary(summary_filename, stats_filename, port_stats)
+                logging.info(f"Summary saved for {port_identifier} in {summary_filename}")
+            except Exception as e:
+                logging.error(f"Failed to save summary for {port_identifier}: {e}")
+
+    def save_ttl_timing(self):
+        pin_labels = {pin: (port_identifier, signal)
+                      for port_identifier, pins in gpio_pins_per_device.items()
+                      for signal, pin in pins.items()}
+        self.save_latency_summary()
+        rows = self.ttl_scheduler.summary(pin_labels)
+        if not rows:
+            return
+        timing_filename = os.path.join(self.experiment_folder, "TTL_pulse_widths.csv")
+        try:
+            with open(timing_filename, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(["Port #", "Signal", "Pin", "N", "Mean duration", "SD duration",
+                                 "Min duration", "Max duration", "Mean error", "Overlaps"])
+                for (port_identifier, signal), pin, n, mean, sd, lo, hi, err, overlaps in rows:
+                    writer.writerow([port_identifier, signal, pin, n, mean, sd, lo, hi, err, overlaps])
+                    logging.info(f"{port_identifier} {signal}: {n} pulses, width {mean * 1000:.3f} ± {sd * 1000:.3f} ms")
+            logging.info(f"TTL pulse widths saved in {timing_filename}")
+        except Exception as e:
+            logging.error(f"Failed to save TTL pulse widths: {e}")
+        self.ttl_scheduler.stats.clear()
+
+    def save_latency_summary(self):
+        # Same shape as source/SPEED_TEST_RESULTS/Pi_TTL_Timing_Summary_Per_Port.csv, in seconds
+        rows = self.latency.per_port_rows()
+        if not rows:
+            return
+        per_port_filename = os.path.join(self.experiment_folder, "TTL_Timing_Summary_Per_Port.csv")
+        per_event_filename = os.path.join(self.experiment_folder, "TTL_Timing_Summary_Per_Event.csv")
+        try:
+            with open(per_port_filename, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(PER_PORT_HEADER)
+                writer.writerows(rows)
+            with open(per_event_filename, mode='w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(PER_EVENT_HEADER)
+                writer.writerows(self.latency.per_event_rows())
+            for port_identifier, mean_delay, sd_delay, _, _, n in rows:
+                logging.info(f"{port_identifier}: serial-to-TTL delay {mean_delay * 1000:.3f} ± {sd_delay * 1000:.3f} ms (N={n})")
+            logging.info(f"TTL timing summary saved in {per_port_filename}")
+        except Exception as e:
+            logging.error(f"Failed to save TTL timing summary: {e}")
+
+    # -- IPC --------------------------------------------------------------------
+
+    def handle_command(self, cmd, args):
+        if cmd == "state":
+            return self.snapshot()
+        if cmd == "latency":
+            return self.latency_labels()
+        if cmd == "stats":
+            return self.stats.snapshot()
+        if cmd == "start":
+            return self.start_experiment(args.get("experimenter"), args.get("experiment"),
+                                         args.get("save_path"), args.get("flat_data_path"))
+        if cmd == "stop":
+            return self.stop_experiment()
+        # Device commands hold ports for seconds; they run in order on the job thread
+        if cmd in ("identify", "sync_clock", "set_mode"):
+            if cmd == "identify":
+                job = (self.identify_devices, ())
+            elif cmd == "sync_clock":
+                job = (self.sync_all_device_times, ())
+            else:
+                mode = int(args["mode"])
+                ports = [p for p in args.get("ports", []) if p in gpio_pins_per_device]
+                if not ports:
+                    raise ipc.CommandError("Check at least one 'Apply Mode' box.")
+                job = (self.set_device_mode, (mode, ports))
+            # Checked and counted under the session lock, so "start" cannot slip in between
+            with self._lock:
+                if cmd != "sync_clock" and self.logging_active:
+                    raise ipc.CommandError("Not available while logging.")
+                self.pending_jobs[cmd] += 1
+                self._jobs.put((cmd,) + job)
+            return {"queued": cmd}
+        if cmd == "shutdown":
+            if self.logging_active and not args.get("force"):
+                raise ipc.CommandError("Logging is active; stop the experiment first.")
+            if self.logging_active:
+                self.stop_experiment()
+            self._stop.set()
+            return {"pid": os.getpid()}
+        raise ipc.CommandError(f"unknown command {cmd!r}")
+
+    def _job_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            cmd, fn, args = job
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception(f"{fn.__name__} failed")
+            finally:
+                with self._lock:
+                    self.pending_jobs[cmd] -= 1
+                    if not self.pending_jobs[cmd]:
+                        del self.pending_jobs[cmd]
+
+    def serve(self, linger=10.0, persist=False):
+        """Run until shutdown, or until idle for ``linger`` s with no client (unless persist)."""
+        self.server.start()
+        logging.info(f"RTFED(PiTTL) service listening on {self.server.path}")
+        jobs = threading.Thread(target=self._job_loop, name="ttl-jobs", daemon=True)
+        jobs.start()
+        self.start_identification_threads_for_connected()
+        idle_since = time.monotonic()
+        last_check = 0.0
+        try:
+            while not self._stop.wait(1.0):
+                now = time.monotonic()
+                if now - last_check >= DEVICE_CHECK_S:
+                    with self._lock:
+                        self.check_connected_devices()
+                    last_check = now
+                if self.logging_active:
+                    step = clock.anchor.check()
+                    if step is not None:
+                        # e.g. NTP syncing after a start without network; later rows carry the corrected time
+                        message = f"Wall clock stepped {step:+.3f} s; timestamps re-anchored."
+                        logging.warning(message)
+                        for port_identifier in port_names:
+                            self.log(port_identifier, message)
+                    self.server.publish({"push": "latency", "labels": self.latency_labels()})
+                    self.server.publish({"push": "stats", "stats": self.stats.snapshot()})
+                if self.logging_active or self.server.clients:
+                    idle_since = now
+                elif not persist and now - idle_since >= linger:
+                    logging.info("No session and no clients; exiting.")
+                    break
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self.logging_active:
+                self.stop_experiment()
+        self._jobs.put(None)
+        self.stop_identification_threads()
+        self.mux.stop()
+        self.ttl_scheduler.stop()
+        self.gpio.cleanup()
+        self.server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless RTFED(PiTTL) acquisition service.")
+    parser.add_argument("--socket", default=None, help=f"Unix socket path (default: ${SOCKET_ENV_VAR} or the runtime dir)")
+    parser.add_argument("--gpio", default=None, choices=sorted(gpio.BACKENDS) + ["auto"],
+                        help=f"GPIO backend (default: ${gpio.ENV_VAR} or auto)")
+    parser.add_argument("--persist", action="store_true", help="keep running with no session and no clients")
+    parser.add_argument("--linger", type=float, default=10.0, help="idle seconds before exiting")
+    parser.add_argument("--log", default=None, help="log file (default: stdout)")
+    args = parser.parse_args(argv)
+    target = {"filename": args.log} if args.log else {"stream": sys.stdout}
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s', **target)
+    try:
+        service = TTLService(args.gpio, args.socket)
+    except gpio.GPIOUnavailable as e:
+        logging.error(f"Not starting: {e}")
+        sys.exit(f"RTFED(PiTTL) service not started: {e}")
+    service.serve(args.linger, args.persist)
+
+
+if __name__ == "__main__":
+    main()